@@ -6,6 +6,7 @@ from django.http import JsonResponse
 from .utils import log_user_operation
 from .models import AIPrediction, AIOptimization, AIAnomaly
 from django.utils import timezone
+from system.permission_resolver import user_in_groups
 
 import os
 # 設定AI模組的日誌記錄器
@@ -21,7 +22,7 @@ ai_logger.setLevel(logging.INFO)
 
 # 檢查用戶是否屬於「AI使用者」群組，或者是超級用戶
 def ai_user_required(user):
-    return user.is_superuser or user.groups.filter(name="AI使用者").exists()
+    return user.is_superuser or user_in_groups(user, "AI使用者")
 
 
 # 檢查是否為超級管理員
@@ -9,6 +9,7 @@ from django.http import HttpResponse, JsonResponse
 import tablib
 import json
 from production.models import ProductionLine
+from system.permission_resolver import user_in_groups
 
 import os
 # 設定設備管理模組的日誌記錄器
@@ -48,7 +49,7 @@ class EquipmentResource(resources.ModelResource):
 
 # 檢查用戶是否屬於「設備使用者」群組，或者是超級用戶
 def equip_user_required(user):
-    return user.is_superuser or user.groups.filter(name="設備使用者").exists()
+    return user.is_superuser or user_in_groups(user, "設備使用者")
 
 
 # 檢查是否為超級管理員
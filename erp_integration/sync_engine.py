@@ -0,0 +1,561 @@
+"""
+ERP 資料同步引擎
+提供 MSSQL → PostgreSQL 資料表鏡像的共用工具：
+- 每個欄位預先建立一次的解碼/編碼函數，避免逐格掃描欄位資訊
+- 以 fetchmany 分批串流讀取 MSSQL，並透過 COPY FROM STDIN 寫入 PostgreSQL 暫存表
+- 暫存表載入完成後於單一交易內原子性替換正式表
+"""
+
+import logging
+import time
+import uuid
+from datetime import date, datetime, time as dt_time
+
+logger = logging.getLogger("erp_integration")
+
+# MSSQL 到 PostgreSQL 的資料型態映射，確保一致性
+MSSQL_TO_PGSQL_TYPE_MAPPING = {
+    "binary": "BYTEA",
+    "varbinary": "BYTEA",
+    "bit": "BOOLEAN",
+    "char": "CHAR",
+    "nchar": "CHAR",
+    "varchar": "VARCHAR",
+    "nvarchar": "VARCHAR",
+    "text": "TEXT",
+    "ntext": "TEXT",
+    "int": "INTEGER",
+    "bigint": "BIGINT",
+    "smallint": "SMALLINT",
+    "tinyint": "SMALLINT",
+    "float": "DOUBLE PRECISION",
+    "real": "REAL",
+    "decimal": "NUMERIC",
+    "numeric": "NUMERIC",
+    "money": "NUMERIC(19,4)",
+    "smallmoney": "NUMERIC(10,4)",
+    "datetime": "TIMESTAMP",
+    "datetime2": "TIMESTAMP",
+    "smalldatetime": "TIMESTAMP",
+    "date": "DATE",
+    "time": "TIME",
+    "uniqueidentifier": "UUID",
+    "image": "BYTEA",
+}
+
+BINARY_DATA_TYPES = ("varbinary", "binary", "image")
+
+# 全量同步每批從 MSSQL 讀取的筆數
+FULL_SYNC_FETCH_SIZE = 5000
+
+# COPY text 格式需要跳脫的字元
+_COPY_ESCAPE_TABLE = str.maketrans(
+    {"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t", "\x00": ""}
+)
+COPY_NULL = "\\N"
+
+# 取不到 ERP 伺服器並行名額時，單表同步任務的重試間隔（秒）
+ERP_SYNC_SLOT_RETRY_SECONDS = 30
+
+# 並行名額的租約時間（秒），避免 worker 異常中止後名額永久被占用
+ERP_SYNC_SLOT_LEASE_SECONDS = 2 * 60 * 60
+
+# 並行名額存放的快取別名：必須是所有 Celery worker 共用的 Redis（settings.CACHES["locks"]），
+# 且不可忽略連線錯誤，否則各 worker 各自計數或在 Redis 故障時誤判名額
+ERP_SYNC_SLOT_CACHE_ALIAS = "locks"
+
+MSSQL_COLUMNS_QUERY = """
+    SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_NAME = %s
+    ORDER BY ORDINAL_POSITION
+"""
+
+
+def fetch_mssql_columns(cursor_mssql, table):
+    """讀取 MSSQL 資料表的欄位資訊（cursor 需為 as_dict=True）"""
+    cursor_mssql.execute(MSSQL_COLUMNS_QUERY, (table,))
+    return cursor_mssql.fetchall()
+
+
+def pg_column_type(col):
+    """依 MSSQL 欄位資訊決定 PostgreSQL 欄位型態，保留長度與精度"""
+    data_type = col["DATA_TYPE"].lower()
+    pg_type = MSSQL_TO_PGSQL_TYPE_MAPPING.get(data_type, "TEXT")
+    if data_type in ("varchar", "nvarchar", "char", "nchar"):
+        length = col["CHARACTER_MAXIMUM_LENGTH"]
+        if length and length > 0:
+            pg_type = f"{pg_type}({length})"
+        elif length == -1:
+            pg_type = "TEXT"
+    elif data_type in ("numeric", "decimal", "money", "smallmoney"):
+        precision = col["NUMERIC_PRECISION"]
+        scale = col["NUMERIC_SCALE"]
+        if precision and scale is not None:
+            pg_type = f"NUMERIC({precision},{scale})"
+    return pg_type
+
+
+def build_create_table_sql(pg_table, columns):
+    """產生鏡像資料表的 CREATE TABLE 語句（含 row_id 與 updated_at）"""
+    column_defs = ['"row_id" SERIAL PRIMARY KEY']
+    for col in columns:
+        column_defs.append(f'"{col["COLUMN_NAME"]}" {pg_column_type(col)}')
+    column_defs.append('"updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    return f'CREATE TABLE "{pg_table}" ({", ".join(column_defs)});'
+
+
+def _decode_text_bytes(value):
+    try:
+        return value.decode("utf-16-le", errors="replace").replace("\x00", "")
+    except UnicodeDecodeError:
+        return value.decode("cp950", errors="replace").replace("\x00", "")
+
+
+def build_value_decoder(data_type):
+    """
+    依欄位型態建立一次性的值轉換函數（與原逐格轉換規則相同）：
+    - 二進位欄位保留 bytes
+    - 文字欄位的 bytes 以 utf-16-le（失敗時 cp950）解碼
+    - 字串移除 NUL 字元
+    """
+    is_binary = data_type.lower() in BINARY_DATA_TYPES
+
+    def decode(value):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            return value if is_binary else _decode_text_bytes(value)
+        if isinstance(value, str):
+            return value.replace("\x00", "")
+        return value
+
+    return decode
+
+
+def build_column_decoders(columns):
+    """為每個欄位預先建立 (欄位名稱, 轉換函數)"""
+    return [
+        (col["COLUMN_NAME"], build_value_decoder(col["DATA_TYPE"]))
+        for col in columns
+    ]
+
+
+def decode_row(row, decoders):
+    """以預建的轉換函數轉換一筆 MSSQL 資料列，回傳依欄位順序排列的值"""
+    return [decode(row[name]) for name, decode in decoders]
+
+
+def _encode_copy_value(value):
+    """將單一值編碼為 COPY text 格式"""
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPE_TABLE)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea 十六進位格式，反斜線在 text 格式下需再跳脫一次
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value).translate(_COPY_ESCAPE_TABLE)
+
+
+class CopyRowStream:
+    """
+    將資料列產生器包裝為 copy_expert 可讀取的檔案物件
+    以 COPY text 格式逐批輸出，記憶體中只保留目前的一小段資料
+    """
+
+    def __init__(self, rows, on_error=None):
+        self._rows = iter(rows)
+        self._buffer = b""
+        self._on_error = on_error
+        self.row_count = 0
+        self.byte_count = 0
+
+    def _next_line(self):
+        for row in self._rows:
+            try:
+                line = "\t".join(_encode_copy_value(value) for value in row) + "\n"
+            except Exception as e:
+                if self._on_error:
+                    self._on_error(row, e)
+                    continue
+                raise
+            self.row_count += 1
+            return line.encode("utf-8")
+        return None
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 16
+        while len(self._buffer) < size:
+            line = self._next_line()
+            if line is None:
+                break
+            self._buffer += line
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.byte_count += len(chunk)
+        return chunk
+
+
+def iter_mssql_batches(cursor_mssql, query, fetch_size=FULL_SYNC_FETCH_SIZE, params=None):
+    """以 fetchmany 分批讀取 MSSQL 查詢結果"""
+    if params is None:
+        cursor_mssql.execute(query)
+    else:
+        cursor_mssql.execute(query, params)
+    while True:
+        batch = cursor_mssql.fetchmany(fetch_size)
+        if not batch:
+            break
+        yield batch
+
+
+def acquire_server_slot(server, max_concurrency, lease_seconds=ERP_SYNC_SLOT_LEASE_SECONDS):
+    """
+    取得 ERP 伺服器的同步並行名額（以共用 Redis 快取實作的計數信號量）
+
+    Returns:
+        (key, token) 或 None（名額已滿）
+    """
+    from django.core.cache import caches
+
+    cache = caches[ERP_SYNC_SLOT_CACHE_ALIAS]
+    token = uuid.uuid4().hex
+    for index in range(max(1, max_concurrency)):
+        key = f"erp_sync_slot:{server}:{index}"
+        if cache.add(key, token, timeout=lease_seconds):
+            return key, token
+    return None
+
+
+def release_server_slot(slot):
+    """釋放 acquire_server_slot 取得的名額（僅釋放自己持有的名額）"""
+    from django.core.cache import caches
+
+    if not slot:
+        return
+    cache = caches[ERP_SYNC_SLOT_CACHE_ALIAS]
+    key, token = slot
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def format_throughput(table, rows, byte_count, elapsed):
+    """格式化每張資料表的同步吞吐量"""
+    elapsed = max(elapsed, 1e-6)
+    return (
+        f"資料表 {table}：{rows} 筆，{byte_count / 1024 / 1024:.2f} MB，"
+        f"耗時 {elapsed:.2f} 秒，{rows / elapsed:.0f} 筆/秒，"
+        f"{byte_count / 1024 / 1024 / elapsed:.2f} MB/秒"
+    )
+
+
+def copy_full_table(cursor_mssql, conn_postgres, table, columns, fetch_size=FULL_SYNC_FETCH_SIZE):
+    """
+    串流全量同步單一資料表：
+    1. 建立暫存表
+    2. 以 fetchmany 分批讀取 MSSQL，透過 COPY FROM STDIN 寫入暫存表
+    3. 於單一交易內刪除舊表並將暫存表改名為正式表
+
+    Args:
+        cursor_mssql: MSSQL cursor（as_dict=True）
+        conn_postgres: psycopg2 連線（autocommit=False）
+        table: 資料表名稱
+        columns: fetch_mssql_columns 的結果
+        fetch_size: 每批讀取筆數
+
+    Returns:
+        dict: rows, bytes, seconds, rows_per_sec, bytes_per_sec, failed_rows
+    """
+    started = time.monotonic()
+    staging_table = f"{table}__staging"
+    column_names = [col["COLUMN_NAME"] for col in columns]
+    decoders = build_column_decoders(columns)
+    failed_rows = []
+
+    def on_error(row, error):
+        logger.warning(f"表 {table} 的某一行同步失敗：{str(error)}")
+        failed_rows.append(f"表 {table} 行數據：{row}")
+
+    cursor_postgres = conn_postgres.cursor()
+    try:
+        cursor_postgres.execute(f'DROP TABLE IF EXISTS "{staging_table}" CASCADE;')
+        cursor_postgres.execute(build_create_table_sql(staging_table, columns))
+
+        select_columns = ", ".join(f"[{name}]" for name in column_names)
+        rows = (
+            decode_row(row, decoders)
+            for batch in iter_mssql_batches(
+                cursor_mssql, f"SELECT {select_columns} FROM [{table}]", fetch_size
+            )
+            for row in batch
+        )
+        stream = CopyRowStream(rows, on_error=on_error)
+        quoted_columns = ", ".join(f'"{name}"' for name in column_names)
+        cursor_postgres.copy_expert(
+            f'COPY "{staging_table}" ({quoted_columns}) FROM STDIN WITH (FORMAT text)',
+            stream,
+        )
+
+        # 原子性替換：舊表在同一交易內刪除，讀取端不會看到空表
+        cursor_postgres.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE;')
+        cursor_postgres.execute(f'ALTER TABLE "{staging_table}" RENAME TO "{table}";')
+        cursor_postgres.execute(
+            f'ALTER SEQUENCE IF EXISTS "{staging_table}_row_id_seq" RENAME TO "{table}_row_id_seq";'
+        )
+        cursor_postgres.execute(
+            f'ALTER INDEX IF EXISTS "{staging_table}_pkey" RENAME TO "{table}_pkey";'
+        )
+        conn_postgres.commit()
+    except Exception:
+        conn_postgres.rollback()
+        raise
+    finally:
+        cursor_postgres.close()
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return {
+        "rows": stream.row_count,
+        "bytes": stream.byte_count,
+        "seconds": elapsed,
+        "rows_per_sec": stream.row_count / elapsed,
+        "bytes_per_sec": stream.byte_count / elapsed,
+        "failed_rows": failed_rows,
+    }
+
+
+# ==================== 增量同步（CHANGETABLE 批次 upsert） ====================
+
+# 增量同步每批處理的變更筆數（一批對應一條 INSERT ... ON CONFLICT 語句與一條 DELETE 語句）
+INCREMENTAL_CHUNK_SIZE = 1000
+
+# CHANGETABLE 的變更類型欄位（I：新增、U：修改、D：刪除）
+CHANGE_OPERATION_COLUMN = "SYS_CHANGE_OPERATION"
+
+# 明確指定每張表的主鍵欄位（根據 MSSQL 表結構）
+TABLE_PRIMARY_KEYS = {
+    "TraBillMain": ["Flag", "BillNo"],
+    "TraBillSub": ["Flag", "BillNo", "RowNo"],
+    "comCustomer": ["Flag", "ID"],
+    "ordBillMain": ["Flag", "BillNO"],
+    "ordBillSub": ["Flag", "BillNO", "RowNO"],
+    "impPurchaseMain": ["Flag", "PurchaseNo"],
+    "impPurchaseMergeSub": ["PurchaseNo", "RowNo"],
+    "impPurchaseSub": ["Flag", "PurchaseNo", "RowNo"],
+    "prdMKOrdMain": ["Flag", "MKOrdNO"],
+    "prdMkOrdMats": ["MkOrdNO", "RowNO"],
+    "stkBorrowSub": ["Flag", "BorrowNO", "RowNo"],
+    "stkYearMonthQty": ["ProdID", "WareID", "YearMonth"],
+    "comProduct": ["ProdID"],
+}
+
+COMMON_PK_NAMES = [
+    "ID",
+    "Code",
+    "Key",
+    "BillNO",
+    "RowNO",
+    "Flag",
+    "Seq",
+    "Number",
+    "WareID",
+    "YearMonth",
+]
+
+
+def resolve_primary_keys(table, column_names):
+    """
+    決定資料表的假設主鍵：先使用明確設定，其次依常見主鍵名稱推測，
+    最後退回前三個欄位；只保留實際存在於 MSSQL 表中的欄位
+    """
+    assumed_primary_keys = list(TABLE_PRIMARY_KEYS.get(table, []))
+    if not assumed_primary_keys:
+        common_names = {name.upper() for name in COMMON_PK_NAMES}
+        assumed_primary_keys = [col for col in column_names if col.upper() in common_names]
+        if not assumed_primary_keys:
+            assumed_primary_keys = column_names[:3]
+
+    valid_primary_keys = []
+    for pk in assumed_primary_keys:
+        if pk in column_names:
+            valid_primary_keys.append(pk)
+        else:
+            logger.warning(f"欄位 {pk} 在表 {table} 中不存在，跳過該主鍵欄位")
+    if not valid_primary_keys:
+        logger.warning(f"表 {table} 無有效主鍵欄位，改用第一個欄位作為主鍵")
+        valid_primary_keys = column_names[:1]
+    return valid_primary_keys
+
+
+def ensure_primary_key_index(conn_postgres, table, primary_keys):
+    """
+    確保鏡像表在假設主鍵上有唯一索引，供 ON CONFLICT 使用
+    若既有資料已有重複主鍵，保留 row_id 最大（最新）的一筆後再建立索引
+    """
+    index_name = f"{table}_sync_pk_uidx"[:63]
+    key_columns = ", ".join(f'"{pk}"' for pk in primary_keys)
+    cursor_postgres = conn_postgres.cursor()
+    try:
+        cursor_postgres.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({key_columns});'
+        )
+        conn_postgres.commit()
+    except Exception as e:
+        conn_postgres.rollback()
+        logger.warning(f"表 {table} 建立主鍵唯一索引失敗（{str(e)}），清除重複主鍵後重試")
+        match_conditions = " AND ".join(f'a."{pk}" = b."{pk}"' for pk in primary_keys)
+        cursor_postgres.execute(
+            f'DELETE FROM "{table}" a USING "{table}" b '
+            f'WHERE a."row_id" < b."row_id" AND {match_conditions};'
+        )
+        logger.info(f"表 {table} 清除 {cursor_postgres.rowcount} 筆重複主鍵資料")
+        cursor_postgres.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({key_columns});'
+        )
+        conn_postgres.commit()
+    finally:
+        cursor_postgres.close()
+
+
+def build_change_query(table, column_names, primary_keys, last_version):
+    """
+    產生讀取 CHANGETABLE 變更的 MSSQL 查詢
+    主鍵取自 CHANGETABLE，已刪除的資料列（SYS_CHANGE_OPERATION = 'D'）也會帶出主鍵
+    """
+    join_conditions = " AND ".join(f"t.[{pk}] = ct.[{pk}]" for pk in primary_keys)
+    select_columns = ", ".join(
+        f"ct.[{col}] AS [{col}]" if col in primary_keys else f"t.[{col}]"
+        for col in column_names
+    )
+    return (
+        f"SELECT ct.[{CHANGE_OPERATION_COLUMN}], {select_columns} "
+        f"FROM CHANGETABLE(CHANGES [{table}], {int(last_version)}) AS ct "
+        f"LEFT JOIN [{table}] t ON {join_conditions}"
+    )
+
+
+def build_delete_sql(table, primary_keys):
+    """產生 execute_values 使用的批次刪除語句（依主鍵）"""
+    key_columns = ", ".join(f'"{pk}"' for pk in primary_keys)
+    return f'DELETE FROM "{table}" WHERE ({key_columns}) IN (VALUES %s)'
+
+
+def build_upsert_sql(table, column_names, primary_keys):
+    """產生 execute_values 使用的 INSERT ... ON CONFLICT DO UPDATE 語句"""
+    columns_list = column_names + ["updated_at"]
+    quoted_columns = ", ".join(f'"{col}"' for col in columns_list)
+    conflict_columns = ", ".join(f'"{pk}"' for pk in primary_keys)
+    update_columns = [col for col in columns_list if col not in primary_keys]
+    set_clause = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in update_columns)
+    return (
+        f'INSERT INTO "{table}" ({quoted_columns}) VALUES %s '
+        f"ON CONFLICT ({conflict_columns}) DO UPDATE SET {set_clause}"
+    )
+
+
+def upsert_changed_rows(
+    cursor_mssql,
+    conn_postgres,
+    table,
+    columns,
+    primary_keys,
+    change_query,
+    chunk_size=INCREMENTAL_CHUNK_SIZE,
+):
+    """
+    以批次 upsert 套用 CHANGETABLE 變更：
+    - 以 fetchmany 將變更結果分批緩衝
+    - 每批以單一 INSERT ... ON CONFLICT (主鍵) DO UPDATE 寫入新增與修改
+    - 每批以單一 DELETE ... WHERE (主鍵) IN (VALUES ...) 移除已刪除的資料列
+    - 每批包在 SAVEPOINT 中，失敗只回滾該批，不影響其他批次
+
+    Args:
+        cursor_mssql: MSSQL cursor（as_dict=True）
+        conn_postgres: psycopg2 連線（autocommit=False）
+        table: 資料表名稱
+        columns: fetch_mssql_columns 的結果
+        primary_keys: resolve_primary_keys 的結果
+        change_query: 取得變更資料列的 MSSQL 查詢（build_change_query 的結果）
+        chunk_size: 每批筆數
+
+    Returns:
+        dict: rows, deleted, failed, statements, seconds, failed_rows
+    """
+    from django.utils import timezone
+    from psycopg2.extras import execute_values
+
+    started = time.monotonic()
+    column_names = [col["COLUMN_NAME"] for col in columns]
+    decoders = build_column_decoders(columns)
+    pk_positions = [column_names.index(pk) for pk in primary_keys]
+    upsert_sql = build_upsert_sql(table, column_names, primary_keys)
+    delete_sql = build_delete_sql(table, primary_keys)
+
+    ensure_primary_key_index(conn_postgres, table, primary_keys)
+
+    successful_rows = 0
+    deleted_rows = 0
+    failed_count = 0
+    statements = 0
+    failed_rows = []
+    cursor_postgres = conn_postgres.cursor()
+    try:
+        for chunk_number, batch in enumerate(
+            iter_mssql_batches(cursor_mssql, change_query, chunk_size), start=1
+        ):
+            now = timezone.now()
+            # 同一語句內不能更新同一列兩次：同批次重複主鍵只保留最後一筆（含刪除）
+            values_by_key = {}
+            for row in batch:
+                values = decode_row(row, decoders)
+                key = tuple(values[i] for i in pk_positions)
+                if row.get(CHANGE_OPERATION_COLUMN) == "D":
+                    values_by_key[key] = None
+                else:
+                    values_by_key[key] = values + [now]
+            chunk_values = [values for values in values_by_key.values() if values is not None]
+            deleted_keys = [key for key, values in values_by_key.items() if values is None]
+
+            cursor_postgres.execute("SAVEPOINT erp_sync_chunk")
+            try:
+                if chunk_values:
+                    execute_values(
+                        cursor_postgres, upsert_sql, chunk_values, page_size=len(chunk_values)
+                    )
+                    statements += 1
+                if deleted_keys:
+                    execute_values(
+                        cursor_postgres, delete_sql, deleted_keys, page_size=len(deleted_keys)
+                    )
+                    statements += 1
+                cursor_postgres.execute("RELEASE SAVEPOINT erp_sync_chunk")
+                successful_rows += len(chunk_values)
+                deleted_rows += len(deleted_keys)
+            except Exception as e:
+                cursor_postgres.execute("ROLLBACK TO SAVEPOINT erp_sync_chunk")
+                failed_count += len(values_by_key)
+                logger.warning(
+                    f"表 {table} 第 {chunk_number} 批（{len(values_by_key)} 筆）同步失敗：{str(e)}"
+                )
+                failed_rows.append(
+                    f"表 {table} 第 {chunk_number} 批，主鍵 {list(values_by_key)[:3]}... 共 {len(values_by_key)} 筆"
+                )
+        conn_postgres.commit()
+    except Exception:
+        conn_postgres.rollback()
+        raise
+    finally:
+        cursor_postgres.close()
+
+    return {
+        "rows": successful_rows,
+        "deleted": deleted_rows,
+        "failed": failed_count,
+        "statements": statements,
+        "seconds": max(time.monotonic() - started, 1e-6),
+        "failed_rows": failed_rows,
+    }
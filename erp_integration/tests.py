@@ -1,3 +1,232 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+
+from .sync_engine import (
+    ERP_SYNC_SLOT_CACHE_ALIAS,
+    acquire_server_slot,
+    build_change_query,
+    build_create_table_sql,
+    build_upsert_sql,
+    copy_full_table,
+    release_server_slot,
+    upsert_changed_rows,
+)
+
+TEST_TABLE = "erp_sync_test_items"
+
+TEST_COLUMNS = [
+    {"COLUMN_NAME": "ID", "DATA_TYPE": "int", "CHARACTER_MAXIMUM_LENGTH": None,
+     "NUMERIC_PRECISION": 10, "NUMERIC_SCALE": 0},
+    {"COLUMN_NAME": "Name", "DATA_TYPE": "nvarchar", "CHARACTER_MAXIMUM_LENGTH": 20,
+     "NUMERIC_PRECISION": None, "NUMERIC_SCALE": None},
+]
+
+BILL_COLUMNS = [
+    {"COLUMN_NAME": "Flag", "DATA_TYPE": "int", "CHARACTER_MAXIMUM_LENGTH": None,
+     "NUMERIC_PRECISION": 10, "NUMERIC_SCALE": 0},
+    {"COLUMN_NAME": "BillNo", "DATA_TYPE": "varchar", "CHARACTER_MAXIMUM_LENGTH": 20,
+     "NUMERIC_PRECISION": None, "NUMERIC_SCALE": None},
+    {"COLUMN_NAME": "Amount", "DATA_TYPE": "int", "CHARACTER_MAXIMUM_LENGTH": None,
+     "NUMERIC_PRECISION": 10, "NUMERIC_SCALE": 0},
+]
+
+
+class FakeMSSQLCursor:
+    """模擬 as_dict=True 的 MSSQL cursor，記錄執行過的查詢"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self._pending = list(self.rows)
+
+    def fetchmany(self, size):
+        batch, self._pending = self._pending[:size], self._pending[size:]
+        return batch
+
+
+class MirrorTableTestMixin:
+    """以獨立的 psycopg2 連線操作測試資料庫中的鏡像表（同步引擎會自行 commit/rollback）"""
+
+    def setUp(self):
+        super().setUp()
+        self.conn_postgres = connection.get_new_connection(connection.get_connection_params())
+        self.addCleanup(self.conn_postgres.close)
+        self.addCleanup(self.drop_tables)
+
+    def drop_tables(self):
+        self.conn_postgres.rollback()
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS "{TEST_TABLE}", "{TEST_TABLE}__staging" CASCADE;')
+        self.conn_postgres.commit()
+
+    def fetch_rows(self, table=TEST_TABLE):
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute(f'SELECT "ID", "Name" FROM "{table}" ORDER BY "ID"')
+            rows = cursor.fetchall()
+        self.conn_postgres.commit()
+        return rows
+
+    def table_exists(self, table):
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'"{table}"',))
+            exists = cursor.fetchone()[0]
+        self.conn_postgres.commit()
+        return exists
+
+
+class ServerSlotTest(TestCase):
+    """ERP 伺服器同步並行名額測試"""
+
+    def setUp(self):
+        caches[ERP_SYNC_SLOT_CACHE_ALIAS].clear()
+
+    def test_slots_are_limited_per_server(self):
+        slots = [acquire_server_slot("erp-a", 2) for _ in range(2)]
+
+        self.assertTrue(all(slots))
+        self.assertIsNone(acquire_server_slot("erp-a", 2))
+        self.assertIsNotNone(acquire_server_slot("erp-b", 2))
+
+        release_server_slot(slots[0])
+        self.assertIsNotNone(acquire_server_slot("erp-a", 2))
+
+    def test_release_ignores_slot_taken_over_after_lease(self):
+        slot = acquire_server_slot("erp-a", 1)
+        key, _ = slot
+        caches[ERP_SYNC_SLOT_CACHE_ALIAS].set(key, "other-worker")
+
+        release_server_slot(slot)
+
+        self.assertEqual(caches[ERP_SYNC_SLOT_CACHE_ALIAS].get(key), "other-worker")
+
+
+class CopyFullTableTest(MirrorTableTestMixin, TestCase):
+    """全量同步（COPY 寫入暫存表後替換正式表）測試"""
+
+    def setUp(self):
+        super().setUp()
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute(build_create_table_sql(TEST_TABLE, TEST_COLUMNS))
+            cursor.execute(f'INSERT INTO "{TEST_TABLE}" ("ID", "Name") VALUES (%s, %s)', (1, "舊資料"))
+        self.conn_postgres.commit()
+
+    def test_staging_table_replaces_mirror(self):
+        cursor_mssql = FakeMSSQLCursor([
+            {"ID": 1, "Name": "甲\t乙"},
+            {"ID": 2, "Name": "C:\\temp\n"},
+            {"ID": 3, "Name": None},
+        ])
+
+        stats = copy_full_table(cursor_mssql, self.conn_postgres, TEST_TABLE, TEST_COLUMNS, fetch_size=2)
+
+        self.assertEqual(stats["rows"], 3)
+        self.assertEqual(stats["failed_rows"], [])
+        self.assertEqual(cursor_mssql.queries, [f"SELECT [ID], [Name] FROM [{TEST_TABLE}]"])
+        self.assertEqual(self.fetch_rows(), [(1, "甲\t乙"), (2, "C:\\temp\n"), (3, None)])
+        self.assertFalse(self.table_exists(f"{TEST_TABLE}__staging"))
+
+    def test_copy_failure_keeps_mirror(self):
+        cursor_mssql = FakeMSSQLCursor([{"ID": 2, "Name": "新資料"}, {"ID": "not-a-number", "Name": "錯誤"}])
+
+        with self.assertRaises(Exception):
+            copy_full_table(cursor_mssql, self.conn_postgres, TEST_TABLE, TEST_COLUMNS)
+
+        self.assertEqual(self.fetch_rows(), [(1, "舊資料")])
+        self.assertFalse(self.table_exists(f"{TEST_TABLE}__staging"))
+
+
+class UpsertChangedRowsTest(MirrorTableTestMixin, TestCase):
+    """增量同步（CHANGETABLE 批次 upsert／刪除）測試"""
+
+    def setUp(self):
+        super().setUp()
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute(build_create_table_sql(TEST_TABLE, BILL_COLUMNS))
+            cursor.execute(
+                f'INSERT INTO "{TEST_TABLE}" ("Flag", "BillNo", "Amount") VALUES (1, %s, 10), (1, %s, 20), (2, %s, 30)',
+                ("A001", "A002", "A001"),
+            )
+        self.conn_postgres.commit()
+
+    def fetch_bills(self):
+        with self.conn_postgres.cursor() as cursor:
+            cursor.execute(f'SELECT "Flag", "BillNo", "Amount" FROM "{TEST_TABLE}" ORDER BY "Flag", "BillNo"')
+            rows = cursor.fetchall()
+        self.conn_postgres.commit()
+        return rows
+
+    def test_build_sql(self):
+        self.assertEqual(
+            build_upsert_sql("ordBillMain", ["Flag", "BillNO", "Amount"], ["Flag", "BillNO"]),
+            'INSERT INTO "ordBillMain" ("Flag", "BillNO", "Amount", "updated_at") VALUES %s '
+            'ON CONFLICT ("Flag", "BillNO") DO UPDATE SET '
+            '"Amount" = EXCLUDED."Amount", "updated_at" = EXCLUDED."updated_at"',
+        )
+        self.assertEqual(
+            build_change_query("ordBillMain", ["Flag", "BillNO", "Amount"], ["Flag", "BillNO"], 42),
+            "SELECT ct.[SYS_CHANGE_OPERATION], ct.[Flag] AS [Flag], ct.[BillNO] AS [BillNO], t.[Amount] "
+            "FROM CHANGETABLE(CHANGES [ordBillMain], 42) AS ct "
+            "LEFT JOIN [ordBillMain] t ON t.[Flag] = ct.[Flag] AND t.[BillNO] = ct.[BillNO]",
+        )
+
+    def test_applies_insert_update_delete_batches(self):
+        cursor_mssql = FakeMSSQLCursor([
+            {"SYS_CHANGE_OPERATION": "U", "Flag": 1, "BillNo": "A001", "Amount": 11},
+            {"SYS_CHANGE_OPERATION": "I", "Flag": 1, "BillNo": "A003", "Amount": 40},
+            {"SYS_CHANGE_OPERATION": "D", "Flag": 1, "BillNo": "A002", "Amount": None},
+            {"SYS_CHANGE_OPERATION": "I", "Flag": 3, "BillNo": "A001", "Amount": 50},
+            {"SYS_CHANGE_OPERATION": "U", "Flag": 3, "BillNo": "A001", "Amount": 55},
+            {"SYS_CHANGE_OPERATION": "U", "Flag": 3, "BillNo": "A001", "Amount": 56},
+        ])
+
+        stats = upsert_changed_rows(
+            cursor_mssql, self.conn_postgres, TEST_TABLE, BILL_COLUMNS, ["Flag", "BillNo"], "CHANGES", chunk_size=2,
+        )
+
+        self.assertEqual((stats["rows"], stats["deleted"], stats["failed"]), (4, 1, 0))
+        # 第 1 批 upsert，第 2 批 upsert + 刪除，第 3 批同主鍵只保留最後一筆
+        self.assertEqual(stats["statements"], 4)
+        self.assertEqual(self.fetch_bills(), [(1, "A001", 11), (1, "A003", 40), (2, "A001", 30), (3, "A001", 56)])
+
+    def test_failed_batch_is_rolled_back_alone(self):
+        cursor_mssql = FakeMSSQLCursor([
+            {"SYS_CHANGE_OPERATION": "U", "Flag": 1, "BillNo": "A001", "Amount": 11},
+            {"SYS_CHANGE_OPERATION": "D", "Flag": 1, "BillNo": "A002", "Amount": None},
+            {"SYS_CHANGE_OPERATION": "I", "Flag": 1, "BillNo": "A004", "Amount": "not-a-number"},
+            {"SYS_CHANGE_OPERATION": "D", "Flag": 2, "BillNo": "A001", "Amount": None},
+        ])
+
+        stats = upsert_changed_rows(
+            cursor_mssql, self.conn_postgres, TEST_TABLE, BILL_COLUMNS, ["Flag", "BillNo"], "CHANGES", chunk_size=2,
+        )
+
+        self.assertEqual((stats["rows"], stats["deleted"], stats["failed"]), (1, 1, 2))
+        self.assertEqual(len(stats["failed_rows"]), 1)
+        self.assertEqual(self.fetch_bills(), [(1, "A001", 11), (2, "A001", 30)])
+
+
+class SyncAllCompaniesTest(TestCase):
+    """公司設定頁的同步所有公司測試"""
+
+    def setUp(self):
+        from .models import ERPConfig
+
+        ERPConfig.objects.create(server="erp", username="sa", password="secret")
+        self.client.force_login(User.objects.create_superuser("admin", password="testpass123"))
+
+    def test_button_dispatches_all_companies_task(self):
+        from . import views
+
+        with mock.patch.object(views.sync_all_companies_task, "delay") as delay:
+            response = self.client.post(reverse("erp_integration:company_config"), {"sync_all_companies": "1"})
 
-# Create your tests here.
+        self.assertRedirects(response, reverse("erp_integration:company_config"), fetch_redirect_response=False)
+        delay.assert_called_once_with(False, "admin")
@@ -14,7 +14,8 @@ from django.contrib.auth.decorators import (
 from django.contrib import messages  # 用於顯示消息提示
 from django.utils import timezone  # 用於處理時間
 from django.db import transaction  # 用於資料庫事務管理
-from celery import shared_task  # 用於異步任務
+import time  # 用於計算同步耗時
+from celery import chord, shared_task  # 用於異步任務
 from .models import ERPConfig, CompanyConfig, ERPIntegrationOperationLog  # 導入模型
 from django_celery_beat.models import CrontabSchedule, PeriodicTask  # 重新啟用
 from django.http import JsonResponse
@@ -49,35 +50,19 @@ DATABASE_PASSWORD = "mes_password"
 DATABASE_HOST = "localhost"
 DATABASE_PORT = "5432"
 
-# MSSQL 到 PostgreSQL 的資料型態映射，確保一致性
-MSSQL_TO_PGSQL_TYPE_MAPPING = {
-    "binary": "BYTEA",
-    "varbinary": "BYTEA",
-    "bit": "BOOLEAN",
-    "char": "CHAR",
-    "nchar": "CHAR",
-    "varchar": "VARCHAR",
-    "nvarchar": "VARCHAR",
-    "text": "TEXT",
-    "ntext": "TEXT",
-    "int": "INTEGER",
-    "bigint": "BIGINT",
-    "smallint": "SMALLINT",
-    "tinyint": "SMALLINT",
-    "float": "DOUBLE PRECISION",
-    "real": "REAL",
-    "decimal": "NUMERIC",
-    "numeric": "NUMERIC",
-    "money": "NUMERIC(19,4)",
-    "smallmoney": "NUMERIC(10,4)",
-    "datetime": "TIMESTAMP",
-    "datetime2": "TIMESTAMP",
-    "smalldatetime": "TIMESTAMP",
-    "date": "DATE",
-    "time": "TIME",
-    "uniqueidentifier": "UUID",
-    "image": "BYTEA",
-}
+# MSSQL 到 PostgreSQL 的資料型態映射與同步引擎
+from .sync_engine import (
+    ERP_SYNC_SLOT_RETRY_SECONDS,
+    acquire_server_slot,
+    build_change_query,
+    build_create_table_sql,
+    copy_full_table,
+    fetch_mssql_columns,
+    format_throughput,
+    release_server_slot,
+    resolve_primary_keys,
+    upsert_changed_rows,
+)
 
 
 # 定義函數，從 JSON 配置文件中讀取允許同步的資料表清單
@@ -100,179 +85,6 @@ def superuser_required(user):
     return user.is_superuser
 
 
-# 定義全量同步函數
-def full_sync_data(
-    company, config, cursor_mssql, cursor_postgres, conn_postgres, sync_tables, user_id
-):
-    failed_tables = []
-    failed_rows = []
-
-    for table in sync_tables:
-        try:
-            # 獲取 MSSQL 資料表的欄位資訊
-            cursor_mssql.execute(
-                """
-                SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = %s
-            """,
-                (table,),
-            )
-            columns = cursor_mssql.fetchall()
-            column_names = [col["COLUMN_NAME"] for col in columns]
-
-            if not column_names:
-                logger.warning(f"資料表 {table} 沒有欄位，跳過同步")
-                continue
-
-            # 驗證欄位數量
-            expected_columns = len(column_names)
-            logger.debug(f"表 {table} 應有 {expected_columns} 個欄位：{column_names}")
-
-            # 檢查 PostgreSQL 表是否存在
-            cursor_postgres.execute(
-                """
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = %s
-                );
-            """,
-                (table,),
-            )
-            table_exists = cursor_postgres.fetchone()[0]
-            logger.debug(f"檢查表 {table} 是否存在：{table_exists}")
-
-            if table_exists:
-                cursor_postgres.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE;')
-                logger.info(f"刪除現有 PostgreSQL 表 {table}")
-                conn_postgres.commit()
-
-            # 創建 PostgreSQL 表，保留 MSSQL 型態、長度和精度
-            create_table_query = f'CREATE TABLE "{table}" ('
-            create_table_query += '"row_id" SERIAL PRIMARY KEY, '
-            for col in columns:
-                col_name = col["COLUMN_NAME"]
-                data_type = col["DATA_TYPE"].lower()
-                pg_type = MSSQL_TO_PGSQL_TYPE_MAPPING.get(data_type, "TEXT")
-                if data_type in ("varchar", "nvarchar", "char", "nchar"):
-                    length = col["CHARACTER_MAXIMUM_LENGTH"]
-                    if length and length > 0:
-                        pg_type = f"{pg_type}({length})"
-                        logger.debug(f"設置字符長度：{table}.{col_name} -> {pg_type}")
-                    elif length == -1:
-                        pg_type = "TEXT"
-                        logger.debug(f"設置為 TEXT：{table}.{col_name}")
-                elif data_type in ("numeric", "decimal"):
-                    precision = col["NUMERIC_PRECISION"]
-                    scale = col["NUMERIC_SCALE"]
-                    if precision and scale is not None:
-                        pg_type = f"NUMERIC({precision},{scale})"
-                        logger.debug(f"設置數值精度：{table}.{col_name} -> {pg_type}")
-                create_table_query += f'"{col_name}" {pg_type}, '
-            create_table_query += '"updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            create_table_query += ");"
-            cursor_postgres.execute(create_table_query)
-            conn_postgres.commit()
-            logger.info(f"在 PostgreSQL 中創建表 {table}")
-
-            # 驗證 PostgreSQL 表結構
-            cursor_postgres.execute(
-                """
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = %s
-            """,
-                (table,),
-            )
-            pg_columns = [row[0] for row in cursor_postgres.fetchall()]
-            missing_columns = [col for col in column_names if col not in pg_columns]
-            extra_columns = [
-                col
-                for col in pg_columns
-                if col not in column_names and col not in ["row_id", "updated_at"]
-            ]
-            if missing_columns:
-                logger.error(f"表 {table} 缺少欄位：{missing_columns}")
-                raise Exception(f"表 {table} 缺少欄位：{missing_columns}")
-            if extra_columns:
-                logger.error(f"表 {table} 多餘欄位：{extra_columns}")
-                raise Exception(f"表 {table} 多餘欄位：{extra_columns}")
-
-            # 同步數據
-            cursor_mssql.execute(f"SELECT * FROM {table}")
-            rows = cursor_mssql.fetchall()
-            logger.info(f"從 MSSQL 獲取表 {table} 的數據，總計 {len(rows)} 筆記錄")
-
-            successful_rows = 0
-            for row in rows:
-                try:
-                    columns_list = column_names + ["updated_at"]
-                    values = []
-                    for col in column_names:
-                        value = row[col]
-                        col_data_type = next(
-                            (
-                                c["DATA_TYPE"].lower()
-                                for c in columns
-                                if c["COLUMN_NAME"] == col
-                            ),
-                            "text",
-                        )
-                        if value is None:
-                            values.append(None)
-                        elif isinstance(value, bytes):
-                            if col_data_type in ("varbinary", "binary", "image"):
-                                values.append(value)
-                            else:
-                                try:
-                                    value = value.decode(
-                                        "utf-16-le", errors="replace"
-                                    ).replace("\x00", "")
-                                except UnicodeDecodeError:
-                                    value = value.decode(
-                                        "cp950", errors="replace"
-                                    ).replace("\x00", "")
-                                values.append(value)
-                        elif isinstance(value, str):
-                            values.append(value.replace("\x00", ""))
-                        else:
-                            values.append(value)
-                    values.append(timezone.now())
-
-                    placeholders = ", ".join(["%s"] * len(columns_list))
-                    insert_query = f"""
-                        INSERT INTO "{table}" ({', '.join([f'"{col}"' for col in columns_list])})
-                        VALUES ({placeholders})
-                        RETURNING "row_id";
-                    """
-                    cursor_postgres.execute(insert_query, values)
-                    if cursor_postgres.fetchone():
-                        successful_rows += 1
-                except Exception as e:
-                    logger.warning(f"表 {table} 的某一行同步失敗：{str(e)}")
-                    failed_rows.append(f"表 {table} 行數據：{row}")
-                    conn_postgres.rollback()
-                    cursor_postgres = conn_postgres.cursor()
-                    continue
-
-            conn_postgres.commit()
-            logger.info(f"成功同步資料表 {table}，{successful_rows} 筆記錄")
-
-        except Exception as e:
-            failed_tables.append(table)
-            logger.error(f"同步資料表 {table} 失敗：{str(e)}")
-            ERPIntegrationOperationLog.objects.create(
-                user=user_id,
-                action=f"同步資料表 {table} 失敗：{str(e)[:900]}",
-                timestamp=timezone.now(),
-            )
-            conn_postgres.rollback()
-            continue
-
-    return failed_tables, failed_rows
-
-
 # 定義首頁視圖，僅允許登入的超級用戶訪問
 @login_required
 @user_passes_test(superuser_required, login_url="/accounts/login/")
@@ -371,7 +183,7 @@ def config(request):
     )
 
 
-# 定義全量同步函數
+# 定義全量同步函數：串流讀取 MSSQL，COPY 至暫存表後原子性替換
 def full_sync_data(
     company, config, cursor_mssql, cursor_postgres, conn_postgres, sync_tables, user_id
 ):
@@ -380,151 +192,23 @@ def full_sync_data(
 
     for table in sync_tables:
         try:
-            cursor_mssql.execute(
-                """
-                SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = %s
-            """,
-                (table,),
-            )
-            columns = cursor_mssql.fetchall()
-            column_names = [col["COLUMN_NAME"] for col in columns]
-
-            if not column_names:
+            columns = fetch_mssql_columns(cursor_mssql, table)
+            if not columns:
                 logger.warning(f"資料表 {table} 沒有欄位，跳過同步")
                 continue
 
-            # 驗證欄位數量
-            expected_columns = len(column_names)
-            logger.debug(f"表 {table} 應有 {expected_columns} 個欄位：{column_names}")
+            stats = copy_full_table(cursor_mssql, conn_postgres, table, columns)
+            failed_rows.extend(stats["failed_rows"])
 
-            cursor_postgres.execute(
-                """
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = %s
-                );
-            """,
-                (table,),
+            throughput = format_throughput(
+                table, stats["rows"], stats["bytes"], stats["seconds"]
             )
-            table_exists = cursor_postgres.fetchone()[0]
-            logger.debug(f"檢查表 {table} 是否存在：{table_exists}")
-
-            if table_exists:
-                cursor_postgres.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE;')
-                logger.info(f"刪除現有 PostgreSQL 表 {table}")
-                conn_postgres.commit()
-
-            create_table_query = f'CREATE TABLE "{table}" ('
-            create_table_query += '"row_id" SERIAL PRIMARY KEY, '
-            for col in columns:
-                col_name = col["COLUMN_NAME"]
-                data_type = col["DATA_TYPE"].lower()
-                pg_type = MSSQL_TO_PGSQL_TYPE_MAPPING.get(data_type, "TEXT")
-                if data_type in ("varchar", "nvarchar", "char", "nchar"):
-                    length = col["CHARACTER_MAXIMUM_LENGTH"]
-                    if length and length > 0:
-                        pg_type = f"{pg_type}({length})"
-                        logger.debug(f"設置字符長度：{table}.{col_name} -> {pg_type}")
-                    elif length == -1:
-                        pg_type = "TEXT"
-                        logger.debug(f"設置為 TEXT：{table}.{col_name}")
-                elif data_type in ("numeric", "decimal", "money", "smallmoney"):
-                    precision = col["NUMERIC_PRECISION"]
-                    scale = col["NUMERIC_SCALE"]
-                    if precision and scale is not None:
-                        pg_type = f"NUMERIC({precision},{scale})"
-                        logger.debug(f"設置數值精度：{table}.{col_name} -> {pg_type}")
-                create_table_query += f'"{col_name}" {pg_type}, '
-            create_table_query += '"updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            create_table_query += ");"
-            cursor_postgres.execute(create_table_query)
-            conn_postgres.commit()
-            logger.info(f"在 PostgreSQL 中創建表 {table}")
-
-            # 驗證 PostgreSQL 表結構
-            cursor_postgres.execute(
-                """
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = %s
-            """,
-                (table,),
+            logger.info(f"公司 {company.company_name} 全量同步完成，{throughput}")
+            ERPIntegrationOperationLog.objects.create(
+                user=user_id,
+                action=f"公司 {company.company_name} 全量同步{throughput}"[:1000],
+                timestamp=timezone.now(),
             )
-            pg_columns = [row[0] for row in cursor_postgres.fetchall()]
-            missing_columns = [col for col in column_names if col not in pg_columns]
-            extra_columns = [
-                col
-                for col in pg_columns
-                if col not in column_names and col not in ["row_id", "updated_at"]
-            ]
-            if missing_columns:
-                logger.error(f"表 {table} 缺少欄位：{missing_columns}")
-                raise Exception(f"表 {table} 缺少欄位：{missing_columns}")
-            if extra_columns:
-                logger.error(f"表 {table} 多餘欄位：{extra_columns}")
-                raise Exception(f"表 {table} 多餘欄位：{extra_columns}")
-
-            cursor_mssql.execute(f"SELECT * FROM {table}")
-            rows = cursor_mssql.fetchall()
-            logger.info(f"從 MSSQL 獲取表 {table} 的數據，總計 {len(rows)} 筆記錄")
-
-            successful_rows = 0
-            for row in rows:
-                try:
-                    columns_list = column_names + ["updated_at"]
-                    values = []
-                    for col in column_names:
-                        value = row[col]
-                        col_data_type = next(
-                            (
-                                c["DATA_TYPE"].lower()
-                                for c in columns
-                                if c["COLUMN_NAME"] == col
-                            ),
-                            "text",
-                        )
-                        if value is None:
-                            values.append(None)
-                        elif isinstance(value, bytes):
-                            if col_data_type in ("varbinary", "binary", "image"):
-                                values.append(value)
-                            else:
-                                try:
-                                    value = value.decode(
-                                        "utf-16-le", errors="replace"
-                                    ).replace("\x00", "")
-                                except UnicodeDecodeError:
-                                    value = value.decode(
-                                        "cp950", errors="replace"
-                                    ).replace("\x00", "")
-                                values.append(value)
-                        elif isinstance(value, str):
-                            values.append(value.replace("\x00", ""))
-                        else:
-                            values.append(value)
-                    values.append(timezone.now())
-
-                    placeholders = ", ".join(["%s"] * len(columns_list))
-                    insert_query = f"""
-                        INSERT INTO "{table}" ({', '.join([f'"{col}"' for col in columns_list])})
-                        VALUES ({placeholders})
-                        RETURNING "row_id";
-                    """
-                    cursor_postgres.execute(insert_query, values)
-                    if cursor_postgres.fetchone():
-                        successful_rows += 1
-                except Exception as e:
-                    logger.warning(f"表 {table} 的某一行同步失敗：{str(e)}")
-                    failed_rows.append(f"表 {table} 行數據：{row}")
-                    conn_postgres.rollback()
-                    cursor_postgres = conn_postgres.cursor()
-                    continue
-
-            conn_postgres.commit()
-            logger.info(f"成功同步資料表 {table}，{successful_rows} 筆記錄")
 
         except Exception as e:
             failed_tables.append(table)
@@ -547,6 +231,19 @@ def company_config(request):
     companies = CompanyConfig.objects.all()
 
     if request.method == "POST":
+        if "sync_all_companies" in request.POST:
+            config = ERPConfig.objects.first()
+            if not config or not config.server or not config.username or not config.password:
+                messages.error(request, "ERP 連線設定不完整！請先完成設定。")
+                return redirect("erp_integration:config")
+
+            sync_all_companies_task.delay(False, request.user.username)
+            messages.success(
+                request,
+                "已提交所有公司的增量同步任務，同步正在後台執行，請稍後查看操作日誌！",
+            )
+            return redirect("erp_integration:company_config")
+
         if "sync_data" in request.POST or "full_sync_data" in request.POST:
             company_id = request.POST.get("company_id")
             company = get_object_or_404(CompanyConfig, id=company_id)
@@ -699,7 +396,33 @@ def company_config(request):
     )
 
 
+def _open_sync_connections(config, company):
+    """為單一同步工作開啟專屬的 MSSQL 與 PostgreSQL 連線"""
+    conn_mssql = pymssql.connect(
+        server=config.server,
+        user=config.username,
+        password=config.password,
+        database=company.mssql_database,
+        timeout=30,
+        tds_version="7.0",
+    )
+    try:
+        conn_postgres = psycopg2.connect(
+            dbname=company.mes_database,
+            user=DATABASE_USER,
+            password=DATABASE_PASSWORD,
+            host=DATABASE_HOST,
+            port=DATABASE_PORT,
+        )
+    except Exception:
+        conn_mssql.close()
+        raise
+    conn_postgres.autocommit = False
+    return conn_mssql, conn_postgres
+
+
 # 定義異步任務，用於執行資料同步（入口函數）
+# 檢查版本後將每張資料表分派為獨立的 sync_table_task，全部完成後由 finalize_company_sync_task 收尾
 @shared_task
 def sync_data_task(company_id, full_sync, user_id):
     try:
@@ -721,28 +444,7 @@ def sync_data_task(company_id, full_sync, user_id):
         return
 
     conn_mssql = None
-    conn_postgres = None
     try:
-        conn_mssql = pymssql.connect(
-            server=config.server,
-            user=config.username,
-            password=config.password,
-            database=company.mssql_database,
-            timeout=30,
-            tds_version="7.0",
-        )
-        cursor_mssql = conn_mssql.cursor(as_dict=True)
-
-        conn_postgres = psycopg2.connect(
-            dbname=company.mes_database,
-            user=DATABASE_USER,
-            password=DATABASE_PASSWORD,
-            host=DATABASE_HOST,
-            port=DATABASE_PORT,
-        )
-        conn_postgres.autocommit = False
-        cursor_postgres = conn_postgres.cursor()
-
         sync_tables = company.sync_tables.split(",") if company.sync_tables else []
         all_table_names = load_allowed_tables()
 
@@ -757,6 +459,15 @@ def sync_data_task(company_id, full_sync, user_id):
             logger.warning(f"公司 {company.company_name} 的同步資料表無效！")
             return
 
+        conn_mssql = pymssql.connect(
+            server=config.server,
+            user=config.username,
+            password=config.password,
+            database=company.mssql_database,
+            timeout=30,
+            tds_version="7.0",
+        )
+        cursor_mssql = conn_mssql.cursor(as_dict=True)
         cursor_mssql.execute(
             "SELECT CHANGE_TRACKING_CURRENT_VERSION() AS CurrentVersion"
         )
@@ -768,20 +479,12 @@ def sync_data_task(company_id, full_sync, user_id):
             return
 
         if full_sync:
+            last_version = 0
             company.last_sync_version = 0
             company.save(update_fields=["last_sync_version"])
             logger.info(
                 f"執行全量同步，重置公司 {company.company_name} 的 last_sync_version 為 0"
             )
-            failed_tables, failed_rows = full_sync_data(
-                company,
-                config,
-                cursor_mssql,
-                cursor_postgres,
-                conn_postgres,
-                sync_tables,
-                user_id,
-            )
         else:
             last_version = company.last_sync_version or 0
             if last_version >= current_version:
@@ -793,38 +496,20 @@ def sync_data_task(company_id, full_sync, user_id):
             logger.info(
                 f"公司 {company.company_name} 有新變更（從版本 {last_version} 到 {current_version}），開始增量同步"
             )
-            failed_tables, failed_rows = incremental_sync_data(
-                company,
-                config,
-                cursor_mssql,
-                cursor_postgres,
-                conn_postgres,
-                sync_tables,
-                user_id,
-                last_version,
-                current_version,
-            )
-
-        company.last_sync_version = current_version
-        company.last_sync_time = timezone.now()
-        company.save(update_fields=["last_sync_version", "last_sync_time"])
-        logger.info(
-            f"更新公司 {company.company_name} 的 last_sync_version 為 {current_version}"
-        )
 
-        sync_type = "全量同步" if full_sync else "增量同步"
-        if failed_tables:
-            ERPIntegrationOperationLog.objects.create(
-                user=user_id,
-                action=f"公司 {company.company_name} 資料{sync_type}部分成功，失敗資料表：{','.join(failed_tables)}\n失敗行：{'; '.join(failed_rows)[:900]}",
-                timestamp=timezone.now(),
+        chord(
+            sync_table_task.s(
+                company_id, table, full_sync, user_id, last_version, current_version
             )
-        else:
-            ERPIntegrationOperationLog.objects.create(
-                user=user_id,
-                action=f"公司 {company.company_name} 資料{sync_type}成功，同步資料表：{', '.join(sync_tables)}",
-                timestamp=timezone.now(),
+            for table in sync_tables
+        )(
+            finalize_company_sync_task.s(
+                company_id, full_sync, user_id, current_version, sync_tables
             )
+        )
+        logger.info(
+            f"公司 {company.company_name} 已分派 {len(sync_tables)} 張資料表的同步工作"
+        )
 
     except Exception as e:
         error_msg = str(e) if str(e) else "未知錯誤"
@@ -840,11 +525,128 @@ def sync_data_task(company_id, full_sync, user_id):
     finally:
         if conn_mssql:
             conn_mssql.close()
+
+
+# 定義單表同步任務：每個工作使用自己的 MSSQL 與 PostgreSQL 連線，並受每台 ERP 伺服器的並行上限控制
+@shared_task(bind=True, max_retries=None)
+def sync_table_task(
+    self, company_id, table, full_sync, user_id, last_version, current_version
+):
+    company = CompanyConfig.objects.get(id=company_id)
+    config = ERPConfig.objects.first()
+
+    slot = acquire_server_slot(
+        config.server, settings.ERP_SYNC_MAX_CONCURRENCY_PER_SERVER
+    )
+    if slot is None:
+        logger.debug(f"ERP 伺服器 {config.server} 同步並行數已滿，資料表 {table} 稍後重試")
+        raise self.retry(countdown=ERP_SYNC_SLOT_RETRY_SECONDS)
+
+    conn_mssql = None
+    conn_postgres = None
+    started = time.monotonic()
+    try:
+        conn_mssql, conn_postgres = _open_sync_connections(config, company)
+        cursor_mssql = conn_mssql.cursor(as_dict=True)
+        cursor_postgres = conn_postgres.cursor()
+
+        if full_sync:
+            failed_tables, failed_rows = full_sync_data(
+                company,
+                config,
+                cursor_mssql,
+                cursor_postgres,
+                conn_postgres,
+                [table],
+                user_id,
+            )
+        else:
+            failed_tables, failed_rows = incremental_sync_data(
+                company,
+                config,
+                cursor_mssql,
+                cursor_postgres,
+                conn_postgres,
+                [table],
+                user_id,
+                last_version,
+                current_version,
+            )
+    except Exception as e:
+        logger.error(
+            f"公司 {company.company_name} 資料表 {table} 同步失敗：{str(e)}\n堆疊資訊：{traceback.format_exc()}"
+        )
+        ERPIntegrationOperationLog.objects.create(
+            user=user_id,
+            action=f"同步資料表 {table} 失敗：{str(e)[:900]}",
+            timestamp=timezone.now(),
+        )
+        failed_tables, failed_rows = [table], []
+    finally:
+        if conn_mssql:
+            conn_mssql.close()
         if conn_postgres:
             conn_postgres.close()
+        release_server_slot(slot)
 
+    return {
+        "table": table,
+        "failed": bool(failed_tables),
+        "failed_rows": failed_rows[:20],
+        "seconds": round(time.monotonic() - started, 2),
+    }
 
-# 定義變更追蹤同步函數
+
+# 定義公司同步收尾任務：所有資料表完成後更新同步版本並記錄結果
+@shared_task
+def finalize_company_sync_task(
+    results, company_id, full_sync, user_id, current_version, sync_tables
+):
+    company = CompanyConfig.objects.get(id=company_id)
+    failed_tables = [result["table"] for result in results if result["failed"]]
+    failed_rows = [row for result in results for row in result["failed_rows"]]
+    timings = ", ".join(
+        f"{result['table']} {result['seconds']:.1f}s"
+        for result in sorted(results, key=lambda r: -r["seconds"])
+    )
+
+    company.last_sync_version = current_version
+    company.last_sync_time = timezone.now()
+    company.save(update_fields=["last_sync_version", "last_sync_time"])
+    logger.info(
+        f"更新公司 {company.company_name} 的 last_sync_version 為 {current_version}，各表耗時：{timings}"
+    )
+
+    sync_type = "全量同步" if full_sync else "增量同步"
+    if failed_tables:
+        ERPIntegrationOperationLog.objects.create(
+            user=user_id,
+            action=f"公司 {company.company_name} 資料{sync_type}部分成功，失敗資料表：{','.join(failed_tables)}\n失敗行：{'; '.join(failed_rows)[:900]}"[:1000],
+            timestamp=timezone.now(),
+        )
+    else:
+        ERPIntegrationOperationLog.objects.create(
+            user=user_id,
+            action=f"公司 {company.company_name} 資料{sync_type}成功，同步資料表：{', '.join(sync_tables)}；耗時：{timings}"[:1000],
+            timestamp=timezone.now(),
+        )
+
+
+# 定義多公司同步任務：將所有已設定的公司同時分派，實際並行數由每台 ERP 伺服器的上限控制
+@shared_task
+def sync_all_companies_task(full_sync=False, user_id="system"):
+    companies = CompanyConfig.objects.exclude(mssql_database="").exclude(
+        mes_database=""
+    ).exclude(sync_tables="")
+    count = 0
+    for company in companies:
+        sync_data_task.delay(company.id, full_sync, user_id)
+        count += 1
+    logger.info(f"已分派 {count} 間公司的資料同步")
+    return count
+
+
+# 定義變更追蹤同步函數：CHANGETABLE 結果分批以 INSERT ... ON CONFLICT 套用
 def incremental_sync_data(
     company,
     config,
@@ -859,74 +661,17 @@ def incremental_sync_data(
     failed_tables = []
     failed_rows = []
 
-    # 明確指定每張表的主鍵欄位（根據 MSSQL 表結構）
-    table_primary_keys = {
-        "TraBillMain": ["Flag", "BillNo"],
-        "TraBillSub": ["Flag", "BillNo", "RowNo"],
-        "comCustomer": ["Flag", "ID"],
-        "ordBillMain": ["Flag", "BillNO"],
-        "ordBillSub": ["Flag", "BillNO", "RowNO"],
-        "impPurchaseMain": ["Flag", "PurchaseNo"],
-        "impPurchaseMergeSub": ["PurchaseNo", "RowNo"],
-        "impPurchaseSub": ["Flag", "PurchaseNo", "RowNo"],
-        "prdMKOrdMain": ["Flag", "MKOrdNO"],
-        "prdMkOrdMats": ["MkOrdNO", "RowNO"],
-        "stkBorrowSub": ["Flag", "BorrowNO", "RowNo"],
-        "stkYearMonthQty": ["ProdID", "WareID", "YearMonth"],
-        "comProduct": ["ProdID"],
-    }
-
     for table in sync_tables:
         try:
-            # 獲取 MSSQL 資料表的欄位資訊
-            cursor_mssql.execute(
-                """
-                SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE
-                FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_NAME = %s
-            """,
-                (table,),
-            )
-            columns = cursor_mssql.fetchall()
+            columns = fetch_mssql_columns(cursor_mssql, table)
             column_names = [col["COLUMN_NAME"] for col in columns]
 
             if not column_names:
                 logger.warning(f"資料表 {table} 沒有欄位，跳過同步")
                 continue
 
-            # 驗證欄位數量
-            expected_columns = len(column_names)
-            logger.debug(f"表 {table} 應有 {expected_columns} 個欄位：{column_names}")
-
-            # 使用硬編碼的主鍵欄位
-            assumed_primary_keys = table_primary_keys.get(table, [])
-            if not assumed_primary_keys:
-                common_pk_names = [
-                    "ID",
-                    "Code",
-                    "Key",
-                    "BillNO",
-                    "RowNO",
-                    "Flag",
-                    "Seq",
-                    "Number",
-                    "WareID",
-                    "YearMonth",
-                ]
-                for col in column_names:
-                    if col.upper() in [name.upper() for name in common_pk_names]:
-                        assumed_primary_keys.append(col)
-                if not assumed_primary_keys:
-                    assumed_primary_keys = (
-                        column_names[:3] if len(column_names) >= 3 else column_names
-                    )
-
-            if not assumed_primary_keys:
-                logger.warning(
-                    f"資料表 {table} 沒有足夠的欄位來假設主鍵，將直接插入數據"
-                )
-            else:
-                logger.info(f"使用資料表 {table} 的主鍵欄位：{assumed_primary_keys}")
+            primary_keys = resolve_primary_keys(table, column_names)
+            logger.info(f"使用資料表 {table} 的主鍵欄位：{primary_keys}")
 
             # 檢查 PostgreSQL 中是否已存在該表
             cursor_postgres.execute(
@@ -943,226 +688,61 @@ def incremental_sync_data(
             logger.debug(f"檢查表 {table} 是否存在：{table_exists}")
 
             if not table_exists:
-                create_table_query = f'CREATE TABLE "{table}" ('
-                create_table_query += '"row_id" SERIAL PRIMARY KEY, '
-                for col in columns:
-                    col_name = col["COLUMN_NAME"]
-                    data_type = col["DATA_TYPE"].lower()
-                    pg_type = MSSQL_TO_PGSQL_TYPE_MAPPING.get(data_type, "TEXT")
-                    if data_type in ("varchar", "nvarchar", "char", "nchar"):
-                        length = col["CHARACTER_MAXIMUM_LENGTH"]
-                        if length and length > 0:
-                            pg_type = f"{pg_type}({length})"
-                            logger.debug(
-                                f"設置字符長度：{table}.{col_name} -> {pg_type}"
-                            )
-                        elif length == -1:
-                            pg_type = "TEXT"
-                            logger.debug(f"設置為 TEXT：{table}.{col_name}")
-                    elif data_type in ("numeric", "decimal", "money", "smallmoney"):
-                        precision = col["NUMERIC_PRECISION"]
-                        scale = col["NUMERIC_SCALE"]
-                        if precision and scale is not None:
-                            pg_type = f"NUMERIC({precision},{scale})"
-                            logger.debug(
-                                f"設置數值精度：{table}.{col_name} -> {pg_type}"
-                            )
-                    create_table_query += f'"{col_name}" {pg_type}, '
-                create_table_query += '"updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-                create_table_query += ");"
-                cursor_postgres.execute(create_table_query)
+                cursor_postgres.execute(build_create_table_sql(table, columns))
                 conn_postgres.commit()
                 logger.info(f"在 PostgreSQL 中創建表 {table}")
             else:
                 cursor_postgres.execute(
                     """
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_schema = 'public' 
-                        AND table_name = %s 
-                        AND column_name = 'row_id'
-                    );
+                    SELECT column_name
+                    FROM information_schema.columns
+                    WHERE table_schema = 'public' AND table_name = %s
                 """,
                     (table,),
                 )
-                has_row_id = cursor_postgres.fetchone()[0]
-                if not has_row_id:
+                pg_columns = [row[0] for row in cursor_postgres.fetchall()]
+                if "row_id" not in pg_columns:
                     cursor_postgres.execute(
                         f'ALTER TABLE "{table}" ADD COLUMN "row_id" SERIAL PRIMARY KEY;'
                     )
                     logger.info(f"為表 {table} 添加 row_id 欄位")
-                    conn_postgres.commit()
-
-                cursor_postgres.execute(
-                    """
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_schema = 'public' 
-                        AND table_name = %s 
-                        AND column_name = 'updated_at'
-                    );
-                """,
-                    (table,),
-                )
-                has_updated_at = cursor_postgres.fetchone()[0]
-                if not has_updated_at:
+                if "updated_at" not in pg_columns:
                     cursor_postgres.execute(
                         f'ALTER TABLE "{table}" ADD COLUMN "updated_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP;'
                     )
                     logger.info(f"為表 {table} 添加 updated_at 欄位")
-                    conn_postgres.commit()
+                conn_postgres.commit()
 
-            # 驗證 PostgreSQL 表結構
-            cursor_postgres.execute(
-                """
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = %s
-            """,
-                (table,),
+                missing_columns = [col for col in column_names if col not in pg_columns]
+                extra_columns = [
+                    col
+                    for col in pg_columns
+                    if col not in column_names and col not in ["row_id", "updated_at"]
+                ]
+                if missing_columns:
+                    logger.error(f"表 {table} 缺少欄位：{missing_columns}")
+                    raise Exception(f"表 {table} 缺少欄位：{missing_columns}")
+                if extra_columns:
+                    logger.error(f"表 {table} 多餘欄位：{extra_columns}")
+                    raise Exception(f"表 {table} 多餘欄位：{extra_columns}")
+
+            # 增量同步：使用 MSSQL 變更追蹤（含已刪除的資料列）
+            query = build_change_query(table, column_names, primary_keys, last_version)
+            stats = upsert_changed_rows(
+                cursor_mssql, conn_postgres, table, columns, primary_keys, query
             )
-            pg_columns = [row[0] for row in cursor_postgres.fetchall()]
-            missing_columns = [col for col in column_names if col not in pg_columns]
-            extra_columns = [
-                col
-                for col in pg_columns
-                if col not in column_names and col not in ["row_id", "updated_at"]
-            ]
-            if missing_columns:
-                logger.error(f"表 {table} 缺少欄位：{missing_columns}")
-                raise Exception(f"表 {table} 缺少欄位：{missing_columns}")
-            if extra_columns:
-                logger.error(f"表 {table} 多餘欄位：{extra_columns}")
-                raise Exception(f"表 {table} 多餘欄位：{extra_columns}")
-
-            # 增量同步：使用 MSSQL 變更追蹤
-            if assumed_primary_keys:
-                valid_primary_keys = []
-                for pk in assumed_primary_keys:
-                    if pk in column_names:
-                        valid_primary_keys.append(pk)
-                    else:
-                        logger.warning(
-                            f"欄位 {pk} 在表 {table} 中不存在，跳過該主鍵欄位"
-                        )
-                if not valid_primary_keys:
-                    logger.warning(f"表 {table} 無有效主鍵欄位，將直接插入數據")
-                    valid_primary_keys = column_names[:1]
-
-                join_conditions = " AND ".join(
-                    [f"t.[{pk}] = ct.[{pk}]" for pk in valid_primary_keys]
-                )
-                query = f"""
-                    SELECT t.*
-                    FROM CHANGETABLE(CHANGES {table}, {last_version}) AS ct
-                    JOIN {table} t
-                    ON {join_conditions}
-                """
-            else:
-                query = f"""
-                    SELECT t.*
-                    FROM CHANGETABLE(CHANGES {table}, {last_version}) AS ct
-                    JOIN {table} t
-                    ON 1=1
-                """
-            cursor_mssql.execute(query)
-            rows = cursor_mssql.fetchall()
-            logger.info(
-                f"從 MSSQL 獲取表 {table} 的增量數據，總計 {len(rows)} 筆記錄（從版本 {last_version} 到 {current_version}）"
+            failed_rows.extend(stats["failed_rows"])
+            summary = (
+                f"資料表 {table}：{stats['rows']} 筆，刪除 {stats['deleted']} 筆，失敗 {stats['failed']} 筆，"
+                f"{stats['statements']} 條批次語句，耗時 {stats['seconds']:.2f} 秒"
+                f"（從版本 {last_version} 到 {current_version}）"
+            )
+            logger.info(f"公司 {company.company_name} 增量同步完成，{summary}")
+            ERPIntegrationOperationLog.objects.create(
+                user=user_id,
+                action=f"公司 {company.company_name} 增量同步{summary}"[:1000],
+                timestamp=timezone.now(),
             )
-
-            successful_rows = 0
-            total_rows_processed = 0
-            for row in rows:
-                total_rows_processed += 1
-                try:
-                    columns_list = column_names + ["updated_at"]
-                    values = []
-                    for col in column_names:
-                        value = row[col]
-                        col_data_type = next(
-                            (
-                                c["DATA_TYPE"].lower()
-                                for c in columns
-                                if c["COLUMN_NAME"] == col
-                            ),
-                            "text",
-                        )
-                        if value is None:
-                            values.append(None)
-                        elif isinstance(value, bytes):
-                            if col_data_type in ("varbinary", "binary", "image"):
-                                values.append(value)
-                            else:
-                                try:
-                                    value = value.decode(
-                                        "utf-16-le", errors="replace"
-                                    ).replace("\x00", "")
-                                except UnicodeDecodeError:
-                                    value = value.decode(
-                                        "cp950", errors="replace"
-                                    ).replace("\x00", "")
-                                values.append(value)
-                        elif isinstance(value, str):
-                            values.append(value.replace("\x00", ""))
-                        else:
-                            values.append(value)
-                    values.append(timezone.now())
-
-                    if assumed_primary_keys:
-                        check_conditions = " AND ".join(
-                            [f'"{pk}" = %s' for pk in valid_primary_keys]
-                        )
-                        check_values = [row[pk] for pk in valid_primary_keys]
-                        cursor_postgres.execute(
-                            f'SELECT "row_id" FROM "{table}" WHERE {check_conditions}',
-                            check_values,
-                        )
-                        exists = cursor_postgres.fetchone()
-
-                        if exists:
-                            set_clause = ", ".join(
-                                [f'"{col}" = %s' for col in column_names]
-                            )
-                            cursor_postgres.execute(
-                                f"""
-                                UPDATE "{table}"
-                                SET {set_clause}, "updated_at" = %s
-                                WHERE {check_conditions}
-                                """,
-                                values[:-1] + [timezone.now()] + check_values,
-                            )
-                            successful_rows += 1
-                        else:
-                            placeholders = ", ".join(["%s"] * len(columns_list))
-                            insert_query = f"""
-                                INSERT INTO "{table}" ({', '.join([f'"{col}"' for col in columns_list])})
-                                VALUES ({placeholders})
-                                RETURNING "row_id";
-                            """
-                            cursor_postgres.execute(insert_query, values)
-                            if cursor_postgres.fetchone():
-                                successful_rows += 1
-                    else:
-                        placeholders = ", ".join(["%s"] * len(columns_list))
-                        insert_query = f"""
-                            INSERT INTO "{table}" ({', '.join([f'"{col}"' for col in columns_list])})
-                            VALUES ({placeholders})
-                            RETURNING "row_id";
-                        """
-                        cursor_postgres.execute(insert_query, values)
-                        if cursor_postgres.fetchone():
-                            successful_rows += 1
-
-                except Exception as e:
-                    logger.warning(f"表 {table} 的某一行同步失敗：{str(e)}")
-                    failed_rows.append(f"表 {table} 行數據：{row}")
-                    conn_postgres.rollback()
-                    cursor_postgres = conn_postgres.cursor()
-                    continue
-
-            conn_postgres.commit()
-            logger.info(f"成功同步資料表 {table}，{successful_rows} 筆記錄")
 
         except Exception as e:
             failed_tables.append(table)
@@ -13,6 +13,7 @@ from .models import (
 )
 from .utils import log_user_operation
 from collections import Counter
+from system.permission_resolver import user_in_groups
 
 import os
 # 設定看板模組的日誌記錄器
@@ -28,7 +29,7 @@ kanban_logger.setLevel(logging.INFO)
 
 # 檢查用戶是否屬於「看板使用者」群組，或者是超級用戶
 def kanban_user_required(user):
-    return user.is_superuser or user.groups.filter(name="看板使用者").exists()
+    return user.is_superuser or user_in_groups(user, "看板使用者")
 
 
 @login_required
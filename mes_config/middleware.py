@@ -12,6 +12,9 @@ from django.contrib.auth import logout
 from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.utils.functional import SimpleLazyObject
+
+from system.permission_resolver import get_effective_permissions
 
 logger = logging.getLogger(__name__)
 
@@ -60,26 +63,31 @@ class RobustSessionMiddleware(SessionMiddleware):
 
 class DatabaseConnectionMiddleware:
     """
-    資料庫連線檢查中間件
+    資料庫連線錯誤處理中間件
+    不在每個請求前執行 SELECT 1：持久連線由 CONN_HEALTH_CHECKS 在重用前檢查，
+    服務狀態改由 /healthz 提供；只有在請求處理中發生資料庫連線錯誤時才導向錯誤頁面
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # 檢查資料庫連線
-        try:
-            from django.db import connection
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT 1")
-        except Exception as e:
-            logger.error(f"資料庫連線檢查失敗: {str(e)}")
-            # 如果資料庫連線失敗，重定向到錯誤頁面
-            from django.http import HttpResponseRedirect
-            return HttpResponseRedirect('/database-error/')
+        return self.get_response(request)
+    
+    def process_exception(self, request, exception):
+        from django.db import InterfaceError, OperationalError
         
-        response = self.get_response(request)
-        return response 
+        if not isinstance(exception, (InterfaceError, OperationalError)):
+            return None
+        
+        logger.error(f"資料庫連線失敗: {str(exception)}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'error': 'database_unavailable',
+                'message': '資料庫連線失敗，請稍後再試',
+                'redirect_url': '/database-error/'
+            }, status=503)
+        return HttpResponseRedirect('/database-error/')
 
 
 class CompanyCodeMiddleware:
@@ -169,6 +177,10 @@ class PermissionCheckMiddleware:
         if request.permission_check_enabled:
             # 載入用戶的權限細分設定
             self._load_user_permissions(request)
+            # 有效權限（作業員／工序／設備範圍與群組）於第一次使用時解析，同一請求只計算一次
+            request.effective_permissions = SimpleLazyObject(
+                lambda: get_effective_permissions(request.user)
+            )
         
         response = self.get_response(request)
         return response
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from django.db import connections
 import mimetypes
@@ -67,7 +68,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",  # 重新啟用認證
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "mes_config.middleware.DatabaseConnectionMiddleware",  # 資料庫連線檢查中間件
+    "mes_config.middleware.DatabaseConnectionMiddleware",  # 資料庫連線錯誤處理中間件
     "mes_config.middleware.CompanyCodeMiddleware",  # 公司代號中間件
     "mes_config.middleware.DataIsolationMiddleware",  # 資料隔離中間件
 ]
@@ -180,6 +181,9 @@ TEMPLATES = [
 WSGI_APPLICATION = env("WSGI_APPLICATION", default="mes_config.wsgi.application")
 
 # 保留原本的 PostgreSQL 資料庫設定
+# 連線策略：每個工作行程保留持久連線 CONN_MAX_AGE 秒，只有重用既有連線時才做健康檢查；
+# 前面架設 PgBouncer（transaction pooling）時把 DATABASE_CONN_MAX_AGE 設為 0 交由 PgBouncer 管理連線，
+# 並設定 DATABASE_DISABLE_SERVER_SIDE_CURSORS=True（iterator() 的伺服器端游標無法跨交易使用）
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -188,8 +192,12 @@ DATABASES = {
         "PASSWORD": env("DATABASE_PASSWORD", default="mespassword"),
         "HOST": env("DATABASE_HOST", default="localhost"),
         "PORT": env("DATABASE_PORT", default="5432"),
+        "CONN_MAX_AGE": env.int("DATABASE_CONN_MAX_AGE", default=60),
+        "CONN_HEALTH_CHECKS": env.bool("DATABASE_CONN_HEALTH_CHECKS", default=True),
+        "DISABLE_SERVER_SIDE_CURSORS": env.bool("DATABASE_DISABLE_SERVER_SIDE_CURSORS", default=False),
         "OPTIONS": {
-            "options": "-c search_path=public"
+            "options": "-c search_path=public",
+            "connect_timeout": env.int("DATABASE_CONNECT_TIMEOUT", default=5),
         },
         "MIGRATE": False,  # 跳過遷移檢查
     }
@@ -260,6 +268,74 @@ CELERY_TASK_SERIALIZER = env("CELERY_TASK_SERIALIZER", default="json")
 CELERY_RESULT_SERIALIZER = env("CELERY_RESULT_SERIALIZER", default="json")
 CELERY_TIMEZONE = env("TIME_ZONE", default="Asia/Taipei")
 
+# ERP 同步：每台 ERP 伺服器同時執行的資料表同步工作上限
+ERP_SYNC_MAX_CONCURRENCY_PER_SERVER = env.int("ERP_SYNC_MAX_CONCURRENCY_PER_SERVER", default=4)
+
+# 客戶訂單同步：同時讀取公司資料庫的執行緒數、單一公司查詢逾時與整體等待上限（秒）
+ORDER_SYNC_MAX_WORKERS = env.int("ORDER_SYNC_MAX_WORKERS", default=4)
+ORDER_SYNC_COMPANY_TIMEOUT = env.int("ORDER_SYNC_COMPANY_TIMEOUT", default=60)
+ORDER_SYNC_TIMEOUT = env.int("ORDER_SYNC_TIMEOUT", default=300)
+
+# 背景匯出檔（MEDIA_ROOT/exports）保留時數，逾期由 workorder.tasks.cleanup_export_files_task 清除
+EXPORT_FILE_MAX_AGE_HOURS = env.int("EXPORT_FILE_MAX_AGE_HOURS", default=24)
+
+# 工單歸檔：每個交易批次轉移的工單數量
+WORKORDER_ARCHIVE_CHUNK_SIZE = env.int("WORKORDER_ARCHIVE_CHUNK_SIZE", default=200)
+
+# 自動審核：每個交易批次處理的報工筆數，與防止排程重疊執行的鎖存活秒數（單次執行最長為一半）
+AUTO_APPROVAL_BATCH_SIZE = env.int("AUTO_APPROVAL_BATCH_SIZE", default=1000)
+AUTO_APPROVAL_LOCK_TIMEOUT = env.int("AUTO_APPROVAL_LOCK_TIMEOUT", default=10 * 60)
+
+# 快取：預設使用 Redis（與 Celery 分開的資料庫）；執行測試或 CACHE_BACKEND=locmem 時改用本機記憶體
+# locks 別名存放跨 worker 的協調資料（ERP 同步並行名額），必須是共用 Redis 且不忽略連線錯誤；
+# locmem 只在單一行程內有效，僅供測試與單機開發使用
+TESTING = (len(sys.argv) > 1 and sys.argv[1] == "test") or "pytest" in sys.modules
+REDIS_CACHE_URL = env("REDIS_CACHE_URL", default=f"redis://localhost:{env('REDIS_PORT', default='6379')}/1")
+if TESTING or env("CACHE_BACKEND", default="redis") == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "mes-default",
+        },
+        "locks": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "mes-locks",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+            "KEY_PREFIX": "mes",
+            "TIMEOUT": env.int("CACHE_DEFAULT_TIMEOUT", default=300),
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                "SOCKET_CONNECT_TIMEOUT": 2,
+                "SOCKET_TIMEOUT": 2,
+                # Redis 無法連線時視為快取未命中，改查資料庫
+                "IGNORE_EXCEPTIONS": True,
+            },
+        },
+        "locks": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+            "KEY_PREFIX": "mes",
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                "SOCKET_CONNECT_TIMEOUT": 2,
+                "SOCKET_TIMEOUT": 2,
+            },
+        },
+    }
+    DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+
+# 主檔快取（公司設定、系統設定、作業員／工序／設備名稱）的存活秒數，異動時由信號主動清除
+MASTER_DATA_CACHE_TIMEOUT = env.int("MASTER_DATA_CACHE_TIMEOUT", default=60 * 60)
+
+# 使用者有效權限快取的存活秒數，權限設定或群組異動時由信號主動失效
+PERMISSION_CACHE_TIMEOUT = env.int("PERMISSION_CACHE_TIMEOUT", default=60 * 60)
+
 # Celery Beat 配置
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
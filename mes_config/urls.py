@@ -1,5 +1,5 @@
 import os
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
@@ -25,6 +25,7 @@ urlpatterns = [
     path("reporting/", include("reporting.urls", namespace="reporting")),
     # path("work-reporting-management/", include("work_reporting_management.urls", namespace="work_reporting_management")),  # 已移除新的報工管理系統
     path("database-error/", views.database_error, name="database_error"),
+    re_path(r"^healthz/?$", views.healthz, name="healthz"),
 ]
 
 # 靜態檔案路由
@@ -10,6 +10,10 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.views import View
+from django.db import connection
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
 # from system.models import EmailConfig  # 暫時註解，重新創建中
 import logging
 import smtplib
@@ -169,6 +173,30 @@ class CustomPasswordResetView(View):
         logger.info("表單無效，返回密碼重置頁面")
         return render(request, self.template_name, {"form": form})
 
+# 健康檢查
+@never_cache
+@require_GET
+def healthz(request):
+    """
+    輕量健康檢查，供負載平衡器與監控使用（不需登入）
+    取代原本每個請求前的資料庫探測，資料庫無法連線時回傳 503
+    """
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        checks["database"] = "ok"
+    except Exception as e:
+        logger.error(f"健康檢查資料庫連線失敗: {str(e)}")
+        checks["database"] = "error"
+
+    healthy = all(value == "ok" for value in checks.values())
+    return JsonResponse(
+        {"status": "ok" if healthy else "error", "checks": checks},
+        status=200 if healthy else 503,
+    )
+
+
 # 資料庫錯誤頁面視圖
 def database_error(request):
     """
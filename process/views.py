@@ -19,6 +19,7 @@ from django.views.decorators.csrf import csrf_exempt
 import csv, io
 from django.utils import timezone
 import pandas as pd
+from system.permission_resolver import user_in_groups
 
 import os
 # 設定製程管理模組的日誌記錄器
@@ -34,7 +35,7 @@ process_logger.setLevel(logging.INFO)
 
 # 檢查用戶是否屬於「工序使用者」群組，或者是超級用戶
 def process_user_required(user):
-    return user.is_superuser or user.groups.filter(name="工序使用者").exists()
+    return user.is_superuser or user_in_groups(user, "工序使用者")
 
 
 @login_required
@@ -10,11 +10,12 @@ from openpyxl.utils import get_column_letter
 from io import BytesIO
 import json
 from production.models import ProductionLine
+from system.permission_resolver import user_in_groups
 
 
 # 檢查用戶是否屬於「工序使用者」群組，或者是超級用戶
 def process_user_required(user):
-    return user.is_superuser or user.groups.filter(name="工序使用者").exists()
+    return user.is_superuser or user_in_groups(user, "工序使用者")
 
 
 # 檢查是否為超級管理員
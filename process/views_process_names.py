@@ -11,6 +11,7 @@ from io import BytesIO
 import json
 import logging
 from equip.models import Equipment
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,7 @@ def get_equipment_options(request):
 
 
 def process_user_required(user):
-    return user.is_superuser or user.groups.filter(name="工序使用者").exists()
+    return user.is_superuser or user_in_groups(user, "工序使用者")
 
 
 def superuser_required(user):
@@ -18,6 +18,7 @@ from django.views.decorators.http import require_POST
 import math
 from urllib.parse import unquote
 from process.models import ProductProcessStandardCapacity
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger(__name__)
 
@@ -82,7 +83,7 @@ def check_product_id_variations(dataset):
 
 
 def process_user_required(user):
-    return user.is_superuser or user.groups.filter(name="工序使用者").exists()
+    return user.is_superuser or user_in_groups(user, "工序使用者")
 
 
 def superuser_required(user):
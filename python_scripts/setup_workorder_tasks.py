@@ -90,10 +90,58 @@ def setup_workorder_tasks():
             )
             print(f"✓ 建立新任務：{periodic_task_auto_dispatch.name}")
         
+        # 3. 設定清除逾期匯出檔案任務（每小時執行一次）
+        task_name_cleanup_exports = "workorder.tasks.cleanup_export_files_task"
+        existing_task_cleanup_exports = PeriodicTask.objects.filter(name="清除逾期匯出檔案").first()
+        
+        if existing_task_cleanup_exports:
+            print("✓ 任務「清除逾期匯出檔案」已存在")
+            # 更新任務設定
+            existing_task_cleanup_exports.task = task_name_cleanup_exports
+            existing_task_cleanup_exports.interval = interval_schedule
+            existing_task_cleanup_exports.enabled = True
+            existing_task_cleanup_exports.save()
+            print("✓ 已更新任務設定")
+        else:
+            # 建立新任務
+            periodic_task_cleanup_exports = PeriodicTask.objects.create(
+                name="清除逾期匯出檔案",
+                task=task_name_cleanup_exports,
+                interval=interval_schedule,
+                enabled=True,
+                description="每小時清除超過保留時數的背景匯出檔案（MEDIA_ROOT/exports）"
+            )
+            print(f"✓ 建立新任務：{periodic_task_cleanup_exports.name}")
+        
+        # 4. 設定增量相符性檢查任務（每小時執行一次）
+        task_name_consistency_check = "workorder.tasks.incremental_consistency_check_task"
+        existing_task_consistency_check = PeriodicTask.objects.filter(name="增量相符性檢查").first()
+        
+        if existing_task_consistency_check:
+            print("✓ 任務「增量相符性檢查」已存在")
+            # 更新任務設定
+            existing_task_consistency_check.task = task_name_consistency_check
+            existing_task_consistency_check.interval = interval_schedule
+            existing_task_consistency_check.enabled = True
+            existing_task_consistency_check.save()
+            print("✓ 已更新任務設定")
+        else:
+            # 建立新任務
+            periodic_task_consistency_check = PeriodicTask.objects.create(
+                name="增量相符性檢查",
+                task=task_name_consistency_check,
+                interval=interval_schedule,
+                enabled=True,
+                description="每小時重新檢查上次檢查後異動的填報記錄與工單"
+            )
+            print(f"✓ 建立新任務：{periodic_task_consistency_check.name}")
+        
         print("\n=== 定時任務設定完成 ===")
         print("已設定的任務：")
         print("1. 全部工單轉生產中 - 每小時執行一次")
         print("2. 自動批次派工 - 每30分鐘執行一次")
+        print("3. 清除逾期匯出檔案 - 每小時執行一次")
+        print("4. 增量相符性檢查 - 每小時執行一次")
         
         return True
         
@@ -109,7 +157,7 @@ def list_workorder_tasks():
     print("\n=== 工單管理定時任務列表 ===")
     
     tasks = PeriodicTask.objects.filter(
-        name__in=["全部工單轉生產中", "自動批次派工"]
+        name__in=["全部工單轉生產中", "自動批次派工", "清除逾期匯出檔案", "增量相符性檢查"]
     )
     
     if not tasks.exists():
@@ -133,7 +181,7 @@ def enable_workorder_tasks():
     print("\n=== 啟用工單管理定時任務 ===")
     
     tasks = PeriodicTask.objects.filter(
-        name__in=["全部工單轉生產中", "自動批次派工"]
+        name__in=["全部工單轉生產中", "自動批次派工", "清除逾期匯出檔案", "增量相符性檢查"]
     )
     
     enabled_count = 0
@@ -155,7 +203,7 @@ def disable_workorder_tasks():
     print("\n=== 停用工單管理定時任務 ===")
     
     tasks = PeriodicTask.objects.filter(
-        name__in=["全部工單轉生產中", "自動批次派工"]
+        name__in=["全部工單轉生產中", "自動批次派工", "清除逾期匯出檔案", "增量相符性檢查"]
     )
     
     disabled_count = 0
@@ -11,6 +11,7 @@ from .models import (
     AOITestReport,
 )
 from .utils import log_user_operation
+from system.permission_resolver import user_in_groups
 
 import os
 # 設定品質管理模組的日誌記錄器
@@ -26,7 +27,7 @@ quality_logger.setLevel(logging.INFO)
 
 # 檢查用戶是否屬於「品質使用者」群組，或者是超級用戶
 def quality_user_required(user):
-    return user.is_superuser or user.groups.filter(name="品質使用者").exists()
+    return user.is_superuser or user_in_groups(user, "品質使用者")
 
 
 @login_required
@@ -10,8 +10,10 @@ class ReportingConfig(AppConfig):
     
     def ready(self):
         """
-        應用程式準備就緒時自動同步報表排程
+        應用程式準備就緒時註冊信號並自動同步報表排程
         """
+        import reporting.signals  # noqa: F401
+        
         try:
             # 只在主進程中執行，避免在子進程中重複執行
             import os
@@ -6,12 +6,24 @@
 """
 
 import logging
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, List, Optional
-from django.db.models import Sum, Count, Avg, Q
+from decimal import Decimal
+from typing import Dict, List
+from django.db.models import Sum, Q
 
 logger = logging.getLogger(__name__)
 
+# collect_report_data 串流讀取的明細欄位（順序即 tuple 解包順序）
+REPORT_ROW_FIELDS = (
+    'company', 'operator_name', 'workorder_id', 'product_code', 'process_name', 'work_date',
+    'start_time', 'end_time', 'work_hours', 'overtime_hours', 'total_hours',
+    'work_quantity', 'defect_quantity',
+)
+
+# 串流讀取明細時每次取回的筆數
+REPORT_ROW_CHUNK_SIZE = 2000
+
 
 class DataCollector:
     """統一資料收集器"""
@@ -34,7 +46,6 @@ class DataCollector:
         """
         try:
             from .models import WorkOrderReportData
-            from erp_integration.models import CompanyConfig
             
             # 建立查詢條件
             query_filters = Q(work_date__range=[start_date, end_date])
@@ -43,41 +54,16 @@ class DataCollector:
             if company_code and company_code != 'ALL':
                 query_filters &= Q(company=company_code)
             
-            # 取得資料
-            queryset = WorkOrderReportData.objects.filter(query_filters)
-            
-            # 基本統計
-            total_records = queryset.count()
-            total_work_hours = queryset.aggregate(
-                total=Sum('work_hours')
-            )['total'] or 0
-            total_overtime_hours = queryset.aggregate(
-                total=Sum('overtime_hours')
-            )['total'] or 0
-            total_hours = queryset.aggregate(
-                total=Sum('work_hours')
-            )['total'] or 0
-            
-            # 計算作業員數和設備數
-            operator_count = queryset.values('operator_name').distinct().count()
-            equipment_count = queryset.values('workorder_id').distinct().count()
-            
-            # 計算不良品數量
-            total_defect_quantity = queryset.aggregate(
-                total=Sum('defect_quantity')
-            )['total'] or 0
-            
-            # 按公司統計
-            company_stats = self._get_company_statistics_from_workorder_report(queryset)
-            
-            # 按工序統計
-            process_stats = self._get_process_statistics_from_workorder_report(queryset)
-            
-            # 按作業員統計
-            operator_stats = self._get_operator_statistics_from_workorder_report(queryset)
-            
-            # 詳細資料
-            detailed_data = self._get_detailed_data_from_workorder_report(queryset)
+            # 取得資料：只讀一次明細，摘要、各分組統計與詳細資料都在同一次串流中計算
+            rows = WorkOrderReportData.objects.filter(query_filters).values_list(
+                *REPORT_ROW_FIELDS
+            ).iterator(chunk_size=REPORT_ROW_CHUNK_SIZE)
+            aggregated = self._aggregate_report_rows(rows)
+            summary = aggregated['summary']
+            company_stats = aggregated['company_stats']
+            process_stats = aggregated['process_stats']
+            operator_stats = aggregated['operator_stats']
+            detailed_data = aggregated['detailed_data']
             
             return {
                 'success': True,
@@ -85,16 +71,7 @@ class DataCollector:
                     'start_date': start_date,
                     'end_date': end_date
                 },
-                'summary': {
-                    'total_records': total_records,
-                    'onsite_records': 0,  # WorkOrderReportData 不區分來源
-                    'normal_hours': float(total_work_hours),
-                    'overtime_hours': float(total_overtime_hours),
-                    'total_work_hours': float(total_hours),
-                    'operator_count': operator_count,
-                    'equipment_count': equipment_count,
-                    'defect_quantity': float(total_defect_quantity)
-                },
+                'summary': summary,
                 'company_stats': company_stats,
                 'process_stats': process_stats,
                 'operator_stats': operator_stats,
@@ -384,24 +361,22 @@ class DataCollector:
             資料摘要字典
         """
         try:
-            from .models import WorkOrderReportData
+            from .models import WorkHourDailyRollup
             
-            # 建立查詢條件
+            # 建立查詢條件（摘要只需加總，直接讀取日彙總表）
             query_filters = Q(work_date__range=[start_date, end_date])
             
-            if company_code:
-                query_filters &= Q(company_code=company_code)
-            
-            queryset = WorkOrderReportData.objects.filter(query_filters)
+            if company_code and company_code != 'ALL':
+                query_filters &= Q(company=company_code)
             
-            # 基本統計
-            total_records = queryset.count()
-            total_work_hours = queryset.aggregate(
-                total=Sum('work_hours')
-            )['total'] or 0
-            total_overtime_hours = queryset.aggregate(
-                total=Sum('overtime_hours')
-            )['total'] or 0
+            totals = WorkHourDailyRollup.objects.filter(query_filters).aggregate(
+                record_count=Sum('record_count'),
+                work_hours=Sum('work_hours'),
+                overtime_hours=Sum('overtime_hours'),
+            )
+            total_records = totals['record_count'] or 0
+            total_work_hours = totals['work_hours'] or 0
+            total_overtime_hours = totals['overtime_hours'] or 0
             
             return {
                 'success': True,
@@ -417,149 +392,146 @@ class DataCollector:
                 'error': str(e)
             }
     
-    def _get_company_statistics_from_workorder_report(self, queryset) -> List[Dict]:
-        """從 WorkOrderReportData 按公司統計"""
-        try:
-            from django.db.models import Sum, Count
-            
-            company_stats = queryset.values('company').annotate(
-                total_work_hours=Sum('work_hours'),
-                total_overtime_hours=Sum('overtime_hours'),
-                total_hours=Sum('total_hours'),
-                total_defect_quantity=Sum('defect_quantity'),
-                record_count=Count('id'),
-                operator_count=Count('operator_name', distinct=True),
-                equipment_count=Count('workorder_id', distinct=True)
-            ).order_by('-total_work_hours')
-            
-            result = []
-            for stat in company_stats:
-                result.append({
-                    'company_name': stat['company'] or '未指定',
-                    'record_count': stat['record_count'],
-                    'normal_hours': float(stat['total_work_hours'] or 0),
-                    'overtime_hours': float(stat['total_overtime_hours'] or 0),
-                    'total_hours': float(stat['total_hours'] or 0),
-                    'operator_count': stat['operator_count'],
-                    'equipment_count': stat['equipment_count']
-                })
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"取得公司統計失敗: {str(e)}")
-            return []
-    
-    def _get_process_statistics_from_workorder_report(self, queryset) -> List[Dict]:
-        """從 WorkOrderReportData 按工序統計"""
-        try:
-            from django.db.models import Sum, Count
-            
-            process_stats = queryset.values('process_name').annotate(
-                total_work_hours=Sum('work_hours'),
-                total_overtime_hours=Sum('overtime_hours'),
-                total_hours=Sum('work_hours'),
-                total_work_quantity=Sum('work_quantity'),
-                total_defect_quantity=Sum('defect_quantity'),
-                record_count=Count('id'),
-                operator_count=Count('operator_name', distinct=True)
-            ).order_by('-total_work_hours')
-            
-            result = []
-            for stat in process_stats:
-                total_hours = float(stat['total_hours'] or 0)
-                total_work = float(stat['total_work_quantity'] or 0)
-                total_defect = float(stat['total_defect_quantity'] or 0)
-                efficiency = 0
-                if total_hours > 0:
-                    # 計算效率：(工作數量 + 不良品數量) / 工作時數
-                    efficiency = (total_work + total_defect) / total_hours
-                
-                result.append({
-                    'process_name': stat['process_name'] or '未指定',
-                    'record_count': stat['record_count'],
-                    'normal_hours': float(stat['total_work_hours'] or 0),
-                    'overtime_hours': float(stat['total_overtime_hours'] or 0),
-                    'total_hours': total_hours,
-                    'work_quantity': total_work,
-                    'defect_quantity': float(stat['total_defect_quantity'] or 0),
-                    'efficiency': efficiency,
-                    'operator_count': stat['operator_count']
-                })
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"取得工序統計失敗: {str(e)}")
-            return []
-    
-    def _get_operator_statistics_from_workorder_report(self, queryset) -> List[Dict]:
-        """從 WorkOrderReportData 按作業員統計"""
-        try:
-            from django.db.models import Sum, Count
-            
-            operator_stats = queryset.values('operator_name').annotate(
-                total_work_hours=Sum('work_hours'),
-                total_overtime_hours=Sum('overtime_hours'),
-                total_hours=Sum('work_hours'),
-                total_work_quantity=Sum('work_quantity'),
-                total_defect_quantity=Sum('defect_quantity'),
-                record_count=Count('id'),
-                equipment_count=Count('workorder_id', distinct=True)  # 使用 workorder_id 代替 equipment_name
-            ).order_by('-total_work_hours')
-            
-            result = []
-            for stat in operator_stats:
-                total_hours = float(stat['total_hours'] or 0)
-                total_work = float(stat['total_work_quantity'] or 0)
-                total_defect = float(stat['total_defect_quantity'] or 0)
-                efficiency = 0
-                if total_hours > 0:
-                    # 計算效率：(工作數量 + 不良品數量) / 工作時數
-                    efficiency = (total_work + total_defect) / total_hours
-                
-                result.append({
-                    'operator_name': stat['operator_name'] or '未指定',
-                    'record_count': stat['record_count'],
-                    'normal_hours': float(stat['total_work_hours'] or 0),
-                    'overtime_hours': float(stat['total_overtime_hours'] or 0),
-                    'total_hours': total_hours,
-                    'work_quantity': total_work,
-                    'defect_quantity': float(stat['total_defect_quantity'] or 0),
-                    'efficiency': efficiency,
-                    'equipment_count': stat['equipment_count']
-                })
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"取得作業員統計失敗: {str(e)}")
-            return []
-    
-    def _get_detailed_data_from_workorder_report(self, queryset) -> List[Dict]:
-        """從 WorkOrderReportData 取得詳細資料"""
-        try:
-            detailed_data = []
-            for record in queryset:
-                detailed_data.append({
-                    'company_name': record.company or '',
-                    'operator_name': record.operator_name or '',
-                    'workorder_id': record.workorder_id or '',
-                    'product_code': record.product_code or '',
-                    'process_name': record.process_name or '',
-                    'work_date': record.work_date.strftime('%Y-%m-%d') if record.work_date else '',
-                    'equipment_name': '',  # WorkOrderReportData 沒有 equipment_name 欄位
-                    'start_time': record.start_time.strftime('%H:%M') if record.start_time else '',
-                    'end_time': record.end_time.strftime('%H:%M') if record.end_time else '',
-                    'work_hours': float(record.work_hours or 0),
-                    'overtime_hours': float(record.overtime_hours or 0),
-                    'work_quantity': float(record.work_quantity or 0),
-                    'remarks': ''
-                })
-            
-            return detailed_data
+    def _aggregate_report_rows(self, rows) -> Dict:
+        """
+        單次走訪明細列，同時計算摘要、公司／工序／作業員統計與詳細資料
+        
+        Args:
+            rows: 依 REPORT_ROW_FIELDS 順序的明細 tuple（可為串流迭代器）
             
-        except Exception as e:
-            logger.error(f"取得詳細資料失敗: {str(e)}")
-            return []
-    
+        Returns:
+            包含 summary、company_stats、process_stats、operator_stats、detailed_data 的字典
+        """
+        zero = Decimal('0')
+        
+        def new_group():
+            return {
+                'record_count': 0,
+                'work_hours': zero,
+                'overtime_hours': zero,
+                'total_hours': zero,
+                'work_quantity': 0,
+                'defect_quantity': 0,
+                'operators': set(),
+                'workorders': set(),
+            }
+        
+        totals = new_group()
+        company_groups = defaultdict(new_group)
+        process_groups = defaultdict(new_group)
+        operator_groups = defaultdict(new_group)
+        detailed_data = []
+        
+        for row in rows:
+            (company, operator_name, workorder_id, product_code, process_name, work_date,
+             start_time, end_time, work_hours, overtime_hours, total_hours,
+             work_quantity, defect_quantity) = row
+            work_hours = work_hours or zero
+            overtime_hours = overtime_hours or zero
+            total_hours = total_hours or zero
+            work_quantity = work_quantity or 0
+            defect_quantity = defect_quantity or 0
+            
+            for group in (totals, company_groups[company], process_groups[process_name],
+                          operator_groups[operator_name]):
+                group['record_count'] += 1
+                group['work_hours'] += work_hours
+                group['overtime_hours'] += overtime_hours
+                group['total_hours'] += total_hours
+                group['work_quantity'] += work_quantity
+                group['defect_quantity'] += defect_quantity
+                # COUNT(DISTINCT) 不計入 NULL
+                if operator_name is not None:
+                    group['operators'].add(operator_name)
+                if workorder_id is not None:
+                    group['workorders'].add(workorder_id)
+            
+            detailed_data.append({
+                'company_name': company or '',
+                'operator_name': operator_name or '',
+                'workorder_id': workorder_id or '',
+                'product_code': product_code or '',
+                'process_name': process_name or '',
+                'work_date': work_date.strftime('%Y-%m-%d') if work_date else '',
+                'equipment_name': '',  # WorkOrderReportData 沒有 equipment_name 欄位
+                'start_time': start_time.strftime('%H:%M') if start_time else '',
+                'end_time': end_time.strftime('%H:%M') if end_time else '',
+                'work_hours': float(work_hours),
+                'overtime_hours': float(overtime_hours),
+                'work_quantity': float(work_quantity),
+                'remarks': ''
+            })
+        
+        def efficiency(group):
+            # 計算效率：(工作數量 + 不良品數量) / 工作時數
+            if group['work_hours'] > 0:
+                return (group['work_quantity'] + group['defect_quantity']) / float(group['work_hours'])
+            return 0
+        
+        def by_work_hours(groups):
+            return sorted(groups.items(), key=lambda item: item[1]['work_hours'], reverse=True)
+        
+        company_stats = [
+            {
+                'company_name': company or '未指定',
+                'record_count': group['record_count'],
+                'normal_hours': float(group['work_hours']),
+                'overtime_hours': float(group['overtime_hours']),
+                'total_hours': float(group['total_hours']),
+                'operator_count': len(group['operators']),
+                'equipment_count': len(group['workorders'])
+            }
+            for company, group in by_work_hours(company_groups)
+        ]
+        
+        process_stats = [
+            {
+                'process_name': process_name or '未指定',
+                'record_count': group['record_count'],
+                'normal_hours': float(group['work_hours']),
+                'overtime_hours': float(group['overtime_hours']),
+                'total_hours': float(group['work_hours']),
+                'work_quantity': float(group['work_quantity']),
+                'defect_quantity': float(group['defect_quantity']),
+                'efficiency': efficiency(group),
+                'operator_count': len(group['operators'])
+            }
+            for process_name, group in by_work_hours(process_groups)
+        ]
+        
+        operator_stats = [
+            {
+                'operator_name': operator_name or '未指定',
+                'record_count': group['record_count'],
+                'normal_hours': float(group['work_hours']),
+                'overtime_hours': float(group['overtime_hours']),
+                'total_hours': float(group['work_hours']),
+                'work_quantity': float(group['work_quantity']),
+                'defect_quantity': float(group['defect_quantity']),
+                'efficiency': efficiency(group),
+                'equipment_count': len(group['workorders'])
+            }
+            for operator_name, group in by_work_hours(operator_groups)
+        ]
+        
+        # 作業員數沿用 values().distinct() 的語意：未填姓名也算一組
+        operator_count = len(operator_groups)
+        
+        summary = {
+            'total_records': totals['record_count'],
+            'onsite_records': 0,  # WorkOrderReportData 不區分來源
+            'normal_hours': float(totals['work_hours']),
+            'overtime_hours': float(totals['overtime_hours']),
+            'total_work_hours': float(totals['work_hours']),
+            'operator_count': operator_count,
+            'equipment_count': len(totals['workorders']),
+            'defect_quantity': float(totals['defect_quantity'])
+        }
+        
+        return {
+            'summary': summary,
+            'company_stats': company_stats,
+            'process_stats': process_stats,
+            'operator_stats': operator_stats,
+            'detailed_data': detailed_data,
+        }
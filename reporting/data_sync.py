@@ -4,43 +4,86 @@
 """
 
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta
+from django.db import transaction
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+# 增量同步的高水位記錄（存放於 SystemConfig）
+SYNC_WATERMARK_KEY = "report_data_sync_watermark"
+
+# 每批讀取與寫入的筆數
+SYNC_CHUNK_SIZE = 2000
+
+# 高水位回溯的安全重疊時間：避免較晚提交但 updated_at 較早的記錄被漏掉（upsert 可重複執行）
+SYNC_WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# 報表資料在 upsert 時需要更新的欄位
+REPORT_DATA_UPDATE_FIELDS = [
+    'workorder_id', 'company', 'operator_name', 'product_code', 'process_name',
+    'work_date', 'work_week', 'work_week_year', 'work_month', 'work_quarter', 'work_year',
+    'start_time', 'end_time', 'work_hours', 'overtime_hours',
+    'work_quantity', 'defect_quantity', 'updated_at',
+]
+
+
+def get_period_fields(work_date):
+    """
+    計算工作日期的週、月、季、年
+
+    週數採 ISO 週，需搭配 ISO 週所屬年度（work_week_year）；
+    例如 2024-12-30 屬於 2025 年第 1 週，2027-01-01 屬於 2026 年第 53 週。
+    月、季、年仍以日曆年度（work_year）計算。
+    """
+    iso_year, iso_week, _ = work_date.isocalendar()
+    return {
+        'work_week': iso_week,
+        'work_week_year': iso_year,
+        'work_month': work_date.month,
+        'work_quarter': (work_date.month - 1) // 3 + 1,
+        'work_year': work_date.year,
+    }
+
+
+def build_report_data_from_fill_work(fill_work):
+    """從填報資料建立（未儲存的）報表資料物件"""
+    from reporting.models import WorkOrderReportData
+    
+    return WorkOrderReportData(
+        fill_work_id=fill_work.id,
+        workorder_id=fill_work.workorder,
+        company=fill_work.company_name,
+        operator_name=fill_work.operator or '',
+        product_code=fill_work.product_id or '',
+        process_name=fill_work.operation or fill_work.process_name or '',
+        work_date=fill_work.work_date,
+        start_time=fill_work.start_time,
+        end_time=fill_work.end_time,
+        work_hours=fill_work.work_hours_calculated or 0,
+        overtime_hours=fill_work.overtime_hours_calculated or 0,
+        total_hours=0,  # 預設值，不計算
+        daily_work_hours=0,  # 預設值，不計算
+        weekly_work_hours=0,  # 預設值，不計算
+        monthly_work_hours=0,  # 預設值，不計算
+        operator_count=1,  # 預設值
+        equipment_hours=0,  # 預設值，不計算
+        work_quantity=fill_work.work_quantity or 0,
+        defect_quantity=fill_work.defect_quantity or 0,
+        updated_at=timezone.now(),
+        **get_period_fields(fill_work.work_date),
+    )
+
 
 def create_report_data_from_fill_work(fill_work):
     """從填報資料建立報表資料 - 純粹同步，不計算"""
     try:
-        from reporting.models import WorkOrderReportData
-        
-        # 純粹的資料複製，不做任何計算
-        report_data = WorkOrderReportData.objects.create(
-            workorder_id=fill_work.workorder,
-            company=fill_work.company_name,
-            operator_name=fill_work.operator or '',
-            product_code=fill_work.product_id or '',
-            process_name=fill_work.operation or fill_work.process_name or '',
-            work_date=fill_work.work_date,
-            work_week=0,  # 預設值，不計算
-            work_month=0,  # 預設值，不計算
-            work_quarter=0,  # 預設值，不計算
-            work_year=0,  # 預設值，不計算
-            start_time=fill_work.start_time,
-            end_time=fill_work.end_time,
-            work_hours=fill_work.work_hours_calculated or 0,
-            overtime_hours=fill_work.overtime_hours_calculated or 0,
-            total_hours=0,  # 預設值，不計算
-            daily_work_hours=0,  # 預設值，不計算
-            weekly_work_hours=0,  # 預設值，不計算
-            monthly_work_hours=0,  # 預設值，不計算
-            operator_count=1,  # 預設值
-            equipment_hours=0,  # 預設值，不計算
-            work_quantity=fill_work.work_quantity or 0,
-            defect_quantity=fill_work.defect_quantity or 0,
-        )
+        from reporting.rollups import refresh_rollups
         
+        report_data = build_report_data_from_fill_work(fill_work)
+        with transaction.atomic():
+            report_data.save()
+            refresh_rollups([(report_data.company, report_data.work_date)])
         return report_data
         
     except Exception as e:
@@ -48,56 +91,110 @@ def create_report_data_from_fill_work(fill_work):
         return None
 
 
-def sync_data():
-    """同步資料 - 簡單的 A 到 B"""
+def _get_watermark():
+    """讀取上次同步到的 FillWork.updated_at"""
+    from workorder.models import SystemConfig
+    
+    value = SystemConfig.get_config(SYNC_WATERMARK_KEY)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        logger.warning(f"無法解析報表同步高水位 {value}，改為全量同步")
+        return None
+
+
+def _set_watermark(updated_at):
+    from workorder.models import SystemConfig
+    
+    SystemConfig.set_config(
+        SYNC_WATERMARK_KEY, updated_at.isoformat(), "報表資料增量同步高水位（FillWork.updated_at）"
+    )
+
+
+def _write_report_data(report_data_list):
+    """以單一 bulk upsert 寫入一批報表資料（依 fill_work_id 唯一約束），並重算受影響的彙總"""
+    from reporting.models import WorkOrderReportData
+    from reporting.rollups import refresh_rollups
+    
+    fill_work_ids = [report_data.fill_work_id for report_data in report_data_list]
+    with transaction.atomic():
+        # 異動前的（公司, 日期）也要重算，避免記錄改期或改公司後舊期間的彙總殘留
+        affected_days = set(
+            WorkOrderReportData.objects.filter(fill_work_id__in=fill_work_ids)
+            .values_list('company', 'work_date')
+        )
+        WorkOrderReportData.objects.bulk_create(
+            report_data_list,
+            update_conflicts=True,
+            unique_fields=['fill_work_id'],
+            update_fields=REPORT_DATA_UPDATE_FIELDS,
+        )
+        affected_days.update(
+            (report_data.company, report_data.work_date) for report_data in report_data_list
+        )
+        refresh_rollups(affected_days)
+
+
+def sync_data(full=False, chunk_size=SYNC_CHUNK_SIZE):
+    """
+    同步資料 - 以 FillWork.updated_at 高水位做增量的 A 到 B 同步
+    
+    Args:
+        full: True 時忽略高水位，重新同步所有已核准填報
+        chunk_size: 每批讀取與寫入的筆數
+    """
     try:
         from workorder.fill_work.models import FillWork
-        from reporting.models import WorkOrderReportData
         
         logger.info("開始同步資料")
         
-        # 同步填報資料
         fill_works = FillWork.objects.filter(approval_status='approved')
+        watermark = None if full else _get_watermark()
+        if watermark:
+            fill_works = fill_works.filter(updated_at__gte=watermark - SYNC_WATERMARK_OVERLAP)
+            logger.info(f"增量同步：自 {watermark} 起的新增或異動填報資料")
+        
+        fill_works = fill_works.order_by('updated_at', 'id').only(
+            'id', 'workorder', 'company_name', 'operator', 'product_id', 'operation',
+            'process_name', 'work_date', 'start_time', 'end_time',
+            'work_hours_calculated', 'overtime_hours_calculated',
+            'work_quantity', 'defect_quantity', 'updated_at',
+        )
+        
         fill_synced = 0
         fill_failed = 0
+        buffer = []
+        last_updated_at = None
         
-        logger.info(f"找到 {fill_works.count()} 筆填報資料需要同步")
-        
-        for fill_work in fill_works:
+        def flush():
+            nonlocal fill_synced, fill_failed
+            if not buffer:
+                return
             try:
-                # 檢查必要欄位
-                if not fill_work.work_date or not fill_work.workorder or not fill_work.company_name:
-                    fill_failed += 1
-                    logger.warning(f"跳過填報資料 {fill_work.id}: 缺少必要欄位")
-                    continue
-                
-                # 檢查是否已存在（使用更精確的唯一性檢查）
-                existing = WorkOrderReportData.objects.filter(
-                    workorder_id=fill_work.workorder,
-                    company=fill_work.company_name,
-                    work_date=fill_work.work_date,
-                    operator_name=fill_work.operator or '',
-                    start_time=fill_work.start_time
-                ).exists()
-                
-                if existing:
-                    # 已存在，跳過
-                    continue
-                
-                # 使用專用的同步函數
-                report_data = create_report_data_from_fill_work(fill_work)
-                
-                if report_data:
-                    fill_synced += 1
-                    logger.info(f"新增報表資料: {fill_work.workorder}")
-                else:
-                    fill_failed += 1
-                    logger.warning(f"同步填報資料失敗 {fill_work.id}: 無法建立報表資料")
+                _write_report_data(buffer)
+                fill_synced += len(buffer)
+                _set_watermark(last_updated_at)
             except Exception as e:
+                fill_failed += len(buffer)
+                logger.error(f"批次寫入報表資料失敗（{len(buffer)} 筆）: {str(e)}")
+                raise
+            finally:
+                buffer.clear()
+        
+        for fill_work in fill_works.iterator(chunk_size=chunk_size):
+            # 檢查必要欄位
+            if not fill_work.work_date or not fill_work.workorder or not fill_work.company_name:
                 fill_failed += 1
-                logger.error(f"同步填報資料失敗 {fill_work.id}: {str(e)}")
-                import traceback
-                logger.error(f"詳細錯誤: {traceback.format_exc()}")
+                logger.warning(f"跳過填報資料 {fill_work.id}: 缺少必要欄位")
+                continue
+            
+            buffer.append(build_report_data_from_fill_work(fill_work))
+            last_updated_at = fill_work.updated_at
+            if len(buffer) >= chunk_size:
+                flush()
+        flush()
         
         # 暫時不同步現場報工資料，先測試填報資料
         onsite_synced = 0
@@ -6,6 +6,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from reporting.models import WorkOrderReportData
+from reporting.rollups import rebuild_all_rollups
 from django.db.models import Count, Max
 import logging
 
@@ -97,6 +98,9 @@ class Command(BaseCommand):
                         
                         if processed_groups % batch_size == 0:
                             self.stdout.write(f'已處理 {processed_groups} 組重複資料...')
+                
+                if deleted_count > 0:
+                    rebuild_all_rollups()
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -0,0 +1,19 @@
+"""
+重建工時彙總表（日、週、月）
+報表資料被直接修改或刪除後，用來讓彙總表與明細重新一致
+"""
+
+from django.core.management.base import BaseCommand
+
+from reporting.rollups import rebuild_all_rollups
+
+
+class Command(BaseCommand):
+    help = '依 WorkOrderReportData 重建工時日、週、月彙總表'
+
+    def handle(self, *args, **options):
+        self.stdout.write('開始重建工時彙總表...')
+        refreshed = rebuild_all_rollups()
+        self.stdout.write(
+            self.style.SUCCESS(f'重建完成！共重算 {refreshed} 個公司日期')
+        )
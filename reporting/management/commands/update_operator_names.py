@@ -4,6 +4,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from reporting.models import WorkOrderReportData
+from reporting.rollups import rebuild_all_rollups
 from workorder.fill_work.models import FillWork
 from workorder.onsite_reporting.models import OnsiteReport
 
@@ -43,6 +44,9 @@ class Command(BaseCommand):
                         report_data.save()
                         updated_count += 1
                         self.stdout.write(f'更新記錄: {report_data.workorder_id} -> {onsite_report.operator}')
+            
+            if updated_count > 0:
+                rebuild_all_rollups()
         
         self.stdout.write(
             self.style.SUCCESS(f'更新完成！共更新 {updated_count} 筆記錄')
@@ -7,6 +7,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from workorder.fill_work.models import FillWork
 from reporting.models import WorkOrderReportData
+from reporting.rollups import refresh_rollups
 from django.db.models import Sum
 from datetime import timedelta
 
@@ -33,6 +34,8 @@ class Command(BaseCommand):
             report_data_list = WorkOrderReportData.objects.all()
         
         updated_count = 0
+        # 工時有異動的（公司, 工作日期），更新後重算對應的彙總表
+        touched_days = set()
         
         with transaction.atomic():
             for report_data in report_data_list:
@@ -78,11 +81,14 @@ class Command(BaseCommand):
                     report_data.weekly_work_hours = weekly_hours
                     report_data.monthly_work_hours = monthly_hours
                     report_data.save()
+                    touched_days.add((report_data.company, report_data.work_date))
                     
                     updated_count += 1
                     
                     if updated_count % 100 == 0:
                         self.stdout.write(f'已更新 {updated_count} 筆資料...')
+            
+            refresh_rollups(touched_days)
         
         self.stdout.write(
             self.style.SUCCESS(f'更新完成！共更新 {updated_count} 筆報表資料')
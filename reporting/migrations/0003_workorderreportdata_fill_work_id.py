@@ -0,0 +1,60 @@
+from django.db import migrations, models
+
+
+# 既有報表資料：以原本的去重條件對應回填報記錄，每筆填報與每筆報表資料最多互相對應一次
+BACKFILL_FILL_WORK_ID_SQL = """
+WITH matches AS (
+    SELECT r.id AS report_id,
+           f.id AS fill_work_id,
+           ROW_NUMBER() OVER (PARTITION BY f.id ORDER BY r.id) AS rn_fill_work,
+           ROW_NUMBER() OVER (PARTITION BY r.id ORDER BY f.id) AS rn_report
+    FROM workorder_report_data r
+    JOIN workorder_fill_work f
+      ON r.workorder_id = f.workorder
+     AND r.company = f.company_name
+     AND r.work_date = f.work_date
+     AND COALESCE(r.operator_name, '') = f.operator
+     AND r.start_time IS NOT DISTINCT FROM f.start_time
+    WHERE f.approval_status = 'approved'
+)
+UPDATE workorder_report_data r
+SET fill_work_id = m.fill_work_id
+FROM matches m
+WHERE r.id = m.report_id AND m.rn_fill_work = 1 AND m.rn_report = 1;
+"""
+
+# 補齊先前以 0 寫入的週、月、季、年欄位，讓既有的期間索引可以使用
+BACKFILL_PERIODS_SQL = """
+UPDATE workorder_report_data
+SET work_week = EXTRACT(WEEK FROM work_date)::int,
+    work_month = EXTRACT(MONTH FROM work_date)::int,
+    work_quarter = EXTRACT(QUARTER FROM work_date)::int,
+    work_year = EXTRACT(YEAR FROM work_date)::int
+WHERE work_year = 0;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reporting", "0002_analysiserrorlog"),
+        ("fill_work", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workorderreportdata",
+            name="fill_work_id",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="來源填報記錄ID"
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_FILL_WORK_ID_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_PERIODS_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name="workorderreportdata",
+            constraint=models.UniqueConstraint(
+                fields=["fill_work_id"], name="uniq_report_data_fill_work"
+            ),
+        ),
+    ]
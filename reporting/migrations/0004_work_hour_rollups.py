@@ -0,0 +1,286 @@
+from django.db import migrations, models
+
+
+# 依既有報表資料建立初始彙總：日彙總取自明細，週、月彙總取自日彙總
+BACKFILL_ROLLUPS_SQL = """
+INSERT INTO workorder_report_daily_rollup (
+    company, work_date, operator_name, process_name,
+    work_week, work_month, work_quarter, work_year,
+    record_count, work_hours, overtime_hours, total_hours,
+    work_quantity, defect_quantity, completed_quantity, updated_at
+)
+SELECT company, work_date, COALESCE(operator_name, ''), COALESCE(process_name, ''),
+       MAX(work_week), MAX(work_month), MAX(work_quarter), MAX(work_year),
+       COUNT(*), SUM(work_hours), SUM(overtime_hours), SUM(total_hours),
+       SUM(work_quantity), SUM(defect_quantity), SUM(completed_quantity), NOW()
+FROM workorder_report_data
+GROUP BY company, work_date, COALESCE(operator_name, ''), COALESCE(process_name, '');
+
+INSERT INTO workorder_report_weekly_rollup (
+    company, work_year, work_week, operator_name, process_name,
+    record_count, work_hours, overtime_hours, total_hours,
+    work_quantity, defect_quantity, completed_quantity, updated_at
+)
+SELECT company, work_year, work_week, operator_name, process_name,
+       SUM(record_count), SUM(work_hours), SUM(overtime_hours), SUM(total_hours),
+       SUM(work_quantity), SUM(defect_quantity), SUM(completed_quantity), NOW()
+FROM workorder_report_daily_rollup
+GROUP BY company, work_year, work_week, operator_name, process_name;
+
+INSERT INTO workorder_report_monthly_rollup (
+    company, work_year, work_month, work_quarter, operator_name, process_name,
+    record_count, work_hours, overtime_hours, total_hours,
+    work_quantity, defect_quantity, completed_quantity, updated_at
+)
+SELECT company, work_year, work_month, MAX(work_quarter), operator_name, process_name,
+       SUM(record_count), SUM(work_hours), SUM(overtime_hours), SUM(total_hours),
+       SUM(work_quantity), SUM(defect_quantity), SUM(completed_quantity), NOW()
+FROM workorder_report_daily_rollup
+GROUP BY company, work_year, work_month, operator_name, process_name;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reporting", "0003_workorderreportdata_fill_work_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkHourDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "company",
+                    models.CharField(max_length=10, verbose_name="公司代號"),
+                ),
+                (
+                    "operator_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="作業員姓名"
+                    ),
+                ),
+                (
+                    "process_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="工序名稱"
+                    ),
+                ),
+                ("record_count", models.IntegerField(default=0, verbose_name="明細筆數")),
+                (
+                    "work_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="工作時數"
+                    ),
+                ),
+                (
+                    "overtime_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="加班時數"
+                    ),
+                ),
+                (
+                    "total_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="合計時數"
+                    ),
+                ),
+                ("work_quantity", models.BigIntegerField(default=0, verbose_name="工作數量")),
+                ("defect_quantity", models.BigIntegerField(default=0, verbose_name="不良品數量")),
+                ("completed_quantity", models.BigIntegerField(default=0, verbose_name="完成數量")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新時間"),
+                ),
+                ("work_date", models.DateField(verbose_name="工作日期")),
+                ("work_week", models.IntegerField(verbose_name="工作週數")),
+                ("work_month", models.IntegerField(verbose_name="工作月份")),
+                ("work_quarter", models.IntegerField(verbose_name="工作季度")),
+                ("work_year", models.IntegerField(verbose_name="工作年度")),
+            ],
+            options={
+                "verbose_name": "工時日彙總",
+                "verbose_name_plural": "工時日彙總",
+                "db_table": "workorder_report_daily_rollup",
+                "indexes": [
+                    models.Index(
+                        fields=["work_date"], name="workorder_r_work_da_864702_idx"
+                    ),
+                    models.Index(
+                        fields=["company", "work_year", "work_week"], name="workorder_r_company_2b76f8_idx"
+                    ),
+                    models.Index(
+                        fields=["company", "work_year", "work_month"], name="workorder_r_company_458140_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=["company", "work_date", "operator_name", "process_name"],
+                        name="uniq_report_daily_rollup",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="WorkHourWeeklyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "company",
+                    models.CharField(max_length=10, verbose_name="公司代號"),
+                ),
+                (
+                    "operator_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="作業員姓名"
+                    ),
+                ),
+                (
+                    "process_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="工序名稱"
+                    ),
+                ),
+                ("record_count", models.IntegerField(default=0, verbose_name="明細筆數")),
+                (
+                    "work_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="工作時數"
+                    ),
+                ),
+                (
+                    "overtime_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="加班時數"
+                    ),
+                ),
+                (
+                    "total_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="合計時數"
+                    ),
+                ),
+                ("work_quantity", models.BigIntegerField(default=0, verbose_name="工作數量")),
+                ("defect_quantity", models.BigIntegerField(default=0, verbose_name="不良品數量")),
+                ("completed_quantity", models.BigIntegerField(default=0, verbose_name="完成數量")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新時間"),
+                ),
+                ("work_year", models.IntegerField(verbose_name="工作年度")),
+                ("work_week", models.IntegerField(verbose_name="工作週數")),
+            ],
+            options={
+                "verbose_name": "工時週彙總",
+                "verbose_name_plural": "工時週彙總",
+                "db_table": "workorder_report_weekly_rollup",
+                "indexes": [
+                    models.Index(
+                        fields=["work_year", "work_week"], name="workorder_r_work_ye_dfa5af_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=["company", "work_year", "work_week", "operator_name", "process_name"],
+                        name="uniq_report_weekly_rollup",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="WorkHourMonthlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "company",
+                    models.CharField(max_length=10, verbose_name="公司代號"),
+                ),
+                (
+                    "operator_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="作業員姓名"
+                    ),
+                ),
+                (
+                    "process_name",
+                    models.CharField(
+                        blank=True, default="", max_length=100, verbose_name="工序名稱"
+                    ),
+                ),
+                ("record_count", models.IntegerField(default=0, verbose_name="明細筆數")),
+                (
+                    "work_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="工作時數"
+                    ),
+                ),
+                (
+                    "overtime_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="加班時數"
+                    ),
+                ),
+                (
+                    "total_hours",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="合計時數"
+                    ),
+                ),
+                ("work_quantity", models.BigIntegerField(default=0, verbose_name="工作數量")),
+                ("defect_quantity", models.BigIntegerField(default=0, verbose_name="不良品數量")),
+                ("completed_quantity", models.BigIntegerField(default=0, verbose_name="完成數量")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新時間"),
+                ),
+                ("work_year", models.IntegerField(verbose_name="工作年度")),
+                ("work_month", models.IntegerField(verbose_name="工作月份")),
+                ("work_quarter", models.IntegerField(verbose_name="工作季度")),
+            ],
+            options={
+                "verbose_name": "工時月彙總",
+                "verbose_name_plural": "工時月彙總",
+                "db_table": "workorder_report_monthly_rollup",
+                "indexes": [
+                    models.Index(
+                        fields=["work_year", "work_month"], name="workorder_r_work_ye_df4ec3_idx"
+                    ),
+                    models.Index(
+                        fields=["company", "work_year", "work_quarter"], name="workorder_r_company_73a55f_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=["company", "work_year", "work_month", "operator_name", "process_name"],
+                        name="uniq_report_monthly_rollup",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_ROLLUPS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,103 @@
+from django.db import migrations, models
+
+
+# 週數採 ISO 週，週所屬年度需用 ISOYEAR，跨年週（如 2024-12-30 屬 2025 年第 1 週）才不會被拆到兩個年度
+BACKFILL_WORK_WEEK_YEAR_SQL = """
+UPDATE workorder_report_data
+SET work_week = EXTRACT(WEEK FROM work_date)::int,
+    work_week_year = EXTRACT(ISOYEAR FROM work_date)::int;
+
+UPDATE workorder_report_daily_rollup
+SET work_week = EXTRACT(WEEK FROM work_date)::int,
+    work_week_year = EXTRACT(ISOYEAR FROM work_date)::int;
+"""
+
+# 週彙總原本以日曆年度分組，依日彙總重建
+REBUILD_WEEKLY_ROLLUP_SQL = """
+DELETE FROM workorder_report_weekly_rollup;
+
+INSERT INTO workorder_report_weekly_rollup (
+    company, work_week_year, work_week, operator_name, process_name,
+    record_count, work_hours, overtime_hours, total_hours,
+    work_quantity, defect_quantity, completed_quantity, updated_at
+)
+SELECT company, work_week_year, work_week, operator_name, process_name,
+       SUM(record_count), SUM(work_hours), SUM(overtime_hours), SUM(total_hours),
+       SUM(work_quantity), SUM(defect_quantity), SUM(completed_quantity), NOW()
+FROM workorder_report_daily_rollup
+GROUP BY company, work_week_year, work_week, operator_name, process_name;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reporting", "0004_work_hour_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workorderreportdata",
+            name="work_week_year",
+            field=models.IntegerField(default=0, verbose_name="工作週所屬年度"),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="workhourdailyrollup",
+            name="work_week_year",
+            field=models.IntegerField(default=0, verbose_name="工作週所屬年度"),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(BACKFILL_WORK_WEEK_YEAR_SQL, migrations.RunSQL.noop),
+        migrations.RemoveIndex(
+            model_name="workhourdailyrollup",
+            name="workorder_r_company_2b76f8_idx",
+        ),
+        migrations.AddIndex(
+            model_name="workhourdailyrollup",
+            index=models.Index(
+                fields=["company", "work_week_year", "work_week"],
+                name="workorder_r_company_a9df9e_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="workorderreportdata",
+            index=models.Index(
+                fields=["company", "work_week_year", "work_week"],
+                name="workorder_r_company_6209bf_idx",
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="workhourweeklyrollup",
+            name="uniq_report_weekly_rollup",
+        ),
+        migrations.RemoveIndex(
+            model_name="workhourweeklyrollup",
+            name="workorder_r_work_ye_dfa5af_idx",
+        ),
+        migrations.RenameField(
+            model_name="workhourweeklyrollup",
+            old_name="work_year",
+            new_name="work_week_year",
+        ),
+        migrations.AlterField(
+            model_name="workhourweeklyrollup",
+            name="work_week_year",
+            field=models.IntegerField(verbose_name="工作週所屬年度"),
+        ),
+        migrations.RunSQL(REBUILD_WEEKLY_ROLLUP_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="workhourweeklyrollup",
+            index=models.Index(
+                fields=["work_week_year", "work_week"],
+                name="workorder_r_work_we_aa7e6f_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="workhourweeklyrollup",
+            constraint=models.UniqueConstraint(
+                fields=["company", "work_week_year", "work_week", "operator_name", "process_name"],
+                name="uniq_report_weekly_rollup",
+            ),
+        ),
+    ]
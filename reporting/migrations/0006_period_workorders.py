@@ -0,0 +1,110 @@
+from django.db import migrations, models
+
+# 依既有報表資料建立各週、月出現過的工單清單
+BACKFILL_PERIOD_WORKORDERS_SQL = """
+INSERT INTO workorder_report_weekly_workorder (company, work_week_year, work_week, workorder_id)
+SELECT DISTINCT company, work_week_year, work_week, workorder_id
+FROM workorder_report_data;
+
+INSERT INTO workorder_report_monthly_workorder (company, work_year, work_month, work_quarter, workorder_id)
+SELECT company, work_year, work_month, MAX(work_quarter), workorder_id
+FROM workorder_report_data
+GROUP BY company, work_year, work_month, workorder_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reporting", "0005_work_week_year"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkHourMonthlyWorkOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("company", models.CharField(max_length=10, verbose_name="公司代號")),
+                ("work_year", models.IntegerField(verbose_name="工作年度")),
+                ("work_month", models.IntegerField(verbose_name="工作月份")),
+                ("work_quarter", models.IntegerField(verbose_name="工作季度")),
+                (
+                    "workorder_id",
+                    models.CharField(max_length=50, verbose_name="工單編號"),
+                ),
+            ],
+            options={
+                "verbose_name": "工時月工單",
+                "verbose_name_plural": "工時月工單",
+                "db_table": "workorder_report_monthly_workorder",
+                "indexes": [
+                    models.Index(
+                        fields=["work_year", "work_month"],
+                        name="workorder_r_work_ye_7c4314_idx",
+                    ),
+                    models.Index(
+                        fields=["company", "work_year", "work_quarter"],
+                        name="workorder_r_company_79c1ab_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("company", "work_year", "work_month", "workorder_id"),
+                        name="uniq_report_monthly_workorder",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="WorkHourWeeklyWorkOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("company", models.CharField(max_length=10, verbose_name="公司代號")),
+                ("work_week_year", models.IntegerField(verbose_name="工作週所屬年度")),
+                ("work_week", models.IntegerField(verbose_name="工作週數")),
+                (
+                    "workorder_id",
+                    models.CharField(max_length=50, verbose_name="工單編號"),
+                ),
+            ],
+            options={
+                "verbose_name": "工時週工單",
+                "verbose_name_plural": "工時週工單",
+                "db_table": "workorder_report_weekly_workorder",
+                "indexes": [
+                    models.Index(
+                        fields=["work_week_year", "work_week"],
+                        name="workorder_r_work_we_95c1b2_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "company",
+                            "work_week_year",
+                            "work_week",
+                            "workorder_id",
+                        ),
+                        name="uniq_report_weekly_workorder",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_PERIOD_WORKORDERS_SQL, migrations.RunSQL.noop),
+    ]
@@ -13,6 +13,7 @@ class WorkOrderReportData(models.Model):
     """工單報表專用資料表 - 支援週月季年度統計"""
     
     # 基本識別資料
+    fill_work_id = models.BigIntegerField(null=True, blank=True, verbose_name="來源填報記錄ID")
     workorder_id = models.CharField(max_length=50, verbose_name="工單編號")
     company = models.CharField(max_length=10, verbose_name="公司代號")
     operator_name = models.CharField(max_length=100, verbose_name="作業員姓名", null=True, blank=True)
@@ -23,7 +24,9 @@ class WorkOrderReportData(models.Model):
     
     # 時間維度資料
     work_date = models.DateField(verbose_name="工作日期")
+    # 週數採 ISO 週，跨年週所屬的年度（work_week_year）可能與日曆年度（work_year）不同
     work_week = models.IntegerField(verbose_name="工作週數")
+    work_week_year = models.IntegerField(verbose_name="工作週所屬年度")
     work_month = models.IntegerField(verbose_name="工作月份")
     work_quarter = models.IntegerField(verbose_name="工作季度")
     work_year = models.IntegerField(verbose_name="工作年度")
@@ -60,13 +63,174 @@ class WorkOrderReportData(models.Model):
         indexes = [
             models.Index(fields=['company', 'work_date']),
             models.Index(fields=['operator_name', 'work_date']),
+            models.Index(fields=['company', 'work_week_year', 'work_week']),
             models.Index(fields=['company', 'work_year', 'work_month']),
             models.Index(fields=['company', 'work_year', 'work_quarter']),
             models.Index(fields=['company', 'work_year']),
         ]
+        constraints = [
+            # 每筆填報記錄只同步一筆報表資料，增量同步以此做 upsert
+            models.UniqueConstraint(fields=['fill_work_id'], name='uniq_report_data_fill_work'),
+        ]
     
     def __str__(self):
         return f"{self.company}-{self.workorder_id}-{self.work_date}"
+
+
+class WorkHourRollupBase(models.Model):
+    """工時彙總表共用欄位 - 公司 × 作業員 × 工序 × 期間"""
+    
+    company = models.CharField(max_length=10, verbose_name="公司代號")
+    # 彙總表以空字串代替 NULL，確保唯一約束可以比對
+    operator_name = models.CharField(max_length=100, default='', blank=True, verbose_name="作業員姓名")
+    process_name = models.CharField(max_length=100, default='', blank=True, verbose_name="工序名稱")
+    
+    record_count = models.IntegerField(default=0, verbose_name="明細筆數")
+    work_hours = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="工作時數")
+    overtime_hours = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="加班時數")
+    total_hours = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="合計時數")
+    work_quantity = models.BigIntegerField(default=0, verbose_name="工作數量")
+    defect_quantity = models.BigIntegerField(default=0, verbose_name="不良品數量")
+    completed_quantity = models.BigIntegerField(default=0, verbose_name="完成數量")
+    
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+    
+    class Meta:
+        abstract = True
+
+
+class WorkHourDailyRollup(WorkHourRollupBase):
+    """工時日彙總表 - 由報表資料同步時增量維護"""
+    
+    work_date = models.DateField(verbose_name="工作日期")
+    work_week = models.IntegerField(verbose_name="工作週數")
+    work_week_year = models.IntegerField(verbose_name="工作週所屬年度")
+    work_month = models.IntegerField(verbose_name="工作月份")
+    work_quarter = models.IntegerField(verbose_name="工作季度")
+    work_year = models.IntegerField(verbose_name="工作年度")
+    
+    class Meta:
+        verbose_name = "工時日彙總"
+        verbose_name_plural = "工時日彙總"
+        db_table = 'workorder_report_daily_rollup'
+        indexes = [
+            models.Index(fields=['work_date']),
+            models.Index(fields=['company', 'work_week_year', 'work_week']),
+            models.Index(fields=['company', 'work_year', 'work_month']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'work_date', 'operator_name', 'process_name'],
+                name='uniq_report_daily_rollup',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company}-{self.work_date}-{self.operator_name}-{self.process_name}"
+
+
+class WorkHourWeeklyRollup(WorkHourRollupBase):
+    """工時週彙總表 - 由日彙總表重算，以 ISO 週所屬年度 + 週數為期間"""
+    
+    work_week_year = models.IntegerField(verbose_name="工作週所屬年度")
+    work_week = models.IntegerField(verbose_name="工作週數")
+    
+    class Meta:
+        verbose_name = "工時週彙總"
+        verbose_name_plural = "工時週彙總"
+        db_table = 'workorder_report_weekly_rollup'
+        indexes = [
+            models.Index(fields=['work_week_year', 'work_week']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'work_week_year', 'work_week', 'operator_name', 'process_name'],
+                name='uniq_report_weekly_rollup',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company}-{self.work_week_year}W{self.work_week}-{self.operator_name}-{self.process_name}"
+
+
+class WorkHourMonthlyRollup(WorkHourRollupBase):
+    """工時月彙總表 - 由日彙總表重算，季報表與年報表也由此加總"""
+    
+    work_year = models.IntegerField(verbose_name="工作年度")
+    work_month = models.IntegerField(verbose_name="工作月份")
+    work_quarter = models.IntegerField(verbose_name="工作季度")
+    
+    class Meta:
+        verbose_name = "工時月彙總"
+        verbose_name_plural = "工時月彙總"
+        db_table = 'workorder_report_monthly_rollup'
+        indexes = [
+            models.Index(fields=['work_year', 'work_month']),
+            models.Index(fields=['company', 'work_year', 'work_quarter']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'work_year', 'work_month', 'operator_name', 'process_name'],
+                name='uniq_report_monthly_rollup',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company}-{self.work_year}/{self.work_month}-{self.operator_name}-{self.process_name}"
+
+
+class WorkHourWeeklyWorkOrder(models.Model):
+    """週期間工單清單 - 每個公司、週出現過的工單各一筆，供摘要計算工單數"""
+    
+    company = models.CharField(max_length=10, verbose_name="公司代號")
+    work_week_year = models.IntegerField(verbose_name="工作週所屬年度")
+    work_week = models.IntegerField(verbose_name="工作週數")
+    workorder_id = models.CharField(max_length=50, verbose_name="工單編號")
+    
+    class Meta:
+        verbose_name = "工時週工單"
+        verbose_name_plural = "工時週工單"
+        db_table = 'workorder_report_weekly_workorder'
+        indexes = [
+            models.Index(fields=['work_week_year', 'work_week']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'work_week_year', 'work_week', 'workorder_id'],
+                name='uniq_report_weekly_workorder',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company}-{self.work_week_year}W{self.work_week}-{self.workorder_id}"
+
+
+class WorkHourMonthlyWorkOrder(models.Model):
+    """月期間工單清單 - 每個公司、月出現過的工單各一筆，季、年摘要也由此去重"""
+    
+    company = models.CharField(max_length=10, verbose_name="公司代號")
+    work_year = models.IntegerField(verbose_name="工作年度")
+    work_month = models.IntegerField(verbose_name="工作月份")
+    work_quarter = models.IntegerField(verbose_name="工作季度")
+    workorder_id = models.CharField(max_length=50, verbose_name="工單編號")
+    
+    class Meta:
+        verbose_name = "工時月工單"
+        verbose_name_plural = "工時月工單"
+        db_table = 'workorder_report_monthly_workorder'
+        indexes = [
+            models.Index(fields=['work_year', 'work_month']),
+            models.Index(fields=['company', 'work_year', 'work_quarter']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'work_year', 'work_month', 'workorder_id'],
+                name='uniq_report_monthly_workorder',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company}-{self.work_year}/{self.work_month}-{self.workorder_id}"
     
 
 
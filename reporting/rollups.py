@@ -0,0 +1,192 @@
+"""
+工時彙總表維護
+報表資料寫入後，依受影響的（公司, 工作日期）重算日彙總，再由日彙總重算對應的週、月彙總。
+週彙總以 ISO 週所屬年度 + 週數為期間，月彙總以日曆年度 + 月份為期間。
+季報表與年報表直接加總月彙總，不另外建表。
+各週、月另存出現過的工單清單，摘要的工單數由此去重，不必掃描明細。
+"""
+
+import logging
+from django.db import connection, transaction
+
+from .data_sync import get_period_fields
+
+logger = logging.getLogger(__name__)
+
+# 彙總表的數值欄位（三張彙總表相同）
+ROLLUP_MEASURES = [
+    'record_count', 'work_hours', 'overtime_hours', 'total_hours',
+    'work_quantity', 'defect_quantity', 'completed_quantity',
+]
+
+_MEASURE_COLUMNS = ", ".join(ROLLUP_MEASURES)
+_MEASURE_UPDATES = ", ".join(f"{column} = EXCLUDED.{column}" for column in ROLLUP_MEASURES)
+# 週、月彙總由日彙總加總
+_MEASURE_SUMS = ", ".join(f"SUM(d.{column})" for column in ROLLUP_MEASURES)
+
+DAILY_DELETE_SQL = """
+DELETE FROM workorder_report_daily_rollup t
+USING unnest(%s::varchar[], %s::date[]) AS k(company, work_date)
+WHERE t.company = k.company AND t.work_date = k.work_date
+"""
+
+DAILY_INSERT_SQL = f"""
+INSERT INTO workorder_report_daily_rollup (
+    company, work_date, operator_name, process_name,
+    work_week, work_week_year, work_month, work_quarter, work_year,
+    {_MEASURE_COLUMNS}, updated_at
+)
+SELECT r.company, r.work_date, COALESCE(r.operator_name, ''), COALESCE(r.process_name, ''),
+       MAX(r.work_week), MAX(r.work_week_year), MAX(r.work_month), MAX(r.work_quarter), MAX(r.work_year),
+       COUNT(*), SUM(r.work_hours), SUM(r.overtime_hours), SUM(r.total_hours),
+       SUM(r.work_quantity), SUM(r.defect_quantity), SUM(r.completed_quantity), NOW()
+FROM workorder_report_data r
+JOIN unnest(%s::varchar[], %s::date[]) AS k(company, work_date)
+  ON r.company = k.company AND r.work_date = k.work_date
+GROUP BY r.company, r.work_date, COALESCE(r.operator_name, ''), COALESCE(r.process_name, '')
+ON CONFLICT (company, work_date, operator_name, process_name)
+DO UPDATE SET work_week = EXCLUDED.work_week, work_week_year = EXCLUDED.work_week_year,
+              work_month = EXCLUDED.work_month, work_quarter = EXCLUDED.work_quarter,
+              work_year = EXCLUDED.work_year,
+              {_MEASURE_UPDATES}, updated_at = EXCLUDED.updated_at
+"""
+
+WEEKLY_DELETE_SQL = """
+DELETE FROM workorder_report_weekly_rollup t
+USING unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_week_year, work_week)
+WHERE t.company = k.company AND t.work_week_year = k.work_week_year AND t.work_week = k.work_week
+"""
+
+WEEKLY_INSERT_SQL = f"""
+INSERT INTO workorder_report_weekly_rollup (
+    company, work_week_year, work_week, operator_name, process_name,
+    {_MEASURE_COLUMNS}, updated_at
+)
+SELECT d.company, d.work_week_year, d.work_week, d.operator_name, d.process_name,
+       {_MEASURE_SUMS}, NOW()
+FROM workorder_report_daily_rollup d
+JOIN unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_week_year, work_week)
+  ON d.company = k.company AND d.work_week_year = k.work_week_year AND d.work_week = k.work_week
+GROUP BY d.company, d.work_week_year, d.work_week, d.operator_name, d.process_name
+ON CONFLICT (company, work_week_year, work_week, operator_name, process_name)
+DO UPDATE SET {_MEASURE_UPDATES}, updated_at = EXCLUDED.updated_at
+"""
+
+MONTHLY_DELETE_SQL = """
+DELETE FROM workorder_report_monthly_rollup t
+USING unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_year, work_month)
+WHERE t.company = k.company AND t.work_year = k.work_year AND t.work_month = k.work_month
+"""
+
+MONTHLY_INSERT_SQL = f"""
+INSERT INTO workorder_report_monthly_rollup (
+    company, work_year, work_month, work_quarter, operator_name, process_name,
+    {_MEASURE_COLUMNS}, updated_at
+)
+SELECT d.company, d.work_year, d.work_month, MAX(d.work_quarter), d.operator_name, d.process_name,
+       {_MEASURE_SUMS}, NOW()
+FROM workorder_report_daily_rollup d
+JOIN unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_year, work_month)
+  ON d.company = k.company AND d.work_year = k.work_year AND d.work_month = k.work_month
+GROUP BY d.company, d.work_year, d.work_month, d.operator_name, d.process_name
+ON CONFLICT (company, work_year, work_month, operator_name, process_name)
+DO UPDATE SET work_quarter = EXCLUDED.work_quarter, {_MEASURE_UPDATES}, updated_at = EXCLUDED.updated_at
+"""
+
+# 期間工單清單：工單數需跨作業員、工序去重，無法由彙總數值加總，另存各期間出現過的工單
+WEEKLY_WORKORDER_DELETE_SQL = """
+DELETE FROM workorder_report_weekly_workorder t
+USING unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_week_year, work_week)
+WHERE t.company = k.company AND t.work_week_year = k.work_week_year AND t.work_week = k.work_week
+"""
+
+WEEKLY_WORKORDER_INSERT_SQL = """
+INSERT INTO workorder_report_weekly_workorder (company, work_week_year, work_week, workorder_id)
+SELECT DISTINCT r.company, r.work_week_year, r.work_week, r.workorder_id
+FROM workorder_report_data r
+JOIN unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_week_year, work_week)
+  ON r.company = k.company AND r.work_week_year = k.work_week_year AND r.work_week = k.work_week
+ON CONFLICT (company, work_week_year, work_week, workorder_id) DO NOTHING
+"""
+
+MONTHLY_WORKORDER_DELETE_SQL = """
+DELETE FROM workorder_report_monthly_workorder t
+USING unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_year, work_month)
+WHERE t.company = k.company AND t.work_year = k.work_year AND t.work_month = k.work_month
+"""
+
+MONTHLY_WORKORDER_INSERT_SQL = """
+INSERT INTO workorder_report_monthly_workorder (company, work_year, work_month, work_quarter, workorder_id)
+SELECT r.company, r.work_year, r.work_month, MAX(r.work_quarter), r.workorder_id
+FROM workorder_report_data r
+JOIN unnest(%s::varchar[], %s::int[], %s::int[]) AS k(company, work_year, work_month)
+  ON r.company = k.company AND r.work_year = k.work_year AND r.work_month = k.work_month
+GROUP BY r.company, r.work_year, r.work_month, r.workorder_id
+ON CONFLICT (company, work_year, work_month, workorder_id) DO NOTHING
+"""
+
+
+def _columns(keys):
+    """把 [(a, b, c), ...] 轉成 ([a...], [b...], [c...]) 供 unnest 使用"""
+    return [list(column) for column in zip(*keys)]
+
+
+def refresh_rollups(day_keys):
+    """
+    重算受影響期間的彙總資料
+
+    Args:
+        day_keys: 可迭代的（公司代號, 工作日期），需包含異動前與異動後的值
+
+    Returns:
+        int: 重算的（公司, 日期）數量
+    """
+    day_keys = {(company, work_date) for company, work_date in day_keys if company and work_date}
+    if not day_keys:
+        return 0
+
+    week_keys = set()
+    month_keys = set()
+    for company, work_date in day_keys:
+        periods = get_period_fields(work_date)
+        week_keys.add((company, periods['work_week_year'], periods['work_week']))
+        month_keys.add((company, periods['work_year'], periods['work_month']))
+
+    day_params = _columns(sorted(day_keys))
+    week_params = _columns(sorted(week_keys))
+    month_params = _columns(sorted(month_keys))
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(DAILY_DELETE_SQL, day_params)
+            cursor.execute(DAILY_INSERT_SQL, day_params)
+            cursor.execute(WEEKLY_DELETE_SQL, week_params)
+            cursor.execute(WEEKLY_INSERT_SQL, week_params)
+            cursor.execute(WEEKLY_WORKORDER_DELETE_SQL, week_params)
+            cursor.execute(WEEKLY_WORKORDER_INSERT_SQL, week_params)
+            cursor.execute(MONTHLY_DELETE_SQL, month_params)
+            cursor.execute(MONTHLY_INSERT_SQL, month_params)
+            cursor.execute(MONTHLY_WORKORDER_DELETE_SQL, month_params)
+            cursor.execute(MONTHLY_WORKORDER_INSERT_SQL, month_params)
+
+    return len(day_keys)
+
+
+def rebuild_all_rollups():
+    """依目前所有報表資料重建彙總表（報表資料被批次修改或刪除後使用）"""
+    from .models import (
+        WorkOrderReportData, WorkHourDailyRollup, WorkHourWeeklyRollup, WorkHourMonthlyRollup,
+        WorkHourWeeklyWorkOrder, WorkHourMonthlyWorkOrder,
+    )
+
+    with transaction.atomic():
+        WorkHourDailyRollup.objects.all().delete()
+        WorkHourWeeklyRollup.objects.all().delete()
+        WorkHourMonthlyRollup.objects.all().delete()
+        WorkHourWeeklyWorkOrder.objects.all().delete()
+        WorkHourMonthlyWorkOrder.objects.all().delete()
+        day_keys = WorkOrderReportData.objects.values_list('company', 'work_date').distinct()
+        refreshed = refresh_rollups(day_keys)
+
+    logger.info(f"工時彙總表重建完成，共 {refreshed} 個公司日期")
+    return refreshed
@@ -0,0 +1,20 @@
+"""
+報表模組 - 信號處理
+行事曆事件異動時讓工作日曆快取失效
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from scheduling.models import Event
+from .workday_calendar import invalidate_workday_cache
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed_invalidate_workday_cache(sender, instance, **kwargs):
+    """
+    事件新增、修改或刪除後清除工作日曆快取
+    事件可能由工作日／放假日改為其他類型，因此不依事件類型過濾
+    """
+    invalidate_workday_cache()
@@ -0,0 +1,253 @@
+"""
+報表模組 - 測試
+"""
+
+from datetime import date, datetime, time
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from scheduling.models import Event
+from workorder.fill_work.models import FillWork
+
+from .data_collector import DataCollector
+from .data_sync import get_period_fields
+from .models import WorkOrderReportData, WorkHourWeeklyRollup, WorkHourMonthlyWorkOrder
+from .rollups import refresh_rollups
+from .work_hour_report_service import WorkHourReportService
+from .workday_calendar import WorkdayCalendarService
+
+
+def create_report_data(**kwargs):
+    """建立測試用報表資料"""
+    work_date = kwargs.pop('work_date', date(2025, 3, 10))
+    values = {
+        'workorder_id': 'WO-001',
+        'company': '10',
+        'operator_name': '王小明',
+        'product_code': 'PROD-A',
+        'process_name': '組裝',
+        'work_date': work_date,
+        'start_time': time(8, 0),
+        'end_time': time(12, 0),
+        'work_hours': Decimal('4.00'),
+        'overtime_hours': Decimal('0.00'),
+        'total_hours': Decimal('4.00'),
+        'daily_work_hours': 0,
+        'weekly_work_hours': 0,
+        'monthly_work_hours': 0,
+        'equipment_hours': 0,
+        'work_quantity': 100,
+        'defect_quantity': 0,
+    }
+    values.update(get_period_fields(work_date))
+    values.update(kwargs)
+    return WorkOrderReportData.objects.create(**values)
+
+
+class DataCollectorTest(TestCase):
+    """統一資料收集器測試"""
+
+    def setUp(self):
+        create_report_data()
+        create_report_data(
+            workorder_id='WO-002', process_name='測試',
+            work_hours=Decimal('3.50'), overtime_hours=Decimal('1.50'), total_hours=Decimal('5.00'),
+            work_quantity=40, defect_quantity=2,
+        )
+        create_report_data(
+            operator_name='李小華', work_hours=Decimal('8.00'), total_hours=Decimal('8.00'),
+            work_quantity=200,
+        )
+        create_report_data(company='20', operator_name=None, workorder_id='WO-900')
+        # 範圍外的資料不應計入
+        create_report_data(work_date=date(2025, 4, 1))
+
+    def test_collect_report_data_uses_single_query(self):
+        """摘要、分組統計與詳細資料只讀一次明細"""
+        collector = DataCollector()
+
+        with self.assertNumQueries(1):
+            result = collector.collect_report_data(date(2025, 3, 1), date(2025, 3, 31))
+
+        self.assertTrue(result['success'])
+        self.assertEqual(len(result['detailed_data']), 4)
+
+    def test_collect_report_data_totals(self):
+        """摘要與分組統計數值"""
+        result = DataCollector().collect_report_data(date(2025, 3, 1), date(2025, 3, 31))
+        summary = result['summary']
+
+        self.assertEqual(summary['total_records'], 4)
+        self.assertEqual(summary['normal_hours'], 19.5)
+        self.assertEqual(summary['overtime_hours'], 1.5)
+        self.assertEqual(summary['total_work_hours'], 19.5)
+        self.assertEqual(summary['operator_count'], 3)
+        self.assertEqual(summary['equipment_count'], 3)
+        self.assertEqual(summary['defect_quantity'], 2)
+
+        company_stats = {stat['company_name']: stat for stat in result['company_stats']}
+        self.assertEqual(result['company_stats'][0]['company_name'], '10')
+        self.assertEqual(company_stats['10']['record_count'], 3)
+        self.assertEqual(company_stats['10']['total_hours'], 17.0)
+        self.assertEqual(company_stats['10']['operator_count'], 2)
+        self.assertEqual(company_stats['20']['operator_count'], 0)
+
+        process_stats = {stat['process_name']: stat for stat in result['process_stats']}
+        self.assertEqual(process_stats['測試']['efficiency'], 42 / 3.5)
+
+        operator_stats = {stat['operator_name']: stat for stat in result['operator_stats']}
+        self.assertEqual(operator_stats['王小明']['equipment_count'], 2)
+        self.assertEqual(operator_stats['未指定']['record_count'], 1)
+
+    def test_collect_report_data_company_filter(self):
+        """指定公司時只統計該公司"""
+        result = DataCollector().collect_report_data(date(2025, 3, 1), date(2025, 3, 31), '20')
+
+        self.assertEqual(result['summary']['total_records'], 1)
+        self.assertEqual([stat['company_name'] for stat in result['company_stats']], ['20'])
+
+
+class WeeklyPeriodTest(TestCase):
+    """跨年 ISO 週的期間測試"""
+
+    def test_period_fields_use_iso_week_year(self):
+        periods = get_period_fields(date(2024, 12, 30))
+        self.assertEqual((periods['work_week_year'], periods['work_week']), (2025, 1))
+        self.assertEqual((periods['work_year'], periods['work_month']), (2024, 12))
+
+        periods = get_period_fields(date(2027, 1, 1))
+        self.assertEqual((periods['work_week_year'], periods['work_week']), (2026, 53))
+        self.assertEqual(periods['work_year'], 2027)
+
+    def test_weekly_rollup_keeps_boundary_week_together(self):
+        # 2024-12-30（週一）與 2025-01-02 同屬 2025 年第 1 週
+        create_report_data(work_date=date(2024, 12, 30))
+        create_report_data(workorder_id='WO-002', work_date=date(2025, 1, 2))
+        refresh_rollups([('10', date(2024, 12, 30)), ('10', date(2025, 1, 2))])
+
+        rollup = WorkHourWeeklyRollup.objects.get(work_week_year=2025, work_week=1)
+        self.assertEqual(rollup.record_count, 2)
+        self.assertEqual(rollup.work_hours, Decimal('8.00'))
+        self.assertFalse(WorkHourWeeklyRollup.objects.filter(work_week_year=2024).exists())
+
+        service = WorkHourReportService()
+        self.assertEqual(service.get_weekly_report('10', 2025, 1).count(), 2)
+        summary = service.get_weekly_summary('10', 2025, 1)
+        self.assertEqual(summary['total_work_hours'], Decimal('8.00'))
+        self.assertEqual(summary['total_workorders'], 2)
+
+
+class PeriodWorkOrderCountTest(TestCase):
+    """期間摘要工單數測試"""
+
+    def setUp(self):
+        # 同一工單有多位作業員、多道工序，只算一張
+        create_report_data(work_date=date(2025, 3, 10))
+        create_report_data(operator_name='李小華', process_name='測試', work_date=date(2025, 3, 11))
+        create_report_data(workorder_id='WO-002', work_date=date(2025, 3, 12))
+        create_report_data(workorder_id='WO-003', work_date=date(2025, 4, 1))
+        create_report_data(workorder_id='WO-004', company='20', work_date=date(2025, 3, 12))
+        self.day_keys = list(WorkOrderReportData.objects.values_list('company', 'work_date').distinct())
+        refresh_rollups(self.day_keys)
+        self.service = WorkHourReportService()
+
+    def test_summary_counts_distinct_workorders_per_period(self):
+        self.assertEqual(self.service.get_weekly_summary('10', 2025, 11)['total_workorders'], 2)
+        self.assertEqual(self.service.get_monthly_summary('10', 2025, 3)['total_workorders'], 2)
+        self.assertEqual(self.service.get_quarterly_summary('10', 2025, 1)['total_workorders'], 2)
+        self.assertEqual(self.service.get_yearly_summary('10', 2025)['total_workorders'], 3)
+        self.assertEqual(self.service.get_yearly_summary('all', 2025)['total_workorders'], 4)
+
+    def test_summary_does_not_scan_report_data(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.service.get_monthly_summary('10', 2025, 3)
+
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertNotIn('"workorder_report_data"', query['sql'])
+
+    def test_refresh_removes_deleted_workorders(self):
+        WorkOrderReportData.objects.filter(workorder_id='WO-002').delete()
+        refresh_rollups(self.day_keys)
+
+        self.assertEqual(self.service.get_monthly_summary('10', 2025, 3)['total_workorders'], 1)
+        self.assertFalse(WorkHourMonthlyWorkOrder.objects.filter(workorder_id='WO-002').exists())
+
+
+class UpdateWorkHoursCommandTest(TestCase):
+    """更新工作時數指令測試"""
+
+    def test_command_refreshes_rollups(self):
+        """依填報資料改寫工時後，週彙總同步更新"""
+        report = create_report_data(company='測試公司')
+        refresh_rollups([(report.company, report.work_date)])
+        fill_work = FillWork.objects.create(
+            operator='王小明', company_name='測試公司', workorder='WO-001', product_id='PROD-A',
+            planned_quantity=100, process_name='組裝', operation='組裝', work_date=report.work_date,
+            start_time=time(8, 0), end_time=time(12, 0), work_quantity=100,
+            approval_status='approved', created_by='testuser',
+        )
+        FillWork.objects.filter(pk=fill_work.pk).update(
+            work_hours_calculated=Decimal('3.50'), overtime_hours_calculated=Decimal('1.00'),
+        )
+
+        call_command('update_work_hours', stdout=StringIO())
+
+        rollup = WorkHourWeeklyRollup.objects.get(company='測試公司', operator_name='王小明')
+        self.assertEqual(rollup.work_hours, Decimal('3.50'))
+        self.assertEqual(rollup.total_hours, Decimal('4.50'))
+
+
+class WorkdayCalendarServiceTest(TestCase):
+    """工作日曆服務測試"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_event(date(2023, 3, 8), 'holiday')  # 週三放假
+        self.create_event(date(2023, 3, 11), 'workday')  # 週六補班
+
+    def create_event(self, event_date, event_type):
+        return Event.objects.create(
+            title=event_type,
+            start=timezone.make_aware(datetime.combine(event_date, time(0, 0))),
+            end=timezone.make_aware(datetime.combine(event_date, time(23, 59))),
+            type=event_type,
+            all_day=True,
+            created_by='test',
+        )
+
+    def test_is_workday_follows_events(self):
+        """工作日事件優先，其次放假日事件，最後依週末判斷"""
+        service = WorkdayCalendarService()
+
+        self.assertFalse(service.is_workday(date(2023, 3, 8)))
+        self.assertTrue(service.is_workday(date(2023, 3, 11)))
+        self.assertFalse(service.is_workday(date(2023, 3, 12)))
+        self.assertTrue(service.is_workday(date(2023, 3, 13)))
+
+    def test_workdays_count_uses_one_query_per_load(self):
+        """整年只查詢一次行事曆，之後由快取回答"""
+        with self.assertNumQueries(1):
+            count = WorkdayCalendarService().get_workdays_count(date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(count, 23)
+
+        with self.assertNumQueries(0):
+            workdays = WorkdayCalendarService().get_workdays_in_range(date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(len(workdays), 23)
+        self.assertNotIn(date(2023, 3, 8), workdays)
+
+    def test_event_change_invalidates_cache(self):
+        """事件異動後重新載入"""
+        service = WorkdayCalendarService()
+        self.assertTrue(service.is_workday(date(2023, 3, 9)))
+
+        self.create_event(date(2023, 3, 9), 'holiday')
+
+        self.assertFalse(service.is_workday(date(2023, 3, 9)))
@@ -1527,15 +1527,14 @@ def weekly_report(request):
             messages.error(request, f'生成週報表失敗: {str(e)}')
             return redirect('reporting:work_hour_report_index')
     
-    # GET 請求顯示表單
-    current_year = timezone.now().year
-    current_week = timezone.now().isocalendar()[1]
+    # GET 請求顯示表單（年度為 ISO 週所屬年度）
+    current_year, current_week, _ = timezone.now().isocalendar()
     
     context = {
         'current_year': current_year,
         'current_week': current_week,
         'years': range(current_year - 5, current_year + 1),
-        'weeks': range(1, 53),
+        'weeks': range(1, 54),  # 一年最多53週
     }
     return render(request, 'reporting/reporting/weekly_report_form.html', context)
 
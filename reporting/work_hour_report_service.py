@@ -8,7 +8,10 @@ from django.utils import timezone
 from decimal import Decimal
 import logging
 
-from .models import WorkOrderReportData
+from .models import (
+    WorkOrderReportData, WorkHourDailyRollup, WorkHourWeeklyRollup, WorkHourMonthlyRollup,
+    WorkHourWeeklyWorkOrder, WorkHourMonthlyWorkOrder,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +24,8 @@ class WorkHourReportService:
     
     def get_daily_report(self, company_code, date):
         """日報表"""
-        return WorkOrderReportData.objects.filter(
-            company=company_code,
-            work_date=date
-        )
+        queryset = WorkOrderReportData.objects.filter(work_date=date)
+        return self._filter_company(queryset, company_code)
     
     def get_daily_report_by_company_operator(self, company, operator, date):
         """按公司和作業員查詢日報表"""
@@ -142,112 +143,108 @@ class WorkHourReportService:
         return summary
     
     def get_weekly_report(self, company_code, year, week):
-        """週報表"""
-        return WorkOrderReportData.objects.filter(
-            company=company_code,
-            work_year=year,
+        """週報表（year 為 ISO 週所屬年度）"""
+        queryset = WorkOrderReportData.objects.filter(
+            work_week_year=year,
             work_week=week
-        ).order_by('operator_name', 'work_date')
+        )
+        return self._filter_company(queryset, company_code).order_by('operator_name', 'work_date')
     
     def get_monthly_report(self, company_code, year, month):
         """月報表"""
-        return WorkOrderReportData.objects.filter(
-            company=company_code,
+        queryset = WorkOrderReportData.objects.filter(
             work_year=year,
             work_month=month
-        ).order_by('operator_name', 'work_date')
+        )
+        return self._filter_company(queryset, company_code).order_by('operator_name', 'work_date')
     
     def get_quarterly_report(self, company_code, year, quarter):
         """季報表"""
-        return WorkOrderReportData.objects.filter(
-            company=company_code,
+        queryset = WorkOrderReportData.objects.filter(
             work_year=year,
             work_quarter=quarter
-        ).order_by('operator_name', 'work_date')
+        )
+        return self._filter_company(queryset, company_code).order_by('operator_name', 'work_date')
     
     def get_yearly_report(self, company_code, year):
         """年報表"""
-        return WorkOrderReportData.objects.filter(
-            company=company_code,
+        queryset = WorkOrderReportData.objects.filter(
             work_year=year
-        ).order_by('operator_name', 'work_date')
+        )
+        return self._filter_company(queryset, company_code).order_by('operator_name', 'work_date')
     
     def get_daily_summary(self, company_code, date):
-        """日報表摘要"""
-        data = self.get_daily_report(company_code, date)
-        
-        summary = {
-            'total_operators': data.values('operator_name').distinct().count(),
-            'total_workorders': data.values('workorder_id').distinct().count(),
-            'total_work_hours': data.aggregate(Sum('work_hours'))['work_hours__sum'] or 0,
-            'total_overtime_hours': data.aggregate(Sum('overtime_hours'))['overtime_hours__sum'] or 0,
-            'total_hours': data.aggregate(Sum('total_hours'))['total_hours__sum'] or 0,
-            'avg_work_hours': data.aggregate(Avg('work_hours'))['work_hours__avg'] or 0,
-            'avg_overtime_hours': data.aggregate(Avg('overtime_hours'))['overtime_hours__avg'] or 0
-        }
-        
-        return summary
+        """日報表摘要（單日明細可由日期索引取得，工單數直接由明細去重）"""
+        rollups = self._filter_company(WorkHourDailyRollup.objects.filter(work_date=date), company_code)
+        return self._build_period_summary(rollups, self.get_daily_report(company_code, date))
     
     def get_weekly_summary(self, company_code, year, week):
         """週報表摘要"""
-        data = self.get_weekly_report(company_code, year, week)
-        
-        summary = {
-            'total_operators': data.values('operator_name').distinct().count(),
-            'total_workorders': data.values('workorder_id').distinct().count(),
-            'total_work_hours': data.aggregate(Sum('work_hours'))['work_hours__sum'] or 0,
-            'total_overtime_hours': data.aggregate(Sum('overtime_hours'))['overtime_hours__sum'] or 0,
-            'total_hours': data.aggregate(Sum('total_hours'))['total_hours__sum'] or 0,
-            'avg_work_hours': data.aggregate(Avg('work_hours'))['work_hours__avg'] or 0,
-            'avg_overtime_hours': data.aggregate(Avg('overtime_hours'))['overtime_hours__avg'] or 0
-        }
-        
-        return summary
+        rollups = self._filter_company(
+            WorkHourWeeklyRollup.objects.filter(work_week_year=year, work_week=week), company_code
+        )
+        workorders = self._filter_company(
+            WorkHourWeeklyWorkOrder.objects.filter(work_week_year=year, work_week=week), company_code
+        )
+        return self._build_period_summary(rollups, workorders)
     
     def get_monthly_summary(self, company_code, year, month):
         """月報表摘要"""
-        data = self.get_monthly_report(company_code, year, month)
-        
-        summary = {
-            'total_operators': data.values('operator_name').distinct().count(),
-            'total_workorders': data.values('workorder_id').distinct().count(),
-            'total_work_hours': data.aggregate(Sum('work_hours'))['work_hours__sum'] or 0,
-            'total_overtime_hours': data.aggregate(Sum('overtime_hours'))['overtime_hours__sum'] or 0,
-            'total_hours': data.aggregate(Sum('total_hours'))['total_hours__sum'] or 0,
-            'avg_work_hours': data.aggregate(Avg('work_hours'))['work_hours__avg'] or 0,
-            'avg_overtime_hours': data.aggregate(Avg('overtime_hours'))['overtime_hours__avg'] or 0
-        }
-        
-        return summary
+        rollups = self._filter_company(
+            WorkHourMonthlyRollup.objects.filter(work_year=year, work_month=month), company_code
+        )
+        workorders = self._filter_company(
+            WorkHourMonthlyWorkOrder.objects.filter(work_year=year, work_month=month), company_code
+        )
+        return self._build_period_summary(rollups, workorders)
     
     def get_quarterly_summary(self, company_code, year, quarter):
         """季報表摘要"""
-        data = self.get_quarterly_report(company_code, year, quarter)
-        
-        summary = {
-            'total_operators': data.values('operator_name').distinct().count(),
-            'total_workorders': data.values('workorder_id').distinct().count(),
-            'total_work_hours': data.aggregate(Sum('work_hours'))['work_hours__sum'] or 0,
-            'total_overtime_hours': data.aggregate(Sum('overtime_hours'))['overtime_hours__sum'] or 0,
-            'total_hours': data.aggregate(Sum('total_hours'))['total_hours__sum'] or 0,
-            'avg_work_hours': data.aggregate(Avg('work_hours'))['work_hours__avg'] or 0,
-            'avg_overtime_hours': data.aggregate(Avg('overtime_hours'))['overtime_hours__avg'] or 0
-        }
-        
-        return summary
+        rollups = self._filter_company(
+            WorkHourMonthlyRollup.objects.filter(work_year=year, work_quarter=quarter), company_code
+        )
+        workorders = self._filter_company(
+            WorkHourMonthlyWorkOrder.objects.filter(work_year=year, work_quarter=quarter), company_code
+        )
+        return self._build_period_summary(rollups, workorders)
     
     def get_yearly_summary(self, company_code, year):
         """年報表摘要"""
-        data = self.get_yearly_report(company_code, year)
+        rollups = self._filter_company(WorkHourMonthlyRollup.objects.filter(work_year=year), company_code)
+        workorders = self._filter_company(WorkHourMonthlyWorkOrder.objects.filter(work_year=year), company_code)
+        return self._build_period_summary(rollups, workorders)
+    
+    def _filter_company(self, queryset, company_code):
+        """依公司代號過濾，未指定或為 all 時包含所有公司"""
+        if company_code and str(company_code).lower() != 'all':
+            queryset = queryset.filter(company=company_code)
+        return queryset
+    
+    def _build_period_summary(self, rollups, workorders):
+        """
+        由彙總表計算期間摘要
+        
+        時數與筆數直接加總彙總表；工單數需跨作業員去重，由期間工單清單（或單日明細）計算
+        """
+        totals = rollups.aggregate(
+            record_count=Sum('record_count'),
+            work_hours=Sum('work_hours'),
+            overtime_hours=Sum('overtime_hours'),
+            total_hours=Sum('total_hours'),
+            operator_count=Count('operator_name', distinct=True),
+        )
+        record_count = totals['record_count'] or 0
+        total_work_hours = totals['work_hours'] or 0
+        total_overtime_hours = totals['overtime_hours'] or 0
         
         summary = {
-            'total_operators': data.values('operator_name').distinct().count(),
-            'total_workorders': data.values('workorder_id').distinct().count(),
-            'total_work_hours': data.aggregate(Sum('work_hours'))['work_hours__sum'] or 0,
-            'total_overtime_hours': data.aggregate(Sum('overtime_hours'))['overtime_hours__sum'] or 0,
-            'total_hours': data.aggregate(Sum('total_hours'))['total_hours__sum'] or 0,
-            'avg_work_hours': data.aggregate(Avg('work_hours'))['work_hours__avg'] or 0,
-            'avg_overtime_hours': data.aggregate(Avg('overtime_hours'))['overtime_hours__avg'] or 0
+            'total_operators': totals['operator_count'],
+            'total_workorders': workorders.order_by().values('workorder_id').distinct().count(),
+            'total_work_hours': total_work_hours,
+            'total_overtime_hours': total_overtime_hours,
+            'total_hours': totals['total_hours'] or 0,
+            'avg_work_hours': total_work_hours / record_count if record_count else 0,
+            'avg_overtime_hours': total_overtime_hours / record_count if record_count else 0
         }
         
         return summary
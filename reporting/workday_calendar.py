@@ -4,17 +4,34 @@
 """
 
 import logging
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
+from django.core.cache import cache
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+# 年度工作日位元圖的快取鍵；版本號在行事曆事件異動時遞增，讓所有年度快取一起失效
+WORKDAY_CACHE_KEY = "workday_calendar:{version}:{year}"
+WORKDAY_CACHE_VERSION_KEY = "workday_calendar:version"
+WORKDAY_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def invalidate_workday_cache():
+    """行事曆事件異動後讓所有年度的工作日快取失效"""
+    try:
+        cache.incr(WORKDAY_CACHE_VERSION_KEY)
+    except ValueError:
+        # 版本號尚未建立或已過期
+        cache.set(WORKDAY_CACHE_VERSION_KEY, 2, None)
+
 
 class WorkdayCalendarService:
     """工作日曆服務 - 只負責工作日曆邏輯"""
     
     def __init__(self):
-        pass
+        # 年度 -> (位元圖, 前綴和)，位元圖每個 byte 代表該年一天，1 為工作日
+        self._years = {}
+        self._cache_version = None
     
     def get_previous_workday(self, current_date):
         """
@@ -53,51 +70,8 @@ class WorkdayCalendarService:
             bool: True 表示是工作日，False 表示不是工作日
         """
         try:
-            # 從行事曆系統查詢該日期的事件
-            from scheduling.models import Event
-            from django.utils import timezone
-            
-            # 將日期轉換為 datetime 範圍（當天的開始和結束時間）
-            start_datetime = timezone.make_aware(
-                timezone.datetime.combine(check_date, timezone.datetime.min.time())
-            )
-            end_datetime = timezone.make_aware(
-                timezone.datetime.combine(check_date, timezone.datetime.max.time())
-            )
-            
-            # 查詢該日期的所有事件
-            events = Event.objects.filter(
-                start__lte=end_datetime,
-                end__gte=start_datetime,
-                all_day=True
-            )
-            
-            # 檢查是否有明確的工作日事件
-            has_workday_event = events.filter(type='workday').exists()
-            if has_workday_event:
-                logger.info(f"日期 {check_date} 有明確的工作日事件，視為工作日")
-                return True
-            
-            # 檢查是否有放假日事件
-            has_holiday_event = events.filter(type='holiday').exists()
-            if has_holiday_event:
-                logger.info(f"日期 {check_date} 有放假日事件，視為非工作日")
-                return False
-            
-            # 如果沒有明確的事件設定，使用預設邏輯
-            # 檢查是否為週末
-            if check_date.weekday() >= 5:  # 週六(5) 或 週日(6)
-                logger.info(f"日期 {check_date} 是週末，視為非工作日")
-                return False
-            
-            # 檢查是否為國定假日
-            if self.is_holiday(check_date):
-                logger.info(f"日期 {check_date} 是國定假日，視為非工作日")
-                return False
-            
-            # 預設為工作日
-            logger.info(f"日期 {check_date} 沒有特殊設定，預設為工作日")
-            return True
+            bitmap, _ = self._get_year(check_date.year)
+            return bool(bitmap[check_date.timetuple().tm_yday - 1])
             
         except Exception as e:
             logger.error(f"檢查工作日失敗: {str(e)}")
@@ -194,12 +168,13 @@ class WorkdayCalendarService:
         """
         try:
             workdays = []
-            current_date = start_date
-            
-            while current_date <= end_date:
-                if self.is_workday(current_date):
-                    workdays.append(current_date)
-                current_date += timedelta(days=1)
+            self._load_years(range(start_date.year, end_date.year + 1))
+            for year, first, last in self._split_by_year(start_date, end_date):
+                bitmap, _ = self._years[year]
+                year_start = date(year, 1, 1)
+                for offset in range(first, last + 1):
+                    if bitmap[offset]:
+                        workdays.append(year_start + timedelta(days=offset))
             
             return workdays
             
@@ -209,7 +184,7 @@ class WorkdayCalendarService:
     
     def get_workdays_count(self, start_date, end_date):
         """
-        取得指定日期範圍內的工作日數量
+        取得指定日期範圍內的工作日數量（以各年度前綴和計算）
         
         Args:
             start_date: 開始日期
@@ -218,8 +193,18 @@ class WorkdayCalendarService:
         Returns:
             int: 工作日數量
         """
-        workdays = self.get_workdays_in_range(start_date, end_date)
-        return len(workdays)
+        try:
+            count = 0
+            self._load_years(range(start_date.year, end_date.year + 1))
+            for year, first, last in self._split_by_year(start_date, end_date):
+                _, prefix = self._years[year]
+                count += prefix[last + 1] - prefix[first]
+            
+            return count
+            
+        except Exception as e:
+            logger.error(f"取得工作日數量失敗: {str(e)}")
+            return 0
     
     def get_next_workday(self, current_date):
         """
@@ -244,3 +229,91 @@ class WorkdayCalendarService:
             logger.error(f"取得下一個工作日失敗: {str(e)}")
             # 如果出錯，返回明天
             return current_date + timedelta(days=1)
+    
+    def _split_by_year(self, start_date, end_date):
+        """把日期範圍切成 (年度, 起始日序, 結束日序)，日序從 0 起算"""
+        for year in range(start_date.year, end_date.year + 1):
+            first = start_date if start_date.year == year else date(year, 1, 1)
+            last = end_date if end_date.year == year else date(year, 12, 31)
+            yield year, first.timetuple().tm_yday - 1, last.timetuple().tm_yday - 1
+    
+    def _get_year(self, year):
+        """取得年度位元圖與前綴和"""
+        self._load_years([year])
+        return self._years[year]
+    
+    def _load_years(self, years):
+        """載入年度工作日位元圖：先讀程序內與共用快取，缺少的年度以單一查詢建立"""
+        version = cache.get(WORKDAY_CACHE_VERSION_KEY, 1)
+        if version != self._cache_version:
+            self._years = {}
+            self._cache_version = version
+        
+        missing = []
+        for year in years:
+            if year in self._years:
+                continue
+            bitmap = cache.get(WORKDAY_CACHE_KEY.format(version=version, year=year))
+            if bitmap is None:
+                missing.append(year)
+            else:
+                self._set_year(year, bitmap)
+        
+        if not missing:
+            return
+        
+        for year, bitmap in self._build_bitmaps(min(missing), max(missing)).items():
+            if year in missing:
+                cache.set(WORKDAY_CACHE_KEY.format(version=version, year=year), bitmap, WORKDAY_CACHE_TIMEOUT)
+                self._set_year(year, bitmap)
+    
+    def _set_year(self, year, bitmap):
+        prefix = [0]
+        for bit in bitmap:
+            prefix.append(prefix[-1] + bit)
+        self._years[year] = (bitmap, prefix)
+    
+    def _build_bitmaps(self, first_year, last_year):
+        """
+        以單一查詢讀取期間內的全天工作日／放假日事件，建立各年度的工作日位元圖
+        
+        規則與逐日判斷相同：工作日事件優先，其次放假日事件，都沒有時依週末與國定假日判斷
+        """
+        from scheduling.models import Event
+        
+        range_start = timezone.make_aware(datetime.combine(date(first_year, 1, 1), time.min))
+        range_end = timezone.make_aware(datetime.combine(date(last_year, 12, 31), time.max))
+        
+        workday_dates = set()
+        holiday_dates = set()
+        events = Event.objects.filter(
+            start__lte=range_end,
+            end__gte=range_start,
+            all_day=True,
+            type__in=['workday', 'holiday'],
+        ).values_list('start', 'end', 'type')
+        for start, end, event_type in events:
+            target = workday_dates if event_type == 'workday' else holiday_dates
+            current = max(timezone.localtime(start).date(), date(first_year, 1, 1))
+            last = min(timezone.localtime(end).date(), date(last_year, 12, 31))
+            while current <= last:
+                target.add(current)
+                current += timedelta(days=1)
+        
+        bitmaps = {}
+        for year in range(first_year, last_year + 1):
+            year_start = date(year, 1, 1)
+            days = (date(year + 1, 1, 1) - year_start).days
+            bitmap = bytearray(days)
+            for offset in range(days):
+                current = year_start + timedelta(days=offset)
+                if current in workday_dates:
+                    bitmap[offset] = 1
+                elif current in holiday_dates:
+                    bitmap[offset] = 0
+                else:
+                    bitmap[offset] = 0 if current.weekday() >= 5 or self.is_holiday(current) else 1
+            bitmaps[year] = bytes(bitmap)
+        
+        logger.debug(f"建立 {first_year}-{last_year} 年工作日位元圖")
+        return bitmaps
@@ -1,3 +1,4 @@
+import bisect
 import logging
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -328,6 +329,177 @@ def generate_auto_tasks(
         )
 
 
+# ==================== 資源時間線 ====================
+
+
+class ResourceTimeline:
+    """
+    記憶體內的資源時間線
+
+    一次載入排程期間內所有相關的 Event，依資源（作業員、設備、SMT 設備）
+    分別維護依開始時間排序的區間陣列與「前綴最大結束時間」陣列，
+    衝突檢查以二分搜尋完成，不再逐次查詢資料庫。
+    """
+
+    OPERATOR = "operator"
+    EQUIPMENT = "equipment"
+    SMT = "smt"
+
+    def __init__(self, operator_ids=None, equipment_ids=None):
+        self.operator_ids = {str(i) for i in (operator_ids or [])}
+        self.equipment_ids = {str(i) for i in (equipment_ids or [])}
+        self._starts = {}  # 資源 -> 已排序的開始時間
+        self._ends = {}  # 資源 -> 與開始時間對應的結束時間
+        self._max_ends = {}  # 資源 -> 前綴最大結束時間
+        self._loaded_event_ids = set()
+        self._loaded_start = None
+        self._loaded_end = None
+        self.query_count = 0
+
+    def ensure_loaded(self, start_time, end_time):
+        """確保 [start_time, end_time) 範圍內的事件都已載入（僅補載缺少的區段）"""
+        if self._loaded_start is None:
+            self._load_range(start_time, end_time)
+            self._loaded_start, self._loaded_end = start_time, end_time
+            return
+        if start_time < self._loaded_start:
+            self._load_range(start_time, self._loaded_start)
+            self._loaded_start = start_time
+        if end_time > self._loaded_end:
+            self._load_range(self._loaded_end, end_time)
+            self._loaded_end = end_time
+
+    def _load_range(self, start_time, end_time):
+        from django.db.models import Q
+        from .models import Event
+
+        resource_filter = Q()
+        if self.operator_ids:
+            resource_filter |= Q(employee_id__in=self.operator_ids)
+        if self.equipment_ids:
+            resource_filter |= Q(equipment_id__in=self.equipment_ids)
+        if not resource_filter:
+            return
+
+        events = (
+            Event.objects.filter(resource_filter, start__lt=end_time, end__gt=start_time)
+            .values_list("id", "start", "end", "employee_id", "equipment_id")
+            .iterator(chunk_size=2000)
+        )
+        self.query_count += 1
+        for event_id, start, end, employee_id, equipment_id in events:
+            if event_id in self._loaded_event_ids:
+                continue
+            self._loaded_event_ids.add(event_id)
+            if employee_id in self.operator_ids:
+                self.reserve(self.OPERATOR, employee_id, start, end)
+            if equipment_id in self.equipment_ids:
+                self.reserve(self.EQUIPMENT, equipment_id, start, end)
+
+    def reserve(self, resource_type, resource_id, start_time, end_time):
+        """在資源時間線上登記一段占用區間"""
+        key = (resource_type, str(resource_id))
+        starts = self._starts.setdefault(key, [])
+        ends = self._ends.setdefault(key, [])
+        max_ends = self._max_ends.setdefault(key, [])
+
+        index = bisect.bisect_right(starts, start_time)
+        starts.insert(index, start_time)
+        ends.insert(index, end_time)
+        max_ends.insert(index, end_time)
+        # 自插入點起重新計算前綴最大結束時間
+        running = max_ends[index - 1] if index > 0 else None
+        for i in range(index, len(max_ends)):
+            if running is None or ends[i] > running:
+                running = ends[i]
+            max_ends[i] = running
+
+    def release(self, resource_type, resource_id, start_time, end_time):
+        """移除 reserve 登記的一段占用區間（排程失敗時退回）"""
+        key = (resource_type, str(resource_id))
+        starts = self._starts.get(key, [])
+        ends = self._ends.get(key, [])
+        max_ends = self._max_ends.get(key, [])
+
+        index = bisect.bisect_left(starts, start_time)
+        while index < len(starts) and starts[index] == start_time:
+            if ends[index] == end_time:
+                break
+            index += 1
+        else:
+            return False
+
+        del starts[index], ends[index], max_ends[index]
+        running = max_ends[index - 1] if index > 0 else None
+        for i in range(index, len(max_ends)):
+            if running is None or ends[i] > running:
+                running = ends[i]
+            max_ends[i] = running
+        return True
+
+    def _latest_end_before(self, key, end_time):
+        """回傳開始時間早於 end_time 的區間中最晚的結束時間"""
+        starts = self._starts.get(key)
+        if not starts:
+            return None
+        index = bisect.bisect_left(starts, end_time)
+        if index == 0:
+            return None
+        return self._max_ends[key][index - 1]
+
+    def is_free(self, resource_type, resource_id, start_time, end_time):
+        """資源在 [start_time, end_time) 是否沒有任何占用"""
+        latest_end = self._latest_end_before((resource_type, str(resource_id)), end_time)
+        return latest_end is None or latest_end <= start_time
+
+
+def create_production_events(tasks, created_by):
+    """
+    將排程任務一次以 bulk_create 寫入 Event
+
+    Args:
+        tasks: 排程任務列表（generate_auto_tasks / generate_optimized_auto_tasks 的輸出）
+        created_by: 建立者帳號
+
+    Returns:
+        建立的事件數量
+    """
+    from .models import Event, OrderMain
+
+    if not tasks:
+        return 0
+
+    orders = OrderMain.objects.in_bulk({task.get("order_id") for task in tasks})
+    events = []
+    for task in tasks:
+        order = orders.get(task.get("order_id"))
+        product_name = order.product_name if order else task.get("order_id")
+        operator = task.get("selected_operator")
+        equipment = task.get("selected_equipment")
+        events.append(
+            Event(
+                title=f"產品 {product_name} - {task['process']['name']}",
+                start=datetime.strptime(task["start_time"], "%Y-%m-%dT%H:%M").replace(
+                    tzinfo=TAIWAN_TZ
+                ),
+                end=datetime.strptime(task["end_time"], "%Y-%m-%dT%H:%M").replace(
+                    tzinfo=TAIWAN_TZ
+                ),
+                type="production",
+                description=task.get("description") or "",
+                classNames="production",
+                all_day=False,
+                category="general",
+                created_by=created_by,
+                employee_id=operator["id"] if operator else None,
+                equipment_id=equipment["id"] if equipment else None,
+                order_id=str(task.get("order_id")),
+            )
+        )
+    Event.objects.bulk_create(events, batch_size=500)
+    return len(events)
+
+
 # ==================== 優化全自動排程算法 ====================
 
 
@@ -339,7 +511,10 @@ class OptimizedAutoScheduler:
         self.operators = operators
         self.equipments = equipments
         self.smt_equipments = smt_equipments
-        self.resource_timeline = {}  # 資源時間線
+        self.resource_timeline = ResourceTimeline(
+            operator_ids=[op["id"] for op in operators],
+            equipment_ids=[eq["id"] for eq in equipments],
+        )  # 資源時間線
         self.order_priority_scores = {}  # 訂單優先級分數
 
     def calculate_order_priority(self, order, current_time):
@@ -408,6 +583,9 @@ class OptimizedAutoScheduler:
         best_slot = None
         best_score = float("inf")
 
+        # 一次載入整個搜尋範圍的事件，後續檢查皆在記憶體內完成
+        self.resource_timeline.ensure_loaded(start_time, end_time)
+
         # 在時間範圍內尋找最佳時間槽
         current_time = start_time
         while current_time + timedelta(minutes=duration_minutes) <= end_time:
@@ -468,46 +646,68 @@ class OptimizedAutoScheduler:
 
     def get_available_operators(self, start_time, end_time, process_id):
         """獲取可用作業員"""
-        available = []
-        for operator in self.operators:
-            if process_id not in operator.get("process_names", []):
-                continue
-            conflicts = check_resource_conflicts(
-                operator_id=operator["id"],
-                start_time=start_time.strftime("%Y-%m-%dT%H:%M"),
-                end_time=end_time.strftime("%Y-%m-%dT%H:%M"),
+        self.resource_timeline.ensure_loaded(start_time, end_time)
+        return [
+            operator
+            for operator in self.operators
+            if process_id in operator.get("process_names", [])
+            and self.resource_timeline.is_free(
+                ResourceTimeline.OPERATOR, operator["id"], start_time, end_time
             )
-            if not conflicts:
-                available.append(operator)
-        return available
+        ]
 
     def get_available_equipment(self, start_time, end_time, process_id):
         """獲取可用設備"""
-        available = []
-        for equipment in self.equipments:
-            if process_id not in equipment.get("process_names", []):
-                continue
-            conflicts = check_resource_conflicts(
-                equipment_id=equipment["id"],
-                start_time=start_time.strftime("%Y-%m-%dT%H:%M"),
-                end_time=end_time.strftime("%Y-%m-%dT%H:%M"),
+        self.resource_timeline.ensure_loaded(start_time, end_time)
+        return [
+            equipment
+            for equipment in self.equipments
+            if process_id in equipment.get("process_names", [])
+            and self.resource_timeline.is_free(
+                ResourceTimeline.EQUIPMENT, equipment["id"], start_time, end_time
             )
-            if not conflicts:
-                available.append(equipment)
-        return available
+        ]
 
     def get_available_smt_equipment(self, start_time, end_time):
         """獲取可用SMT設備"""
-        available = []
-        for smt_equipment in self.smt_equipments:
-            conflicts = check_resource_conflicts(
-                smt_equipment_id=smt_equipment["id"],
-                start_time=start_time.strftime("%Y-%m-%dT%H:%M"),
-                end_time=end_time.strftime("%Y-%m-%dT%H:%M"),
+        self.resource_timeline.ensure_loaded(start_time, end_time)
+        return [
+            smt_equipment
+            for smt_equipment in self.smt_equipments
+            if self.resource_timeline.is_free(
+                ResourceTimeline.SMT, smt_equipment["id"], start_time, end_time
+            )
+        ]
+
+    def reserve_resources(self, start_time, end_time, operator, equipment, smt_equipment):
+        """將已分配的資源登記到時間線，避免同一次排程重複占用"""
+        if operator:
+            self.resource_timeline.reserve(
+                ResourceTimeline.OPERATOR, operator["id"], start_time, end_time
+            )
+        if equipment:
+            self.resource_timeline.reserve(
+                ResourceTimeline.EQUIPMENT, equipment["id"], start_time, end_time
+            )
+        if smt_equipment:
+            self.resource_timeline.reserve(
+                ResourceTimeline.SMT, smt_equipment["id"], start_time, end_time
+            )
+
+    def release_resources(self, start_time, end_time, operator, equipment, smt_equipment):
+        """退回 reserve_resources 登記的資源占用"""
+        if operator:
+            self.resource_timeline.release(
+                ResourceTimeline.OPERATOR, operator["id"], start_time, end_time
+            )
+        if equipment:
+            self.resource_timeline.release(
+                ResourceTimeline.EQUIPMENT, equipment["id"], start_time, end_time
+            )
+        if smt_equipment:
+            self.resource_timeline.release(
+                ResourceTimeline.SMT, smt_equipment["id"], start_time, end_time
             )
-            if not conflicts:
-                available.append(smt_equipment)
-        return available
 
     def calculate_setup_time_penalty(self, start_time, end_time):
         """計算設置時間懲罰"""
@@ -569,6 +769,7 @@ class OptimizedAutoScheduler:
     def schedule_order(self, order, routes, current_time):
         """排程單個訂單"""
         tasks = []
+        reservations = []  # 本訂單已登記的資源，任一工序失敗時全部退回
         order_qty = int(order.qty_remain)
 
         # 計算訂單完成的最晚時間
@@ -588,6 +789,8 @@ class OptimizedAutoScheduler:
             )
 
             if start_time is None:
+                for reservation in reservations:
+                    self.release_resources(*reservation)
                 return (
                     [],
                     f"無法為工序 {process_id} 找到合適的時間槽",
@@ -595,6 +798,9 @@ class OptimizedAutoScheduler:
                 )
 
             end_time = start_time + timedelta(minutes=duration_minutes)
+            reservation = (start_time, end_time, operator, equipment, smt_equipment)
+            self.reserve_resources(*reservation)
+            reservations.append(reservation)
 
             process_name = next(
                 (p["name"] for p in self.processes if p["id"] == process_id), "Unknown"
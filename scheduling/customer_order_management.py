@@ -9,20 +9,51 @@
 """
 
 import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
-from django.db import connections, DatabaseError
+from django.db import connections, transaction, DatabaseError
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q, Count, Sum, F
+from django.db.models import Q, Count, Sum, F, QuerySet
 from django.http import HttpResponse
 import csv
 import json
 
-from .models import OrderMain, OrderUpdateSchedule, SchedulingOperationLog
+from .models import OrderMain, OrderUpdateSchedule, SchedulingOperationLog, parse_order_date
 
 logger = logging.getLogger("scheduling.customer_order_management")
 
+# 同步比對訂單的鍵值欄位（同一鍵值可能有多筆訂單明細）
+ORDER_SYNC_KEY_FIELDS = ("company_name", "bill_no", "product_id")
+
+# 同步時比對與更新的欄位
+ORDER_SYNC_UPDATE_FIELDS = (
+    "customer_short_name", "product_name", "quantity", "pre_in_date",
+    "qty_remain", "order_type", "bill_date",
+)
+
+# 由字串日期轉換的日期欄位（pre_in_date → delivery_date，bill_date → order_date）
+ORDER_DATE_FIELDS = ("delivery_date", "order_date")
+
+# bulk_create／bulk_update 每批筆數
+ORDER_SYNC_BATCH_SIZE = 1000
+
+# 訂單列表可用的排序參數 → 日期欄位
+ORDER_SORT_FIELDS = {
+    "pre_in_date": "delivery_date",
+    "bill_date": "order_date",
+}
+
+# 訂單列表每頁預設與最大筆數
+ORDER_PAGE_SIZE = 20
+ORDER_MAX_PAGE_SIZE = 100
+
+# 匯出時每次從資料庫讀取的筆數
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
 
 class OrderManager:
     """
@@ -32,66 +63,212 @@ class OrderManager:
     def __init__(self):
         self.logger = logging.getLogger("scheduling.order_manager")
 
-    def sync_orders_from_erp(self, user=None, ip_address=None) -> Dict[str, any]:
+    def sync_orders_from_erp(self, user=None, ip_address=None, sync_log=None) -> Dict[str, any]:
         """
         從 ERP 整合模組已同步的資料中提取訂單資料
 
+        各公司的訂單先載入記憶體，再與既有訂單依（公司名稱, 訂單號, 產品編號）比對，
+        在同一個交易中批次新增、更新、刪除，同步期間訂單表不會被清空；
+        讀取失敗的公司保留原有訂單，不會被誤刪
+
         Args:
             user: 執行同步的使用者
             ip_address: 使用者 IP 地址
+            sync_log: 要寫入結果的 OrderSyncLog，省略時自動建立
 
         Returns:
-            Dict 包含同步結果
+            Dict 包含同步結果與新增、更新、刪除筆數
         """
+        from system.models import OrderSyncLog
+
+        started = time.monotonic()
+        if sync_log is None:
+            sync_log = OrderSyncLog.objects.create(
+                sync_type="sync",
+                status="running",
+                message=f"{user.username} 手動同步" if user else "同步訂單資料",
+            )
+
         try:
             self.logger.info("開始從 ERP 整合模組提取訂單資料")
 
-            # 清空現有訂單資料
-            OrderMain.objects.all().delete()
-            self.logger.debug("已清空 OrderMain 表")
-
-            orders = []
-            # 使用 ERP 模組的 API 獲取公司配置
-            companies_data = self._get_companies_via_api()
-            self.logger.debug(f"透過 API 獲取 {len(companies_data)} 家公司配置")
+            companies_data = self._get_company_configs()
+            self.logger.debug(f"取得 {len(companies_data)} 家公司配置")
 
             if not companies_data:
                 self.logger.warning("無公司配置資料，無法查詢訂單")
-                return {
+                result = {
                     "status": "error",
                     "message": "無公司配置，請先設定公司資料庫",
                     "total_orders": 0,
                 }
+                self._finish_sync_log(sync_log, result, started)
+                return result
 
-            # 處理每家公司
+            # 先把每家公司的訂單並行載入暫存
+            orders = []
+            synced_companies = []
+            failed_companies = []
+            fetched, company_latency = self._fetch_companies_orders(companies_data)
             for company_data in companies_data:
-                manufacturing_orders = self._sync_manufacturing_orders_from_company_data(company_data)
-                orders.extend(manufacturing_orders)
+                company_orders = fetched.get(company_data.get("company_name"))
+                if company_orders is None:
+                    failed_companies.append(company_data.get("company_name"))
+                    continue
+                synced_companies.append(company_data.get("company_name"))
+                orders.extend(company_orders)
+
+            if not synced_companies:
+                result = {
+                    "status": "error",
+                    "message": f"所有公司的訂單資料讀取失敗：{', '.join(map(str, failed_companies))}",
+                    "total_orders": 0,
+                    "failed_companies": failed_companies,
+                    "company_latency": company_latency,
+                }
+                self._finish_sync_log(sync_log, result, started)
+                return result
 
-            # 儲存訂單資料
-            self._save_orders(orders)
+            # 比對後批次寫入；不在公司設定中的公司訂單一併清除
+            configured_companies = [company_data.get("company_name") for company_data in companies_data]
+            scope = Q(company_name__in=synced_companies) | ~Q(company_name__in=configured_companies)
+            counts = self._apply_order_diff(orders, scope)
 
             # 更新同步時間
             self._update_sync_timestamp()
 
             # 記錄操作日誌
             if user:
-                self._log_operation(user, ip_address, f"提取 {len(orders)} 筆訂單")
+                self._log_operation(
+                    user, ip_address,
+                    f"提取 {len(orders)} 筆訂單（新增 {counts['created']}、更新 {counts['updated']}、刪除 {counts['deleted']}）",
+                )
 
-            self.logger.info(f"訂單資料提取完成，共處理 {len(orders)} 筆訂單")
-            return {
+            message = (
+                f"訂單數據提取成功，共 {len(orders)} 筆"
+                f"（新增 {counts['created']}、更新 {counts['updated']}、刪除 {counts['deleted']}）"
+            )
+            if failed_companies:
+                message += f"；以下公司讀取失敗，保留原有訂單：{', '.join(map(str, failed_companies))}"
+            self.logger.info(message)
+            result = {
                 "status": "success",
-                "message": f"訂單數據提取成功，共 {len(orders)} 筆",
+                "message": message,
                 "total_orders": len(orders),
+                **counts,
+                "failed_companies": failed_companies,
+                "company_latency": company_latency,
             }
+            self._finish_sync_log(sync_log, result, started)
+            return result
 
         except Exception as e:
             self.logger.error(f"訂單資料提取失敗: {str(e)}", exc_info=True)
-            return {
+            result = {
                 "status": "error",
                 "message": f"提取失敗: {str(e)}",
                 "total_orders": 0,
             }
+            self._finish_sync_log(sync_log, result, started)
+            return result
+
+    def _apply_order_diff(self, orders: List[Dict], scope: Q) -> Dict[str, int]:
+        """
+        將暫存訂單與既有訂單比對，在單一交易中批次新增、更新、刪除
+
+        同一鍵值有多筆明細時，先配對內容完全相同的訂單，其餘依序配對更新，多出的新增或刪除
+
+        Args:
+            orders: 暫存的訂單資料
+            scope: 本次同步涵蓋的既有訂單範圍
+
+        Returns:
+            Dict: created、updated、deleted、unchanged 筆數
+        """
+        staged = defaultdict(list)
+        for order in orders:
+            staged[tuple(order[field] for field in ORDER_SYNC_KEY_FIELDS)].append(
+                tuple(order[field] for field in ORDER_SYNC_UPDATE_FIELDS)
+            )
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        delete_ids = []
+        unchanged = 0
+
+        with transaction.atomic():
+            existing = defaultdict(list)
+            rows = OrderMain.objects.filter(scope).order_by("id").values_list(
+                "id", *ORDER_SYNC_KEY_FIELDS, *ORDER_SYNC_UPDATE_FIELDS
+            )
+            key_length = len(ORDER_SYNC_KEY_FIELDS)
+            for row in rows:
+                existing[row[1:1 + key_length]].append((row[0], row[1 + key_length:]))
+
+            for key, staged_values in staged.items():
+                remaining = existing.pop(key, [])
+                unmatched = []
+                for values in staged_values:
+                    match = next((index for index, (_, current) in enumerate(remaining) if current == values), None)
+                    if match is None:
+                        unmatched.append(values)
+                    else:
+                        remaining.pop(match)
+                        unchanged += 1
+
+                for (order_id, _), values in zip(remaining, unmatched):
+                    to_update.append(OrderMain(
+                        id=order_id, updated_at=now,
+                        **dict(zip(ORDER_SYNC_KEY_FIELDS, key)), **dict(zip(ORDER_SYNC_UPDATE_FIELDS, values)),
+                    ))
+                for values in unmatched[len(remaining):]:
+                    to_create.append(OrderMain(
+                        **dict(zip(ORDER_SYNC_KEY_FIELDS, key)), **dict(zip(ORDER_SYNC_UPDATE_FIELDS, values)),
+                    ))
+                delete_ids.extend(order_id for order_id, _ in remaining[len(unmatched):])
+
+            # ERP 已不存在的訂單
+            for existing_rows in existing.values():
+                delete_ids.extend(order_id for order_id, _ in existing_rows)
+
+            # bulk_create／bulk_update 不呼叫 save()，日期欄位需自行轉換
+            for order in (*to_create, *to_update):
+                order.sync_dates()
+            if to_create:
+                OrderMain.objects.bulk_create(to_create, batch_size=ORDER_SYNC_BATCH_SIZE)
+            if to_update:
+                OrderMain.objects.bulk_update(
+                    to_update, [*ORDER_SYNC_UPDATE_FIELDS, *ORDER_DATE_FIELDS, "updated_at"],
+                    batch_size=ORDER_SYNC_BATCH_SIZE,
+                )
+            if delete_ids:
+                OrderMain.objects.filter(id__in=delete_ids).delete()
+
+        return {
+            "created": len(to_create),
+            "updated": len(to_update),
+            "deleted": len(delete_ids),
+            "unchanged": unchanged,
+        }
+
+    def _finish_sync_log(self, sync_log, result: Dict, started: float):
+        """將同步結果、筆數與執行時間寫入 OrderSyncLog"""
+        try:
+            sync_log.status = "success" if result.get("status") == "success" else "failed"
+            sync_log.message = result.get("message", "")
+            sync_log.completed_at = timezone.now()
+            sync_log.duration_seconds = round(time.monotonic() - started, 3)
+            sync_log.details = {
+                key: result[key]
+                for key in (
+                    "total_orders", "created", "updated", "deleted", "unchanged", "failed_companies", "company_latency",
+                )
+                if key in result
+            }
+            sync_log.save()
+        except Exception as e:
+            self.logger.error(f"更新訂單同步日誌失敗: {str(e)}")
 
     def _sync_manufacturing_orders(self, company) -> List[Dict]:
         """
@@ -152,8 +329,8 @@ class OrderManager:
             tables[table_name] = cursor.fetchone()[0]
         return tables
 
-    def _sync_domestic_orders(self, cursor, company_name: str) -> List[Dict]:
-        """同步國內訂單"""
+    def _sync_domestic_orders(self, cursor, company_name: str, raise_errors: bool = False) -> List[Dict]:
+        """同步國內訂單（raise_errors 為 True 時查詢失敗直接拋出，供同步判斷該公司是否讀取成功）"""
         try:
             cursor.execute(
                 """
@@ -186,10 +363,12 @@ class OrderManager:
 
         except DatabaseError as e:
             self.logger.error(f"查詢國內訂單失敗: {str(e)}")
+            if raise_errors:
+                raise
             return []
 
-    def _sync_foreign_orders(self, cursor, company_name: str) -> List[Dict]:
-        """同步國外訂單"""
+    def _sync_foreign_orders(self, cursor, company_name: str, raise_errors: bool = False) -> List[Dict]:
+        """同步國外訂單（raise_errors 同 _sync_domestic_orders）"""
         try:
             cursor.execute(
                 """
@@ -220,6 +399,8 @@ class OrderManager:
 
         except DatabaseError as e:
             self.logger.error(f"查詢國外訂單失敗: {str(e)}")
+            if raise_errors:
+                raise
             return []
 
     def _format_domestic_order(self, order_data: tuple, company_name: str) -> Dict:
@@ -266,11 +447,6 @@ class OrderManager:
         except Exception:
             return "N/A"
 
-    def _save_orders(self, orders: List[Dict]):
-        """批次儲存訂單資料"""
-        for order in orders:
-            OrderMain.objects.create(**order)
-
     def _update_sync_timestamp(self):
         """更新同步時間戳記"""
         schedule = OrderUpdateSchedule.objects.first()
@@ -287,85 +463,119 @@ class OrderManager:
             ip_address=ip_address,
         )
 
-    def _get_companies_via_api(self) -> List[Dict]:
-        """
-        使用 ERP 模組的 API 獲取公司配置資料
-        """
+    def _get_company_configs(self) -> List[Dict]:
+        """讀取公司設定（需要各公司的 mes_database）"""
+        from erp_integration.models import CompanyConfig
+
         try:
-            from erp_integration.api import CompanyConfigAPIView
-            from django.test import RequestFactory
-            import json
-            
-            # 建立 API 請求
-            factory = RequestFactory()
-            request = factory.get('/api/erp/company-config/')
-            
-            # 調用 API
-            view = CompanyConfigAPIView()
-            response = view.get(request)
-            
-            if response.status_code == 200:
-                data = json.loads(response.content.decode())
-                if data.get('success'):
-                    companies_data = []
-                    for company in data.get('data', []):
-                        companies_data.append({
-                            'company_name': company.get('company_name'),
-                            'company_code': company.get('company_code'),
-                            'mssql_database': company.get('mssql_database'),
-                            'mes_database': company.get('mes_database'),
-                            'sync_tables': company.get('sync_tables')
-                        })
-                    return companies_data
-            
-            self.logger.error(f"API 調用失敗，狀態碼: {response.status_code}")
-            return []
-            
+            return list(CompanyConfig.objects.order_by("id").values(
+                "id", "company_name", "company_code", "mssql_database", "mes_database", "sync_tables",
+            ))
         except Exception as e:
-            self.logger.error(f"透過 API 獲取公司配置失敗: {str(e)}")
+            self.logger.error(f"讀取公司配置失敗: {str(e)}")
             return []
 
-    def _sync_manufacturing_orders_from_company_data(self, company_data: Dict) -> List[Dict]:
+    def _fetch_companies_orders(self, companies_data: List[Dict]) -> Tuple[Dict[str, Optional[List[Dict]]], Dict[str, float]]:
         """
-        從公司資料字典同步訂單資料
+        以有上限的執行緒池並行讀取各公司的訂單，每個執行緒使用自己的資料庫連線
+
+        單一公司的查詢受 ORDER_SYNC_COMPANY_TIMEOUT 限制；超過 ORDER_SYNC_TIMEOUT 仍未完成的公司
+        視為讀取失敗（保留原有訂單），不拖慢其他公司的同步
+
+        Returns:
+            (公司名稱 → 訂單列表或 None, 公司名稱 → 讀取秒數)
+        """
+        max_workers = max(1, min(getattr(settings, "ORDER_SYNC_MAX_WORKERS", 4), len(companies_data)))
+        timeout = getattr(settings, "ORDER_SYNC_TIMEOUT", 300)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="order-sync")
+        try:
+            future_to_company = {
+                executor.submit(self._timed_stage_company_orders, company_data): company_data.get("company_name")
+                for company_data in companies_data
+            }
+            done, not_done = wait(future_to_company, timeout=timeout)
+
+            fetched = {}
+            company_latency = {}
+            for future in done:
+                company_name = future_to_company[future]
+                try:
+                    fetched[company_name], company_latency[company_name] = future.result()
+                except Exception as e:
+                    self.logger.error(f"讀取公司 {company_name} 訂單失敗: {str(e)}")
+                    fetched[company_name] = None
+            for future in not_done:
+                company_name = future_to_company[future]
+                self.logger.warning(f"公司 {company_name} 的訂單讀取超過 {timeout} 秒，本次保留原有訂單")
+                fetched[company_name] = None
+                company_latency[company_name] = None
+        finally:
+            # 逾時的公司不再等待；已開始的查詢由 statement_timeout 結束並自行關閉連線
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for company_name, seconds in company_latency.items():
+            if seconds is not None:
+                self.logger.info(f"公司 {company_name} 訂單讀取耗時 {seconds} 秒")
+        return fetched, company_latency
+
+    def _timed_stage_company_orders(self, company_data: Dict) -> Tuple[Optional[List[Dict]], float]:
+        """在工作執行緒中讀取單一公司的訂單並記錄耗時"""
+        started = time.monotonic()
+        orders = self._stage_company_orders(company_data)
+        return orders, round(time.monotonic() - started, 3)
+
+    def _stage_company_orders(self, company_data: Dict) -> Optional[List[Dict]]:
+        """
+        讀取單一公司本地資料庫中的國內、國外訂單（可在工作執行緒中執行）
+
+        Returns:
+            訂單列表；未設定資料庫或讀取失敗時回傳 None，讓同步保留該公司原有訂單
         """
-        orders = []
         db_name = company_data.get('mes_database')
         company_name = company_data.get('company_name')
 
         if not db_name:
             self.logger.warning(f"公司 {company_name} 的 mes_database 為空，跳過")
-            return orders
+            return None
 
+        # 每家公司使用獨立的連線別名，多家公司共用同一資料庫時也不會互相移除設定
+        alias = f"order_sync_{company_data.get('id') or db_name}"
+        orders = []
         try:
-            # 建立資料庫連線
-            from django.db import connections
-            from django.conf import settings
-            
+            # 建立資料庫連線，查詢逾時由資料庫中止，避免單一公司拖住工作執行緒
             db_config = settings.DATABASES["default"].copy()
             db_config["NAME"] = db_name
-            connections.databases[db_name] = db_config
+            db_config["CONN_MAX_AGE"] = 0
+            statement_timeout = getattr(settings, "ORDER_SYNC_COMPANY_TIMEOUT", 60) * 1000
+            db_options = dict(db_config.get("OPTIONS", {}))
+            # 附加在既有的連線參數之後，保留預設的 search_path 等設定
+            db_options["options"] = " ".join(
+                filter(None, [db_options.get("options", ""), f"-c statement_timeout={statement_timeout}"])
+            )
+            db_config["OPTIONS"] = db_options
+            connections.databases[alias] = db_config
 
-            with connections[db_name].cursor() as cursor:
+            with connections[alias].cursor() as cursor:
                 # 檢查表是否存在
                 table_exists = self._check_tables_exist(cursor)
 
                 # 同步國內訂單
                 if table_exists["ordBillMain"]:
-                    domestic_orders = self._sync_domestic_orders(cursor, company_name)
-                    orders.extend(domestic_orders)
+                    orders.extend(self._sync_domestic_orders(cursor, company_name, raise_errors=True))
 
                 # 同步國外訂單
                 if table_exists["TraBillMain"]:
-                    foreign_orders = self._sync_foreign_orders(cursor, company_name)
-                    orders.extend(foreign_orders)
+                    orders.extend(self._sync_foreign_orders(cursor, company_name, raise_errors=True))
 
         except Exception as e:
             self.logger.error(f"從公司 {company_name} 的本地資料庫讀取訂單資料失敗: {str(e)}")
+            return None
         finally:
             # 清理連線
-            if db_name in connections.databases:
-                del connections.databases[db_name]
+            if alias in connections.databases:
+                connections[alias].close()
+                del connections.databases[alias]
 
         return orders
 
@@ -378,13 +588,14 @@ class OrderQueryManager:
     def __init__(self):
         self.logger = logging.getLogger("scheduling.order_query")
 
-    def get_orders_with_filters(self, filters: Dict) -> Tuple[List[OrderMain], Dict]:
+    def get_orders_with_filters(self, filters: Dict) -> Tuple[QuerySet, Dict]:
         """
         根據篩選條件查詢訂單，支援排序
+        去重（同公司、訂單號、產品編號保留最新更新的一筆）、篩選與統計皆在資料庫完成
         Args:
-            filters: 篩選條件字典，可包含 'order_by'（排序欄位，預設-pre_in_date）
+            filters: 篩選條件字典，可包含 'order_by'（排序欄位，預設pre_in_date）
         Returns:
-            (客戶訂單列表, 統計資訊)
+            (客戶訂單查詢集, 統計資訊)
         """
         try:
             # 建立查詢條件
@@ -396,99 +607,139 @@ class OrderQueryManager:
                 query &= Q(customer_short_name=filters["customer"])
             if filters.get("order_type"):
                 query &= Q(order_type=filters["order_type"])
-            if filters.get("date_start"):
-                query &= Q(pre_in_date__gte=filters["date_start"])
-            if filters.get("date_end"):
-                query &= Q(pre_in_date__lte=filters["date_end"])
-            
-
-
-            # 取得排序欄位，預設用預交貨日（pre_in_date）升冪排序
-            order_by = filters.get("order_by", "pre_in_date")
-            if order_by not in [
-                "pre_in_date",
-                "-pre_in_date",
-                "bill_date",
-                "-bill_date",
-            ]:
-                order_by = "pre_in_date"
-
-            # 執行查詢並去重（按公司名稱和訂單號去重，保留最新的記錄）
-            orders = OrderMain.objects.filter(query).order_by(order_by)
-            
-            # 去重邏輯：按公司名稱、訂單號和產品編號分組，保留每組中最新更新的記錄
-            unique_orders = []
-            seen_keys = set()
-            
-            for order in orders:
-                # 建立唯一鍵：公司名稱 + 訂單號 + 產品編號
-                unique_key = f"{order.company_name}_{order.bill_no}_{order.product_id}"
-                
-                # 排除公司名稱與客戶名稱相同的問題記錄
-                if order.company_name == order.customer_short_name:
-                    self.logger.warning(f"跳過問題記錄: 公司={order.company_name}, 客戶={order.customer_short_name}, 訂單號={order.bill_no}")
-                    continue
-                
-                if unique_key not in seen_keys:
-                    seen_keys.add(unique_key)
-                    unique_orders.append(order)
-            
+            date_start = parse_order_date(filters.get("date_start"))
+            if date_start:
+                query &= Q(delivery_date__gte=date_start)
+            date_end = parse_order_date(filters.get("date_end"))
+            if date_end:
+                query &= Q(delivery_date__lte=date_end)
+
+            # 去重：DISTINCT ON (公司名稱, 訂單號, 產品編號)，保留每組中最新更新的記錄
+            # 排除公司名稱與客戶名稱相同的問題記錄
+            latest_orders = (
+                OrderMain.objects.filter(query)
+                .exclude(company_name=F("customer_short_name"))
+                .order_by(*ORDER_SYNC_KEY_FIELDS, "-updated_at", "-id")
+                .distinct(*ORDER_SYNC_KEY_FIELDS)
+            )
+
+            field, descending = self._resolve_order_by(filters.get("order_by"))
+            orders = OrderMain.objects.filter(
+                id__in=latest_orders.values("id")
+            ).order_by(*self._ordering(field, descending))
+
             # 計算統計資訊（使用去重後的資料）
-            stats = self._calculate_order_stats(unique_orders)
-            return unique_orders, stats
+            stats = self._calculate_order_stats(orders)
+            return orders, stats
         except Exception as e:
             self.logger.error(f"查詢訂單失敗: {str(e)}")
-            return [], {}
+            return OrderMain.objects.none(), {}
 
-    def _calculate_order_stats(self, orders) -> Dict:
-        """計算訂單統計資訊"""
-        try:
-            # 檢查 orders 的類型並進行相應的計算
-            if isinstance(orders, list):
-                # 如果 orders 是列表（去重後的資料），手動計算
-                total_orders = len(orders)
-                total_quantity = sum(order.quantity for order in orders)
-                total_remain = sum(order.qty_remain for order in orders)
+    def get_orders_page(
+        self, orders: QuerySet, order_by: Optional[str] = None, cursor: Optional[str] = None,
+        limit: int = ORDER_PAGE_SIZE,
+    ) -> Tuple[List[OrderMain], Optional[str]]:
+        """
+        以鍵集分頁（依排序日期與 id 接續）取得一頁訂單，不使用 OFFSET，翻到後面的頁數也不會變慢
+
+        Args:
+            orders: get_orders_with_filters() 回傳的查詢集
+            order_by: 與查詢時相同的排序參數
+            cursor: 上一頁回傳的游標，第一頁為 None
+            limit: 每頁筆數
+
+        Returns:
+            (本頁訂單列表, 下一頁游標；沒有下一頁時為 None)
+        """
+        field, descending = self._resolve_order_by(order_by)
+        limit = max(1, min(limit, ORDER_MAX_PAGE_SIZE))
+
+        if cursor:
+            position = self._keyset_filter(field, descending, cursor)
+            if position is None:
+                self.logger.warning(f"訂單分頁游標格式錯誤，從第一頁開始: {cursor}")
             else:
-                # 如果 orders 是 QuerySet，使用資料庫聚合
-                total_orders = orders.count()
-                total_quantity = orders.aggregate(Sum("quantity"))["quantity__sum"] or 0
-                total_remain = orders.aggregate(Sum("qty_remain"))["qty_remain__sum"] or 0
+                orders = orders.filter(position)
+
+        page = list(orders[:limit + 1])
+        if len(page) <= limit:
+            return page, None
+
+        page = page[:limit]
+        last = page[-1]
+        last_date = getattr(last, field)
+        return page, f"{last_date.isoformat() if last_date else ''}:{last.id}"
+
+    @staticmethod
+    def _resolve_order_by(order_by: Optional[str]) -> Tuple[str, bool]:
+        """將排序參數（pre_in_date、-bill_date 等）轉為 (日期欄位, 是否降冪)，預設預交貨日升冪"""
+        order_by = order_by or "pre_in_date"
+        descending = order_by.startswith("-")
+        field = ORDER_SORT_FIELDS.get(order_by.lstrip("-"))
+        if field is None:
+            return ORDER_SORT_FIELDS["pre_in_date"], False
+        return field, descending
+
+    @staticmethod
+    def _ordering(field: str, descending: bool) -> List:
+        """日期排序並以 id 決定同日順序；無日期（N/A）的訂單升冪時排最後、降冪時排最前"""
+        if descending:
+            return [F(field).desc(nulls_first=True), "-id"]
+        return [F(field).asc(nulls_last=True), "id"]
+
+    @staticmethod
+    def _keyset_filter(field: str, descending: bool, cursor: str) -> Optional[Q]:
+        """依游標（"日期:id"，無日期時為 ":id"）建立「排在游標之後」的條件，格式錯誤時回傳 None"""
+        date_part, _, id_part = cursor.partition(":")
+        if not id_part.isdigit():
+            return None
+        last_id = int(id_part)
+        last_date = parse_order_date(date_part)
+        if date_part and last_date is None:
+            return None
+
+        if descending:
+            if last_date is None:
+                return Q(**{f"{field}__isnull": True, "id__lt": last_id}) | Q(**{f"{field}__isnull": False})
+            return Q(**{f"{field}__lt": last_date}) | Q(**{field: last_date, "id__lt": last_id})
+        if last_date is None:
+            return Q(**{f"{field}__isnull": True, "id__gt": last_id})
+        return (
+            Q(**{f"{field}__gt": last_date})
+            | Q(**{field: last_date, "id__gt": last_id})
+            | Q(**{f"{field}__isnull": True})
+        )
+
+    def _calculate_order_stats(self, orders: QuerySet) -> Dict:
+        """以資料庫聚合計算訂單統計資訊"""
+        try:
+            orders = orders.order_by()
+            totals = orders.aggregate(
+                total_orders=Count("id"),
+                total_quantity=Sum("quantity"),
+                total_remain=Sum("qty_remain"),
+            )
 
             # 按公司統計
-            company_stats = {}
-            for order in orders:
-                company_name = order.company_name
-                if company_name not in company_stats:
-                    company_stats[company_name] = {
-                        'count': 0,
-                        'total_qty': 0,
-                        'total_remain': 0
-                    }
-                company_stats[company_name]['count'] += 1
-                company_stats[company_name]['total_qty'] += order.quantity
-                company_stats[company_name]['total_remain'] += order.qty_remain
+            company_stats = orders.values("company_name").annotate(
+                count=Count("id"),
+                total_qty=Sum("quantity"),
+                total_remain=Sum("qty_remain"),
+            ).order_by("company_name")
 
             # 按訂單類型統計
-            type_stats = {}
-            for order in orders:
-                order_type = order.order_type
-                if order_type not in type_stats:
-                    type_stats[order_type] = {
-                        'count': 0,
-                        'total_qty': 0,
-                        'total_remain': 0
-                    }
-                type_stats[order_type]['count'] += 1
-                type_stats[order_type]['total_qty'] += order.quantity
-                type_stats[order_type]['total_remain'] += order.qty_remain
+            type_stats = orders.values("order_type").annotate(
+                count=Count("id"),
+                total_qty=Sum("quantity"),
+                total_remain=Sum("qty_remain"),
+            ).order_by("order_type")
 
             return {
-                "total_orders": total_orders,
-                "total_quantity": total_quantity,
-                "total_remain": total_remain,
-                "company_stats": [{'company_name': k, **v} for k, v in company_stats.items()],
-                "type_stats": [{'order_type': k, **v} for k, v in type_stats.items()],
+                "total_orders": totals["total_orders"],
+                "total_quantity": totals["total_quantity"] or 0,
+                "total_remain": totals["total_remain"] or 0,
+                "company_stats": list(company_stats),
+                "type_stats": list(type_stats),
             }
 
         except Exception as e:
@@ -549,7 +800,9 @@ class OrderQueryManager:
                 ]
             )
 
-            # 寫入資料列
+            # 寫入資料列（查詢集分批讀取，避免一次載入全部訂單）
+            if isinstance(orders, QuerySet):
+                orders = orders.iterator(chunk_size=ORDER_EXPORT_CHUNK_SIZE)
             for order in orders:
                 writer.writerow(
                     [
@@ -706,13 +959,14 @@ class OrderAnalytics:
     def get_order_summary(self) -> Dict:
         """取得訂單摘要統計"""
         try:
-            total_orders = OrderMain.objects.count()
-            total_quantity = (
-                OrderMain.objects.aggregate(Sum("quantity"))["quantity__sum"] or 0
-            )
-            total_remain = (
-                OrderMain.objects.aggregate(Sum("qty_remain"))["qty_remain__sum"] or 0
+            totals = OrderMain.objects.aggregate(
+                total_orders=Count("id"),
+                total_quantity=Sum("quantity"),
+                total_remain=Sum("qty_remain"),
             )
+            total_orders = totals["total_orders"]
+            total_quantity = totals["total_quantity"] or 0
+            total_remain = totals["total_remain"] or 0
 
             # 按公司統計
             company_summary = OrderMain.objects.values("company_name").annotate(
@@ -731,7 +985,7 @@ class OrderAnalytics:
             # 最近 30 天趨勢
             thirty_days_ago = timezone.now().date() - timedelta(days=30)
             recent_orders = OrderMain.objects.filter(
-                bill_date__gte=thirty_days_ago.strftime("%Y-%m-%d")
+                order_date__gte=thirty_days_ago
             ).count()
 
             return {
@@ -755,27 +1009,25 @@ class OrderAnalytics:
     def get_delivery_analysis(self) -> Dict:
         """取得交期分析"""
         try:
-            # 即將到期的訂單（7天內）
-            seven_days_later = (timezone.now().date() + timedelta(days=7)).strftime(
-                "%Y-%m-%d"
+            today = timezone.now().date()
+            seven_days_later = today + timedelta(days=7)
+
+            # 未交完的訂單依交期一次統計：已逾期、即將到期（7天內，含逾期）、其餘
+            counts = OrderMain.objects.filter(
+                qty_remain__gt=0, delivery_date__isnull=False
+            ).aggregate(
+                overdue=Count("id", filter=Q(delivery_date__lt=today)),
+                urgent=Count("id", filter=Q(delivery_date__lte=seven_days_later)),
+                normal=Count("id", filter=Q(delivery_date__gt=seven_days_later)),
             )
-            urgent_orders = OrderMain.objects.filter(
-                pre_in_date__lte=seven_days_later, qty_remain__gt=0
-            ).count()
-
-            # 已逾期的訂單
-            today = timezone.now().date().strftime("%Y-%m-%d")
-            overdue_orders = OrderMain.objects.filter(
-                pre_in_date__lt=today, qty_remain__gt=0
-            ).count()
+            urgent_orders = counts["urgent"]
+            overdue_orders = counts["overdue"]
 
             # 按交期分組統計
             delivery_groups = {
                 "overdue": overdue_orders,
                 "urgent": urgent_orders,
-                "normal": OrderMain.objects.filter(
-                    pre_in_date__gt=seven_days_later, qty_remain__gt=0
-                ).count(),
+                "normal": counts["normal"],
             }
 
             return {
@@ -788,88 +1040,6 @@ class OrderAnalytics:
             self.logger.error(f"取得交期分析失敗: {str(e)}")
             return {}
 
-    def _get_companies_via_api(self) -> List[Dict]:
-        """
-        使用 ERP 模組的 API 獲取公司配置資料
-        """
-        try:
-            from erp_integration.api import CompanyConfigAPIView
-            from django.test import RequestFactory
-            import json
-            
-            # 建立 API 請求
-            factory = RequestFactory()
-            request = factory.get('/api/erp/company-config/')
-            
-            # 調用 API
-            view = CompanyConfigAPIView()
-            response = view.get(request)
-            
-            if response.status_code == 200:
-                data = json.loads(response.content.decode())
-                if data.get('success'):
-                    companies_data = []
-                    for company in data.get('data', []):
-                        companies_data.append({
-                            'company_name': company.get('company_name'),
-                            'company_code': company.get('company_code'),
-                            'mssql_database': company.get('mssql_database'),
-                            'mes_database': company.get('mes_database'),
-                            'sync_tables': company.get('sync_tables')
-                        })
-                    return companies_data
-            
-            self.logger.error(f"API 調用失敗，狀態碼: {response.status_code}")
-            return []
-            
-        except Exception as e:
-            self.logger.error(f"透過 API 獲取公司配置失敗: {str(e)}")
-            return []
-
-    def _sync_manufacturing_orders_from_company_data(self, company_data: Dict) -> List[Dict]:
-        """
-        從公司資料字典同步訂單資料
-        """
-        orders = []
-        db_name = company_data.get('mes_database')
-        company_name = company_data.get('company_name')
-
-        if not db_name:
-            self.logger.warning(f"公司 {company_name} 的 mes_database 為空，跳過")
-            return orders
-
-        try:
-            # 建立資料庫連線
-            from django.db import connections
-            from django.conf import settings
-            
-            db_config = settings.DATABASES["default"].copy()
-            db_config["NAME"] = db_name
-            connections.databases[db_name] = db_config
-
-            with connections[db_name].cursor() as cursor:
-                # 檢查表是否存在
-                table_exists = self._check_tables_exist(cursor)
-
-                # 同步國內訂單
-                if table_exists["ordBillMain"]:
-                    domestic_orders = self._sync_domestic_orders(cursor, company_name)
-                    orders.extend(domestic_orders)
-
-                # 同步國外訂單
-                if table_exists["TraBillMain"]:
-                    foreign_orders = self._sync_foreign_orders(cursor, company_name)
-                    orders.extend(foreign_orders)
-
-        except Exception as e:
-            self.logger.error(f"從公司 {company_name} 的本地資料庫讀取訂單資料失敗: {str(e)}")
-        finally:
-            # 清理連線
-            if db_name in connections.databases:
-                del connections.databases[db_name]
-
-        return orders
-
 
 # 全域實例
 order_manager = OrderManager()
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def parse_order_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_order_dates(apps, schema_editor):
+    """以既有的字串日期回填日期欄位"""
+    OrderMain = apps.get_model("scheduling", "OrderMain")
+    batch = []
+    for order_id, pre_in_date, bill_date in OrderMain.objects.order_by().values_list(
+        "id", "pre_in_date", "bill_date"
+    ).iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        batch.append(OrderMain(
+            id=order_id,
+            delivery_date=parse_order_date(pre_in_date),
+            order_date=parse_order_date(bill_date),
+        ))
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            OrderMain.objects.bulk_update(batch, ["delivery_date", "order_date"])
+            batch = []
+    if batch:
+        OrderMain.objects.bulk_update(batch, ["delivery_date", "order_date"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scheduling", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ordermain",
+            name="delivery_date",
+            field=models.DateField(blank=True, null=True, verbose_name="預交貨日"),
+        ),
+        migrations.AddField(
+            model_name="ordermain",
+            name="order_date",
+            field=models.DateField(blank=True, null=True, verbose_name="訂單日"),
+        ),
+        migrations.RunPython(backfill_order_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="ordermain",
+            index=models.Index(
+                fields=["company_name", "bill_no", "product_id", "-updated_at"],
+                name="order_main_dedup_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ordermain",
+            index=models.Index(fields=["delivery_date", "id"], name="order_main_delivery_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="ordermain",
+            index=models.Index(fields=["order_date", "id"], name="order_main_order_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="ordermain",
+            index=models.Index(
+                condition=models.Q(("qty_remain__gt", 0)),
+                fields=["delivery_date"],
+                name="order_main_open_delivery_idx",
+            ),
+        ),
+    ]
@@ -32,6 +32,16 @@ class OrderUpdateSchedule(models.Model):
         return "自動同步已禁用"
 
 
+def parse_order_date(value):
+    """將 YYYY-MM-DD 字串轉為日期，"N/A" 或格式錯誤時回傳 None"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
 class OrderMain(models.Model):
     """
     訂單主檔：記錄客戶訂單的基本資料與狀態
@@ -47,6 +57,9 @@ class OrderMain(models.Model):
     qty_remain = models.IntegerField(verbose_name="未交貨數量")
     order_type = models.CharField(max_length=20, verbose_name="訂單類型")
     bill_date = models.CharField(max_length=10, verbose_name="訂單日期")
+    # 由 pre_in_date／bill_date 轉換的日期欄位，供篩選、排序與交期統計使用（"N/A" 為 NULL）
+    delivery_date = models.DateField(null=True, blank=True, verbose_name="預交貨日")
+    order_date = models.DateField(null=True, blank=True, verbose_name="訂單日")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
 
@@ -54,9 +67,36 @@ class OrderMain(models.Model):
         verbose_name = "訂單主檔"
         verbose_name_plural = "訂單主檔"
         ordering = ["-updated_at"]
+        indexes = [
+            # 去重（DISTINCT ON 公司、訂單號、產品編號，保留最新更新）
+            models.Index(
+                fields=["company_name", "bill_no", "product_id", "-updated_at"],
+                name="order_main_dedup_idx",
+            ),
+            models.Index(fields=["delivery_date", "id"], name="order_main_delivery_idx"),
+            models.Index(fields=["order_date", "id"], name="order_main_order_date_idx"),
+            # 交期分析只統計未交完的訂單
+            models.Index(
+                fields=["delivery_date"],
+                name="order_main_open_delivery_idx",
+                condition=models.Q(qty_remain__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.bill_no} - {self.product_name}"
+
+    def sync_dates(self):
+        """依字串日期更新日期欄位（bulk_create／bulk_update 前需自行呼叫）"""
+        self.delivery_date = parse_order_date(self.pre_in_date)
+        self.order_date = parse_order_date(self.bill_date)
+
+    def save(self, *args, **kwargs):
+        self.sync_dates()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"pre_in_date", "bill_date"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "delivery_date", "order_date"}
+        super().save(*args, **kwargs)
     
     @property
     def delivered_quantity(self):
@@ -66,19 +106,14 @@ class OrderMain(models.Model):
     @property
     def is_overdue(self):
         """是否逾期"""
-        try:
-            delivery_date = datetime.strptime(self.pre_in_date, '%Y-%m-%d').date()
-            return delivery_date < timezone.now().date()
-        except:
+        if self.delivery_date is None:
             return False
+        return self.delivery_date < timezone.now().date()
     
     @property
     def is_urgent(self):
         """是否緊急（交期在3天內）"""
-        try:
-            delivery_date = datetime.strptime(self.pre_in_date, '%Y-%m-%d').date()
-            today = timezone.now().date()
-            days_until_delivery = (delivery_date - today).days
-            return 0 <= days_until_delivery <= 3
-        except:
+        if self.delivery_date is None:
             return False
+        days_until_delivery = (self.delivery_date - timezone.now().date()).days
+        return 0 <= days_until_delivery <= 3
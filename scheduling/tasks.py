@@ -32,34 +32,20 @@ def sync_orders_task():
         # 創建客戶訂單管理器
         order_manager = OrderManager()
         
-        # 執行同步
-        result = order_manager.sync_orders_from_erp()
+        # 執行同步（結果、筆數與執行時間由同步流程寫入同步日誌）
+        result = order_manager.sync_orders_from_erp(sync_log=log)
         
         if result.get('status') == 'success':
             logger.info(f"客戶訂單同步成功：{result.get('message')}")
             
             # 更新同步狀態
             try:
-                from system.models import OrderSyncSettings, OrderSyncLog
+                from system.models import OrderSyncSettings
                 settings_obj, _ = OrderSyncSettings.objects.get_or_create(id=1)
                 settings_obj.last_sync_time = timezone.now()
                 settings_obj.last_sync_status = "成功"
                 settings_obj.last_sync_message = result.get('message')
                 settings_obj.save()
-                
-                # 更新同步日誌
-                log = OrderSyncLog.objects.filter(
-                    sync_type='sync',
-                    status='running'
-                ).order_by('-started_at').first()
-                
-                if log:
-                    log.status = 'success'
-                    log.completed_at = timezone.now()
-                    log.duration_seconds = (log.completed_at - log.started_at).total_seconds()
-                    log.message = result.get('message')
-                    log.save()
-                    
             except Exception as e:
                 logger.error(f"更新同步狀態失敗: {str(e)}")
             
@@ -67,6 +53,9 @@ def sync_orders_task():
                 'success': True,
                 'message': result.get('message'),
                 'total_orders': result.get('total_orders', 0),
+                'created': result.get('created', 0),
+                'updated': result.get('updated', 0),
+                'deleted': result.get('deleted', 0),
                 'executed_at': timezone.now().isoformat()
             }
         else:
@@ -74,26 +63,12 @@ def sync_orders_task():
             
             # 更新同步狀態
             try:
-                from system.models import OrderSyncSettings, OrderSyncLog
+                from system.models import OrderSyncSettings
                 settings_obj, _ = OrderSyncSettings.objects.get_or_create(id=1)
                 settings_obj.last_sync_time = timezone.now()
                 settings_obj.last_sync_status = "失敗"
                 settings_obj.last_sync_message = result.get('message')
                 settings_obj.save()
-                
-                # 更新同步日誌
-                log = OrderSyncLog.objects.filter(
-                    sync_type='sync',
-                    status='running'
-                ).order_by('-started_at').first()
-                
-                if log:
-                    log.status = 'failed'
-                    log.completed_at = timezone.now()
-                    log.duration_seconds = (log.completed_at - log.started_at).total_seconds()
-                    log.message = result.get('message')
-                    log.save()
-                    
             except Exception as e:
                 logger.error(f"更新同步狀態失敗: {str(e)}")
             
@@ -0,0 +1,228 @@
+"""
+排程管理模組 - 測試
+"""
+
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+
+from .algorithms import OptimizedAutoScheduler, ResourceTimeline
+from .customer_order_management import OrderAnalytics, OrderManager, OrderQueryManager
+from .models import OrderMain
+
+
+def order_data(**kwargs):
+    """建立測試用訂單資料"""
+    values = {
+        'company_name': '測試公司',
+        'customer_short_name': '客戶A',
+        'bill_no': '113-0001',
+        'product_id': 'PFP-001',
+        'product_name': '產品A',
+        'quantity': 100,
+        'pre_in_date': '2025-03-31',
+        'qty_remain': 100,
+        'order_type': '國內',
+        'bill_date': '2025-03-01',
+    }
+    values.update(kwargs)
+    return values
+
+
+class OrderSyncDiffTest(TestCase):
+    """客戶訂單差異同步測試"""
+
+    def setUp(self):
+        self.unchanged = OrderMain.objects.create(**order_data())
+        self.changed = OrderMain.objects.create(**order_data(bill_no='113-0002'))
+        self.removed = OrderMain.objects.create(**order_data(bill_no='113-0003'))
+        self.other_company = OrderMain.objects.create(**order_data(company_name='第二公司'))
+
+    def test_apply_order_diff(self):
+        """只新增、更新、刪除有差異的訂單，範圍外的公司不受影響"""
+        orders = [
+            order_data(),
+            order_data(bill_no='113-0002', qty_remain=60),
+            order_data(bill_no='113-0004'),
+        ]
+
+        counts = OrderManager()._apply_order_diff(orders, Q(company_name='測試公司'))
+
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1})
+        self.assertTrue(OrderMain.objects.filter(id=self.unchanged.id).exists())
+        self.assertEqual(OrderMain.objects.get(id=self.changed.id).qty_remain, 60)
+        self.assertFalse(OrderMain.objects.filter(id=self.removed.id).exists())
+        self.assertTrue(OrderMain.objects.filter(bill_no='113-0004').exists())
+        self.assertTrue(OrderMain.objects.filter(id=self.other_company.id).exists())
+
+    def test_duplicate_keys_keep_row_count(self):
+        """同一訂單號與產品有多筆明細時保留筆數"""
+        orders = [order_data(), order_data(quantity=50, qty_remain=50)]
+
+        counts = OrderManager()._apply_order_diff(orders, Q(company_name='測試公司'))
+
+        self.assertEqual(counts['unchanged'], 1)
+        self.assertEqual(counts['created'], 1)
+        self.assertEqual(OrderMain.objects.filter(company_name='測試公司', bill_no='113-0001').count(), 2)
+
+    def test_failed_company_keeps_orders(self):
+        """讀取失敗的公司保留原有訂單，並寫入同步日誌"""
+        from system.models import OrderSyncLog
+
+        companies = [{'company_name': '測試公司', 'mes_database': 'db_a'}, {'company_name': '第二公司', 'mes_database': 'db_b'}]
+        staged = {'測試公司': [order_data()], '第二公司': None}
+        manager = OrderManager()
+        with mock.patch.object(manager, '_get_company_configs', return_value=companies), \
+                mock.patch.object(manager, '_stage_company_orders', side_effect=lambda company: staged[company['company_name']]):
+            result = manager.sync_orders_from_erp()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['failed_companies'], ['第二公司'])
+        self.assertTrue(OrderMain.objects.filter(id=self.other_company.id).exists())
+        self.assertEqual(OrderMain.objects.filter(company_name='測試公司').count(), 1)
+
+        log = OrderSyncLog.objects.get()
+        self.assertEqual(log.status, 'success')
+        self.assertEqual(log.details['deleted'], 2)
+        self.assertEqual(set(log.details['company_latency']), {'測試公司', '第二公司'})
+        self.assertIsNotNone(log.duration_seconds)
+
+    def test_company_connection_keeps_default_options(self):
+        """公司資料庫連線附加查詢逾時，仍保留預設的連線參數（search_path）"""
+        from django.conf import settings
+
+        captured = {}
+
+        def open_connection(alias):
+            captured.update(databases[alias])
+            return mock.MagicMock()
+
+        databases = {}
+        connections = mock.MagicMock(databases=databases)
+        connections.__getitem__.side_effect = open_connection
+        manager = OrderManager()
+        company = {'id': 1, 'company_name': '測試公司', 'mes_database': 'db_a'}
+        with self.settings(ORDER_SYNC_COMPANY_TIMEOUT=30), \
+                mock.patch('scheduling.customer_order_management.connections', connections), \
+                mock.patch.object(manager, '_check_tables_exist', return_value={'ordBillMain': False, 'TraBillMain': False}):
+            self.assertEqual(manager._stage_company_orders(company), [])
+
+        self.assertEqual(captured['NAME'], 'db_a')
+        self.assertEqual(
+            captured['OPTIONS']['options'],
+            f"{settings.DATABASES['default']['OPTIONS']['options']} -c statement_timeout=30000",
+        )
+        self.assertNotIn('statement_timeout', settings.DATABASES['default']['OPTIONS']['options'])
+        self.assertEqual(databases, {})
+
+    def test_slow_company_does_not_block_sync(self):
+        """超過整體等待時間的公司視為讀取失敗，其餘公司照常同步"""
+        release = threading.Event()
+
+        def stage(company):
+            if company['company_name'] == '第二公司':
+                release.wait(5)
+                return [order_data(company_name='第二公司', bill_no='113-0009')]
+            return [order_data()]
+
+        companies = [{'company_name': '測試公司', 'mes_database': 'db_a'}, {'company_name': '第二公司', 'mes_database': 'db_b'}]
+        manager = OrderManager()
+        try:
+            with self.settings(ORDER_SYNC_TIMEOUT=0.5), \
+                    mock.patch.object(manager, '_get_company_configs', return_value=companies), \
+                    mock.patch.object(manager, '_stage_company_orders', side_effect=stage):
+                result = manager.sync_orders_from_erp()
+        finally:
+            release.set()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['failed_companies'], ['第二公司'])
+        self.assertIsNone(result['company_latency']['第二公司'])
+        self.assertTrue(OrderMain.objects.filter(id=self.other_company.id).exists())
+
+
+class OrderQueryTest(TestCase):
+    """訂單查詢（資料庫去重、統計與鍵集分頁）測試"""
+
+    def setUp(self):
+        OrderMain.objects.create(**order_data(quantity=80, qty_remain=80))
+        self.latest = OrderMain.objects.create(**order_data(qty_remain=30))
+        OrderMain.objects.create(**order_data(bill_no='113-0002', pre_in_date='2025-04-15', order_type='國外'))
+        OrderMain.objects.create(**order_data(bill_no='113-0003', pre_in_date='N/A'))
+        OrderMain.objects.create(**order_data(bill_no='113-0004', customer_short_name='測試公司'))
+        self.manager = OrderQueryManager()
+
+    def test_dedup_and_stats(self):
+        """同鍵值保留最新一筆、排除問題記錄，統計以去重後資料聚合"""
+        orders, stats = self.manager.get_orders_with_filters({})
+
+        self.assertEqual([order.bill_no for order in orders], ['113-0001', '113-0002', '113-0003'])
+        self.assertEqual(orders[0].id, self.latest.id)
+        self.assertEqual(stats['total_orders'], 3)
+        self.assertEqual(stats['total_remain'], 230)
+        self.assertEqual(
+            stats['type_stats'],
+            [{'order_type': '國內', 'count': 2, 'total_qty': 200, 'total_remain': 130},
+             {'order_type': '國外', 'count': 1, 'total_qty': 100, 'total_remain': 100}],
+        )
+
+        orders, _ = self.manager.get_orders_with_filters({'date_start': '2025-04-01'})
+        self.assertEqual([order.bill_no for order in orders], ['113-0002'])
+
+    def test_keyset_pages_cover_all_orders(self):
+        """逐頁以游標接續，結果與完整排序一致（含無日期的訂單）"""
+        for order_by in ('pre_in_date', '-pre_in_date'):
+            orders, _ = self.manager.get_orders_with_filters({'order_by': order_by})
+            expected = [order.id for order in orders]
+
+            collected, cursor = [], None
+            while True:
+                page, cursor = self.manager.get_orders_page(orders, order_by, cursor, limit=1)
+                collected.extend(order.id for order in page)
+                if cursor is None:
+                    break
+
+            self.assertEqual(collected, expected)
+
+    def test_delivery_analysis(self):
+        """交期分析以日期欄位統計"""
+        today = timezone.now().date()
+        OrderMain.objects.all().delete()
+        for days in (-2, 3, 30):
+            OrderMain.objects.create(**order_data(
+                bill_no=f'114-{days}', pre_in_date=(today + timedelta(days=days)).strftime('%Y-%m-%d'),
+            ))
+        OrderMain.objects.create(**order_data(bill_no='114-N/A', pre_in_date='N/A'))
+
+        analysis = OrderAnalytics().get_delivery_analysis()
+
+        self.assertEqual(analysis['delivery_groups'], {'overdue': 1, 'urgent': 2, 'normal': 1})
+
+
+class ScheduleOrderTest(TestCase):
+    """單一訂單排程測試"""
+
+    def test_failed_route_releases_earlier_reservations(self):
+        """後續工序找不到時間槽時，退回前面工序已登記的資源"""
+        operator = {'id': '1', 'name': '王小明'}
+        scheduler = OptimizedAutoScheduler(
+            [{'id': 1, 'name': '組裝'}, {'id': 2, 'name': '測試'}], [operator], [], [],
+        )
+        start = timezone.now().replace(microsecond=0)
+        routes = [{'process_name__id': 1, 'step_order': 1}, {'process_name__id': 2, 'step_order': 2}]
+        order = mock.Mock(id=1, qty_remain=100)
+
+        with mock.patch.object(scheduler, 'find_optimal_resource_slot', side_effect=[
+            (start, operator, None, None), (None, None, None, None),
+        ]):
+            tasks, error, _ = scheduler.schedule_order(order, routes, start)
+
+        self.assertEqual(tasks, [])
+        self.assertIn('2', error)
+        self.assertTrue(scheduler.resource_timeline.is_free(
+            ResourceTimeline.OPERATOR, '1', start, start + timedelta(days=1),
+        ))
@@ -6,12 +6,13 @@ from ..utils import log_user_operation
 import logging
 from datetime import datetime
 from django.contrib import messages  # 添加這行
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -5,12 +5,13 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from ..models import Event
 import json
+from system.permission_resolver import user_in_groups
 
 # 權限檢查
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 # 取得所有排程任務與依賴
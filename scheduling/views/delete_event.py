@@ -5,12 +5,13 @@ from django.utils.translation import gettext_lazy as gettext_lazy
 from django.utils import timezone
 from ..models import Event, SchedulingOperationLog
 import logging
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -6,12 +6,13 @@ from django.utils import timezone
 from datetime import datetime
 from ..models import Unit, Event, SchedulingOperationLog
 import logging
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -3,13 +3,14 @@ from django.http import JsonResponse
 from zoneinfo import ZoneInfo
 from ..models import Event
 import logging
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 TAIWAN_TZ = ZoneInfo("Asia/Taipei")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
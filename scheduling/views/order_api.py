@@ -13,6 +13,7 @@ import json
 import logging
 
 from ..customer_order_management import (
+    ORDER_PAGE_SIZE,
     order_manager,
     order_query_manager,
     order_schedule_manager,
@@ -28,6 +29,7 @@ def get_orders_api(request):
     """
     取得客戶訂單列表 API
     GET /api/orders/
+    帶 limit 或 cursor 參數時以鍵集分頁回傳，回應中的 next_cursor 用於取得下一頁
     """
     try:
         # 取得查詢參數
@@ -37,6 +39,7 @@ def get_orders_api(request):
             "order_type": request.GET.get("order_type", "").strip(),
             "date_start": request.GET.get("date_start", "").strip(),
             "date_end": request.GET.get("date_end", "").strip(),
+            "order_by": request.GET.get("order_by", "").strip(),
         }
 
         # 移除空值
@@ -45,6 +48,19 @@ def get_orders_api(request):
         # 查詢訂單
         orders, stats = order_query_manager.get_orders_with_filters(filters)
 
+        # 分頁
+        next_cursor = None
+        cursor = request.GET.get("cursor", "").strip()
+        limit = request.GET.get("limit", "").strip()
+        if cursor or limit:
+            try:
+                limit = int(limit) if limit else ORDER_PAGE_SIZE
+            except ValueError:
+                limit = ORDER_PAGE_SIZE
+            orders, next_cursor = order_query_manager.get_orders_page(
+                orders, filters.get("order_by"), cursor or None, limit
+            )
+
         # 序列化訂單資料
         orders_data = []
         for order in orders:
@@ -76,7 +92,8 @@ def get_orders_api(request):
                 "data": {
                     "orders": orders_data,
                     "stats": stats,
-                    "total_count": len(orders_data),
+                    "total_count": stats.get("total_orders", len(orders_data)),
+                    "next_cursor": next_cursor,
                 },
             }
         )
@@ -43,7 +43,7 @@ def customer_order_list(request):
     except ValueError:
         per_page = 20
     
-    # 建立分頁器
+    # 建立分頁器（訂單為查詢集，只讀取目前頁面的資料）
     paginator = Paginator(orders, per_page)
     
     try:
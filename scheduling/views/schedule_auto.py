@@ -9,19 +9,21 @@ from datetime import datetime, timedelta
 from ..models import OrderMain, ProductionSafetySettings, Event
 from ..algorithms import (
     check_holiday_conflicts,
+    create_production_events,
     generate_auto_tasks,
     generate_optimized_auto_tasks,
 )
 import logging
 import requests
 import traceback
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 TAIWAN_TZ = ZoneInfo("Asia/Taipei")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -265,49 +267,10 @@ def schedule_auto(request):
 
                     all_tasks.extend(tasks)
 
-            # 創建事件
-            created_events_count = 0
-            if not all_tasks:
-                all_tasks = []
-            for task in all_tasks:
-                start_datetime = datetime.strptime(
-                    task["start_time"], "%Y-%m-%dT%H:%M"
-                ).replace(tzinfo=TAIWAN_TZ)
-                end_datetime = datetime.strptime(
-                    task["end_time"], "%Y-%m-%dT%H:%M"
-                ).replace(tzinfo=TAIWAN_TZ)
-                order = OrderMain.objects.filter(id=task.get("order_id")).first()
-                process_name = task["process"]["name"]
-
-                Event.objects.create(
-                    title=f"產品 {order.product_name} - {process_name}",
-                    unit=None,
-                    start=start_datetime,
-                    end=end_datetime,
-                    type="production",
-                    description=task.get("description"),
-                    classNames="production",
-                    all_day=False,
-                    category="general",
-                    created_by=request.user.username,
-                    employee_id=(
-                        task["selected_operator"]["id"]
-                        if task["selected_operator"]
-                        else None
-                    ),
-                    equipment_id=(
-                        task["selected_equipment"]["id"]
-                        if task["selected_equipment"]
-                        else None
-                    ),
-                    smt_equipment_id=(
-                        task["selected_smt_equipment"]["id"]
-                        if task["selected_smt_equipment"]
-                        else None
-                    ),
-                    order_id=str(task.get("order_id")),
-                )
-                created_events_count += 1
+            # 創建事件（排程完成後一次批次寫入）
+            created_events_count = create_production_events(
+                all_tasks or [], request.user.username
+            )
 
             # 回傳失敗訂單詳細資訊
             if failed_orders:
@@ -8,12 +8,13 @@ from django.contrib import messages
 from django.urls import reverse
 from datetime import datetime, timedelta
 from ..models import Event
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -6,12 +6,13 @@ from scheduling.models import OrderMain  # 訂單主檔標準名稱
 from scheduling.algorithms import calculate_task_duration
 from equip.models import Equipment
 import logging
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger(__name__)
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 def get_standard_capacity_for_route(product_code, process_name):
@@ -15,13 +15,14 @@ import traceback
 import json
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 TAIWAN_TZ = ZoneInfo("Asia/Taipei")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
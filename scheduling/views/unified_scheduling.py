@@ -24,6 +24,7 @@ from ..models import (
     Unit,
     ProcessIntervalSettings,
 )
+from system.permission_resolver import user_in_groups
 
 # 暫時註解掉有問題的匯入，先讓系統能夠運行
 # from ..algorithms import OptimizedAutoScheduler
@@ -37,7 +38,7 @@ logger = logging.getLogger("scheduling.views")
 
 def scheduling_user_required(user):
     """檢查使用者是否有排程權限"""
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
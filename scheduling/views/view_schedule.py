@@ -10,12 +10,13 @@ import re
 import unicodedata
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("scheduling.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SystemConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "system"
+
+    def ready(self):
+        from .signals import register_permission_cache_signals
+
+        register_permission_cache_signals()
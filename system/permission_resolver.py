@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+使用者有效權限解析
+每個請求只計算一次使用者可操作的作業員／工序／設備 ID 與所屬群組，
+結果依使用者與權限版本存放於快取；UserWorkPermission 或群組異動時更新版本，舊快取隨之失效。
+超級使用者、管理員旗標直接取自使用者物件，不放入快取。
+"""
+
+import logging
+import time
+from typing import FrozenSet, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_VERSION_CACHE_KEY = 'permissions:version'
+PERMISSION_CACHE_KEY = 'permissions:{version}:{user_id}'
+
+# 同一請求內重複查詢時，結果暫存於使用者物件的屬性
+REQUEST_CACHE_ATTR = '_effective_permissions'
+
+# 主管群組（可審核填報、存取填報設定）
+SUPERVISOR_GROUPS = ('系統管理員', '主管')
+
+
+def _cache_timeout():
+    return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60)
+
+
+def _parse_ids(values):
+    """將 JSON ID 列表轉為整數集合，忽略非數字的值"""
+    return frozenset(int(value) for value in values or () if str(value).isdigit())
+
+
+class PermissionData(NamedTuple):
+    """快取的權限資料；ID 集合為 None 表示不限制"""
+    groups: FrozenSet[str] = frozenset()
+    has_work_permission: bool = False
+    operator_ids: Optional[FrozenSet[int]] = None
+    process_ids: Optional[FrozenSet[int]] = None
+    equipment_ids: Optional[FrozenSet[int]] = None
+    can_fill_work: bool = True
+    can_onsite_reporting: bool = True
+    can_smt_reporting: bool = True
+
+
+def _load_permission_data(user):
+    from .models import UserWorkPermission
+
+    groups = frozenset(user.groups.values_list('name', flat=True))
+    work_permission = UserWorkPermission.objects.filter(user=user.get_username()).first()
+    if work_permission is None:
+        return PermissionData(groups=groups)
+
+    return PermissionData(
+        groups=groups,
+        has_work_permission=True,
+        operator_ids=None if work_permission.can_operate_all_operators else _parse_ids(work_permission.allowed_operators),
+        process_ids=None if work_permission.can_operate_all_processes else _parse_ids(work_permission.allowed_processes),
+        equipment_ids=None if work_permission.can_operate_all_equipments else _parse_ids(work_permission.allowed_equipments),
+        can_fill_work=work_permission.can_fill_work,
+        can_onsite_reporting=work_permission.can_onsite_reporting,
+        can_smt_reporting=work_permission.can_smt_reporting,
+    )
+
+
+class EffectivePermissions:
+    """
+    使用者有效權限
+    超級使用者與管理員（is_staff）不受作業員／工序／設備限制；
+    以 bypass_staff=False 查詢時只有超級使用者不受限制（system.utils 的權限檢查）；
+    未設定 UserWorkPermission 的使用者預設不限制
+    """
+
+    def __init__(self, user, data=None):
+        self.is_superuser = bool(getattr(user, 'is_superuser', False))
+        self.is_staff = bool(getattr(user, 'is_staff', False))
+        self.data = data or PermissionData()
+
+    @property
+    def is_admin(self):
+        return self.is_superuser or self.is_staff
+
+    @property
+    def groups(self):
+        return self.data.groups
+
+    def in_group(self, *names):
+        """是否屬於任一指定群組"""
+        return not self.data.groups.isdisjoint(names)
+
+    @property
+    def is_supervisor(self):
+        """超級使用者或主管群組成員"""
+        return self.is_superuser or self.in_group(*SUPERVISOR_GROUPS)
+
+    def allowed_ids(self, resource, bypass_staff=True):
+        """
+        可操作的資源 ID，None 表示不限制
+
+        Args:
+            resource: 'operator'、'process' 或 'equipment'
+            bypass_staff: 管理員（is_staff）是否不受限制；False 時只有超級使用者不受限制
+        """
+        bypass = self.is_admin if bypass_staff else self.is_superuser
+        return None if bypass else getattr(self.data, f'{resource}_ids')
+
+    @property
+    def operator_ids(self):
+        """可操作的作業員 ID，None 表示不限制"""
+        return self.allowed_ids('operator')
+
+    @property
+    def process_ids(self):
+        """可操作的工序 ID，None 表示不限制"""
+        return self.allowed_ids('process')
+
+    @property
+    def equipment_ids(self):
+        """可操作的設備 ID，None 表示不限制"""
+        return self.allowed_ids('equipment')
+
+    def can_report(self, reporting_type):
+        """是否可進行指定類型報工（fill_work、onsite_reporting、smt_reporting）"""
+        if self.is_superuser:
+            return True
+        return bool(getattr(self.data, f'can_{reporting_type}', False))
+
+    @staticmethod
+    def _filter(queryset, ids):
+        return queryset if ids is None else queryset.filter(id__in=ids)
+
+    def filter_operators(self, queryset, bypass_staff=True):
+        return self._filter(queryset, self.allowed_ids('operator', bypass_staff))
+
+    def filter_processes(self, queryset, bypass_staff=True):
+        return self._filter(queryset, self.allowed_ids('process', bypass_staff))
+
+    def filter_equipments(self, queryset, bypass_staff=True):
+        return self._filter(queryset, self.allowed_ids('equipment', bypass_staff))
+
+
+def _current_version():
+    version = cache.get(PERMISSION_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(PERMISSION_VERSION_CACHE_KEY, time.time_ns(), None)
+        version = cache.get(PERMISSION_VERSION_CACHE_KEY)
+    return version
+
+
+def get_effective_permissions(user):
+    """
+    取得使用者有效權限
+    同一請求內重複呼叫直接回傳使用者物件上的結果；跨請求由快取提供
+    """
+    permissions = getattr(user, REQUEST_CACHE_ATTR, None)
+    if permissions is not None:
+        return permissions
+
+    if not getattr(user, 'is_authenticated', False):
+        permissions = EffectivePermissions(user)
+    else:
+        key = PERMISSION_CACHE_KEY.format(version=_current_version(), user_id=user.pk)
+        data = cache.get(key)
+        if data is None:
+            data = _load_permission_data(user)
+            cache.set(key, data, _cache_timeout())
+        permissions = EffectivePermissions(user, data)
+
+    try:
+        setattr(user, REQUEST_CACHE_ATTR, permissions)
+    except AttributeError:
+        pass
+    return permissions
+
+
+def user_in_groups(user, *names):
+    """使用者是否屬於任一指定群組"""
+    return get_effective_permissions(user).in_group(*names)
+
+
+def is_supervisor(user):
+    """使用者是否為超級使用者或主管群組成員"""
+    return get_effective_permissions(user).is_supervisor
+
+
+def invalidate_permissions():
+    """
+    更新權限版本，使所有使用者的權限快取失效
+    立即更新一次，交易提交後再更新一次，避免其他連線在提交前重新載入舊資料
+    """
+    def bump():
+        cache.set(PERMISSION_VERSION_CACHE_KEY, time.time_ns(), None)
+
+    bump()
+    transaction.on_commit(bump)
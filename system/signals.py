@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+系統管理模組信號處理器
+使用者工作權限、群組或群組成員異動時使權限快取失效
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+def register_permission_cache_signals():
+    """
+    註冊權限快取失效信號
+    在應用程式啟動時調用
+    """
+    from django.contrib.auth.models import Group, User
+
+    from .models import UserWorkPermission
+    from .permission_resolver import invalidate_permissions
+
+    def permissions_changed(sender, **kwargs):
+        invalidate_permissions()
+
+    def group_membership_changed(sender, action, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_permissions()
+
+    for sender in (UserWorkPermission, Group):
+        uid = f"permission_cache_{sender._meta.label_lower}"
+        post_save.connect(permissions_changed, sender=sender, weak=False, dispatch_uid=f"{uid}_save")
+        post_delete.connect(permissions_changed, sender=sender, weak=False, dispatch_uid=f"{uid}_delete")
+    m2m_changed.connect(
+        group_membership_changed, sender=User.groups.through, weak=False, dispatch_uid="permission_cache_user_groups"
+    )
@@ -132,26 +132,103 @@ def cleanup_old_backup_files():
         logger.error(f"清理備份文件時發生錯誤: {str(e)}")
 
 
+# 自動審核：執行鎖（避免排程重疊執行）與每個交易批次處理的筆數
+AUTO_APPROVAL_LOCK_KEY = 'auto_approval:lock'
+DEFAULT_AUTO_APPROVAL_BATCH_SIZE = 1000
+DEFAULT_AUTO_APPROVAL_LOCK_TIMEOUT = 10 * 60
+
+# 自動審核人員
+AUTO_APPROVER = '自動審核系統'
+
+
+def _auto_approval_candidates(rules):
+    """
+    待自動審核的報工記錄，並以資料庫運算標註第一個未通過的規則（rejected_rule）
+    規則依序為工作時數、不良率、加班時數；rejected_rule 為空者審核通過
+    """
+    from django.db.models import Case, CharField, F, FloatField, Q, Value, When
+    from django.db.models.functions import Cast
+    from workorder.fill_work.models import FillWork
+
+    candidates = FillWork.objects.filter(approval_status='pending')
+    if rules['exclude_operators']:
+        candidates = candidates.exclude(operator__in=rules['exclude_operators'])
+    if rules['exclude_processes']:
+        candidates = candidates.exclude(operation__in=rules['exclude_processes'])
+
+    # 不良率 = 不良品數量 / 工作數量（%），工作數量為 0 時不檢查
+    candidates = candidates.annotate(
+        defect_rate=Case(
+            When(work_quantity__gt=0, then=Cast('defect_quantity', FloatField()) * 100 / F('work_quantity')),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+    conditions = []
+    if rules['auto_approve_work_hours']:
+        conditions.append(When(work_hours_calculated__gt=rules['max_work_hours'], then=Value('work_hours')))
+    if rules['auto_approve_defect_rate']:
+        conditions.append(When(defect_rate__gt=rules['max_defect_rate'], then=Value('defect_rate')))
+    if rules['auto_approve_overtime']:
+        conditions.append(When(overtime_hours_calculated__gt=rules['max_overtime_hours'], then=Value('overtime')))
+
+    rejected_rule = Case(*conditions, default=Value(None), output_field=CharField()) if conditions else Value(None, output_field=CharField())
+    return candidates.annotate(rejected_rule=rejected_rule)
+
+
+def _rejection_reason(row, rules):
+    """依未通過的規則產生駁回原因"""
+    if row['rejected_rule'] == 'work_hours':
+        return f"工作時數({float(row['work_hours_calculated'] or 0)}小時)超過限制({rules['max_work_hours']}小時)"
+    if row['rejected_rule'] == 'defect_rate':
+        return f"不良率({row['defect_rate']:.2f}%)超過限制({rules['max_defect_rate']}%)"
+    return f"加班時數({float(row['overtime_hours_calculated'] or 0)}小時)超過限制({rules['max_overtime_hours']}小時)"
+
+
 @shared_task
 def auto_approve_work_reports():
     """
     自動審核報工記錄
     根據設定的條件自動審核符合條件的報工
+    規則於資料庫中判斷，每個批次的核准與駁回各以一次更新寫入；
+    受影響的工單於結束時一併交給 WorkOrderRefreshService 重算。
+    以快取鎖避免排程重疊執行，單次執行超過鎖的一半時間即停止，其餘記錄留待下次處理。
     """
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import transaction
     from workorder.models import SystemConfig
     from workorder.fill_work.models import FillWork
-    from django.db.models import Q
-    from decimal import Decimal
+    from workorder.services.workorder_refresh_service import WorkOrderRefreshService
     import logging
+    import time
+    import uuid
     
     logger = logging.getLogger(__name__)
     
+    lock_timeout = getattr(settings, 'AUTO_APPROVAL_LOCK_TIMEOUT', DEFAULT_AUTO_APPROVAL_LOCK_TIMEOUT)
+    batch_size = getattr(settings, 'AUTO_APPROVAL_BATCH_SIZE', DEFAULT_AUTO_APPROVAL_BATCH_SIZE)
+    lock_token = uuid.uuid4().hex
+    if not cache.add(AUTO_APPROVAL_LOCK_KEY, lock_token, lock_timeout):
+        logger.info("上一次自動審核仍在執行，跳過本次")
+        return {
+            'success': True,
+            'message': '上一次自動審核仍在執行，跳過本次',
+            'skipped': True,
+            'approved_count': 0,
+            'rejected_count': 0,
+            'timestamp': timezone.now().isoformat()
+        }
+    
     try:
         # 取得自動審核設定
         try:
             def get_config(key, default_value, value_type=str):
+                value = SystemConfig.get_config(key)
+                if value is None:
+                    return default_value
                 try:
-                    value = SystemConfig.objects.get(key=key).value
                     if value_type == bool:
                         return value == "True"
                     elif value_type == int:
@@ -159,7 +236,7 @@ def auto_approve_work_reports():
                     elif value_type == float:
                         return float(value)
                     return value
-                except (SystemConfig.DoesNotExist, ValueError):
+                except ValueError:
                     return default_value
             
             # 檢查自動審核是否啟用
@@ -172,18 +249,19 @@ def auto_approve_work_reports():
                 }
             
             # 取得審核條件設定
-            auto_approve_work_hours = get_config("auto_approve_work_hours", True, bool)
-            max_work_hours = get_config("max_work_hours", 12.0, float)
-            auto_approve_defect_rate = get_config("auto_approve_defect_rate", True, bool)
-            max_defect_rate = get_config("max_defect_rate", 5.0, float)
-            auto_approve_overtime = get_config("auto_approve_overtime", False, bool)
-            max_overtime_hours = get_config("max_overtime_hours", 4.0, float)
             exclude_operators_text = get_config("exclude_operators", "")
             exclude_processes_text = get_config("exclude_processes", "")
-            
-            # 處理排除設定
-            exclude_operators = [op.strip() for op in exclude_operators_text.split('\n') if op.strip()] if exclude_operators_text else []
-            exclude_processes = [proc.strip() for proc in exclude_processes_text.split('\n') if proc.strip()] if exclude_processes_text else []
+            rules = {
+                'auto_approve_work_hours': get_config("auto_approve_work_hours", True, bool),
+                'max_work_hours': get_config("max_work_hours", 12.0, float),
+                'auto_approve_defect_rate': get_config("auto_approve_defect_rate", True, bool),
+                'max_defect_rate': get_config("max_defect_rate", 5.0, float),
+                'auto_approve_overtime': get_config("auto_approve_overtime", False, bool),
+                'max_overtime_hours': get_config("max_overtime_hours", 4.0, float),
+                # 處理排除設定
+                'exclude_operators': [op.strip() for op in exclude_operators_text.split('\n') if op.strip()] if exclude_operators_text else [],
+                'exclude_processes': [proc.strip() for proc in exclude_processes_text.split('\n') if proc.strip()] if exclude_processes_text else [],
+            }
             
         except Exception as e:
             logger.error(f"取得自動審核設定失敗: {str(e)}")
@@ -192,80 +270,90 @@ def auto_approve_work_reports():
                 'error': f'取得自動審核設定失敗: {str(e)}'
             }
         
-        # 查詢待審核的報工記錄
-        pending_reports = FillWork.objects.filter(
-            approval_status='pending'  # 待審核狀態
+        started = time.monotonic()
+        candidates = _auto_approval_candidates(rules).order_by('id').values(
+            'id', 'company_code', 'company_name', 'workorder', 'product_id', 'operation',
+            'work_hours_calculated', 'overtime_hours_calculated', 'defect_rate', 'rejected_rule',
         )
         
-        # 排除設定的作業員和工序
-        if exclude_operators:
-            pending_reports = pending_reports.exclude(operator__in=exclude_operators)
+        approved_reports = []
+        rejected_reports = []
+        # 受影響的工單鍵 → 是否需要完工檢查
+        dirty_keys = {}
+        completed = True
+        
+        while True:
+            # 單次執行不超過鎖的一半時間，避免鎖到期後與下一次排程重疊
+            if time.monotonic() - started > lock_timeout / 2:
+                completed = False
+                break
+            
+            with transaction.atomic():
+                # 略過正由主管手動審核而鎖定的記錄
+                batch = list(candidates.select_for_update(skip_locked=True)[:batch_size])
+                if not batch:
+                    break
+                
+                now = timezone.now()
+                approved_ids = [row['id'] for row in batch if row['rejected_rule'] is None]
+                rejected = [
+                    FillWork(
+                        id=row['id'],
+                        approval_status='rejected',
+                        rejected_at=now,
+                        rejected_by=AUTO_APPROVER,
+                        rejection_reason=_rejection_reason(row, rules),
+                        updated_at=now,
+                    )
+                    for row in batch if row['rejected_rule'] is not None
+                ]
+                
+                # 執行審核
+                if approved_ids:
+                    FillWork.objects.filter(id__in=approved_ids).update(
+                        approval_status='approved',
+                        approved_at=now,
+                        approved_by=AUTO_APPROVER,
+                        approval_remarks='自動審核通過',
+                        updated_at=now,
+                    )
+                if rejected:
+                    FillWork.objects.bulk_update(
+                        rejected, ['approval_status', 'rejected_at', 'rejected_by', 'rejection_reason', 'updated_at']
+                    )
+            
+            approved_reports.extend(approved_ids)
+            rejected_reports.extend(record.id for record in rejected)
+            for row in batch:
+                key = (row['company_code'], row['company_name'], row['workorder'], row['product_id'])
+                check_completion = row['rejected_rule'] is None and row['operation'] == '出貨包裝'
+                dirty_keys[key] = dirty_keys.get(key, False) or check_completion
+            
+            if len(batch) < batch_size:
+                break
         
-        if exclude_processes:
-            pending_reports = pending_reports.exclude(operation__in=exclude_processes)
+        # update() 與 bulk_update() 不觸發 post_save，受影響的工單在同一交易中記錄，提交後只排程一次重算
+        if dirty_keys:
+            with transaction.atomic():
+                for key, check_completion in dirty_keys.items():
+                    WorkOrderRefreshService.mark_dirty(*key, check_completion=check_completion)
+        
+        approved_count = len(approved_reports)
+        rejected_count = len(rejected_reports)
+        total_pending = approved_count + rejected_count
+        elapsed = time.monotonic() - started
+        throughput = total_pending / elapsed if elapsed > 0 else 0.0
         
-        total_pending = pending_reports.count()
         if total_pending == 0:
             logger.info("沒有待審核的報工記錄")
             return {
                 'success': True,
                 'message': '沒有待審核的報工記錄',
                 'approved_count': 0,
-                'rejected_count': 0
+                'rejected_count': 0,
+                'timestamp': timezone.now().isoformat()
             }
         
-        approved_count = 0
-        rejected_count = 0
-        approved_reports = []
-        rejected_reports = []
-        
-        for report in pending_reports:
-            should_approve = True
-            rejection_reason = []
-            
-            # 檢查工作時數
-            if auto_approve_work_hours:
-                work_hours = float(report.work_hours_calculated or 0)
-                if work_hours > max_work_hours:
-                    should_approve = False
-                    rejection_reason.append(f"工作時數({work_hours}小時)超過限制({max_work_hours}小時)")
-            
-            # 檢查不良率
-            if auto_approve_defect_rate and should_approve:
-                if hasattr(report, 'defect_quantity') and hasattr(report, 'completed_quantity'):
-                    if report.completed_quantity > 0:
-                        defect_rate = (report.defect_quantity / report.completed_quantity) * 100
-                        if defect_rate > max_defect_rate:
-                            should_approve = False
-                            rejection_reason.append(f"不良率({defect_rate:.2f}%)超過限制({max_defect_rate}%)")
-            
-            # 檢查加班時數
-            if auto_approve_overtime and should_approve:
-                overtime_hours = float(report.overtime_hours_calculated or 0)
-                if overtime_hours > max_overtime_hours:
-                    should_approve = False
-                    rejection_reason.append(f"加班時數({overtime_hours}小時)超過限制({max_overtime_hours}小時)")
-            
-            # 執行審核
-            if should_approve:
-                report.approval_status = 'approved'
-                report.approved_at = timezone.now()
-                report.approved_by = '自動審核系統'
-                report.approval_remarks = '自動審核通過'
-                report.save()
-                approved_count += 1
-                approved_reports.append(report.id)
-                logger.info(f"自動審核通過: 報工記錄 {report.id} (作業員: {report.operator}, 工序: {report.operation})")
-            else:
-                report.approval_status = 'rejected'
-                report.rejected_at = timezone.now()
-                report.rejected_by = '自動審核系統'
-                report.rejection_reason = '; '.join(rejection_reason)
-                report.save()
-                rejected_count += 1
-                rejected_reports.append(report.id)
-                logger.info(f"自動審核拒絕: 報工記錄 {report.id} (作業員: {report.operator}, 工序: {report.operation}) - 原因: {'; '.join(rejection_reason)}")
-        
         # 發送通知（如果啟用）
         notification_enabled = get_config("auto_approval_notification_enabled", True, bool)
         if notification_enabled and (approved_count > 0 or rejected_count > 0):
@@ -333,7 +421,10 @@ def auto_approve_work_reports():
             except Exception as e:
                 logger.error(f"發送自動審核通知失敗: {str(e)}")
         
-        logger.info(f"自動審核完成: 總計 {total_pending} 筆，通過 {approved_count} 筆，拒絕 {rejected_count} 筆")
+        logger.info(
+            f"自動審核完成: 總計 {total_pending} 筆，通過 {approved_count} 筆，拒絕 {rejected_count} 筆，"
+            f"耗時 {elapsed:.2f} 秒，{throughput:.0f} 筆/秒" + ("" if completed else "，已達單次執行時間上限，其餘記錄留待下次處理")
+        )
         
         return {
             'success': True,
@@ -342,7 +433,11 @@ def auto_approve_work_reports():
             'approved_count': approved_count,
             'rejected_count': rejected_count,
             'approved_reports': approved_reports,
-            'rejected_reports': rejected_reports
+            'rejected_reports': rejected_reports,
+            'completed': completed,
+            'elapsed_seconds': round(elapsed, 3),
+            'records_per_second': round(throughput, 1),
+            'timestamp': timezone.now().isoformat()
         }
         
     except Exception as e:
@@ -351,6 +446,10 @@ def auto_approve_work_reports():
             'success': False,
             'error': f'自動審核任務執行失敗: {str(e)}'
         }
+    finally:
+        # 只釋放自己持有的鎖
+        if cache.get(AUTO_APPROVAL_LOCK_KEY) == lock_token:
+            cache.delete(AUTO_APPROVAL_LOCK_KEY)
 
 
 @shared_task
@@ -7,6 +7,7 @@
 from django.contrib.auth.models import User
 from django.db.models import Q
 from .models import UserWorkPermission
+from .permission_resolver import get_effective_permissions
 
 
 def get_user_work_permissions(user):
@@ -36,14 +37,10 @@ def check_user_operator_permission(user, operator_id):
     Returns:
         bool: 是否有權限
     """
-    if user.is_superuser:
-        return True
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission:
-        return True  # 如果沒有設定，預設允許
-        
-    return work_permission.check_operator_permission(operator_id)
+    allowed_ids = get_effective_permissions(user).allowed_ids('operator', bypass_staff=False)
+    if allowed_ids is None:
+        return True  # 超級使用者或未設定限制時允許（管理員仍受限制）
+    return str(operator_id).isdigit() and int(operator_id) in allowed_ids
 
 
 def check_user_process_permission(user, process_id):
@@ -57,14 +54,10 @@ def check_user_process_permission(user, process_id):
     Returns:
         bool: 是否有權限
     """
-    if user.is_superuser:
-        return True
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission:
-        return True  # 如果沒有設定，預設允許
-        
-    return work_permission.check_process_permission(process_id)
+    allowed_ids = get_effective_permissions(user).allowed_ids('process', bypass_staff=False)
+    if allowed_ids is None:
+        return True  # 超級使用者或未設定限制時允許（管理員仍受限制）
+    return str(process_id).isdigit() and int(process_id) in allowed_ids
 
 
 def check_user_equipment_permission(user, equipment_id):
@@ -78,14 +71,10 @@ def check_user_equipment_permission(user, equipment_id):
     Returns:
         bool: 是否有權限
     """
-    if user.is_superuser:
-        return True
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission:
-        return True  # 如果沒有設定，預設允許
-        
-    return work_permission.check_equipment_permission(equipment_id)
+    allowed_ids = get_effective_permissions(user).allowed_ids('equipment', bypass_staff=False)
+    if allowed_ids is None:
+        return True  # 超級使用者或未設定限制時允許（管理員仍受限制）
+    return str(equipment_id).isdigit() and int(equipment_id) in allowed_ids
 
 
 def filter_operators_by_user_permission(user, queryset):
@@ -99,14 +88,7 @@ def filter_operators_by_user_permission(user, queryset):
     Returns:
         QuerySet: 過濾後的查詢集
     """
-    if user.is_superuser:
-        return queryset
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission or work_permission.can_operate_all_operators:
-        return queryset
-        
-    return queryset.filter(id__in=work_permission.allowed_operators)
+    return get_effective_permissions(user).filter_operators(queryset, bypass_staff=False)
 
 
 def filter_processes_by_user_permission(user, queryset):
@@ -120,14 +102,7 @@ def filter_processes_by_user_permission(user, queryset):
     Returns:
         QuerySet: 過濾後的查詢集
     """
-    if user.is_superuser:
-        return queryset
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission or work_permission.can_operate_all_processes:
-        return queryset
-        
-    return queryset.filter(id__in=work_permission.allowed_processes)
+    return get_effective_permissions(user).filter_processes(queryset, bypass_staff=False)
 
 
 def filter_equipments_by_user_permission(user, queryset):
@@ -141,14 +116,7 @@ def filter_equipments_by_user_permission(user, queryset):
     Returns:
         QuerySet: 過濾後的查詢集
     """
-    if user.is_superuser:
-        return queryset
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission or work_permission.can_operate_all_equipments:
-        return queryset
-        
-    return queryset.filter(id__in=work_permission.allowed_equipments)
+    return get_effective_permissions(user).filter_equipments(queryset, bypass_staff=False)
 
 
 def check_user_reporting_permission(user, reporting_type):
@@ -162,21 +130,9 @@ def check_user_reporting_permission(user, reporting_type):
     Returns:
         bool: 是否有權限
     """
-    if user.is_superuser:
-        return True
-        
-    work_permission = get_user_work_permissions(user)
-    if not work_permission:
-        return True  # 如果沒有設定，預設允許
-        
-    if reporting_type == 'fill_work':
-        return work_permission.can_fill_work
-    elif reporting_type == 'onsite_reporting':
-        return work_permission.can_onsite_reporting
-    elif reporting_type == 'smt_reporting':
-        return work_permission.can_smt_reporting
-    
-    return False
+    if reporting_type not in ('fill_work', 'onsite_reporting', 'smt_reporting'):
+        return False
+    return get_effective_permissions(user).can_report(reporting_type)
 
 
 def get_user_permission_summary(user):
@@ -12,6 +12,10 @@ class WorkorderConfig(AppConfig):
         註冊信號處理器
         """
         try:
+            # 註冊主檔快取失效信號
+            from .signals.master_data_cache_signals import register_master_data_cache_signals
+            register_master_data_cache_signals()
+
             # 註冊完工觸發信號
             from .signals.completion_trigger_signals import register_completion_trigger_signals
             register_completion_trigger_signals()
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fill_work', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fillwork',
+            index=models.Index(fields=['updated_at', 'id'], name='workorder_f_updated_2f9eac_idx'),
+        ),
+    ]
@@ -96,6 +96,7 @@ class FillWork(models.Model):
             models.Index(fields=['product_id']),
             models.Index(fields=['approval_status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -169,64 +170,17 @@ class FillWork(models.Model):
         super().save(*args, **kwargs)
     
     def calculate_work_hours(self):
-        """計算工作時數和加班時數"""
-        from datetime import datetime, time
+        """計算工作時數和加班時數（休息與加班規則依公司、班別設定，見 work_hours.WorkHourCalculator）"""
+        from .work_hours import WorkHourCalculator
         
         if not self.start_time or not self.end_time:
             return
         
         try:
-            # 計算總工作時間（分鐘）
-            start_minutes = self.start_time.hour * 60 + self.start_time.minute
-            end_minutes = self.end_time.hour * 60 + self.end_time.minute
-            
-            if end_minutes <= start_minutes:
-                end_minutes += 24 * 60  # 跨日處理
-            
-            # 判斷是否為作業員填報（有午休機制）
-            is_operator_fill = bool(self.has_break)
-            
-            # 固定午休區間（12:00~13:00），僅作業員適用
-            lunch_deduction_minutes = 0
-            if is_operator_fill:
-                lunch_start = 12 * 60
-                lunch_end = 13 * 60
-                overlaps_lunch = (start_minutes < lunch_end and end_minutes > lunch_start)
-                if overlaps_lunch:
-                    lunch_deduction_minutes = 60
-                    self.break_hours = Decimal('1.00')
-                else:
-                    self.break_hours = Decimal('0.00')
-            else:
-                self.break_hours = Decimal('0.00')
-            
-            # 決定加班起算時間
-            if is_operator_fill:
-                # 作業員填報：17:30後加班
-                overtime_start_minutes = 17 * 60 + 30
-            else:
-                # SMT填報：16:30後加班
-                overtime_start_minutes = 16 * 60 + 30
-            
-            # 計算正常工時和加班時數
-            normal_minutes = 0
-            overtime_minutes = 0
-            
-            current_minutes = start_minutes
-            while current_minutes < end_minutes:
-                if current_minutes < overtime_start_minutes:
-                    normal_minutes += 1
-                else:
-                    overtime_minutes += 1
-                current_minutes += 1
-            
-            # 作業員：若與午休有交集，固定扣除1小時（僅扣正常工時，且不低於0）
-            if is_operator_fill and lunch_deduction_minutes > 0:
-                normal_minutes = max(0, normal_minutes - lunch_deduction_minutes)
-            
-            self.work_hours_calculated = Decimal(str(normal_minutes / 60))
-            self.overtime_hours_calculated = Decimal(str(overtime_minutes / 60))
-            
+            # 作業員填報有午休機制，SMT 填報沒有
+            self.work_hours_calculated, self.overtime_hours_calculated, self.break_hours = WorkHourCalculator.calculate(
+                self.start_time, self.end_time, bool(self.has_break), self.company_code, self.company_name
+            )
         except (ValueError, AttributeError):
             # 如果時間格式錯誤，設為0
             self.work_hours_calculated = Decimal('0.00')
@@ -255,9 +209,8 @@ class FillWork(models.Model):
                 )
             
             # 驗證公司代號是否一致（需要從公司代號轉換為公司名稱進行比較）
-            from erp_integration.models import CompanyConfig
-            company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-            dispatch_company_name = company_config.company_name if company_config else None
+            from workorder.services.master_data_cache import MasterDataCache
+            dispatch_company_name = MasterDataCache.get_company_name(dispatch.company_code)
             
             if dispatch_company_name != self.company_name:
                 raise ValueError(
@@ -12,7 +12,8 @@ from datetime import datetime
 from .models import FillWork
 from workorder.models import WorkOrder
 from workorder.workorder_dispatch.models import WorkOrderDispatch
-from erp_integration.models import CompanyConfig
+from workorder.services.master_data_cache import MasterDataCache
+from workorder.services.workorder_refresh_service import WorkOrderRefreshService
 
 logger = logging.getLogger(__name__)
 
@@ -69,11 +70,7 @@ class RDSampleWorkOrderService:
             # 建立新工單
             with transaction.atomic():
                 # 獲取公司代號
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(
-                    company_name=fill_work_record.company_name
-                ).first()
-                company_code = company_config.company_code if company_config else '10'
+                company_code = MasterDataCache.get_company_code(fill_work_record.company_name, '10')
                 
                 new_workorder = WorkOrder.objects.create(
                     company_code=company_code,
@@ -196,6 +193,83 @@ class RDSampleWorkOrderService:
                 'dispatch_created': False
             }
 
+    @staticmethod
+    def bulk_process_rd_sample_approval(fill_work_records):
+        """
+        批次處理RD樣品核准流程
+        一次查詢既有的工單與派工單，缺少的以 bulk_create 建立；同一工單只建立一次
+
+        Args:
+            fill_work_records: 已確認為RD樣品的 FillWork 記錄列表
+
+        Returns:
+            dict: 處理結果，含建立的工單數與派工單數
+        """
+        # 同一工單號碼 + 產品編號以第一筆填報記錄為準（與逐筆核准時先建立者相同）
+        records_by_key = {}
+        for record in fill_work_records:
+            records_by_key.setdefault((record.workorder, record.product_id), record)
+        if not records_by_key:
+            return {'workorders_created': 0, 'dispatches_created': 0}
+
+        order_numbers = {order_number for order_number, _ in records_by_key}
+        product_codes = {product_code for _, product_code in records_by_key}
+
+        workorders = {}
+        for workorder in WorkOrder.objects.filter(
+            order_number__in=order_numbers, product_code__in=product_codes
+        ).order_by('pk'):
+            workorders.setdefault((workorder.order_number, workorder.product_code), workorder)
+
+        now = timezone.now()
+        new_workorders = [
+            WorkOrder(
+                company_code=MasterDataCache.get_company_code(record.company_name, '10'),
+                order_number=order_number,
+                product_code=product_code,
+                quantity=record.planned_quantity or 0,
+                status='in_progress',  # RD樣品直接設為生產中狀態
+                order_source='mes',  # 標記為MES手動建立
+                created_at=now,
+            )
+            for (order_number, product_code), record in records_by_key.items()
+            if (order_number, product_code) not in workorders
+        ]
+        for workorder in WorkOrder.objects.bulk_create(new_workorders):
+            workorders[(workorder.order_number, workorder.product_code)] = workorder
+
+        dispatch_keys = {
+            (workorder.company_code, workorder.order_number, workorder.product_code): (workorder, records_by_key[key])
+            for key, workorder in workorders.items() if key in records_by_key
+        }
+        existing_dispatch_keys = set(
+            WorkOrderDispatch.objects.filter(
+                order_number__in=order_numbers, product_code__in=product_codes
+            ).values_list('company_code', 'order_number', 'product_code')
+        )
+        new_dispatches = [
+            WorkOrderDispatch(
+                company_code=workorder.company_code,
+                order_number=workorder.order_number,
+                product_code=workorder.product_code,
+                product_name=f"RD樣品-{workorder.product_code}",
+                planned_quantity=workorder.quantity,
+                status='in_production',  # 直接設為生產中
+                dispatch_date=record.work_date,
+                assigned_operator=record.operator,
+                assigned_equipment=record.equipment,
+                process_name='',  # RD樣品不設定預定工序
+                notes=f"RD樣品自動建立 - 核准時間: {now} - 注意：RD樣品無預定工序流程",
+                created_by='system'
+            )
+            for key, (workorder, record) in dispatch_keys.items()
+            if key not in existing_dispatch_keys
+        ]
+        WorkOrderDispatch.objects.bulk_create(new_dispatches)
+
+        logger.info(f"RD樣品批次核准處理完成: 建立工單 {len(new_workorders)} 張、派工單 {len(new_dispatches)} 張")
+        return {'workorders_created': len(new_workorders), 'dispatches_created': len(new_dispatches)}
+
 
 class FillWorkApprovalService:
     """
@@ -256,16 +330,13 @@ class FillWorkApprovalService:
                     try:
                         from workorder.services.workorder_status_service import WorkOrderStatusService
                         from workorder.models import WorkOrder
-                        from erp_integration.models import CompanyConfig
                         
                         # 查找對應的工單
-                        company_config = CompanyConfig.objects.filter(
-                            company_name=fill_work_record.company_name
-                        ).first()
+                        company_code = MasterDataCache.get_company_code(fill_work_record.company_name)
                         
-                        if company_config:
+                        if company_code:
                             workorder = WorkOrder.objects.filter(
-                                company_code=company_config.company_code,
+                                company_code=company_code,
                                 order_number=fill_work_record.workorder,
                                 product_code=fill_work_record.product_id
                             ).first()
@@ -317,7 +388,6 @@ class FillWorkApprovalService:
         """
         try:
             from workorder.workorder_dispatch.models import WorkOrderDispatch
-            from erp_integration.models import CompanyConfig
             
             # 查找對應的派工單
             dispatch = WorkOrderDispatch.objects.filter(
@@ -325,33 +395,7 @@ class FillWorkApprovalService:
                 product_code=fill_work_record.product_id
             ).first()
             
-            if not dispatch:
-                return {
-                    'success': False,
-                    'message': f'找不到對應的派工單：工單號碼={fill_work_record.workorder}, 產品編號={fill_work_record.product_id}'
-                }
-            
-            # 驗證公司名稱是否一致
-            company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-            dispatch_company_name = company_config.company_name if company_config else None
-            
-            if dispatch_company_name != fill_work_record.company_name:
-                return {
-                    'success': False,
-                    'message': f'公司名稱不一致：填報記錄={fill_work_record.company_name}, 派工單={dispatch_company_name}'
-                }
-            
-            # 驗證產品編號是否一致
-            if dispatch.product_code != fill_work_record.product_id:
-                return {
-                    'success': False,
-                    'message': f'產品編號不一致：填報記錄={fill_work_record.product_id}, 派工單={dispatch.product_code}'
-                }
-            
-            return {
-                'success': True,
-                'message': '派工單驗證通過'
-            }
+            return FillWorkApprovalService._check_dispatch(fill_work_record, dispatch)
                 
         except ImportError:
             # 如果派工單模組不存在，跳過驗證
@@ -366,55 +410,148 @@ class FillWorkApprovalService:
             }
     
     @staticmethod
-    def batch_approve_fill_work_records(record_ids, approved_by):
+    def _check_dispatch(fill_work_record, dispatch):
+        """
+        比對填報記錄與派工單的公司名稱、產品編號
+
+        Args:
+            fill_work_record: FillWork記錄
+            dispatch: 對應的派工單，找不到時為 None
+
+        Returns:
+            dict: 驗證結果
+        """
+        if not dispatch:
+            return {
+                'success': False,
+                'message': f'找不到對應的派工單：工單號碼={fill_work_record.workorder}, 產品編號={fill_work_record.product_id}'
+            }
+        
+        # 驗證公司名稱是否一致
+        dispatch_company_name = MasterDataCache.get_company_name(dispatch.company_code)
+        
+        if dispatch_company_name != fill_work_record.company_name:
+            return {
+                'success': False,
+                'message': f'公司名稱不一致：填報記錄={fill_work_record.company_name}, 派工單={dispatch_company_name}'
+            }
+        
+        # 驗證產品編號是否一致
+        if dispatch.product_code != fill_work_record.product_id:
+            return {
+                'success': False,
+                'message': f'產品編號不一致：填報記錄={fill_work_record.product_id}, 派工單={dispatch.product_code}'
+            }
+        
+        return {
+            'success': True,
+            'message': '派工單驗證通過'
+        }
+    
+    @staticmethod
+    def batch_approve_fill_work_records(record_ids, approved_by, approval_remarks=''):
         """
         批量核准填報記錄
+        一次載入待核准記錄與對應派工單，在記憶體中驗證後以單一 update 更新核准狀態；
+        RD樣品工單與派工單批次建立，受影響的工單交由 WorkOrderRefreshService 各重算一次
         
         Args:
             record_ids: 記錄ID列表
             approved_by: 核准人員
+            approval_remarks: 核准備註
             
         Returns:
-            dict: 批量核准結果
+            dict: 批量核准結果，未通過派工單驗證的記錄列於 warnings
         """
         try:
-            # 查詢待核准的記錄
-            pending_records = FillWork.objects.filter(
-                id__in=record_ids,
-                approval_status='pending'
-            )
-            
-            if not pending_records.exists():
-                return {
-                    'success': False,
-                    'message': '沒有找到需要核准的記錄',
-                    'approved_count': 0,
-                    'rd_workorders_created': 0,
-                    'rd_dispatches_created': 0
-                }
-            
-            approved_count = 0
-            rd_workorders_created = 0
-            rd_dispatches_created = 0
-            
-            for record in pending_records:
-                result = FillWorkApprovalService.approve_fill_work_record(
-                    record, approved_by
+            with transaction.atomic():
+                # 查詢待核准的記錄（鎖定，避免同時核准重複處理）
+                pending_records = list(
+                    FillWork.objects.select_for_update().filter(
+                        id__in=record_ids,
+                        approval_status='pending'
+                    ).order_by('pk')
                 )
                 
-                if result['success']:
-                    approved_count += 1
-                    if result.get('workorder_created'):
-                        rd_workorders_created += 1
-                    if result.get('dispatch_created'):
-                        rd_dispatches_created += 1
+                if not pending_records:
+                    return {
+                        'success': False,
+                        'message': '沒有找到需要核准的記錄',
+                        'approved_count': 0,
+                        'rd_workorders_created': 0,
+                        'rd_dispatches_created': 0
+                    }
+                
+                rd_records = [record for record in pending_records if RDSampleWorkOrderService.is_rd_sample_record(record)]
+                rd_ids = {record.id for record in rd_records}
+                
+                # 核准前驗證派工單（RD樣品除外）
+                dispatches = FillWorkApprovalService._dispatch_map(
+                    record for record in pending_records if record.id not in rd_ids
+                )
+                approved_records, warnings = [], []
+                for record in pending_records:
+                    if record.id not in rd_ids:
+                        validation_result = FillWorkApprovalService._check_dispatch(
+                            record, dispatches.get((record.workorder, record.product_id))
+                        )
+                        if not validation_result['success']:
+                            warnings.append(f"{record.workorder}（{record.operator}）{validation_result['message']}")
+                            continue
+                    approved_records.append(record)
+                
+                if not approved_records:
+                    return {
+                        'success': False,
+                        'message': '所選記錄皆未通過派工單驗證',
+                        'approved_count': 0,
+                        'rd_workorders_created': 0,
+                        'rd_dispatches_created': 0,
+                        'warnings': warnings
+                    }
+                
+                # 更新核准狀態
+                approved_at = timezone.now()
+                FillWork.objects.filter(id__in=[record.id for record in approved_records]).update(
+                    approval_status='approved',
+                    approved_by=approved_by,
+                    approved_at=approved_at,
+                    approval_remarks=approval_remarks,
+                    updated_at=approved_at,
+                )
+                for record in approved_records:
+                    record.approval_status = 'approved'
+                    record.approved_by = approved_by
+                    record.approved_at = approved_at
+                    record.approval_remarks = approval_remarks
+                
+                # 只有RD樣品才處理工單建立
+                rd_result = RDSampleWorkOrderService.bulk_process_rd_sample_approval(
+                    [record for record in approved_records if record.id in rd_ids]
+                )
+                
+                # update() 不觸發 post_save，改為直接記錄受影響的工單；
+                # 派工單統計、工單狀態與自動完工於提交後每張工單只重算一次
+                for record in approved_records:
+                    WorkOrderRefreshService.mark_dirty(
+                        record.company_code,
+                        record.company_name,
+                        record.workorder,
+                        record.product_id,
+                        check_completion=(record.operation == '出貨包裝'),
+                    )
+                
+                # 同步到生產執行監控
+                FillWorkApprovalService._sync_production_details(approved_records)
             
+            approved_count = len(approved_records)
             return {
                 'success': True,
                 'message': f'成功核准 {approved_count} 筆填報記錄',
                 'approved_count': approved_count,
-                'rd_workorders_created': rd_workorders_created,
-                'rd_dispatches_created': rd_dispatches_created
+                'rd_workorders_created': rd_result['workorders_created'],
+                'rd_dispatches_created': rd_result['dispatches_created'],
+                'warnings': warnings
             }
             
         except Exception as e:
@@ -425,4 +562,573 @@ class FillWorkApprovalService:
                 'approved_count': 0,
                 'rd_workorders_created': 0,
                 'rd_dispatches_created': 0
-            } 
\ No newline at end of file
+            }
+    
+    @staticmethod
+    def _dispatch_map(fill_work_records):
+        """
+        一次查詢填報記錄對應的派工單
+
+        Returns:
+            dict: (工單號碼, 產品編號) → 派工單（同鍵多筆時取最早建立者，與 .first() 相同）
+        """
+        keys = {(record.workorder, record.product_id) for record in fill_work_records}
+        if not keys:
+            return {}
+        
+        dispatches = {}
+        for dispatch in WorkOrderDispatch.objects.filter(
+            order_number__in={order_number for order_number, _ in keys},
+            product_code__in={product_code for _, product_code in keys},
+        ).order_by('pk'):
+            key = (dispatch.order_number, dispatch.product_code)
+            if key in keys:
+                dispatches.setdefault(key, dispatch)
+        return dispatches
+    
+    @staticmethod
+    def _sync_production_details(fill_work_records):
+        """
+        將核准的填報記錄同步到生產中工單詳情
+        工單以一次查詢取得：優先以公司代號 + 工單號碼對應，找不到公司設定時只以工單號碼對應
+        """
+        from workorder.services.production_sync_service import ProductionReportSyncService
+        
+        order_numbers = {record.workorder for record in fill_work_records if record.workorder}
+        if not order_numbers:
+            return
+        
+        by_company, by_number = {}, {}
+        for workorder in WorkOrder.objects.filter(order_number__in=order_numbers).order_by('pk'):
+            by_company.setdefault((workorder.company_code, workorder.order_number), workorder)
+            by_number.setdefault(workorder.order_number, workorder)
+        
+        for record in fill_work_records:
+            company_code = MasterDataCache.get_company_code(record.company_name) if record.company_name else None
+            if company_code:
+                workorder = by_company.get((company_code, record.workorder))
+            else:
+                workorder = by_number.get(record.workorder)
+            if not workorder:
+                continue
+            try:
+                ProductionReportSyncService.sync_fill_work_record(record, workorder)
+            except Exception as sync_error:
+                # 同步失敗不影響核准流程，只記錄錯誤
+                logger.error(f"同步填報記錄 {record.id} 到生產詳情失敗: {str(sync_error)}")
+
+
+# 匯出／匯入範本共用的欄位標頭
+FILL_WORK_EXPORT_HEADERS = [
+    '作業員名稱','公司名稱','報工日期','開始時間','結束時間','工單號','產品編號','工序名稱','設備名稱','報工數量','不良品數量','備註','異常紀錄','工作時數','加班時數'
+]
+
+# 匯出時讀取的欄位，順序與 FILL_WORK_EXPORT_HEADERS 對應
+FILL_WORK_EXPORT_FIELDS = (
+    'operator', 'company_name', 'work_date', 'start_time', 'end_time', 'workorder',
+    'product_id', 'operation', 'equipment', 'work_quantity', 'defect_quantity',
+    'remarks', 'abnormal_notes', 'work_hours_calculated', 'overtime_hours_calculated',
+)
+
+
+class FillWorkExportService:
+    """
+    填報記錄匯出服務
+    以串流匯出層逐批輸出作業員／SMT 填報記錄，避免一次載入整份資料
+    """
+    
+    SHEET_TITLE = 'FillWork'
+    
+    @staticmethod
+    def get_queryset(kind):
+        """依匯出類型（operator／smt）取得填報記錄"""
+        from django.db.models import Q
+        
+        smt_filter = Q(operator__icontains='SMT') | Q(process_name__icontains='SMT')
+        if kind == 'smt':
+            queryset = FillWork.objects.filter(smt_filter)
+        else:
+            queryset = FillWork.objects.exclude(smt_filter)
+        return queryset.order_by('-created_at')
+    
+    @staticmethod
+    def format_row(row, file_format):
+        """將 values_list tuple 轉為輸出列；CSV 保留時數原始字串，XLSX 輸出數值"""
+        (operator, company_name, work_date, start_time, end_time, workorder,
+         product_id, operation, equipment, work_quantity, defect_quantity,
+         remarks, abnormal_notes, work_hours, overtime_hours) = row
+        if file_format == 'csv':
+            work_hours, overtime_hours = str(work_hours), str(overtime_hours)
+        else:
+            work_hours, overtime_hours = float(work_hours or 0), float(overtime_hours or 0)
+        return [
+            operator,
+            company_name,
+            work_date.strftime('%Y-%m-%d') if work_date else '',
+            start_time.strftime('%H:%M') if start_time else '',
+            end_time.strftime('%H:%M') if end_time else '',
+            workorder,
+            product_id,
+            operation,
+            equipment,
+            work_quantity,
+            defect_quantity,
+            remarks or '',
+            abnormal_notes or '',
+            work_hours,
+            overtime_hours,
+        ]
+    
+    @classmethod
+    def iter_rows(cls, queryset, file_format):
+        from workorder.services.export_service import StreamingExportService
+        
+        return StreamingExportService.iter_rows(
+            queryset, FILL_WORK_EXPORT_FIELDS, lambda row: cls.format_row(row, file_format)
+        )
+    
+    @classmethod
+    def build_response(cls, queryset, filename, file_format):
+        """直接以串流回應匯出"""
+        from workorder.services.export_service import StreamingExportService
+        
+        rows = cls.iter_rows(queryset, file_format)
+        if file_format == 'csv':
+            return StreamingExportService.csv_response(filename, FILL_WORK_EXPORT_HEADERS, rows)
+        return StreamingExportService.xlsx_response(filename, cls.SHEET_TITLE, FILL_WORK_EXPORT_HEADERS, rows)
+    
+    @classmethod
+    def write_export_file(cls, kind, file_format, stored_name, owner_id):
+        """背景匯出：寫入發起者的匯出目錄供稍後下載"""
+        from workorder.services.export_service import StreamingExportService
+        
+        rows = cls.iter_rows(cls.get_queryset(kind), file_format)
+        return StreamingExportService.write_export_file(
+            stored_name, owner_id, file_format, cls.SHEET_TITLE, FILL_WORK_EXPORT_HEADERS, rows
+        )
+
+
+# 匯入每批寫入資料庫的筆數
+FILL_WORK_IMPORT_CHUNK_SIZE = 1000
+
+# 上傳檔案超過此大小時改由背景任務匯入
+FILL_WORK_IMPORT_ASYNC_SIZE = 2 * 1024 * 1024
+
+# 背景匯入的暫存檔放在 MEDIA_ROOT 下的子目錄
+FILL_WORK_IMPORT_DIR = 'imports'
+
+# 背景匯入進度存放於快取
+FILL_WORK_IMPORT_PROGRESS_KEY = 'fill_work_import:{job_id}'
+FILL_WORK_IMPORT_PROGRESS_TIMEOUT = 24 * 60 * 60
+
+# 進度資訊最多保留的錯誤訊息筆數
+FILL_WORK_IMPORT_MAX_ERRORS = 100
+
+# 填報記錄唯一鍵（與 FillWork.Meta.unique_together 相同）
+FILL_WORK_UNIQUE_FIELDS = (
+    'company_name', 'workorder', 'product_id', 'operation', 'operator', 'work_date', 'start_time',
+)
+
+# 覆蓋既有記錄時更新的欄位（與 FillWork.save 覆蓋重複記錄時相同）
+FILL_WORK_IMPORT_UPDATE_FIELDS = [
+    'operator', 'company_name', 'workorder', 'product_id', 'planned_quantity', 'process_id',
+    'operation', 'equipment', 'work_date', 'start_time', 'end_time', 'has_break',
+    'break_start_time', 'break_end_time', 'break_hours', 'work_quantity', 'defect_quantity',
+    'approval_status', 'remarks', 'abnormal_notes', 'created_by',
+    'work_hours_calculated', 'overtime_hours_calculated', 'updated_at',
+]
+
+
+def _parse_time(value):
+    from datetime import time as time_cls
+    if value is None or value == "":
+        return None
+    # 允許直接給 datetime.time / datetime.datetime
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time_cls):
+        return value
+    s = str(value).strip()
+    for fmt in ('%H:%M', '%H%M', '%H.%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(s, fmt).time()
+        except Exception:
+            pass
+    raise ValueError(f'時間格式錯誤：{value}（需 HH:MM）')
+
+
+def _parse_date(value):
+    from datetime import date as date_cls
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date_cls):
+        return value
+    s = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except Exception:
+            pass
+    raise ValueError(f'日期格式錯誤：{value}（需 YYYY-MM-DD）')
+
+
+def _to_int(val, default=0):
+    if val in (None, ""):
+        return default
+    try:
+        return int(val)
+    except Exception:
+        try:
+            return int(float(val))
+        except Exception:
+            raise ValueError(f'整數欄位格式錯誤：{val}')
+
+
+def _to_decimal(val):
+    from decimal import Decimal
+    if val in (None, ""):
+        return None
+    try:
+        return Decimal(str(val))
+    except Exception:
+        raise ValueError(f'數值欄位格式錯誤：{val}')
+
+
+def _is_blank(value):
+    return value is None or str(value).strip() == ''
+
+
+class FillWorkImportService:
+    """
+    填報記錄匯入服務
+    逐列串流讀取 CSV／XLSX 並在記憶體中驗證，以一次查詢取得檔案日期範圍內既有的唯一鍵，
+    再分批 bulk_create／bulk_update；派工單統計與工單狀態交由 WorkOrderRefreshService 統一重算。
+    """
+    
+    @staticmethod
+    def iter_file_rows(fileobj, filename):
+        """
+        逐列讀取上傳檔案，回傳（列號, {標頭: 值}）
+        
+        Raises:
+            ValueError: 檔案格式、編碼或標頭不符
+        """
+        import csv
+        import io
+        
+        if filename.lower().endswith('.xlsx'):
+            try:
+                import openpyxl
+            except ImportError:
+                raise ValueError('系統未安裝 openpyxl，無法解析 Excel')
+            wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+            try:
+                rows = wb.active.iter_rows(values_only=True)
+                header_row = next(rows, None) or ()
+                headers = [str(value).strip() if value is not None else '' for value in header_row]
+                header_map = {h: i for i, h in enumerate(headers)}
+                missing = [h for h in FILL_WORK_EXPORT_HEADERS if h not in header_map]
+                if missing:
+                    raise ValueError(f"必要欄位缺漏：{', '.join(missing)}")
+                for idx, row in enumerate(rows, start=2):
+                    yield idx, {
+                        h: (row[header_map[h]] if header_map[h] < len(row) else '')
+                        for h in FILL_WORK_EXPORT_HEADERS
+                    }
+            finally:
+                wb.close()
+        else:
+            # CSV：UTF-8（允許含 BOM），以文字串流逐列讀取
+            text = io.TextIOWrapper(getattr(fileobj, 'file', fileobj), encoding='utf-8-sig', newline='')
+            try:
+                reader = csv.DictReader(text)
+                headers = [h.strip() for h in (reader.fieldnames or [])]
+                reader.fieldnames = headers
+                missing = [h for h in FILL_WORK_EXPORT_HEADERS if h not in headers]
+                if missing:
+                    raise ValueError(f"必要欄位缺漏：{', '.join(missing)}")
+                for idx, row in enumerate(reader, start=2):
+                    yield idx, row
+            except UnicodeDecodeError:
+                raise ValueError('CSV 編碼非 UTF-8，請轉存為 UTF-8 後再上傳')
+            finally:
+                text.detach()
+    
+    @staticmethod
+    def load_lookups():
+        """一次載入公司設定與工序名稱對照，避免逐列查詢"""
+        from process.models import ProcessName
+        
+        company_codes = dict(MasterDataCache.company_code_map())
+        # 使用者可能直接填公司代號
+        for company_code in MasterDataCache.company_name_map():
+            company_codes.setdefault(company_code, company_code)
+        
+        process_ids = dict(ProcessName.objects.values_list('name', 'id'))
+        return company_codes, process_ids
+    
+    @staticmethod
+    def build_record(row, is_smt, username, company_codes, process_ids):
+        """
+        將一列匯入資料轉為未儲存的 FillWork，並在記憶體中計算工時
+        
+        Raises:
+            ValueError: 必要欄位缺漏或格式錯誤
+        """
+        from decimal import Decimal
+        from process.models import ProcessName
+        
+        # 必要欄位檢查
+        required = ['公司名稱', '報工日期', '開始時間', '結束時間', '工單號', '產品編號', '工序名稱', '報工數量']
+        missing = [h for h in required if row.get(h) in (None, "")]
+        if missing:
+            raise ValueError(f"必要欄位缺漏：{', '.join(missing)}")
+        
+        # 正規化日期/時間/數值
+        work_date = _parse_date(row.get('報工日期'))
+        start_time = _parse_time(row.get('開始時間'))
+        end_time = _parse_time(row.get('結束時間'))
+        work_quantity = _to_int(row.get('報工數量'), 0)
+        defect_quantity = _to_int(row.get('不良品數量'), 0)
+        
+        operator_raw = row.get('作業員名稱')
+        equipment_raw = row.get('設備名稱')
+        operator = str(operator_raw).strip() if operator_raw not in (None, "") else ""
+        company_name = str(row.get('公司名稱')).strip()
+        workorder = str(row.get('工單號')).strip()
+        product_id = str(row.get('產品編號')).strip()
+        operation = str(row.get('工序名稱')).strip()
+        equipment = str(equipment_raw).strip() if equipment_raw not in (None, "") else ""
+        remarks = "" if row.get('備註') in (None, "") else str(row.get('備註'))
+        abnormal_notes = "" if row.get('異常紀錄') in (None, "") else str(row.get('異常紀錄'))
+        
+        # 公司名稱或公司代號須存在於公司設定
+        if company_name not in company_codes:
+            raise ValueError(f"找不到公司設定：{company_name}")
+        
+        # 智能判斷是否為 SMT 類型
+        is_smt = is_smt or 'SMT' in operation.upper() or 'SMT' in equipment.upper() or 'SMT' in operator.upper()
+        
+        # 對應工序名稱到 ProcessName.id（若不存在則自動建立）
+        if operation not in process_ids:
+            process_ids[operation] = ProcessName.objects.get_or_create(name=operation)[0].id
+        
+        record = FillWork(
+            operator=operator or (equipment if is_smt else operator),
+            company_name=company_name,
+            workorder=workorder,
+            product_id=product_id,
+            planned_quantity=0,
+            operation=operation,
+            equipment=equipment,
+            work_date=work_date,
+            start_time=start_time,
+            end_time=end_time,
+            has_break=(not is_smt),
+            break_start_time=(None if is_smt else _parse_time('12:00')),
+            break_end_time=(None if is_smt else _parse_time('13:00')),
+            work_quantity=work_quantity,
+            defect_quantity=defect_quantity,
+            approval_status='pending',
+            created_by=username,
+            process_id=process_ids[operation],
+            remarks=remarks,
+            abnormal_notes=abnormal_notes,
+        )
+        
+        # 若匯入有提供工時數值 → 直接使用並跳過自動計算
+        work_hours_raw = row.get('工作時數')
+        overtime_hours_raw = row.get('加班時數')
+        provided_hours = False
+        if work_hours_raw not in (None, ""):
+            record.work_hours_calculated = _to_decimal(work_hours_raw) or Decimal('0')
+            provided_hours = True
+        if overtime_hours_raw not in (None, ""):
+            record.overtime_hours_calculated = _to_decimal(overtime_hours_raw) or Decimal('0')
+            provided_hours = True
+        
+        if provided_hours:
+            record._skip_auto_hours_calculation = True
+        else:
+            record.calculate_work_hours()
+        return record
+    
+    @staticmethod
+    def unique_key(record):
+        return tuple(getattr(record, field) for field in FILL_WORK_UNIQUE_FIELDS)
+    
+    @classmethod
+    def fetch_existing(cls, records):
+        """
+        一次查詢取得檔案日期範圍內既有記錄的唯一鍵
+        
+        Returns:
+            dict: 唯一鍵 → (id, break_hours)
+        """
+        if not records:
+            return {}
+        work_dates = [record.work_date for record in records]
+        company_names = {record.company_name for record in records}
+        rows = FillWork.objects.filter(
+            work_date__range=(min(work_dates), max(work_dates)),
+            company_name__in=company_names,
+        ).values_list(*FILL_WORK_UNIQUE_FIELDS, 'id', 'break_hours').iterator(chunk_size=FILL_WORK_IMPORT_CHUNK_SIZE)
+        return {row[:-2]: row[-2:] for row in rows}
+    
+    @classmethod
+    def import_file(cls, fileobj, filename, is_smt, username, job_id=None):
+        """
+        匯入填報記錄檔案
+        同一檔案內唯一鍵重複時以後面的列為準，與資料庫既有記錄重複時覆蓋既有記錄
+        
+        Args:
+            fileobj: 上傳檔案（二進位串流）
+            filename: 檔名，用於判斷 CSV／XLSX
+            is_smt: 是否為 SMT 匯入
+            username: 建立人員
+            job_id: 背景匯入任務代號，提供時會更新匯入進度
+        
+        Returns:
+            dict: 匯入結果，含 created、updated、errors 與受影響的工單鍵 affected_keys
+        """
+        created = 0
+        updated = 0
+        errors = []
+        records = {}
+        parsed_count = 0
+        
+        try:
+            company_codes, process_ids = cls.load_lookups()
+            for idx, row in cls.iter_file_rows(fileobj, filename):
+                # 跳過整列空白
+                if all(_is_blank(row.get(h)) for h in FILL_WORK_EXPORT_HEADERS):
+                    continue
+                try:
+                    record = cls.build_record(row, is_smt, username, company_codes, process_ids)
+                except Exception as e:
+                    errors.append(f'第 {idx} 列：{e}')
+                    continue
+                records[cls.unique_key(record)] = record
+                parsed_count += 1
+                if job_id and parsed_count % FILL_WORK_IMPORT_CHUNK_SIZE == 0:
+                    cls.set_progress(job_id, 'parsing', processed=parsed_count, errors=errors)
+            
+            if not parsed_count:
+                if not errors:
+                    errors.append('檔案無資料內容')
+                return cls._import_result(0, 0, errors, set(), job_id)
+            
+            existing = cls.fetch_existing(list(records.values()))
+            to_create = []
+            to_update = []
+            now = timezone.now()
+            for key, record in records.items():
+                if key in existing:
+                    record.pk, break_hours = existing[key]
+                    if getattr(record, '_skip_auto_hours_calculation', False):
+                        # 匯入提供工時時不重算，保留原休息時數
+                        record.break_hours = break_hours
+                    record.updated_at = now
+                    to_update.append(record)
+                else:
+                    to_create.append(record)
+            
+            total = len(to_create) + len(to_update)
+            written = 0
+            with transaction.atomic():
+                for start in range(0, len(to_create), FILL_WORK_IMPORT_CHUNK_SIZE):
+                    chunk = to_create[start:start + FILL_WORK_IMPORT_CHUNK_SIZE]
+                    FillWork.objects.bulk_create(chunk)
+                    written += len(chunk)
+                    if job_id:
+                        cls.set_progress(job_id, 'writing', processed=written, total=total, errors=errors)
+                for start in range(0, len(to_update), FILL_WORK_IMPORT_CHUNK_SIZE):
+                    chunk = to_update[start:start + FILL_WORK_IMPORT_CHUNK_SIZE]
+                    FillWork.objects.bulk_update(chunk, FILL_WORK_IMPORT_UPDATE_FIELDS)
+                    written += len(chunk)
+                    if job_id:
+                        cls.set_progress(job_id, 'writing', processed=written, total=total, errors=errors)
+                
+                # bulk 寫入不觸發 post_save，改為記錄受影響的工單，提交後統一重算派工單統計與工單狀態
+                affected_keys = {
+                    (record.company_name, record.workorder, record.product_id) for record in records.values()
+                }
+                for company_name, workorder, product_id in affected_keys:
+                    WorkOrderRefreshService.mark_dirty(None, company_name, workorder, product_id)
+            
+            created = len(to_create)
+            # 與逐筆儲存時相同：檔案內重複的列也計為覆蓋
+            updated = parsed_count - created
+            logger.info(f"填報記錄匯入完成：新增 {created} 筆，覆蓋 {updated} 筆，失敗 {len(errors)} 筆")
+            return cls._import_result(created, updated, errors, affected_keys, job_id)
+        
+        except ValueError as e:
+            return cls._import_result(0, 0, [str(e)], set(), job_id)
+        except Exception as e:
+            logger.error(f"填報記錄匯入失敗：{str(e)}")
+            errors.append(f'匯入過程發生未預期錯誤：{e}')
+            return cls._import_result(0, 0, errors, set(), job_id)
+    
+    @classmethod
+    def _import_result(cls, created, updated, errors, affected_keys, job_id):
+        result = {
+            'success': bool(created or updated) or not errors,
+            'created': created,
+            'updated': updated,
+            'errors': errors,
+            'affected_keys': affected_keys,
+        }
+        if job_id:
+            status = 'completed' if result['success'] else 'failed'
+            cls.set_progress(
+                job_id, status, processed=created + updated, total=created + updated,
+                errors=errors, created=created, updated=updated,
+            )
+        return result
+    
+    @staticmethod
+    def save_upload(uploaded_file):
+        """
+        將上傳檔案存到匯入暫存目錄供背景任務讀取
+        
+        Returns:
+            tuple: (job_id, 暫存檔路徑)
+        """
+        import os
+        import uuid
+        from django.conf import settings
+        
+        job_id = uuid.uuid4().hex
+        import_dir = os.path.join(settings.MEDIA_ROOT, FILL_WORK_IMPORT_DIR)
+        os.makedirs(import_dir, exist_ok=True)
+        extension = '.xlsx' if (uploaded_file.name or '').lower().endswith('.xlsx') else '.csv'
+        path = os.path.join(import_dir, f"{job_id}{extension}")
+        with open(path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+        return job_id, path
+    
+    @staticmethod
+    def set_progress(job_id, status, processed=0, total=None, errors=None, created=0, updated=0):
+        """更新背景匯入進度（parsing → writing → completed／failed）"""
+        from django.core.cache import cache
+        
+        errors = errors or []
+        cache.set(FILL_WORK_IMPORT_PROGRESS_KEY.format(job_id=job_id), {
+            'status': status,
+            'processed': processed,
+            'total': total,
+            'created': created,
+            'updated': updated,
+            'error_count': len(errors),
+            'errors': errors[:FILL_WORK_IMPORT_MAX_ERRORS],
+            'updated_at': timezone.now().isoformat(),
+        }, FILL_WORK_IMPORT_PROGRESS_TIMEOUT)
+    
+    @staticmethod
+    def get_progress(job_id):
+        from django.core.cache import cache
+        
+        return cache.get(FILL_WORK_IMPORT_PROGRESS_KEY.format(job_id=job_id))
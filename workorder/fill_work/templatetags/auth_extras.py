@@ -5,6 +5,8 @@
 """
 from django import template
 
+from system.permission_resolver import user_in_groups
+
 register = template.Library()
 
 
@@ -16,6 +18,6 @@ def has_group(user, group_name: str) -> bool:
     try:
         if not getattr(user, "is_authenticated", False):
             return False
-        return user.groups.filter(name=str(group_name)).exists()
+        return user_in_groups(user, str(group_name))
     except Exception:
         return False 
\ No newline at end of file
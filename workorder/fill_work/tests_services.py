@@ -0,0 +1,465 @@
+"""
+填報作業管理子模組 - 服務層測試
+匯入、背景匯出、異動彙整、批次核准、自動審核、工時計算、主檔快取與權限解析
+"""
+
+import os
+import shutil
+import tempfile
+import time as time_module
+from datetime import date, time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import FillWork
+from .services import FillWorkImportService, FILL_WORK_EXPORT_HEADERS
+
+
+class FillWorkImportServiceTest(TestCase):
+    """填報記錄匯入服務測試"""
+    
+    def setUp(self):
+        """測試前準備"""
+        from erp_integration.models import CompanyConfig
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        FillWork.objects.create(
+            operator='王小明',
+            company_name='測試公司',
+            workorder='WO-001',
+            product_id='PROD-A',
+            process_id='1',
+            operation='組裝',
+            work_date=date(2025, 3, 10),
+            start_time=time(8, 0),
+            end_time=time(12, 0),
+            work_quantity=10,
+            created_by='testuser',
+        )
+    
+    def build_csv(self, rows):
+        import csv
+        from io import BytesIO, StringIO
+        
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(FILL_WORK_EXPORT_HEADERS)
+        writer.writerows(rows)
+        return BytesIO(output.getvalue().encode('utf-8'))
+    
+    def test_import_creates_and_overwrites_in_bulk(self):
+        """既有記錄覆蓋、檔案內重複以後列為準、格式錯誤的列回報列號"""
+        fileobj = self.build_csv([
+            ['王小明', '測試公司', '2025-03-10', '08:00', '12:00', 'WO-001', 'PROD-A', '組裝', '', '80', '1', '', '', '', ''],
+            ['李小華', '測試公司', '2025-03-11', '08:00', '17:00', 'WO-001', 'PROD-A', '組裝', '', '50', '0', '', '', '', ''],
+            ['李小華', '測試公司', '2025-03-11', '08:00', '17:00', 'WO-001', 'PROD-A', '組裝', '', '60', '0', '', '', '', ''],
+            ['李小華', '測試公司', '2025/13/40', '08:00', '17:00', 'WO-001', 'PROD-A', '組裝', '', '60', '0', '', '', '', ''],
+        ])
+        
+        result = FillWorkImportService.import_file(fileobj, 'import.csv', is_smt=False, username='importer')
+        
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertTrue(result['errors'][0].startswith('第 5 列'))
+        self.assertEqual(result['affected_keys'], {('測試公司', 'WO-001', 'PROD-A')})
+        self.assertEqual(FillWork.objects.count(), 2)
+        self.assertEqual(FillWork.objects.get(operator='王小明').work_quantity, 80)
+        new_record = FillWork.objects.get(operator='李小華')
+        self.assertEqual(new_record.work_quantity, 60)
+        self.assertEqual(new_record.work_hours_calculated, Decimal('8.00'))
+    
+    def test_import_rejects_missing_headers(self):
+        """缺少標頭時不匯入任何資料"""
+        from io import BytesIO
+        
+        result = FillWorkImportService.import_file(BytesIO('作業員名稱\n王小明\n'.encode('utf-8')), 'import.csv', False, 'importer')
+        
+        self.assertEqual(result['created'], 0)
+        self.assertTrue(result['errors'][0].startswith('必要欄位缺漏'))
+
+
+class FillWorkBackgroundExportTest(TestCase):
+    """背景匯出檔的下載權限與逾期清除測試"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.other = User.objects.create_user(username='other', password='testpass')
+        FillWork.objects.create(
+            operator='王小明', company_name='測試公司', workorder='WO-001', product_id='PROD-A',
+            operation='組裝', work_date=date(2025, 3, 10), start_time=time(8, 0), end_time=time(12, 0),
+            work_quantity=10, created_by='testuser',
+        )
+    
+    def export(self, user):
+        from workorder.services.export_service import StreamingExportService
+        from workorder.tasks import export_fill_work_records_task
+        
+        stored_name = StreamingExportService.new_export_name('operator_fill_work_export.csv')
+        result = export_fill_work_records_task('operator', 'csv', stored_name, user.id)
+        self.assertTrue(result['success'])
+        return stored_name, result['file_path']
+    
+    def download(self, user, stored_name):
+        self.client.force_login(user)
+        return self.client.get(reverse('workorder:fill_work:fill_work_export_download', args=[stored_name]))
+    
+    def test_only_owner_can_download(self):
+        stored_name, path = self.export(self.owner)
+        self.assertEqual(os.path.dirname(path), os.path.join(self.media_root, 'exports', str(self.owner.id)))
+        
+        response = self.download(self.other, stored_name)
+        self.assertEqual(response.status_code, 302)
+        
+        response = self.download(self.owner, stored_name)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        response.close()
+        self.assertIn('WO-001', content)
+    
+    def test_cleanup_removes_expired_exports(self):
+        from workorder.tasks import cleanup_export_files_task
+        
+        _, expired_path = self.export(self.owner)
+        _, fresh_path = self.export(self.other)
+        expired_at = time_module.time() - 25 * 60 * 60
+        os.utime(expired_path, (expired_at, expired_at))
+        
+        with self.settings(EXPORT_FILE_MAX_AGE_HOURS=24):
+            result = cleanup_export_files_task()
+        
+        self.assertEqual(result['removed_count'], 1)
+        self.assertFalse(os.path.exists(os.path.dirname(expired_path)))
+        self.assertTrue(os.path.exists(fresh_path))
+
+
+class WorkOrderRefreshPipelineTest(TestCase):
+    """填報記錄異動彙整測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def create_fill_work(self, operator, start_time, workorder='WO-001'):
+        return FillWork.objects.create(
+            operator=operator,
+            company_name='測試公司',
+            workorder=workorder,
+            product_id='PROD-A',
+            process_id='1',
+            operation='組裝',
+            work_date=date(2025, 3, 10),
+            start_time=start_time,
+            end_time=time(17, 0),
+            work_quantity=10,
+            created_by='testuser',
+        )
+    
+    def test_saves_in_one_transaction_schedule_one_refresh(self):
+        """同一交易內多筆儲存只排程一次，且同一工單只出現一次"""
+        from unittest import mock
+        
+        with mock.patch('workorder.tasks.refresh_dirty_workorders_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_fill_work('王小明', time(8, 0))
+                self.create_fill_work('李小華', time(9, 0))
+            # 時間窗內再次異動不重複排程
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_fill_work('陳小美', time(10, 0))
+        
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], [[['', '測試公司', 'WO-001', 'PROD-A', False]]])
+    
+    def test_rolled_back_writes_are_not_scheduled(self):
+        """回滾的交易（保存點）內記錄的工單鍵隨之捨棄，不會由之後的提交送出"""
+        from unittest import mock
+        from django.db import transaction
+        
+        with mock.patch('workorder.tasks.refresh_dirty_workorders_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self.create_fill_work('王小明', time(8, 0), workorder='WO-ROLLBACK')
+                        raise RuntimeError('rollback')
+                except RuntimeError:
+                    pass
+                self.create_fill_work('李小華', time(9, 0))
+        
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], [[['', '測試公司', 'WO-001', 'PROD-A', False]]])
+
+
+class BatchApprovalTest(TestCase):
+    """批次核准測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from erp_integration.models import CompanyConfig
+        from workorder.models import WorkOrder
+        from workorder.workorder_dispatch.models import WorkOrderDispatch
+        cache.clear()
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        WorkOrder.objects.create(company_code='10', order_number='WO-001', product_code='PROD-A', quantity=100)
+        WorkOrderDispatch.objects.create(company_code='10', order_number='WO-001', product_code='PROD-A')
+        # 生產明細以工單 + 工序 + 報工日期為唯一鍵；陳大同與王小明同日同工序，明細衝突不應中斷核准
+        self.records = [
+            self.create_fill_work('王小明', 'WO-001', time(8, 0), date(2025, 3, 10)),
+            self.create_fill_work('李小華', 'WO-001', time(9, 0), date(2025, 3, 11)),
+            self.create_fill_work('陳大同', 'WO-001', time(13, 0), date(2025, 3, 10)),
+            self.create_fill_work('陳小美', 'WO-404', time(8, 0), date(2025, 3, 10)),
+            self.create_fill_work('王小明', 'RD樣品-001', time(13, 0), date(2025, 3, 10)),
+            self.create_fill_work('李小華', 'RD樣品-001', time(13, 0), date(2025, 3, 11)),
+        ]
+    
+    def create_fill_work(self, operator, workorder, start_time, work_date):
+        return FillWork.objects.create(
+            operator=operator,
+            company_name='測試公司',
+            workorder=workorder,
+            product_id='PROD-A',
+            planned_quantity=50,
+            process_id='1',
+            operation='出貨包裝',
+            work_date=work_date,
+            start_time=start_time,
+            end_time=time(17, 0),
+            work_quantity=10,
+            created_by='testuser',
+        )
+    
+    def test_batch_approve(self):
+        """驗證失敗者列為警告，其餘一次核准；RD樣品工單只建立一次，每張工單只排程一次重算"""
+        from unittest import mock
+        from workorder.models import WorkOrder, WorkOrderProductionDetail
+        from workorder.workorder_dispatch.models import WorkOrderDispatch
+        from .services import FillWorkApprovalService
+        
+        with mock.patch('workorder.tasks.refresh_dirty_workorders_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = FillWorkApprovalService.batch_approve_fill_work_records(
+                    [record.id for record in self.records], 'supervisor'
+                )
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(result['approved_count'], 5)
+        self.assertEqual(result['rd_workorders_created'], 1)
+        self.assertEqual(result['rd_dispatches_created'], 1)
+        self.assertEqual(len(result['warnings']), 1)
+        self.assertEqual(
+            set(FillWork.objects.filter(approval_status='approved').values_list('workorder', flat=True)),
+            {'WO-001', 'RD樣品-001'},
+        )
+        self.assertEqual(WorkOrder.objects.filter(order_number='RD樣品-001').count(), 1)
+        self.assertEqual(WorkOrderDispatch.objects.filter(order_number='RD樣品-001').count(), 1)
+        self.assertEqual(WorkOrderProductionDetail.objects.filter(original_report_type='fill_work').count(), 4)
+        
+        apply_async.assert_called_once()
+        completion_keys = [key for key in apply_async.call_args.kwargs['args'][0] if key[4]]
+        self.assertEqual(sorted(key[2] for key in completion_keys), ['RD樣品-001', 'WO-001'])
+
+
+class AutoApprovalTaskTest(TestCase):
+    """自動審核任務測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from workorder.models import SystemConfig
+        cache.clear()
+        SystemConfig.set_config('auto_approval', 'True')
+        SystemConfig.set_config('auto_approval_notification_enabled', 'False')
+        self.ok = self.create_fill_work('王小明', time(8, 0), time(12, 0), 100, 2)
+        self.long_hours = self.create_fill_work('李小華', time(8, 0), time(12, 0), 100, 0)
+        FillWork.objects.filter(id=self.long_hours.id).update(work_hours_calculated=Decimal('13.00'))
+        self.defective = self.create_fill_work('陳小美', time(8, 0), time(12, 0), 100, 10)
+        self.no_quantity = self.create_fill_work('林小強', time(8, 0), time(12, 0), 0, 3)
+    
+    def create_fill_work(self, operator, start_time, end_time, work_quantity, defect_quantity):
+        return FillWork.objects.create(
+            operator=operator,
+            company_name='測試公司',
+            workorder='WO-001',
+            product_id='PROD-A',
+            process_id='1',
+            operation='組裝',
+            work_date=date(2025, 3, 10),
+            start_time=start_time,
+            end_time=end_time,
+            work_quantity=work_quantity,
+            defect_quantity=defect_quantity,
+            created_by='testuser',
+        )
+    
+    def test_rules_applied_in_bulk(self):
+        """規則於資料庫判斷，核准與駁回批次寫入，受影響的工單只排程一次重算"""
+        from unittest import mock
+        from system.tasks import auto_approve_work_reports
+        
+        with self.settings(AUTO_APPROVAL_BATCH_SIZE=2), \
+                mock.patch('workorder.tasks.refresh_dirty_workorders_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = auto_approve_work_reports()
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(sorted(result['approved_reports']), sorted([self.ok.id, self.no_quantity.id]))
+        self.assertEqual(sorted(result['rejected_reports']), sorted([self.long_hours.id, self.defective.id]))
+        self.assertTrue(result['completed'])
+        self.assertIn('records_per_second', result)
+        
+        self.assertEqual(FillWork.objects.get(id=self.ok.id).approved_by, '自動審核系統')
+        self.assertEqual(FillWork.objects.get(id=self.long_hours.id).rejection_reason, '工作時數(13.0小時)超過限制(12.0小時)')
+        self.assertEqual(FillWork.objects.get(id=self.defective.id).rejection_reason, '不良率(10.00%)超過限制(5.0%)')
+        apply_async.assert_called_once()
+    
+    def test_overlapping_run_is_skipped(self):
+        """上一次執行仍持有鎖時跳過，不處理任何記錄"""
+        from django.core.cache import cache
+        from system.tasks import AUTO_APPROVAL_LOCK_KEY, auto_approve_work_reports
+        
+        cache.add(AUTO_APPROVAL_LOCK_KEY, 'other-run', 60)
+        result = auto_approve_work_reports()
+        
+        self.assertTrue(result['skipped'])
+        self.assertEqual(FillWork.objects.filter(approval_status='pending').count(), 4)
+        self.assertEqual(cache.get(AUTO_APPROVAL_LOCK_KEY), 'other-run')
+
+
+class WorkHourCalculatorTest(TestCase):
+    """填報工時計算測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def calculate(self, start_time, end_time, has_break, company_code=None):
+        from .work_hours import WorkHourCalculator
+        return WorkHourCalculator.calculate(start_time, end_time, has_break, company_code)
+    
+    def test_default_rules(self):
+        """作業員扣午休、17:30 後加班；SMT 不扣午休、16:30 後加班；跨日計為加班"""
+        self.assertEqual(self.calculate(time(8, 0), time(17, 0), True), (Decimal('8'), Decimal('0'), Decimal('1')))
+        self.assertEqual(self.calculate(time(8, 0), time(19, 30), True)[1], Decimal('2'))
+        self.assertEqual(self.calculate(time(8, 0), time(17, 0), False), (Decimal('8.5'), Decimal('0.5'), Decimal('0')))
+        self.assertEqual(self.calculate(time(20, 0), time(2, 0), False)[:2], (Decimal('0'), Decimal('6')))
+    
+    def test_company_rules(self):
+        """公司可設定自己的休息與加班規則"""
+        from .work_hours import WorkHourCalculator
+        WorkHourCalculator.save_rules({
+            '10': {'operator': {'break_start': '12:00', 'break_end': '12:30', 'overtime_start': '17:00', 'break_mode': 'overlap'}},
+        })
+        
+        self.assertEqual(self.calculate(time(12, 15), time(18, 0), True, '10'), (Decimal('4.5'), Decimal('1'), Decimal('0.25')))
+        # 其他公司仍使用預設規則
+        self.assertEqual(self.calculate(time(8, 0), time(17, 0), True, '20')[0], Decimal('8'))
+
+
+
+class MasterDataCacheTest(TestCase):
+    """主檔快取測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from erp_integration.models import CompanyConfig
+        cache.clear()
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        CompanyConfig.objects.create(company_name='第二公司', company_code='20')
+    
+    def test_company_lookup_uses_one_query(self):
+        """公司代號與名稱對應只在第一次載入時查詢"""
+        from workorder.services.master_data_cache import MasterDataCache
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(MasterDataCache.get_company_code('測試公司'), '10')
+            self.assertEqual(MasterDataCache.get_company_name('20'), '第二公司')
+            self.assertIsNone(MasterDataCache.get_company_name('99'))
+    
+    def test_save_invalidates_cache(self):
+        """公司設定與系統設定異動後重新載入"""
+        from erp_integration.models import CompanyConfig
+        from workorder.models import SystemConfig
+        from workorder.services.master_data_cache import MasterDataCache
+        
+        self.assertEqual(MasterDataCache.get_company_name('10'), '測試公司')
+        self.assertIsNone(SystemConfig.get_config('auto_approval'))
+        
+        company = CompanyConfig.objects.get(company_code='10')
+        company.company_name = '更名公司'
+        company.save()
+        SystemConfig.set_config('auto_approval', 'True')
+        
+        self.assertEqual(MasterDataCache.get_company_name('10'), '更名公司')
+        self.assertEqual(SystemConfig.get_config('auto_approval'), 'True')
+
+
+class PermissionResolverTest(TestCase):
+    """使用者有效權限解析測試"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from process.models import Operator
+        from system.models import UserWorkPermission
+        cache.clear()
+        self.user = User.objects.create_user(username='operator_user', password='testpass123')
+        self.allowed = Operator.objects.create(name='王小明')
+        Operator.objects.create(name='李小華')
+        UserWorkPermission.objects.create(
+            user='operator_user', can_operate_all_operators=False, allowed_operators=[str(self.allowed.id)]
+        )
+    
+    def test_permissions_resolved_once_and_cached(self):
+        """同一請求只解析一次，之後的請求由快取提供"""
+        from .views import get_user_filtered_operators
+        from system.permission_resolver import get_effective_permissions
+        
+        self.assertEqual(list(get_user_filtered_operators(self.user)), [self.allowed])
+        with self.assertNumQueries(0):
+            get_effective_permissions(self.user)
+        
+        fresh_user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_effective_permissions(fresh_user).operator_ids, frozenset([self.allowed.id]))
+    
+    def test_changes_invalidate_cache(self):
+        """工作權限與群組異動後重新解析"""
+        from django.contrib.auth.models import Group
+        from system.models import UserWorkPermission
+        from system.permission_resolver import get_effective_permissions, is_supervisor
+        
+        self.assertFalse(is_supervisor(self.user))
+        
+        permission = UserWorkPermission.objects.get(user='operator_user')
+        permission.can_operate_all_operators = True
+        permission.save()
+        self.user.groups.add(Group.objects.create(name='主管'))
+        
+        fresh_user = User.objects.get(pk=self.user.pk)
+        self.assertIsNone(get_effective_permissions(fresh_user).operator_ids)
+        self.assertTrue(is_supervisor(fresh_user))
+    
+    def test_system_utils_only_bypass_superuser(self):
+        """管理員在填報畫面不受限制，system.utils 的權限檢查仍只放行超級使用者"""
+        from process.models import Operator
+        from .views import get_user_filtered_operators
+        from system.utils import check_user_operator_permission, filter_operators_by_user_permission
+        
+        denied = Operator.objects.get(name='李小華')
+        self.user.is_staff = True
+        self.user.save()
+        
+        staff_user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_user_filtered_operators(staff_user).count(), 2)
+        self.assertFalse(check_user_operator_permission(staff_user, denied.id))
+        self.assertEqual(list(filter_operators_by_user_permission(staff_user, Operator.objects.all())), [self.allowed])
+        
+        staff_user.is_superuser = True
+        staff_user.save()
+        superuser = User.objects.get(pk=self.user.pk)
+        self.assertTrue(check_user_operator_permission(superuser, denied.id))
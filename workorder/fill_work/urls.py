@@ -54,12 +54,14 @@ urlpatterns = [
     # 資料匯入
     path("settings/data/operator/import/", views.import_fill_work_records_operator, name="fill_work_import_operator"),
     path("settings/data/smt/import/", views.import_fill_work_records_smt, name="fill_work_import_smt"),
+    path("settings/data/import/status/<str:job_id>/", views.fill_work_import_status, name="fill_work_import_status"),
 
     # 資料匯出功能
     path("settings/data/operator/export/", views.export_fill_work_records_operator, name="fill_work_export_operator"),
     path("settings/data/smt/export/", views.export_fill_work_records_smt, name="fill_work_export_smt"),
     path("settings/data/operator/export-xlsx/", views.export_fill_work_records_operator_xlsx, name="fill_work_export_operator_xlsx"),
     path("settings/data/smt/export-xlsx/", views.export_fill_work_records_smt_xlsx, name="fill_work_export_smt_xlsx"),
+    path("settings/data/export/download/<str:stored_name>/", views.download_fill_work_export, name="fill_work_export_download"),
 
     # 批次操作
     path("batch/delete/", views.batch_delete_fill_work, name="batch_delete_fill_work"),
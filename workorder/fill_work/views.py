@@ -9,7 +9,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import Q
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.forms import ModelForm
 from django import forms
 from datetime import datetime, time
@@ -22,7 +22,7 @@ from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 import csv
 from io import StringIO
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 from io import StringIO, BytesIO
 from django.utils import timezone
 try:
@@ -31,12 +31,16 @@ except Exception:
     openpyxl = None
 
 from .models import FillWork
+from .services import FillWorkExportService, FillWorkImportService, FILL_WORK_EXPORT_HEADERS, FILL_WORK_IMPORT_ASYNC_SIZE
+from workorder.services.export_service import StreamingExportService, EXPORT_ASYNC_THRESHOLD
 from workorder.workorder_dispatch.models import WorkOrderDispatch
 from erp_integration.models import CompanyConfig
+from workorder.services.master_data_cache import MasterDataCache
 from process.models import ProcessName, Operator
 from equip.models import Equipment
 from workorder.models import WorkOrder
 from workorder.services.production_sync_service import ProductionReportSyncService
+from system.permission_resolver import get_effective_permissions, is_supervisor, user_in_groups
 
 
 # ==================== 權限過濾工具函數 ====================
@@ -47,40 +51,17 @@ def get_user_filtered_operators(user, request=None):
     
     Args:
         user: 使用者物件
-        request: HTTP請求物件（可選，用於獲取權限設定）
+        request: HTTP請求物件（可選，保留相容）
     
     Returns:
         QuerySet: 過濾後的作業員查詢集
     """
+    operators = Operator.objects.all().order_by('name')
     try:
-        # 檢查用戶權限
-        if user.is_superuser or user.is_staff:
-            # 超級管理員和管理員可以看到所有作業員
-            return Operator.objects.all().order_by('name')
-        
-        # 嘗試從用戶物件獲取權限設定
-        try:
-            from system.models import UserWorkPermission
-            permission_detail = UserWorkPermission.objects.get(user=user)
-            if permission_detail.can_operate_all_operators:
-                return Operator.objects.all().order_by('name')
-            elif permission_detail.allowed_operators:
-                # 將字符串ID轉換為整數
-                operator_ids = [int(op_id) for op_id in permission_detail.allowed_operators if str(op_id).isdigit()]
-                if operator_ids:
-                    return Operator.objects.filter(id__in=operator_ids).order_by('name')
-                else:
-                    return Operator.objects.none()
-            else:
-                return Operator.objects.none()
-        except UserWorkPermission.DoesNotExist:
-            pass
-        
-        # 預設顯示全部作業員
-        return Operator.objects.all().order_by('name')
+        return get_effective_permissions(user).filter_operators(operators)
     except Exception:
         # 發生錯誤時，預設顯示全部
-        return Operator.objects.all().order_by('name')
+        return operators
 
 
 def get_user_filtered_processes(user, request=None):
@@ -89,40 +70,17 @@ def get_user_filtered_processes(user, request=None):
     
     Args:
         user: 使用者物件
-        request: HTTP請求物件（可選，用於獲取權限設定）
+        request: HTTP請求物件（可選，保留相容）
     
     Returns:
         QuerySet: 過濾後的工序查詢集
     """
+    processes = ProcessName.objects.all().order_by('name')
     try:
-        # 檢查用戶權限
-        if user.is_superuser or user.is_staff:
-            # 超級管理員和管理員可以看到所有工序
-            return ProcessName.objects.all().order_by('name')
-        
-        # 嘗試從用戶物件獲取權限設定
-        try:
-            from system.models import UserWorkPermission
-            permission_detail = UserWorkPermission.objects.get(user=user)
-            if permission_detail.can_operate_all_processes:
-                return ProcessName.objects.all().order_by('name')
-            elif permission_detail.allowed_processes:
-                # 將字符串ID轉換為整數
-                process_ids = [int(proc_id) for proc_id in permission_detail.allowed_processes if str(proc_id).isdigit()]
-                if process_ids:
-                    return ProcessName.objects.filter(id__in=process_ids).order_by('name')
-                else:
-                    return ProcessName.objects.none()
-            else:
-                return ProcessName.objects.none()
-        except UserWorkPermission.DoesNotExist:
-            pass
-        
-        # 預設顯示全部工序
-        return ProcessName.objects.all().order_by('name')
+        return get_effective_permissions(user).filter_processes(processes)
     except Exception:
         # 發生錯誤時，預設顯示全部
-        return ProcessName.objects.all().order_by('name')
+        return processes
 
 
 def get_user_filtered_equipments(user, request=None):
@@ -131,40 +89,17 @@ def get_user_filtered_equipments(user, request=None):
     
     Args:
         user: 使用者物件
-        request: HTTP請求物件（可選，用於獲取權限設定）
+        request: HTTP請求物件（可選，保留相容）
     
     Returns:
         QuerySet: 過濾後的設備查詢集
     """
+    equipments = Equipment.objects.all().order_by('name')
     try:
-        # 檢查用戶權限
-        if user.is_superuser or user.is_staff:
-            # 超級管理員和管理員可以看到所有設備
-            return Equipment.objects.all().order_by('name')
-        
-        # 嘗試從用戶物件獲取權限設定
-        try:
-            from system.models import UserWorkPermission
-            permission_detail = UserWorkPermission.objects.get(user=user)
-            if permission_detail.can_operate_all_equipments:
-                return Equipment.objects.all().order_by('name')
-            elif permission_detail.allowed_equipments:
-                # 將字符串ID轉換為整數
-                equipment_ids = [int(eq_id) for eq_id in permission_detail.allowed_equipments if str(eq_id).isdigit()]
-                if equipment_ids:
-                    return Equipment.objects.filter(id__in=equipment_ids).order_by('name')
-                else:
-                    return Equipment.objects.none()
-            else:
-                return Equipment.objects.none()
-        except UserWorkPermission.DoesNotExist:
-            pass
-        
-        # 預設顯示全部設備
-        return Equipment.objects.all().order_by('name')
+        return get_effective_permissions(user).filter_equipments(equipments)
     except Exception:
         # 發生錯誤時，預設顯示全部
-        return Equipment.objects.all().order_by('name')
+        return equipments
 
 
 # ==================== 表單類別定義 ====================
@@ -1302,7 +1237,6 @@ class OperatorRDBackfillCreateView(LoginRequiredMixin, CreateView):
         try:
             from workorder.models import WorkOrder
             from workorder.workorder_dispatch.models import WorkOrderDispatch
-            from erp_integration.models import CompanyConfig
             from django.utils import timezone
             
             # 取得表單資料
@@ -1310,13 +1244,11 @@ class OperatorRDBackfillCreateView(LoginRequiredMixin, CreateView):
             product_code = form.cleaned_data.get('product_id')
             
             # 取得公司代號（移除驗證）
-            company_config = CompanyConfig.objects.filter(company_name=company_name).first()
-            if not company_config:
+            company_code_value = MasterDataCache.get_company_code(company_name)
+            if not company_code_value:
                 # 移除驗證錯誤，使用預設值
                 company_code_value = 'DEFAULT'
                 messages.info(self.request, '使用預設公司代號')
-            else:
-                company_code_value = company_config.company_code
             
             # 直接使用 workorder 欄位的內容作為工單號碼
             workorder_number = form.cleaned_data.get('workorder')
@@ -1552,7 +1484,6 @@ class SMTRDBackfillCreateView(LoginRequiredMixin, CreateView):
         try:
             from workorder.models import WorkOrder
             from workorder.workorder_dispatch.models import WorkOrderDispatch
-            from erp_integration.models import CompanyConfig
             from django.utils import timezone
             
             # 取得表單資料
@@ -1560,13 +1491,11 @@ class SMTRDBackfillCreateView(LoginRequiredMixin, CreateView):
             product_code = form.cleaned_data.get('product_id')
             
             # 取得公司代號（移除驗證）
-            company_config = CompanyConfig.objects.filter(company_name=company_name).first()
-            if not company_config:
+            company_code_value = MasterDataCache.get_company_code(company_name)
+            if not company_code_value:
                 # 移除驗證錯誤，使用預設值
                 company_code_value = 'DEFAULT'
                 messages.info(self.request, '使用預設公司代號')
-            else:
-                company_code_value = company_config.company_code
             
             # 查找現有工單（只根據公司代號和工單號碼，因為唯一性約束是 (company_code, order_number)）
             existing_workorder = WorkOrder.objects.filter(
@@ -2146,7 +2075,7 @@ def cancel_approve_fill_work(request, pk: int):
     """
     from django.shortcuts import redirect
     record = get_object_or_404(FillWork, pk=pk)
-    if not (request.user.is_superuser or request.user.groups.filter(name__in=['系統管理員', '主管']).exists()):
+    if not is_supervisor(request.user):
         messages.error(request, '無權限取消核准')
         return redirect('workorder:fill_work:fill_work_detail', pk=pk)
 
@@ -2280,7 +2209,7 @@ class FillWorkSettingsView(LoginRequiredMixin, UserPassesTestMixin, TemplateView
 
     def test_func(self) -> bool:
         user = self.request.user
-        return bool(getattr(user, 'is_superuser', False) or user.groups.filter(name__in=['系統管理員', '主管']).exists())
+        return is_supervisor(user)
 
     def handle_no_permission(self):
         messages.error(self.request, '無權限存取填報功能設定')
@@ -2351,9 +2280,8 @@ def import_fill_work_records(request):
     return redirect('workorder:fill_work:fill_work_list')
 
 
-TEMPLATE_HEADERS = [
-    '作業員名稱','公司名稱','報工日期','開始時間','結束時間','工單號','產品編號','工序名稱','設備名稱','報工數量','不良品數量','備註','異常紀錄','工作時數','加班時數'
-]
+# 匯入範本與匯出共用同一組欄位
+TEMPLATE_HEADERS = FILL_WORK_EXPORT_HEADERS
 
 
 def _build_csv_response(filename: str, rows: list[list[str]]):
@@ -2432,205 +2360,46 @@ def import_fill_work_records_smt(request):
 # 匯出（目前依照 type 參數）
 @login_required
 def export_fill_work_records_operator(request):
-    qs = FillWork.objects.exclude(Q(operator__icontains='SMT') | Q(process_name__icontains='SMT')).order_by('-created_at')
-    return _export_fill_work_qs(qs, 'operator_fill_work_export.csv')
+    return _export_fill_work(request, 'operator', 'csv', 'operator_fill_work_export.csv')
 
 
 @login_required
 def export_fill_work_records_smt(request):
-    qs = FillWork.objects.filter(Q(operator__icontains='SMT') | Q(process_name__icontains='SMT')).order_by('-created_at')
-    return _export_fill_work_qs(qs, 'smt_fill_work_export.csv')
-
-
-def _export_fill_work_qs(qs, filename: str):
-    rows = [TEMPLATE_HEADERS]
-    for r in qs:
-        rows.append([
-            r.operator,
-            r.company_name,
-            r.work_date.strftime('%Y-%m-%d') if r.work_date else '',
-            r.start_time.strftime('%H:%M') if r.start_time else '',
-            r.end_time.strftime('%H:%M') if r.end_time else '',
-            r.workorder,
-            r.product_id,
-            r.operation,
-            r.equipment,
-            r.work_quantity,
-            r.defect_quantity,
-            r.remarks or '',
-            r.abnormal_notes or '',
-            str(r.work_hours_calculated),
-            str(r.overtime_hours_calculated),
-        ])
-    return _build_csv_response(filename, rows)
-
-
-def _parse_time(value: str):
-    from datetime import datetime, time as time_cls
-    if value is None or value == "":
-        return None
-    # 允許直接給 datetime.time / datetime.datetime
-    if isinstance(value, time_cls):
-        return value
-    if isinstance(value, datetime):
-        return value.time()
-    s = str(value).strip()
-    for fmt in ('%H:%M', '%H%M', '%H.%M', '%H:%M:%S'):
-        try:
-            return datetime.strptime(s, fmt).time()
-        except Exception:
-            pass
-    raise ValueError(f'時間格式錯誤：{value}（需 HH:MM）')
-
-
-def _parse_date(value):
-    from datetime import datetime, date as date_cls
-    if value is None or value == "":
-        return None
-    if isinstance(value, date_cls):
-        return value
-    if isinstance(value, datetime):
-        return value.date()
-    s = str(value).strip()
-    for fmt in ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d'):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            pass
-    raise ValueError(f'日期格式錯誤：{value}（需 YYYY-MM-DD）')
+    return _export_fill_work(request, 'smt', 'csv', 'smt_fill_work_export.csv')
 
 
-def _to_int(val, default=0):
-    if val in (None, ""):
-        return default
-    try:
-        return int(val)
-    except Exception:
-        try:
-            return int(float(val))
-        except Exception:
-            raise ValueError(f'整數欄位格式錯誤：{val}')
-
-
-def _to_decimal(val):
-    if val in (None, ""):
-        return None
-    try:
-        return Decimal(str(val))
-    except Exception:
-        raise ValueError(f'數值欄位格式錯誤：{val}')
-
-
-def _create_fillwork_from_row(row: dict, is_smt: bool, username: str) -> FillWork:
-    from datetime import datetime
-    # 讀取欄位（依指定格式）
-    operator_raw = row.get('作業員名稱')
-    company_name_raw = row.get('公司名稱')
-    work_date_raw = row.get('報工日期')
-    start_time_raw = row.get('開始時間')
-    end_time_raw = row.get('結束時間')
-    workorder_raw = row.get('工單號')
-    product_id_raw = row.get('產品編號')
-    operation_raw = row.get('工序名稱')
-    equipment_raw = row.get('設備名稱')
-    work_qty_raw = row.get('報工數量')
-    defect_qty_raw = row.get('不良品數量')
-    remarks_raw = row.get('備註')
-    abnormal_raw = row.get('異常紀錄')
-    work_hours_raw = row.get('工作時數')
-    overtime_hours_raw = row.get('加班時數')
-
-    # 必要欄位檢查
-    required = {
-        '公司名稱': company_name_raw,
-        '報工日期': work_date_raw,
-        '開始時間': start_time_raw,
-        '結束時間': end_time_raw,
-        '工單號': workorder_raw,
-        '產品編號': product_id_raw,
-        '工序名稱': operation_raw,
-        '報工數量': work_qty_raw,
-    }
-    missing = [k for k, v in required.items() if v in (None, "")]
-    if missing:
-        raise ValueError(f"必要欄位缺漏：{', '.join(missing)}")
-
-    # 正規化日期/時間/數值
-    work_date = _parse_date(work_date_raw)
-    start_time = _parse_time(start_time_raw)
-    end_time = _parse_time(end_time_raw)
-    work_quantity = _to_int(work_qty_raw, 0)
-    defect_quantity = _to_int(defect_qty_raw, 0)
-
-    operator = (str(operator_raw).strip() if operator_raw not in (None, "") else "")
-    company_name = str(company_name_raw).strip()
-    workorder = str(workorder_raw).strip()
-    product_id = str(product_id_raw).strip()
-    operation = str(operation_raw).strip()
-    equipment = str(equipment_raw).strip() if equipment_raw not in (None, "") else ""
-    remarks = "" if remarks_raw in (None, "") else str(remarks_raw)
-    abnormal_notes = "" if abnormal_raw in (None, "") else str(abnormal_raw)
-
-    # 公司名稱轉公司代號（統一使用 CompanyConfig）
-    company_code = None
-    from erp_integration.models import CompanyConfig
-    cfg = CompanyConfig.objects.filter(company_name=company_name).first()
-    if cfg:
-        company_code = cfg.company_code
-    else:
-        # 若名稱找不到，嘗試用代號本身（使用者可能直接填代號）
-        cfg2 = CompanyConfig.objects.filter(company_code=company_name).first()
-        if cfg2:
-            company_code = cfg2.company_code
-        else:
-            raise ValueError(f"找不到公司設定：{company_name}")
-
-    # 智能判斷是否為 SMT 類型
-    is_smt = is_smt or ('SMT' in (operation.upper() if operation else '')) or ('SMT' in (equipment.upper() if equipment else '')) or ('SMT' in (operator.upper() if operator else ''))
-
-    # 建立 FillWork
-    # 對應工序名稱到 ProcessName.id（若不存在則自動建立）
-    process_obj = ProcessName.objects.filter(name=operation).first()
-    if not process_obj:
-        process_obj = ProcessName.objects.create(name=operation)
-    obj = FillWork(
-        operator=operator or (equipment if is_smt else operator),
-        company_name=company_name,
-        workorder=workorder,
-        product_id=product_id,
-        planned_quantity=0,
-        operation=operation,
-        equipment=equipment,
-        work_date=work_date,
-        start_time=start_time,
-        end_time=end_time,
-        has_break=(not is_smt),
-        break_start_time=(None if is_smt else _parse_time('12:00')),
-        break_end_time=(None if is_smt else _parse_time('13:00')),
-        work_quantity=work_quantity,
-        defect_quantity=defect_quantity,
-        approval_status='pending',
-        created_by=username,
-        process_id=process_obj.id,
-        remarks=remarks,
-        abnormal_notes=abnormal_notes,
+def _export_fill_work(request, kind: str, file_format: str, filename: str):
+    """串流匯出填報記錄；資料量超過門檻或指定 background=1 時改由背景任務產生檔案"""
+    settings_url = (
+        'workorder:fill_work:fill_work_settings_data_smt' if kind == 'smt'
+        else 'workorder:fill_work:fill_work_settings_data_operator'
     )
+    if file_format == 'xlsx' and openpyxl is None:
+        messages.error(request, '系統未安裝 openpyxl，無法匯出 Excel')
+        return redirect(settings_url)
+    
+    qs = FillWorkExportService.get_queryset(kind)
+    if request.GET.get('background') == '1' or qs.count() > EXPORT_ASYNC_THRESHOLD:
+        from workorder.tasks import export_fill_work_records_task
+        
+        stored_name = StreamingExportService.new_export_name(filename)
+        export_fill_work_records_task.delay(kind, file_format, stored_name, request.user.id)
+        download_url = reverse('workorder:fill_work:fill_work_export_download', args=[stored_name])
+        messages.info(request, f'資料量較大，已改由背景產生匯出檔案，完成後請至 {download_url} 下載')
+        return redirect(settings_url)
+    
+    return FillWorkExportService.build_response(qs, filename, file_format)
 
-    # 若匯入有提供工時數值 → 直接使用並跳過自動計算
-    provided_hours = False
-    if work_hours_raw not in (None, ""):
-        obj.work_hours_calculated = _to_decimal(work_hours_raw) or Decimal('0')
-        provided_hours = True
-    if overtime_hours_raw not in (None, ""):
-        obj.overtime_hours_calculated = _to_decimal(overtime_hours_raw) or Decimal('0')
-        provided_hours = True
 
-    if provided_hours:
-        obj._skip_auto_hours_calculation = True
-    
-    # 儲存物件（如果發現重複會自動覆蓋）
-    obj.save()
-    return obj
+@login_required
+def download_fill_work_export(request, stored_name):
+    """下載背景產生的填報記錄匯出檔（只能下載自己發起的匯出）"""
+    path = StreamingExportService.get_export_path(stored_name, request.user.id)
+    if path is None:
+        messages.warning(request, '匯出檔案尚未產生完成或已不存在，請稍後再試')
+        return redirect('workorder:fill_work:fill_work_settings')
+    filename = stored_name.split('_', 1)[-1]
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
 
 
 @login_required
@@ -2677,6 +2446,8 @@ def import_fill_work_records_operator(request):
     if not file:
         messages.error(request, '未選擇檔案')
         return redirect('workorder:fill_work:fill_work_settings_data_operator')
+    if file.size > FILL_WORK_IMPORT_ASYNC_SIZE:
+        return _queue_import(request, file, False, 'workorder:fill_work:fill_work_settings_data_operator')
     created, updated, errors = _import_any(file, is_smt=False, username=request.user.username)
     if errors:
         if created > 0 or updated > 0:
@@ -2702,6 +2473,8 @@ def import_fill_work_records_smt(request):
     if not file:
         messages.error(request, '未選擇檔案')
         return redirect('workorder:fill_work:fill_work_settings_data_smt')
+    if file.size > FILL_WORK_IMPORT_ASYNC_SIZE:
+        return _queue_import(request, file, True, 'workorder:fill_work:fill_work_settings_data_smt')
     created, updated, errors = _import_any(file, is_smt=True, username=request.user.username)
     if errors:
         if created > 0 or updated > 0:
@@ -2719,166 +2492,43 @@ def import_fill_work_records_smt(request):
 
 
 def _import_any(file, is_smt: bool, username: str):
-    name = (file.name or '').lower()
-    created = 0
-    updated = 0
-    errors: list[str] = []
-    try:
-        if file.size == 0:
-            return 0, 0, ['上傳檔案為空']
-        if name.endswith('.xlsx'):
-            if openpyxl is None:
-                return 0, 0, ['系統未安裝 openpyxl，無法解析 Excel']
-            wb = openpyxl.load_workbook(file)
-            ws = wb.active
-            headers = [str(c.value).strip() if c.value is not None else '' for c in next(ws.iter_rows(min_row=1, max_row=1))]
-            header_map = {h: i for i, h in enumerate(headers)}
-            missing = [h for h in TEMPLATE_HEADERS if h not in header_map]
-            if missing:
-                return 0, 0, [f"必要欄位缺漏：{', '.join(missing)}"]
-            if ws.max_row <= 1:
-                return 0, 0, ['Excel 無資料內容']
-            for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                # 跳過整列空白
-                if row is None or all((cell is None or str(cell).strip() == '') for cell in row):
-                    continue
-                try:
-                    data = {h: (row[header_map[h]] if header_map[h] < len(row) else '') for h in TEMPLATE_HEADERS}
-                    # 再次檢查必要欄位是否皆空，若皆空則忽略
-                    if all((data.get(h) in (None, '') or str(data.get(h)).strip() == '') for h in TEMPLATE_HEADERS):
-                        continue
-                    
-                    # 檢查是否為重複記錄
-                    is_duplicate = _check_duplicate_record(data)
-                    obj = _create_fillwork_from_row(data, is_smt=is_smt, username=username)
-                    
-                    if is_duplicate:
-                        updated += 1
-                    else:
-                        created += 1
-                except Exception as e:
-                    errors.append(f'第 {idx} 列：{e}')
-            return created, updated, errors
-        else:
-            # CSV
-            try:
-                decoded = file.read().decode('utf-8')
-            except Exception:
-                return 0, 0, ['CSV 編碼非 UTF-8，請轉存為 UTF-8 後再上傳']
-            reader = csv.DictReader(StringIO(decoded))
-            headers = [h.strip() for h in (reader.fieldnames or [])]
-            header_map = {h: i for i, h in enumerate(headers)}
-            missing = [h for h in TEMPLATE_HEADERS if h not in header_map]
-            if missing:
-                return 0, 0, [f"必要欄位缺漏：{', '.join(missing)}"]
-            any_row = False
-            for idx, row in enumerate(reader, start=2):
-                # 跳過整列空白
-                if all((row.get(h) in (None, '') or str(row.get(h)).strip() == '') for h in row.keys()):
-                    continue
-                any_row = True
-                try:
-                    # 若必要欄位皆空白，忽略
-                    if all((str(row.get(h, '')).strip() == '') for h in TEMPLATE_HEADERS):
-                        continue
-                    
-                    # 檢查是否為重複記錄
-                    is_duplicate = _check_duplicate_record(row)
-                    obj = _create_fillwork_from_row(row, is_smt=is_smt, username=username)
-                    
-                    if is_duplicate:
-                        updated += 1
-                    else:
-                        created += 1
-                except Exception as e:
-                    errors.append(f'第 {idx} 列：{e}')
-            if not any_row:
-                return 0, 0, ['CSV 無資料內容']
-            return created, updated, errors
-    except Exception as e:
-        errors.append(f'匯入過程發生未預期錯誤：{e}')
-        return created, updated, errors
+    """同步匯入填報記錄，回傳（新增筆數, 覆蓋筆數, 錯誤訊息）"""
+    if file.size == 0:
+        return 0, 0, ['上傳檔案為空']
+    result = FillWorkImportService.import_file(file, file.name or '', is_smt=is_smt, username=username)
+    return result['created'], result['updated'], result['errors']
 
 
-def _check_duplicate_record(data: dict) -> bool:
-    """檢查是否為重複記錄"""
-    from datetime import datetime
-    
-    # 解析資料
-    company_name = str(data.get('公司名稱', '')).strip()
-    workorder = str(data.get('工單號', '')).strip()
-    product_id = str(data.get('產品編號', '')).strip()
-    operation = str(data.get('工序名稱', '')).strip()
-    operator = str(data.get('作業員名稱', '')).strip()
-    work_date_raw = data.get('報工日期', '')
-    start_time_raw = data.get('開始時間', '')
-    
-    # 解析日期和時間
-    try:
-        work_date = _parse_date(work_date_raw)
-        start_time = _parse_time(start_time_raw)
-    except:
-        return False
-    
-    # 檢查是否已存在相同記錄
-    existing_record = FillWork.objects.filter(
-        company_name=company_name,
-        workorder=workorder,
-        product_id=product_id,
-        operation=operation,
-        operator=operator,
-        work_date=work_date,
-        start_time=start_time
-    ).first()
+def _queue_import(request, file, is_smt: bool, settings_url: str):
+    """大型檔案改由背景任務匯入，並告知查詢進度的網址"""
+    from workorder.tasks import import_fill_work_records_task
     
-    return existing_record is not None
+    job_id, path = FillWorkImportService.save_upload(file)
+    FillWorkImportService.set_progress(job_id, 'queued')
+    import_fill_work_records_task.delay(job_id, path, is_smt, request.user.username)
+    status_url = reverse('workorder:fill_work:fill_work_import_status', args=[job_id])
+    messages.info(request, f'檔案較大，已改由背景匯入，可至 {status_url} 查詢進度')
+    return redirect(settings_url)
+
+
+@login_required
+def fill_work_import_status(request, job_id):
+    """查詢背景匯入進度"""
+    progress = FillWorkImportService.get_progress(job_id)
+    if progress is None:
+        return JsonResponse({'success': False, 'message': '找不到匯入任務或進度已過期'}, status=404)
+    return JsonResponse({'success': True, 'job_id': job_id, **progress})
 
 
 # 匯出：新增 XLSX
 @login_required
 def export_fill_work_records_operator_xlsx(request):
-    qs = FillWork.objects.exclude(Q(operator__icontains='SMT') | Q(process_name__icontains='SMT')).order_by('-created_at')
-    return _export_fill_work_qs_xlsx(qs, 'operator_fill_work_export.xlsx')
+    return _export_fill_work(request, 'operator', 'xlsx', 'operator_fill_work_export.xlsx')
 
 
 @login_required
 def export_fill_work_records_smt_xlsx(request):
-    qs = FillWork.objects.filter(Q(operator__icontains='SMT') | Q(process_name__icontains='SMT')).order_by('-created_at')
-    return _export_fill_work_qs_xlsx(qs, 'smt_fill_work_export.xlsx')
-
-
-def _export_fill_work_qs_xlsx(qs, filename: str):
-    if openpyxl is None:
-        messages.error(request, '系統未安裝 openpyxl，無法匯出 Excel')
-        return redirect('workorder:fill_work:fill_work_settings')
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'FillWork'
-    ws.append(TEMPLATE_HEADERS)
-    for r in qs:
-        ws.append([
-            r.operator,
-            r.company_name,
-            r.work_date.strftime('%Y-%m-%d') if r.work_date else '',
-            r.start_time.strftime('%H:%M') if r.start_time else '',
-            r.end_time.strftime('%H:%M') if r.end_time else '',
-            r.workorder,
-            r.product_id,
-            r.operation,
-            r.equipment,
-            r.work_quantity,
-            r.defect_quantity,
-            r.remarks or '',
-            r.abnormal_notes or '',
-            float(r.work_hours_calculated or 0),
-            float(r.overtime_hours_calculated or 0),
-        ])
-    buf = BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    resp = HttpResponse(buf.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return resp
+    return _export_fill_work(request, 'smt', 'xlsx', 'smt_fill_work_export.xlsx')
 
 
 def delete_all_fill_work_records(request):
@@ -3012,7 +2662,7 @@ class SupervisorPendingListView(LoginRequiredMixin, UserPassesTestMixin, ListVie
 
     def test_func(self):
         user = self.request.user
-        return user.is_superuser or user.groups.filter(name__in=['系統管理員', '主管']).exists()
+        return is_supervisor(user)
 
     def get_queryset(self):
         from datetime import datetime
@@ -3131,7 +2781,7 @@ class SupervisorReviewedListView(LoginRequiredMixin, UserPassesTestMixin, ListVi
 
     def test_func(self):
         user = self.request.user
-        return user.is_superuser or user.groups.filter(name__in=['系統管理員', '主管']).exists()
+        return is_supervisor(user)
 
     def get_queryset(self):
         from datetime import datetime
@@ -3315,7 +2965,7 @@ def batch_approve_fill_work(request):
         return redirect('workorder:fill_work:supervisor_pending_list')
     
     # 檢查權限
-    if not (request.user.is_superuser or request.user.groups.filter(name__in=['系統管理員', '主管']).exists()):
+    if not is_supervisor(request.user):
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
                 'success': False,
@@ -3337,7 +2987,7 @@ def batch_approve_fill_work(request):
             messages.warning(request, '請選擇要核准的記錄')
             return redirect('workorder:fill_work:supervisor_pending_list')
         
-        # 使用服務層處理批量核准
+        # 使用服務層處理批量核准（含生產執行監控同步，工單狀態於交易提交後統一重算）
         from .services import FillWorkApprovalService
         batch_result = FillWorkApprovalService.batch_approve_fill_work_records(
             record_ids, request.user.username
@@ -3369,146 +3019,16 @@ def batch_approve_fill_work(request):
             
             messages.success(request, success_message)
         else:
+            error_message = batch_result['message']
+            if batch_result.get('warnings'):
+                error_message += f"（{'；'.join(batch_result['warnings'])}）"
             # 如果是 AJAX 請求，返回 JSON 回應
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': False,
-                    'message': batch_result['message']
+                    'message': error_message
                 })
-            messages.error(request, batch_result['message'])
-        
-        # 批量同步到生產執行監控
-        try:
-            # 取得所有已核准的記錄
-            approved_records = FillWork.objects.filter(
-                id__in=record_ids,
-                approval_status='approved'
-            )
-            
-            synced_workorders = set()  # 記錄需要同步的工單
-            
-            for record in approved_records:
-                if record.workorder:
-                    synced_workorders.add(record.workorder)
-            
-            if synced_workorders:
-                for workorder_number in synced_workorders:
-                    # 使用公司名稱和工單號碼組合查詢，確保唯一性
-                    # 注意：這裡需要從填報記錄中獲取公司名稱
-                    fill_work_record = FillWork.objects.filter(workorder=workorder_number).first()
-                    if fill_work_record and fill_work_record.company_name:
-                        # 先從公司名稱找到公司代號，再查詢工單
-                        from erp_integration.models import CompanyConfig
-                        company_config = CompanyConfig.objects.filter(
-                            company_name=fill_work_record.company_name
-                        ).first()
-                        
-                        if company_config:
-                            workorder = WorkOrder.objects.filter(
-                                company_code=company_config.company_code,
-                                order_number=workorder_number
-                            ).first()
-                        else:
-                            # 如果找不到公司配置，使用舊方式查詢（向後相容）
-                            workorder = WorkOrder.objects.filter(order_number=workorder_number).first()
-                    else:
-                        # 如果沒有公司名稱，使用舊方式查詢（向後相容）
-                        workorder = WorkOrder.objects.filter(order_number=workorder_number).first()
-                    if workorder:
-                        # 取得該工單的所有已核准填報記錄
-                        approved_fill_works = FillWork.objects.filter(
-                            workorder=workorder_number,
-                            approval_status='approved'
-                        )
-                        
-                        for fill_work in approved_fill_works:
-                            # 判斷類型：SMT 或 作業員
-                            is_smt = False
-                            try:
-                                if (fill_work.operator and 'SMT' in fill_work.operator.upper()) or (fill_work.process_name and 'SMT' in fill_work.process_name.upper()):
-                                    is_smt = True
-                            except Exception:
-                                is_smt = False
-                            report_type = 'smt' if is_smt else 'operator'
-
-                            ProductionReportSyncService._create_or_update_production_detail(
-                                workorder=workorder,
-                                process_name=(fill_work.process_name or fill_work.operation or ''),
-                                report_date=fill_work.work_date,
-                                report_time=timezone.now(),
-                                work_quantity=fill_work.work_quantity or 0,
-                                defect_quantity=fill_work.defect_quantity or 0,
-                                operator=(fill_work.operator or None),
-                                equipment=(fill_work.equipment or None),
-                                report_source='fill_work',
-                                start_time=fill_work.start_time,
-                                end_time=fill_work.end_time,
-                                remarks=fill_work.remarks,
-                                abnormal_notes=fill_work.abnormal_notes,
-                                original_report_id=fill_work.id,
-                                original_report_type='fill_work',
-                                work_hours=float(fill_work.work_hours_calculated or 0),
-                                overtime_hours=float(fill_work.overtime_hours_calculated or 0),
-                                has_break=bool(fill_work.has_break),
-                                break_start_time=fill_work.break_start_time,
-                                break_end_time=fill_work.break_end_time,
-                                break_hours=float(fill_work.break_hours or 0),
-                                report_type=report_type,
-                                allocated_quantity=0,
-                                quantity_source='original',
-                                allocation_notes='',
-                                is_completed=bool(fill_work.is_completed),
-                                completion_method='manual',
-                                auto_completed=False,
-                                completion_time=None,
-                                cumulative_quantity=0,
-                                cumulative_hours=float(fill_work.work_hours_calculated or 0),
-                                approval_status='approved',
-                                approved_by=fill_work.approved_by,
-                                approved_at=fill_work.approved_at,
-                                approval_remarks=fill_work.approval_remarks or ''
-                            )
-        except Exception as sync_error:
-            # 同步失敗不影響核准流程，只記錄錯誤
-            import logging
-            logging.error(f"批次同步填報記錄到生產詳情失敗: {str(sync_error)}")
-        
-        # 批量更新工單狀態
-        try:
-            from workorder.services.workorder_status_service import WorkOrderStatusService
-            
-            # 取得所有相關工單並更新狀態
-            synced_workorders = set()
-            for record in approved_records:
-                if record.workorder:
-                    synced_workorders.add(record.workorder)
-            
-            for workorder_number in synced_workorders:
-                # 查找對應的工單
-                fill_work_record = FillWork.objects.filter(workorder=workorder_number).first()
-                if fill_work_record and fill_work_record.company_name:
-                    from erp_integration.models import CompanyConfig
-                    company_config = CompanyConfig.objects.filter(
-                        company_name=fill_work_record.company_name
-                    ).first()
-                    
-                    if company_config:
-                        workorder = WorkOrder.objects.filter(
-                            company_code=company_config.company_code,
-                            order_number=workorder_number
-                        ).first()
-                    else:
-                        workorder = WorkOrder.objects.filter(order_number=workorder_number).first()
-                else:
-                    workorder = WorkOrder.objects.filter(order_number=workorder_number).first()
-                
-                if workorder:
-                    WorkOrderStatusService.update_workorder_status(workorder.id)
-                    
-        except Exception as status_error:
-            # 狀態更新錯誤不阻斷使用者操作
-            import logging
-            logging.error(f"批量工單狀態更新失敗: {str(status_error)}")
+            messages.error(request, error_message)
         
     except Exception as e:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -3597,7 +3117,7 @@ def batch_unapprove_fill_work(request):
         return redirect('workorder:fill_work:supervisor_reviewed_list')
     
     # 檢查權限
-    if not (request.user.is_superuser or request.user.is_staff or request.user.groups.filter(name__in=['系統管理員', '主管', '工單使用者']).exists()):
+    if not (request.user.is_staff or is_supervisor(request.user) or user_in_groups(request.user, '工單使用者')):
         messages.error(request, '您沒有權限執行批次取消審核操作')
         return redirect('workorder:fill_work:supervisor_reviewed_list')
     
@@ -0,0 +1,274 @@
+"""
+填報作業管理子模組 - 工時計算
+以區間交集計算正常工時、加班與休息時數（每筆 O(1)），並提供以 NumPy 批次重算整批填報記錄的介面。
+休息與加班規則可依公司、班別（作業員／SMT）設定，存放於 SystemConfig。
+"""
+
+import json
+import logging
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# SystemConfig 中存放工時規則的設定鍵
+WORK_HOUR_RULES_CONFIG_KEY = 'fill_work_hour_rules'
+
+# 工時規則快取
+WORK_HOUR_RULES_CACHE_KEY = 'fill_work_hour_rules'
+WORK_HOUR_RULES_CACHE_TIMEOUT = 5 * 60
+
+# 批次重算每批筆數
+WORK_HOUR_RECALC_BATCH_SIZE = 2000
+
+# 預設規則：作業員午休 12:00~13:00、17:30 後加班；SMT 無午休、16:30 後加班
+# break_mode：fixed 表示與休息區間有交集即扣除整段休息，overlap 表示只扣除實際重疊的分鐘數
+DEFAULT_WORK_HOUR_RULES = {
+    'operator': {'break_start': '12:00', 'break_end': '13:00', 'overtime_start': '17:30', 'break_mode': 'fixed'},
+    'smt': {'break_start': None, 'break_end': None, 'overtime_start': '16:30', 'break_mode': 'fixed'},
+}
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class WorkHourRule(NamedTuple):
+    """單一班別的工時規則（時間皆以當日分鐘數表示）"""
+    overtime_start: int
+    break_start: Optional[int] = None
+    break_end: Optional[int] = None
+    break_mode: str = 'fixed'
+
+
+def _to_minutes(value):
+    """將 HH:MM 字串或 time 轉為當日分鐘數"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        hour, minute = value.strip().split(':')[:2]
+        return int(hour) * 60 + int(minute)
+    return value.hour * 60 + value.minute
+
+
+def _build_rule(values):
+    return WorkHourRule(
+        overtime_start=_to_minutes(values['overtime_start']),
+        break_start=_to_minutes(values.get('break_start')),
+        break_end=_to_minutes(values.get('break_end')),
+        break_mode=values.get('break_mode') or 'fixed',
+    )
+
+
+def _shift(has_break):
+    """有午休機制的是作業員填報，否則視為 SMT 填報"""
+    return 'operator' if has_break else 'smt'
+
+
+class WorkHourCalculator:
+    """
+    填報工時計算
+    規則設定格式（SystemConfig: fill_work_hour_rules，JSON）：
+        {"<公司代號或公司名稱>": {"operator": {...}, "smt": {...}}}
+    未設定的公司或欄位沿用 DEFAULT_WORK_HOUR_RULES
+    """
+
+    @staticmethod
+    def load_rules():
+        """
+        載入工時規則
+
+        Returns:
+            dict: {(公司代號或名稱 或 None, 班別): WorkHourRule}，None 為預設規則
+        """
+        rules = cache.get(WORK_HOUR_RULES_CACHE_KEY)
+        if rules is not None:
+            return rules
+
+        from workorder.models import SystemConfig
+
+        configured = {}
+        raw = SystemConfig.get_config(WORK_HOUR_RULES_CONFIG_KEY)
+        if raw:
+            try:
+                configured = json.loads(raw)
+            except ValueError:
+                logger.error(f"工時規則設定格式錯誤，使用預設規則：{raw}")
+
+        rules = {(None, shift): _build_rule(values) for shift, values in DEFAULT_WORK_HOUR_RULES.items()}
+        for company, shifts in configured.items():
+            for shift, values in (shifts or {}).items():
+                if shift not in DEFAULT_WORK_HOUR_RULES:
+                    continue
+                try:
+                    rules[(company, shift)] = _build_rule({**DEFAULT_WORK_HOUR_RULES[shift], **values})
+                except (KeyError, TypeError, ValueError):
+                    logger.error(f"工時規則設定錯誤，略過：{company} {shift} {values}")
+
+        cache.set(WORK_HOUR_RULES_CACHE_KEY, rules, WORK_HOUR_RULES_CACHE_TIMEOUT)
+        return rules
+
+    @staticmethod
+    def save_rules(configured):
+        """儲存公司／班別工時規則並清除快取"""
+        from workorder.models import SystemConfig
+
+        SystemConfig.set_config(
+            WORK_HOUR_RULES_CONFIG_KEY, json.dumps(configured, ensure_ascii=False), "填報工時計算規則（依公司、班別）"
+        )
+        cache.delete(WORK_HOUR_RULES_CACHE_KEY)
+
+    @classmethod
+    def get_rule(cls, company_code, company_name, has_break, rules=None):
+        """依公司代號、公司名稱、班別取得規則，找不到時使用預設規則"""
+        rules = rules if rules is not None else cls.load_rules()
+        shift = _shift(has_break)
+        for company in (company_code, company_name):
+            if company and (company, shift) in rules:
+                return rules[(company, shift)]
+        return rules[(None, shift)]
+
+    @staticmethod
+    def calculate_minutes(start_time, end_time, rule):
+        """
+        以區間交集計算正常工時、加班與休息分鐘數
+
+        Returns:
+            tuple: (正常分鐘, 加班分鐘, 休息分鐘)
+        """
+        start = start_time.hour * 60 + start_time.minute
+        end = end_time.hour * 60 + end_time.minute
+        if end <= start:
+            end += MINUTES_PER_DAY  # 跨日處理
+
+        # 加班起算時間前為正常工時，之後（含跨日）皆為加班
+        normal = max(0, min(end, rule.overtime_start) - start)
+        overtime = (end - start) - normal
+
+        # 休息時間僅扣正常工時，且不低於0
+        break_minutes = 0
+        if rule.break_start is not None and rule.break_end is not None:
+            overlap = max(0, min(end, rule.break_end) - max(start, rule.break_start))
+            if overlap > 0:
+                break_minutes = rule.break_end - rule.break_start if rule.break_mode == 'fixed' else overlap
+        normal = max(0, normal - break_minutes)
+
+        return normal, overtime, break_minutes
+
+    @classmethod
+    def calculate(cls, start_time, end_time, has_break, company_code=None, company_name=None):
+        """
+        計算單筆填報工時
+
+        Returns:
+            tuple: (工作時數, 加班時數, 休息時數)，皆為 Decimal
+        """
+        rule = cls.get_rule(company_code, company_name, has_break)
+        normal, overtime, break_minutes = cls.calculate_minutes(start_time, end_time, rule)
+        return (
+            Decimal(str(normal / 60)),
+            Decimal(str(overtime / 60)),
+            Decimal(str(break_minutes / 60)),
+        )
+
+    @classmethod
+    def calculate_batch(cls, rows, rules=None):
+        """
+        以 NumPy 向量運算批次計算工時
+
+        Args:
+            rows: [(公司代號, 公司名稱, 是否有午休, 開始時間, 結束時間), ...]，時間不可為空
+            rules: load_rules() 的結果，省略時自動載入
+
+        Returns:
+            tuple: (正常分鐘, 加班分鐘, 休息分鐘) 三個 numpy 陣列
+        """
+        import numpy as np
+
+        rules = rules if rules is not None else cls.load_rules()
+        rule_cache = {}
+        row_rules = []
+        for company_code, company_name, has_break, _, _ in rows:
+            key = (company_code, company_name, bool(has_break))
+            if key not in rule_cache:
+                rule_cache[key] = cls.get_rule(company_code, company_name, has_break, rules)
+            row_rules.append(rule_cache[key])
+
+        start = np.fromiter((row[3].hour * 60 + row[3].minute for row in rows), dtype=np.int32, count=len(rows))
+        end = np.fromiter((row[4].hour * 60 + row[4].minute for row in rows), dtype=np.int32, count=len(rows))
+        overtime_start = np.fromiter((rule.overtime_start for rule in row_rules), dtype=np.int32, count=len(rows))
+        has_break_rule = np.fromiter(
+            (rule.break_start is not None and rule.break_end is not None for rule in row_rules),
+            dtype=bool, count=len(rows),
+        )
+        break_start = np.fromiter((rule.break_start or 0 for rule in row_rules), dtype=np.int32, count=len(rows))
+        break_end = np.fromiter((rule.break_end or 0 for rule in row_rules), dtype=np.int32, count=len(rows))
+        fixed = np.fromiter((rule.break_mode == 'fixed' for rule in row_rules), dtype=bool, count=len(rows))
+
+        end = np.where(end <= start, end + MINUTES_PER_DAY, end)
+        normal = np.maximum(np.minimum(end, overtime_start) - start, 0)
+        overtime = (end - start) - normal
+        overlap = np.where(has_break_rule, np.maximum(np.minimum(end, break_end) - np.maximum(start, break_start), 0), 0)
+        break_minutes = np.where(overlap > 0, np.where(fixed, break_end - break_start, overlap), 0)
+        normal = np.maximum(normal - break_minutes, 0)
+        return normal, overtime, break_minutes
+
+    @classmethod
+    def recalculate_queryset(cls, queryset, batch_size=WORK_HOUR_RECALC_BATCH_SIZE):
+        """
+        依目前規則重算整批填報記錄的工時（例如調整班別規則後），以 bulk_update 寫回
+
+        匯入時直接提供工時的記錄也會被重算，呼叫端應自行篩選範圍
+
+        Returns:
+            int: 更新筆數
+        """
+        from .models import FillWork
+        from workorder.services.workorder_refresh_service import WorkOrderRefreshService
+
+        rules = cls.load_rules()
+        fields = ('id', 'company_code', 'company_name', 'has_break', 'start_time', 'end_time', 'workorder', 'product_id')
+        rows = queryset.filter(
+            start_time__isnull=False, end_time__isnull=False
+        ).values_list(*fields).iterator(chunk_size=batch_size)
+
+        updated = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                updated += cls._write_batch(FillWork, batch, rules)
+                batch = []
+        if batch:
+            updated += cls._write_batch(FillWork, batch, rules)
+
+        # bulk_update 不觸發 post_save，改為記錄受影響的工單統一重算
+        for company_code, company_name, workorder, product_id in queryset.order_by().values_list(
+            'company_code', 'company_name', 'workorder', 'product_id'
+        ).distinct():
+            WorkOrderRefreshService.mark_dirty(company_code, company_name, workorder, product_id)
+
+        logger.info(f"填報工時重算完成，共 {updated} 筆")
+        return updated
+
+    @classmethod
+    def _write_batch(cls, model, batch, rules):
+        normal, overtime, break_minutes = cls.calculate_batch([row[1:6] for row in batch], rules)
+        now = timezone.now()
+        records = [
+            model(
+                id=row[0],
+                work_hours_calculated=Decimal(str(normal_minutes / 60)),
+                overtime_hours_calculated=Decimal(str(overtime_minutes / 60)),
+                break_hours=Decimal(str(break_minute / 60)),
+                updated_at=now,
+            )
+            for row, normal_minutes, overtime_minutes, break_minute in zip(
+                batch, normal.tolist(), overtime.tolist(), break_minutes.tolist()
+            )
+        ]
+        model.objects.bulk_update(
+            records, ['work_hours_calculated', 'overtime_hours_calculated', 'break_hours', 'updated_at']
+        )
+        return len(records)
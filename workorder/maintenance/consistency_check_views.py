@@ -165,7 +165,7 @@ class ConsistencyCheckAjaxView(LoginRequiredMixin, UserPassesTestMixin, View):
                 count = service.check_wrong_workorder()
                 message = f"工單號碼錯誤檢查完成，發現 {count} 筆問題（已排除RD樣品）"
             elif check_type == 'all':
-                results = service.run_all_checks()
+                results = service.run_all_checks(incremental=request.POST.get('incremental') == '1')
                 total = sum(results.values())
                 message = f"所有相符性檢查完成，總共發現 {total} 筆問題（已排除RD樣品）"
             else:
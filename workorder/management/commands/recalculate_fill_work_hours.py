@@ -0,0 +1,37 @@
+"""
+依目前的工時規則重新計算填報記錄工時（調整公司／班別工時規則後使用）
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from workorder.fill_work.models import FillWork
+from workorder.fill_work.work_hours import WorkHourCalculator
+
+
+class Command(BaseCommand):
+    help = '依目前的工時規則重新計算填報記錄的工作時數、加班時數與休息時數'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=str, help='開始日期 (YYYY-MM-DD)')
+        parser.add_argument('--date-to', type=str, help='結束日期 (YYYY-MM-DD)')
+        parser.add_argument('--company', type=str, help='公司代號或公司名稱')
+
+    def handle(self, *args, **options):
+        queryset = FillWork.objects.all()
+
+        try:
+            if options['date_from']:
+                queryset = queryset.filter(work_date__gte=date.fromisoformat(options['date_from']))
+            if options['date_to']:
+                queryset = queryset.filter(work_date__lte=date.fromisoformat(options['date_to']))
+        except ValueError:
+            raise CommandError('日期格式錯誤，請使用 YYYY-MM-DD 格式')
+
+        if options['company']:
+            queryset = queryset.filter(Q(company_code=options['company']) | Q(company_name=options['company']))
+
+        updated = WorkHourCalculator.recalculate_queryset(queryset)
+        self.stdout.write(self.style.SUCCESS(f'重新計算完成！共更新 {updated} 筆填報記錄'))
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workorder', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consistencycheckresult',
+            name='fill_work_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='填報記錄ID'),
+        ),
+        migrations.AddIndex(
+            model_name='consistencycheckresult',
+            index=models.Index(fields=['fill_work_id', 'check_type'], name='workorder_c_fill_wo_73f351_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workorder', '0002_consistencycheckresult_fill_work_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='systemconfig',
+            name='value',
+            field=models.TextField(help_text='設定值', verbose_name='設定值'),
+        ),
+    ]
@@ -66,11 +66,11 @@ class DataIsolationMixin(CompanyCodeMixin):
                     queryset = queryset.filter(company_code=company_code)
                 elif hasattr(queryset.model, 'company_name'):
                     # 如果模型只有 company_name，需要從 CompanyConfig 獲取對應的公司代號
-                    from erp_integration.models import CompanyConfig
+                    from workorder.services.master_data_cache import MasterDataCache
                     try:
-                        company_config = CompanyConfig.objects.filter(company_code=company_code).first()
-                        if company_config:
-                            queryset = queryset.filter(company_name=company_config.company_name)
+                        company_name = MasterDataCache.get_company_name(company_code)
+                        if company_name:
+                            queryset = queryset.filter(company_name=company_name)
                     except Exception:
                         pass
         
@@ -151,10 +151,8 @@ class FillWorkQueryMixin(CompanyCodeMixin):
             # 如果沒有提供公司名稱，嘗試從用戶的公司代號獲取公司名稱
             company_code = self.get_user_company_code()
             if company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=company_code).first()
-                if company_config:
-                    company_name = company_config.company_name
+                from workorder.services.master_data_cache import MasterDataCache
+                company_name = MasterDataCache.get_company_name(company_code)
         
         if company_name:
             return FillWork.objects.filter(company_name=company_name)
@@ -173,10 +171,8 @@ class FillWorkQueryMixin(CompanyCodeMixin):
             # 如果沒有提供公司名稱，嘗試從用戶的公司代號獲取公司名稱
             company_code = self.get_user_company_code()
             if company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=company_code).first()
-                if company_config:
-                    company_name = company_config.company_name
+                from workorder.services.master_data_cache import MasterDataCache
+                company_name = MasterDataCache.get_company_name(company_code)
         
         if company_name and product_code:
             # 完整的多公司架構查詢
@@ -18,6 +18,91 @@ from .manufacturing_order.models import ManufacturingOrder
 # 導入報工管理子模組的模型
 # 
 
+
+class WorkOrderQuerySet(models.QuerySet):
+    """工單查詢集"""
+
+    def with_progress(self):
+        """
+        以子查詢一次帶出工單進度相關欄位，列表頁不必每列再查詢工序
+        WorkOrder 的 completed_quantity、progress、completion_rate、current_operator、
+        current_process、start_time 屬性會優先使用這些註解
+        """
+        from django.db.models import Count, IntegerField, Min, OuterRef, Q, Subquery
+        from django.db.models.functions import Coalesce
+
+        processes = WorkOrderProcess.objects.filter(workorder_id=OuterRef("pk")).order_by()
+        grouped = processes.values("workorder_id")
+        in_progress = processes.filter(status="in_progress").order_by("workorder_id", "step_order")
+
+        return self.annotate(
+            process_count=Coalesce(
+                Subquery(grouped.annotate(value=Count("id")).values("value")[:1], output_field=IntegerField()), 0
+            ),
+            completed_process_count=Coalesce(
+                Subquery(
+                    grouped.annotate(value=Count("id", filter=Q(status="completed"))).values("value")[:1],
+                    output_field=IntegerField(),
+                ),
+                0,
+            ),
+            process_completed_quantity_total=Coalesce(
+                Subquery(grouped.annotate(value=Sum("completed_quantity")).values("value")[:1], output_field=IntegerField()),
+                0,
+            ),
+            first_process_start_time=Subquery(
+                grouped.filter(actual_start_time__isnull=False).annotate(value=Min("actual_start_time")).values("value")[:1],
+                output_field=models.DateTimeField(),
+            ),
+            current_process_name=Subquery(in_progress.values("process_name")[:1]),
+            current_process_operator=Subquery(in_progress.values("assigned_operator")[:1]),
+        )
+
+    def with_company_name(self):
+        """註解公司名稱（company_name），找不到公司設定時顯示公司代號，代號為空時顯示 -"""
+        from django.db.models import OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce, NullIf
+        from erp_integration.models import CompanyConfig
+
+        company_names = CompanyConfig.objects.filter(company_code=OuterRef("company_code")).order_by("id")
+        return self.annotate(
+            company_name=Coalesce(
+                Subquery(company_names.values("company_name")[:1]),
+                NullIf(models.F("company_code"), Value("")),
+                Value("-"),
+                output_field=models.CharField(),
+            )
+        )
+
+    def in_production(self):
+        """
+        執行中工單：有已核准填報記錄且未完工的工單，加上派工單狀態為生產中的工單
+        填報記錄以公司名稱對應公司代號，與工單的公司代號、工單號碼、產品編號比對
+        """
+        from django.db.models import Exists, OuterRef, Q
+        from erp_integration.models import CompanyConfig
+        from workorder.fill_work.models import FillWork
+        from workorder.workorder_dispatch.models import WorkOrderDispatch
+
+        approved_reports = FillWork.objects.filter(
+            approval_status="approved",
+            company_name__in=CompanyConfig.objects.filter(company_code=OuterRef(OuterRef("company_code"))).values(
+                "company_name"
+            ),
+            workorder=OuterRef("order_number"),
+            product_id=OuterRef("product_code"),
+        )
+        production_dispatches = WorkOrderDispatch.objects.filter(
+            status="in_production",
+            company_code=OuterRef("company_code"),
+            order_number=OuterRef("order_number"),
+            product_code=OuterRef("product_code"),
+        )
+        return self.filter(
+            (Exists(approved_reports) & ~Q(status="completed")) | Exists(production_dispatches)
+        )
+
+
 class WorkOrder(models.Model):
     """
     工單管理模型：支援多公司唯一識別，記錄每一張工單的基本資料與狀態
@@ -65,7 +150,7 @@ class WorkOrder(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name="完工時間")
 
-    objects = models.Manager()  # 明確宣告 objects manager，解決 linter 錯誤
+    objects = WorkOrderQuerySet.as_manager()  # 支援 WorkOrder.objects.with_progress()
 
     class Meta:
         verbose_name = "工單"
@@ -127,22 +212,40 @@ class WorkOrder(models.Model):
 
         return f"{prefix}{sequence_str}"
 
+    def _has_progress_annotations(self):
+        """是否由 WorkOrder.objects.with_progress() 取得"""
+        return "process_count" in self.__dict__
+
     @property
     def completed_quantity(self):
         """計算工單完成數量（所有工序完成數量的平均值）"""
-        processes = WorkOrderProcess.objects.filter(workorder_id=self.id)
-        if processes.count() > 0:
-            total_completed = sum(process.completed_quantity for process in processes)
-            return round(total_completed / processes.count())
+        if self._has_progress_annotations():
+            process_count = self.process_count
+            total_completed = self.process_completed_quantity_total
+        else:
+            totals = WorkOrderProcess.objects.filter(workorder_id=self.id).aggregate(
+                process_count=models.Count("id"), total_completed=Sum("completed_quantity")
+            )
+            process_count = totals["process_count"]
+            total_completed = totals["total_completed"] or 0
+        if process_count > 0:
+            return round(total_completed / process_count)
         return 0
 
     @property
     def progress(self):
         """計算工單進度百分比"""
         # 計算已完成工序的百分比
-        total_processes = WorkOrderProcess.objects.filter(workorder_id=self.id).count()
+        if self._has_progress_annotations():
+            total_processes = self.process_count
+            completed_processes = self.completed_process_count
+        else:
+            counts = WorkOrderProcess.objects.filter(workorder_id=self.id).aggregate(
+                total=models.Count("id"), completed=models.Count("id", filter=models.Q(status="completed"))
+            )
+            total_processes = counts["total"]
+            completed_processes = counts["completed"]
         if total_processes > 0:
-            completed_processes = WorkOrderProcess.objects.filter(workorder_id=self.id, status='completed').count()
             return round((completed_processes / total_processes) * 100, 1)
         return 0.0
 
@@ -157,30 +260,40 @@ class WorkOrder(models.Model):
     @property
     def current_operator(self):
         """取得當前負責的作業員"""
-        current_process = WorkOrderProcess.objects.filter(workorder_id=self.id, status="in_progress").first()
-        if current_process and current_process.assigned_operator:
-            return current_process.assigned_operator
+        if self._has_progress_annotations():
+            assigned_operator = self.current_process_operator
+        else:
+            current_process = WorkOrderProcess.objects.filter(workorder_id=self.id, status="in_progress").first()
+            assigned_operator = current_process.assigned_operator if current_process else None
+        if assigned_operator:
+            return assigned_operator
         return "未分配"
 
     @property
     def current_process(self):
         """取得當前進行的工序"""
-        current_process = WorkOrderProcess.objects.filter(workorder_id=self.id, status="in_progress").first()
-        if current_process:
-            return current_process.process_name
+        if self._has_progress_annotations():
+            process_name = self.current_process_name
+        else:
+            current_process = WorkOrderProcess.objects.filter(workorder_id=self.id, status="in_progress").first()
+            process_name = current_process.process_name if current_process else None
+        if process_name is not None:
+            return process_name
         return "無進行中工序"
 
     @property
     def start_time(self):
         """取得工單開始時間（第一個工序的開始時間或工單狀態變更時間）"""
         # 優先顯示第一個工序的實際開始時間
-        first_process = (
-            WorkOrderProcess.objects.filter(workorder_id=self.id, actual_start_time__isnull=False)
-            .order_by("actual_start_time")
-            .first()
-        )
-        if first_process and first_process.actual_start_time:
-            return first_process.actual_start_time
+        if self._has_progress_annotations():
+            first_start_time = self.first_process_start_time
+        else:
+            first_start_time = (
+                WorkOrderProcess.objects.filter(workorder_id=self.id, actual_start_time__isnull=False)
+                .aggregate(first_start_time=models.Min("actual_start_time"))["first_start_time"]
+            )
+        if first_start_time:
+            return first_start_time
 
         # 如果工單狀態是生產中或暫停，則顯示工單的更新時間（狀態變更時間）
         if self.status in ["in_progress", "paused"]:
@@ -1214,6 +1327,8 @@ class ConsistencyCheckResult(models.Model):
     ]
     
     check_type = models.CharField(max_length=50, choices=CHECK_TYPE_CHOICES, verbose_name="檢查類型")
+    # 觸發此結果的填報記錄，增量檢查時依此替換結果
+    fill_work_id = models.BigIntegerField(verbose_name="填報記錄ID", null=True, blank=True)
     company_code = models.CharField(max_length=10, verbose_name="公司代號", null=True, blank=True)
     company_name = models.CharField(max_length=100, verbose_name="公司名稱", null=True, blank=True)
     workorder = models.CharField(max_length=100, verbose_name="工單號碼", null=True, blank=True)
@@ -1254,6 +1369,7 @@ class ConsistencyCheckResult(models.Model):
             models.Index(fields=['product_code']),
             models.Index(fields=['is_fixed']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['fill_work_id', 'check_type']),
         ]
     
     def __str__(self):
@@ -1276,7 +1392,7 @@ class SystemConfig(models.Model):
     """
     
     key = models.CharField(max_length=50, unique=True, verbose_name="設定名稱", help_text="設定名稱")
-    value = models.CharField(max_length=100, verbose_name="設定值", help_text="設定值")
+    value = models.TextField(verbose_name="設定值", help_text="設定值")
     description = models.TextField(blank=True, verbose_name="設定說明", help_text="設定說明")
     
     # 系統欄位
@@ -1294,12 +1410,9 @@ class SystemConfig(models.Model):
     
     @classmethod
     def get_config(cls, key, default=None):
-        """取得設定值"""
-        try:
-            config = cls.objects.get(key=key)
-            return config.value
-        except cls.DoesNotExist:
-            return default
+        """取得設定值（經由主檔快取，設定異動時自動失效）"""
+        from workorder.services.master_data_cache import MasterDataCache
+        return MasterDataCache.get_system_config(key, default)
     
     @classmethod
     def set_config(cls, key, value, description=""):
@@ -21,55 +21,15 @@ def onsite_report_post_save(sender, instance, created, **kwargs):
     當現場報工記錄被建立或更新時，自動更新對應工單的工序完成數量
     """
     try:
-        # 自動更新派工單統計資料
-        try:
-            from workorder.workorder_dispatch.models import WorkOrderDispatch
-            
-            # 查找對應的派工單
-            dispatch = WorkOrderDispatch.objects.filter(
-                order_number=instance.workorder,
-                product_code=instance.product_id,
-                company_code=instance.company_code
-            ).first()
-            
-            if dispatch:
-                # 更新派工單統計資料 - 簡化版本
-                dispatch.completion_threshold_met = (dispatch.packaging_total_quantity >= dispatch.planned_quantity and dispatch.planned_quantity > 0)
-                dispatch.can_complete = dispatch.completion_threshold_met
-                dispatch.save()
-                logger.info(f"已更新派工單統計資料: {dispatch.order_number}")
-            else:
-                logger.warning(f"找不到對應的派工單：{instance.workorder} - {instance.product_id}")
-                
-        except Exception as e:
-            logger.error(f"更新派工單統計資料失敗：{str(e)}")
-        
-        # 查找對應的工單
-        from workorder.models import WorkOrder
-        try:
-            workorder = WorkOrder.objects.filter(
-                order_number=instance.workorder,
-                product_code=instance.product_id
-            ).first()
-            
-            # 如果工單有公司代號，進一步檢查公司代號是否匹配
-            if workorder and workorder.company_code and instance.company_code:
-                if workorder.company_code != instance.company_code:
-                    # 公司代號不匹配，視為找不到工單
-                    workorder = None
-            
-            if workorder:
-                # 更新工單狀態 - 新增
-                from workorder.services.workorder_status_service import WorkOrderStatusService
-                updated = WorkOrderStatusService.update_workorder_status(workorder.id)
-                
-                if updated:
-                    logger.info(f"現場報工記錄觸發工單狀態更新成功：工單 {workorder.order_number}")
-                else:
-                    logger.warning(f"現場報工記錄觸發工單狀態更新失敗：工單 {workorder.order_number}")
-            
-        except Exception as e:
-            logger.error(f"現場報工記錄查找工單失敗：{str(e)}")
+        # 派工單統計、工單狀態與完工檢查於交易提交後由 WorkOrderRefreshService 統一重算
+        from workorder.services.workorder_refresh_service import WorkOrderRefreshService
+        WorkOrderRefreshService.mark_dirty(
+            instance.company_code,
+            instance.company_name,
+            instance.workorder,
+            instance.product_id,
+            check_completion=(instance.status == 'completed'),
+        )
         
         # 只處理已完成的報工記錄
         if instance.status == 'completed':
@@ -141,34 +101,3 @@ def onsite_report_post_save(sender, instance, created, **kwargs):
                 
     except Exception as e:
         logger.error(f"現場報工信號處理錯誤：{str(e)}")
-
-
-@receiver(post_save, sender=OnsiteReport)
-def onsite_report_completion_check(sender, instance, created, **kwargs):
-    """
-    現場報工完成後檢查工單完工狀態
-    """
-    try:
-        # 只處理已完成的報工記錄
-        if instance.status == 'completed':
-            logger.info(f"檢查工單完工狀態：{instance.workorder}")
-            
-            # 查找對應的工單
-            from workorder.models import WorkOrder
-            try:
-                workorder = WorkOrder.objects.get(order_number=instance.workorder)
-                
-                # 檢查是否所有工序都完成
-                from workorder.services.process_completion_service import ProcessCompletionService
-                if ProcessCompletionService.check_process_completion(workorder.id):
-                    logger.info(f"工單 {workorder.order_number} 所有工序已完成，觸發完工檢查")
-                    
-                    # 觸發完工檢查
-                    from workorder.tasks import auto_check_workorder_completion
-                    auto_check_workorder_completion.delay()
-                    
-            except WorkOrder.DoesNotExist:
-                logger.warning(f"找不到對應的工單：{instance.workorder}")
-                
-    except Exception as e:
-        logger.error(f"現場報工完工檢查錯誤：{str(e)}") 
\ No newline at end of file
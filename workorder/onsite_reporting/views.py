@@ -20,10 +20,9 @@ from decimal import Decimal
 import json
 
 from .models import OnsiteReport, OnsiteReportHistory, OnsiteReportConfig, OnsiteReportSession
-from process.models import ProcessName, Operator
-from equip.models import Equipment
 from workorder.models import WorkOrder
 from erp_integration.models import CompanyConfig
+from workorder.services.master_data_cache import MasterDataCache
 
 
 # ==================== 現場報工表單類別 ====================
@@ -1014,13 +1013,11 @@ def operator_rd_onsite_report_create(request):
             # 移除所有驗證邏輯 - RD樣品表單完全無驗證
             
             # 取得公司代號
-            company_config = CompanyConfig.objects.filter(company_name=company_code).first()
-            if not company_config:
+            company_code_value = MasterDataCache.get_company_code(company_code)
+            if not company_code_value:
                 messages.error(request, '找不到對應的公司設定')
                 return redirect('workorder:onsite_reporting:operator_rd_onsite_report_create')
             
-            company_code_value = company_config.company_code
-            
             # 檢查並建立工單
             from workorder.models import WorkOrder
             from workorder.workorder_dispatch.models import WorkOrderDispatch
@@ -1116,23 +1113,13 @@ def operator_rd_onsite_report_create(request):
         except Exception as e:
             messages.error(request, f'作業員RD樣品現場報工記錄建立失敗：{str(e)}')
     
-    # 取得作業員列表（過濾非SMT）
-    operators = Operator.objects.filter(
-        ~Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
-    
-    # 取得工序列表（過濾非SMT）
-    processes = ProcessName.objects.filter(
-        ~Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
-    
-    # 取得設備列表（過濾非SMT）
-    equipments = Equipment.objects.filter(
-        ~Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
+    # 取得作業員、工序、設備列表（過濾非SMT，由主檔快取提供）
+    operators = [name for name in MasterDataCache.operator_names() if 'SMT' not in name.upper()]
+    processes = [name for name in MasterDataCache.process_names() if 'SMT' not in name.upper()]
+    equipments = [name for name in MasterDataCache.equipment_names() if 'SMT' not in name.upper()]
     
     # 取得公司名稱列表
-    companies = CompanyConfig.objects.values_list('company_name', 'company_name').distinct()
+    companies = [(name, name) for name in MasterDataCache.company_code_map()]
     
     context = {
         'operators': operators,
@@ -1166,13 +1153,11 @@ def smt_rd_onsite_report_create(request):
             from workorder.workorder_dispatch.models import WorkOrderDispatch
             
             # 取得公司代號（移除驗證）
-            company_config = CompanyConfig.objects.filter(company_name=company_code).first()
-            if not company_config:
+            company_code_value = MasterDataCache.get_company_code(company_code)
+            if not company_code_value:
                 # 移除驗證錯誤，使用預設值
                 company_code_value = 'DEFAULT'
                 messages.info(request, '使用預設公司代號')
-            else:
-                company_code_value = company_config.company_code
             
             # 查找現有工單（只根據公司代號和工單號碼，因為唯一性約束是 (company_code, order_number)）
             existing_workorder = WorkOrder.objects.filter(
@@ -1265,23 +1250,13 @@ def smt_rd_onsite_report_create(request):
         except Exception as e:
             messages.error(request, f'SMT_RD樣品現場報工記錄建立失敗：{str(e)}')
     
-    # 取得作業員列表（只顯示SMT相關）
-    operators = Operator.objects.filter(
-        Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
-    
-    # 取得工序列表（只顯示SMT相關）
-    processes = ProcessName.objects.filter(
-        Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
-    
-    # 取得設備列表（只顯示SMT相關）
-    equipments = Equipment.objects.filter(
-        Q(name__icontains='SMT')
-    ).values_list('name', flat=True).distinct()
+    # 取得作業員、工序、設備列表（只顯示SMT相關，由主檔快取提供）
+    operators = [name for name in MasterDataCache.operator_names() if 'SMT' in name.upper()]
+    processes = [name for name in MasterDataCache.process_names() if 'SMT' in name.upper()]
+    equipments = [name for name in MasterDataCache.equipment_names() if 'SMT' in name.upper()]
     
     # 取得公司名稱列表
-    companies = CompanyConfig.objects.values_list('company_name', 'company_name').distinct()
+    companies = [(name, name) for name in MasterDataCache.company_code_map()]
     
     context = {
         'operators': operators,
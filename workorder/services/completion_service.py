@@ -10,6 +10,7 @@ from django.db.models import Sum
 from ..models import WorkOrder, CompletedWorkOrder, WorkOrderProductionDetail
 from ..fill_work.models import FillWork
 from ..workorder_dispatch.models import WorkOrderDispatch
+from .master_data_cache import MasterDataCache
 
 logger = logging.getLogger(__name__)
 
@@ -48,64 +49,60 @@ class FillWorkCompletionService:
             error_count = 0
             errors = []
             
+            # 一次取得派工單對應的工單（公司代號+工單號碼+產品編號為唯一性條件）
+            workorders_by_key = {}
+            for workorder in WorkOrder.objects.filter(
+                order_number__in=active_dispatches.values('order_number')
+            ).only('id', 'company_code', 'order_number', 'product_code'):
+                key = (workorder.company_code, workorder.order_number, workorder.product_code)
+                workorders_by_key.setdefault(key, []).append(workorder)
+            
+            changed_dispatches = []
+            archive_workorder_ids = []
             for dispatch in active_dispatches:
                 # 直接檢查完工條件，不使用模型中的複雜函數
                 can_complete = (dispatch.packaging_total_quantity >= dispatch.planned_quantity and 
                                dispatch.planned_quantity > 0)
                 
                 # 更新派工單的完工狀態
-                dispatch.completion_threshold_met = can_complete
-                dispatch.can_complete = can_complete
-                dispatch.save()
+                if dispatch.completion_threshold_met != can_complete or dispatch.can_complete != can_complete:
+                    dispatch.completion_threshold_met = can_complete
+                    dispatch.can_complete = can_complete
+                    changed_dispatches.append(dispatch)
                 
-                # 通過公司名稱+工單號碼+產品編號獲取對應的工單（唯一性條件）
-                try:
-                    workorder = WorkOrder.objects.get(
-                        company_code=dispatch.company_code,
-                        order_number=dispatch.order_number,
-                        product_code=dispatch.product_code
-                    )
-                except WorkOrder.DoesNotExist:
+                matches = workorders_by_key.get((dispatch.company_code, dispatch.order_number, dispatch.product_code), [])
+                if not matches:
                     logger.warning(f"派工單 {dispatch.company_code}-{dispatch.order_number}-{dispatch.product_code} 對應的工單不存在，跳過")
                     continue
-                except WorkOrder.MultipleObjectsReturned:
+                if len(matches) > 1:
                     logger.error(f"派工單 {dispatch.company_code}-{dispatch.order_number}-{dispatch.product_code} 對應多個工單，資料不一致，跳過")
                     continue
+                workorder = matches[0]
                 
                 # 排除條件：跳過工單號碼是「RD樣品」的工單
                 if workorder.order_number == 'RD樣品':
                     logger.info(f"工單 {workorder.order_number} 是RD樣品工單，跳過完工判斷")
                     continue
-                try:
-                    # 1. 完工判斷：使用派工單的完工狀態
-                    if dispatch.can_complete and dispatch.completion_threshold_met:
-                        logger.info(f"工單 {workorder.order_number} 達到歸檔條件：出貨包裝數量={dispatch.packaging_total_quantity} >= 計劃數量={dispatch.planned_quantity}")
-                        
-                        # 2. 資料轉移：使用統一轉移服務
-                        from .unified_transfer_service import UnifiedTransferService
-                        transfer_result = UnifiedTransferService.transfer_workorder_to_completed(
-                            workorder.id, "工單歸檔"
-                        )
-                        
-                        if transfer_result.get('success'):
-                            # 3. 更新派工單狀態為已完工
-                            dispatch.status = 'completed'
-                            dispatch.production_end_date = timezone.now()
-                            dispatch.save()
-                            
-                            archived_count += 1
-                            logger.info(f"工單 {workorder.order_number} 歸檔完成")
-                        else:
-                            error_count += 1
-                            errors.append(f"工單 {workorder.order_number}: 資料轉移失敗 - {transfer_result.get('error', '未知錯誤')}")
-                    else:
-                        logger.debug(f"工單 {workorder.order_number} 尚未達到歸檔條件：可以完工={dispatch.can_complete}, 閾值達成={dispatch.completion_threshold_met}")
-                        
-                except Exception as e:
-                    error_count += 1
-                    error_msg = f"工單 {workorder.order_number} 歸檔失敗: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
+                
+                # 1. 完工判斷：使用派工單的完工狀態
+                if can_complete:
+                    logger.info(f"工單 {workorder.order_number} 達到歸檔條件：出貨包裝數量={dispatch.packaging_total_quantity} >= 計劃數量={dispatch.planned_quantity}")
+                    archive_workorder_ids.append(workorder.id)
+                else:
+                    logger.debug(f"工單 {workorder.order_number} 尚未達到歸檔條件：出貨包裝數量={dispatch.packaging_total_quantity}, 計劃數量={dispatch.planned_quantity}")
+            
+            if changed_dispatches:
+                WorkOrderDispatch.objects.bulk_update(changed_dispatches, ['completion_threshold_met', 'can_complete'])
+            
+            # 2. 資料轉移與清除：批次轉移，轉移成功的工單連同派工單一併刪除
+            if archive_workorder_ids:
+                from .unified_transfer_service import UnifiedTransferService
+                transfer_result = UnifiedTransferService.transfer_workorders_to_completed(
+                    archive_workorder_ids, "工單歸檔"
+                )
+                archived_count = transfer_result['transferred_count'] + transfer_result['already_transferred_count']
+                error_count = len(transfer_result['errors'])
+                errors.extend(transfer_result['errors'])
             
             result = {
                 'total_checked': total_checked,
@@ -154,16 +151,13 @@ class FillWorkCompletionService:
             
             # 嚴格的公司分離
             if workorder.company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(
-                    company_code=workorder.company_code
-                ).first()
+                company_name = MasterDataCache.get_company_name(workorder.company_code)
                 
-                if company_config:
+                if company_name:
                     fillwork_reports = fillwork_reports.filter(
-                        company_name=company_config.company_name
+                        company_name=company_name
                     )
-                    logger.debug(f"工單 {workorder.order_number} 完工時間查詢按公司名稱 '{company_config.company_name}' 過濾")
+                    logger.debug(f"工單 {workorder.order_number} 完工時間查詢按公司名稱 '{company_name}' 過濾")
                 else:
                     logger.warning(f"工單 {workorder.order_number} 公司代號 {workorder.company_code} 在 CompanyConfig 中找不到對應配置")
                     fillwork_reports = FillWork.objects.none()
@@ -216,16 +210,13 @@ class FillWorkCompletionService:
             
             # 嚴格的公司分離
             if workorder.company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(
-                    company_code=workorder.company_code
-                ).first()
+                company_name = MasterDataCache.get_company_name(workorder.company_code)
                 
-                if company_config:
+                if company_name:
                     fillwork_reports = fillwork_reports.filter(
-                        company_name=company_config.company_name
+                        company_name=company_name
                     )
-                    logger.debug(f"工單 {workorder.order_number} 填報記錄按公司名稱 '{company_config.company_name}' 過濾")
+                    logger.debug(f"工單 {workorder.order_number} 填報記錄按公司名稱 '{company_name}' 過濾")
                 else:
                     logger.warning(f"工單 {workorder.order_number} 公司代號 {workorder.company_code} 在 CompanyConfig 中找不到對應配置")
                     fillwork_reports = FillWork.objects.none()
@@ -610,13 +601,8 @@ class FillWorkCompletionService:
             
             # 嚴格的公司分離：必須同時檢查公司代號和公司名稱
             if workorder.company_code:
-                # 從 CompanyConfig 獲取公司名稱
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(
-                    company_code=workorder.company_code
-                ).first()
-                
-                if company_config:
+                # 確認公司代號在 CompanyConfig 中有對應設定
+                if MasterDataCache.get_company_name(workorder.company_code):
                     # 同時按公司代號和公司名稱過濾，確保資料分離
                     onsite_reports = onsite_reports.filter(
                         company_code=workorder.company_code
@@ -666,17 +652,14 @@ class FillWorkCompletionService:
             
             # 嚴格的公司分離：必須同時檢查公司代號和公司名稱
             if workorder.company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(
-                    company_code=workorder.company_code
-                ).first()
+                company_name = MasterDataCache.get_company_name(workorder.company_code)
                 
-                if company_config:
+                if company_name:
                     # 按公司名稱過濾，確保資料分離
                     fillwork_reports = fillwork_reports.filter(
-                        company_name=company_config.company_name
+                        company_name=company_name
                     )
-                    logger.info(f"工單 {workorder.order_number} 填報記錄按公司名稱 '{company_config.company_name}' 過濾")
+                    logger.info(f"工單 {workorder.order_number} 填報記錄按公司名稱 '{company_name}' 過濾")
                 else:
                     # 如果找不到公司配置，清空結果避免資料混淆
                     logger.warning(f"工單 {workorder.order_number} 公司代號 {workorder.company_code} 在 CompanyConfig 中找不到對應配置，清空填報記錄結果")
@@ -710,46 +693,73 @@ class FillWorkCompletionService:
     
     
     
+    # 批量完工檢查每個交易處理的工單數
+    COMPLETION_BATCH_SIZE = 200
+
     @classmethod
-    def check_all_workorders_completion(cls):
+    def check_all_workorders_completion(cls, batch_size=None):
         """
         檢查所有工單的完工狀態
-        這是批量檢查工單完工條件的方法
+        這是批量檢查工單完工條件的方法：
+        1. 以分組查詢一次算出所有進行中工單的出貨包裝數量（填報 + 現場報工）
+        2. 找出達到完工條件的工單
+        3. 依 batch_size 分批在交易中完成工單與其工序
+        
+        Args:
+            batch_size: 每個交易處理的工單數，預設 COMPLETION_BATCH_SIZE
         
         Returns:
             dict: 檢查結果統計
         """
         try:
             logger.info("開始批量檢查工單完工狀態")
+            batch_size = batch_size or cls.COMPLETION_BATCH_SIZE
             
             # 獲取所有進行中的工單（排除已完工的）
-            active_workorders = WorkOrder.objects.filter(
-                status__in=['pending', 'in_progress']
-            ).order_by('order_number')
+            active_workorders = list(
+                WorkOrder.objects.filter(
+                    status__in=['pending', 'in_progress']
+                ).exclude(
+                    order_number='RD樣品'
+                ).only(
+                    'id', 'company_code', 'order_number', 'product_code', 'quantity', 'status'
+                ).order_by('order_number')
+            )
             
-            total_checked = 0
+            total_checked = len(active_workorders)
             completed_count = 0
             error_count = 0
             errors = []
             
+            company_names = cls._get_company_name_map()
+            packaging_totals = cls._get_batch_packaging_quantities(company_names)
+            
+            qualified = []
             for workorder in active_workorders:
+                company_name = company_names.get(workorder.company_code)
+                if not company_name:
+                    continue
+                packaging_quantity = packaging_totals.get(
+                    (workorder.company_code, company_name, workorder.order_number, workorder.product_code), 0
+                )
+                if workorder.quantity > 0 and packaging_quantity >= workorder.quantity:
+                    qualified.append((workorder, company_name))
+            
+            logger.info(f"批量完工檢查：{total_checked} 個工單中有 {len(qualified)} 個達到完工條件")
+            
+            for start in range(0, len(qualified), batch_size):
+                chunk = qualified[start:start + batch_size]
                 try:
-                    total_checked += 1
-                    
-                    # 檢查並完成工單
-                    if cls.check_and_complete_workorder(workorder.id):
-                        completed_count += 1
-                        logger.info(f"工單 {workorder.order_number} 完工檢查成功")
-                    
+                    completed_count += cls._complete_workorders_batch(chunk)
                 except Exception as e:
-                    error_count += 1
-                    error_msg = f"工單 {workorder.order_number} 完工檢查失敗: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append({
-                        'workorder_id': workorder.id,
-                        'order_number': workorder.order_number,
-                        'error': str(e)
-                    })
+                    error_count += len(chunk)
+                    logger.error(f"批量完工第 {start // batch_size + 1} 批失敗: {str(e)}")
+                    for workorder, _ in chunk:
+                        errors.append({
+                            'workorder_id': workorder.id,
+                            'order_number': workorder.order_number,
+                            'error': str(e)
+                        })
             
             result = {
                 'total_checked': total_checked,
@@ -772,6 +782,162 @@ class FillWorkCompletionService:
                 'error_count': 1
             }
     
+    @classmethod
+    def _get_company_name_map(cls):
+        """取得公司代號 -> 公司名稱對照表（主檔快取）"""
+        return MasterDataCache.company_name_map()
+    
+    @classmethod
+    def _get_batch_packaging_quantities(cls, company_names):
+        """
+        以兩個分組查詢計算所有進行中工單的出貨包裝數量（良品 + 不良品）
+        與 _get_fillwork_quantity / _get_onsite_quantity 的公司分離規則相同
+        
+        Returns:
+            dict: (公司代號, 公司名稱, 工單號碼, 產品編號) -> 出貨包裝數量
+        """
+        from workorder.onsite_reporting.models import OnsiteReport
+        
+        open_workorders = WorkOrder.objects.filter(status__in=['pending', 'in_progress'])
+        code_by_name = {}
+        for company_code, company_name in company_names.items():
+            code_by_name.setdefault(company_name, company_code)
+        
+        totals = {}
+        
+        # 填報記錄：按公司名稱分離
+        fillwork_rows = FillWork.objects.filter(
+            workorder__in=open_workorders.values('order_number'),
+            operation__exact=cls.PACKAGING_PROCESS_NAME,
+            approval_status='approved',
+            company_name__in=list(company_names.values()),
+        ).values('company_name', 'workorder', 'product_id').annotate(
+            good=Sum('work_quantity'), defect=Sum('defect_quantity')
+        )
+        for row in fillwork_rows:
+            company_code = code_by_name.get(row['company_name'])
+            key = (company_code, row['company_name'], row['workorder'], row['product_id'])
+            totals[key] = totals.get(key, 0) + (row['good'] or 0) + (row['defect'] or 0)
+        
+        # 現場報工：按公司代號分離
+        onsite_rows = OnsiteReport.objects.filter(
+            workorder__in=open_workorders.values('order_number'),
+            process=cls.PACKAGING_PROCESS_NAME,
+            status='completed',
+            company_code__in=list(company_names.keys()),
+        ).values('company_code', 'workorder', 'product_id').annotate(
+            good=Sum('work_quantity'), defect=Sum('defect_quantity')
+        )
+        for row in onsite_rows:
+            company_name = company_names.get(row['company_code'])
+            key = (row['company_code'], company_name, row['workorder'], row['product_id'])
+            totals[key] = totals.get(key, 0) + (row['good'] or 0) + (row['defect'] or 0)
+        
+        return totals
+    
+    @classmethod
+    def _get_batch_last_packaging_end_times(cls, workorders_with_company):
+        """
+        一次查詢取得多個工單最後一筆出貨包裝報工的結束時間
+        
+        Args:
+            workorders_with_company: [(WorkOrder, 公司名稱), ...]
+            
+        Returns:
+            dict: (公司名稱, 工單號碼) -> datetime
+        """
+        from datetime import datetime
+        
+        order_numbers = {workorder.order_number for workorder, _ in workorders_with_company}
+        company_names = {company_name for _, company_name in workorders_with_company}
+        
+        last_reports = FillWork.objects.filter(
+            workorder__in=order_numbers,
+            company_name__in=company_names,
+            process_name__exact=cls.PACKAGING_PROCESS_NAME,
+            approval_status='approved'
+        ).order_by(
+            'company_name', 'workorder', '-work_date', '-end_time'
+        ).distinct(
+            'company_name', 'workorder'
+        ).values_list('company_name', 'workorder', 'work_date', 'end_time')
+        
+        end_times = {}
+        for company_name, order_number, work_date, end_time in last_reports:
+            if end_time:
+                end_times[(company_name, order_number)] = timezone.make_aware(
+                    datetime.combine(work_date, end_time)
+                )
+        return end_times
+    
+    @classmethod
+    def _complete_workorders_batch(cls, workorders_with_company):
+        """
+        在單一交易中完成一批工單（與 _complete_workorder 相同的狀態變更）
+        
+        Args:
+            workorders_with_company: [(WorkOrder, 公司名稱), ...]
+            
+        Returns:
+            int: 完工的工單數
+        """
+        from django.db.models import Case, When, Value, DateTimeField
+        from ..models import WorkOrderProcess
+        
+        if not workorders_with_company:
+            return 0
+        
+        end_times = cls._get_batch_last_packaging_end_times(workorders_with_company)
+        now = timezone.now()
+        
+        workorders = []
+        for workorder, company_name in workorders_with_company:
+            workorder.status = 'completed'
+            workorder.completed_at = end_times.get((company_name, workorder.order_number), now)
+            workorder.updated_at = now
+            workorders.append(workorder)
+        
+        completed_ids = [workorder.id for workorder in workorders]
+        with transaction.atomic():
+            WorkOrder.objects.bulk_update(workorders, ['status', 'completed_at', 'updated_at'])
+            WorkOrderProcess.objects.filter(
+                workorder_id__in=[workorder.id for workorder in workorders]
+            ).update(
+                status='completed',
+                actual_end_time=Case(
+                    *[When(workorder_id=workorder.id, then=Value(workorder.completed_at)) for workorder in workorders],
+                    output_field=DateTimeField(),
+                ),
+                updated_at=now,
+            )
+            # bulk_update 不會觸發 post_save 的資料轉移信號，交易提交後直接批次轉移
+            transaction.on_commit(lambda: cls._transfer_completed_workorders(completed_ids))
+        
+        for workorder in workorders:
+            logger.info(f"工單 {workorder.order_number} 狀態更新為完工，完工時間: {workorder.completed_at}")
+        return len(workorders)
+    
+    @classmethod
+    def _transfer_completed_workorders(cls, workorder_ids):
+        """
+        將批量完工的工單轉移到已完工工單
+        與 trigger_data_transfer_on_completion 信號使用同一個開關（auto_completion_enabled）
+        """
+        from ..models import SystemConfig
+        from .unified_transfer_service import UnifiedTransferService
+        
+        try:
+            if SystemConfig.get_config("auto_completion_enabled", "True").lower() != 'true':
+                logger.info("資料轉移功能已停用，批量完工的工單不自動轉移")
+                return
+            
+            result = UnifiedTransferService.transfer_workorders_to_completed(workorder_ids, "批量自動完工轉移")
+            logger.info(f"批量完工資料轉移完成：轉移 {result['transferred_count']} 個工單")
+            for error in result['errors']:
+                logger.warning(f"批量完工資料轉移失敗：{error}")
+        except Exception as e:
+            logger.error(f"批量完工資料轉移失敗: {str(e)}")
+    
     
     @classmethod
     def cleanup_transferred_workorders(cls):
@@ -978,45 +1144,10 @@ class FillWorkCompletionService:
     def setup_auto_completion_triggers(cls):
         """
         設置自動完工觸發器
-        在填報記錄提交時自動檢查完工條件
+        填報記錄儲存時由 fill_work 信號記錄受影響的工單，交易提交後由
+        WorkOrderRefreshService 統一檢查完工條件，不再另外註冊逐筆觸發的信號
         """
-        try:
-            from django.db.models.signals import post_save
-            from django.dispatch import receiver
-            from workorder.fill_work.models import FillWork
-            
-            @receiver(post_save, sender=FillWork)
-            def auto_check_completion(sender, instance, created, **kwargs):
-                """
-                填報記錄保存後自動檢查完工條件
-                """
-                # 只處理已核准的填報記錄
-                if instance.approval_status == 'approved':
-                    try:
-                        # 使用 Celery 異步執行，避免阻塞主線程
-                        from django_celery_beat.models import PeriodicTask
-                        from celery import shared_task
-                        
-                        @shared_task
-                        def check_completion_task(fillwork_id):
-                            try:
-                                fillwork = FillWork.objects.get(id=fillwork_id)
-                                return cls.auto_check_completion_on_fillwork_submit(fillwork)
-                            except Exception as e:
-                                logger.error(f"異步檢查完工條件失敗：{str(e)}")
-                                return {'success': False, 'message': str(e)}
-                        
-                        # 異步執行檢查
-                        check_completion_task.delay(instance.id)
-                        logger.info(f"已安排異步檢查工單完工條件：{instance.workorder}")
-                        
-                    except Exception as e:
-                        logger.error(f"設置自動完工觸發器失敗：{str(e)}")
-            
-            logger.info("自動完工觸發器設置完成")
-            
-        except Exception as e:
-            logger.error(f"設置自動完工觸發器失敗：{str(e)}")
+        logger.info("自動完工由工單異動彙整服務觸發，無需另外設置觸發器")
     
     @classmethod
     def enable_auto_completion(cls):
@@ -4,7 +4,9 @@
 """
 
 import logging
-from django.db import transaction
+from datetime import datetime
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 from workorder.models import WorkOrder, ConsistencyCheckResult
 from workorder.workorder_dispatch.models import WorkOrderDispatch
@@ -13,35 +15,185 @@ from erp_integration.models import CompanyConfig
 
 logger = logging.getLogger('workorder')
 
+# 增量檢查的高水位記錄（存放於 SystemConfig）
+CONSISTENCY_CHECK_WATERMARK_KEY = "consistency_check_watermark"
+
+# 檢查結果每批讀取與寫入的筆數
+CONSISTENCY_CHECK_BATCH_SIZE = 2000
+
+# 檢查查詢的輸出欄位順序（每個檢查的 SELECT 都依此排列）
+RESULT_COLUMNS = (
+    'fill_work_id', 'company_code', 'company_name', 'workorder', 'product_code',
+    'wrong_company_code', 'wrong_company_name', 'wrong_workorder', 'wrong_product_code',
+    'operator', 'work_date',
+)
+
+# 公司名稱 -> 公司代號；同名多筆設定時取最小代號
+NAME_TO_CODE_CTE = """
+name_to_code AS (
+    SELECT company_name, MIN(company_code) AS company_code
+    FROM {company_table}
+    GROUP BY company_name
+)
+"""
+
+# 工單與其正確公司名稱（找不到公司設定時以公司代號代替），排除RD樣品工單
+WORKORDER_WITH_NAME_CTE = """
+code_to_name AS (
+    SELECT company_code, MIN(company_name) AS company_name
+    FROM {company_table}
+    GROUP BY company_code
+),
+wo AS (
+    SELECT w.company_code, w.order_number, w.product_code,
+           COALESCE(c.company_name, w.company_code) AS company_name
+    FROM {workorder_table} w
+    LEFT JOIN code_to_name c ON c.company_code = w.company_code
+    WHERE w.order_number <> 'RD樣品'
+)
+"""
+
+# 填報異常：找不到對應工單的填報記錄（有公司代號比對代號，否則以公司名稱換算；都沒有時只比對工單與產品）
+MISSING_DISPATCH_SQL = """
+WITH """ + NAME_TO_CODE_CTE + """
+SELECT f.id, f.company_code, f.company_name, f.workorder, f.product_id,
+       NULL, f.company_name, f.workorder, f.product_id,
+       f.operator, f.work_date
+FROM {fill_work_table} f
+LEFT JOIN name_to_code c
+       ON NULLIF(f.company_code, '') IS NULL AND c.company_name = f.company_name
+WHERE f.workorder <> 'RD樣品' {scope}
+  AND NOT EXISTS (
+      SELECT 1 FROM {workorder_table} w
+      WHERE w.order_number = f.workorder
+        AND w.product_code = f.product_id
+        AND (COALESCE(NULLIF(f.company_code, ''), c.company_code) IS NULL
+             OR w.company_code = COALESCE(NULLIF(f.company_code, ''), c.company_code))
+  )
+"""
+
+# 產品編號錯誤：公司名稱+工單號碼相同，產品編號不同
+WRONG_PRODUCT_CODE_SQL = """
+WITH """ + WORKORDER_WITH_NAME_CTE + """
+SELECT f.id, wo.company_code, wo.company_name, wo.order_number, wo.product_code,
+       NULL, NULL, NULL, f.product_id,
+       f.operator, f.work_date
+FROM wo
+JOIN {fill_work_table} f
+  ON f.company_name = wo.company_name
+ AND f.workorder = wo.order_number
+ AND f.product_id IS DISTINCT FROM wo.product_code
+WHERE TRUE {scope}
+"""
+
+# 公司代號/名稱錯誤：工單號碼+產品編號相同，公司名稱不同
+WRONG_COMPANY_SQL = """
+WITH """ + WORKORDER_WITH_NAME_CTE + """
+SELECT f.id, wo.company_code, wo.company_name, wo.order_number, wo.product_code,
+       f.company_code, f.company_name, NULL, NULL,
+       f.operator, f.work_date
+FROM wo
+JOIN {fill_work_table} f
+  ON f.workorder = wo.order_number
+ AND f.product_id = wo.product_code
+ AND f.company_name IS DISTINCT FROM wo.company_name
+WHERE TRUE {scope}
+"""
+
+# 工單號碼錯誤：公司名稱+產品編號相同，工單號碼不同
+WRONG_WORKORDER_SQL = """
+WITH """ + WORKORDER_WITH_NAME_CTE + """
+SELECT f.id, wo.company_code, wo.company_name, wo.order_number, wo.product_code,
+       NULL, NULL, f.workorder, NULL,
+       f.operator, f.work_date
+FROM wo
+JOIN {fill_work_table} f
+  ON f.company_name = wo.company_name
+ AND f.product_id = wo.product_code
+ AND f.workorder IS DISTINCT FROM wo.order_number
+WHERE TRUE {scope}
+"""
+
+CHECK_SQL = {
+    'missing_dispatch': MISSING_DISPATCH_SQL,
+    'wrong_product_code': WRONG_PRODUCT_CODE_SQL,
+    'wrong_company': WRONG_COMPANY_SQL,
+    'wrong_workorder': WRONG_WORKORDER_SQL,
+}
+
 class ConsistencyCheckService:
     """
     相符性檢查服務類別
     提供各種相符性檢查功能，排除RD樣品工單
+    每項檢查都是一個 SQL 反連接／連接查詢，結果串流寫入 bulk_create
     """
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
-    def clear_old_results(self, check_type=None):
+    def clear_old_results(self, check_type=None, fill_work_ids=None):
         """
         清除舊的檢查結果
         
         Args:
             check_type: 指定檢查類型，如果為None則清除所有類型
+            fill_work_ids: 只清除這些填報記錄的結果（增量檢查），None 表示全部
         """
         try:
+            results = ConsistencyCheckResult.objects.all()
             if check_type:
-                ConsistencyCheckResult.objects.filter(check_type=check_type).delete()
-            else:
-                ConsistencyCheckResult.objects.all().delete()
+                results = results.filter(check_type=check_type)
+            if fill_work_ids is not None:
+                results = results.filter(fill_work_id__in=fill_work_ids)
+            results.delete()
             self.logger.info(f"已清除舊的相符性檢查結果")
         except Exception as e:
             self.logger.error(f"清除舊檢查結果失敗：{str(e)}")
             raise
     
-
+    def _run_check(self, check_type, fill_work_ids=None):
+        """
+        執行單一檢查並以批次 bulk_create 寫入結果
+        
+        Args:
+            check_type: 檢查類型（CHECK_SQL 的鍵）
+            fill_work_ids: 只檢查這些填報記錄（增量檢查），None 表示全部
+            
+        Returns:
+            int: 發現的問題筆數
+        """
+        scope = ''
+        params = []
+        if fill_work_ids is not None:
+            if not fill_work_ids:
+                return 0
+            scope = 'AND f.id = ANY(%s)'
+            params.append(list(fill_work_ids))
+        
+        sql = CHECK_SQL[check_type].format(
+            company_table=CompanyConfig._meta.db_table,
+            workorder_table=WorkOrder._meta.db_table,
+            fill_work_table=FillWork._meta.db_table,
+            scope=scope,
+        )
+        
+        found_count = 0
+        with transaction.atomic():
+            self.clear_old_results(check_type, fill_work_ids)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(CONSISTENCY_CHECK_BATCH_SIZE)
+                    if not rows:
+                        break
+                    ConsistencyCheckResult.objects.bulk_create([
+                        ConsistencyCheckResult(check_type=check_type, **dict(zip(RESULT_COLUMNS, row)))
+                        for row in rows
+                    ])
+                    found_count += len(rows)
+        return found_count
     
-    def check_missing_dispatch(self):
+    def check_missing_dispatch(self, fill_work_ids=None):
         """
         檢查填報異常
         比對條件：公司代號或公司名稱+工單號碼+產品編號
@@ -49,61 +201,7 @@ class ConsistencyCheckService:
         修正：先檢查是否有對應的工單，再檢查是否有派工單
         """
         try:
-            self.clear_old_results('missing_dispatch')
-            
-            # 排除RD樣品工單的填報紀錄
-            fill_works = FillWork.objects.exclude(workorder='RD樣品')
-            missing_count = 0
-            
-            for fill_work in fill_works:
-                # 修正邏輯：先檢查是否有對應的工單
-                workorder_exists = False
-                
-                # 檢查是否有對應的工單
-                if fill_work.company_code:
-                    # 有公司代號時，直接比對公司代號
-                    workorder_exists = WorkOrder.objects.filter(
-                        company_code=fill_work.company_code,
-                        order_number=fill_work.workorder,
-                        product_code=fill_work.product_id
-                    ).exists()
-                else:
-                    # 當 company_code 為 None 時，使用公司名稱進行比對
-                    # 先從 CompanyConfig 找到對應的公司代號
-                    try:
-                        company_config = CompanyConfig.objects.get(company_name=fill_work.company_name)
-                        workorder_exists = WorkOrder.objects.filter(
-                            company_code=company_config.company_code,
-                            order_number=fill_work.workorder,
-                            product_code=fill_work.product_id
-                        ).exists()
-                    except CompanyConfig.DoesNotExist:
-                        # 如果找不到公司配置，只比對工單號碼和產品編號
-                        workorder_exists = WorkOrder.objects.filter(
-                            order_number=fill_work.workorder,
-                            product_code=fill_work.product_id
-                        ).exists()
-                
-                # 如果沒有對應的工單，才算是真正的填報異常
-                if not workorder_exists:
-                    ConsistencyCheckResult.objects.create(
-                        check_type='missing_dispatch',
-                        company_code=fill_work.company_code,
-                        company_name=fill_work.company_name,
-                        workorder=fill_work.workorder,
-                        product_code=fill_work.product_id,
-                        # 記錄錯誤的資料，用於修復時查找
-                        wrong_company_name=fill_work.company_name,
-                        wrong_workorder=fill_work.workorder,
-                        wrong_product_code=fill_work.product_id,
-                        operator=fill_work.operator,
-                        work_date=fill_work.work_date,
-                    )
-                    missing_count += 1
-                    self.logger.debug(f"發現填報異常：{fill_work.company_name} {fill_work.workorder} {fill_work.product_id} - 無對應工單")
-                else:
-                    self.logger.debug(f"跳過正常填報：{fill_work.company_name} {fill_work.workorder} {fill_work.product_id} - 有對應工單")
-            
+            missing_count = self._run_check('missing_dispatch', fill_work_ids)
             self.logger.info(f"填報異常檢查完成，發現 {missing_count} 筆問題")
             return missing_count
             
@@ -111,55 +209,14 @@ class ConsistencyCheckService:
             self.logger.error(f"檢查填報異常失敗：{str(e)}")
             raise
     
-    def check_wrong_product_code(self):
+    def check_wrong_product_code(self, fill_work_ids=None):
         """
         檢查產品編號錯誤
         比對條件：公司代號或公司名稱+工單號碼一樣，產品編號跟工單不一樣
         排除RD樣品工單
         """
         try:
-            self.clear_old_results('wrong_product_code')
-            
-            # 排除RD樣品工單
-            workorders = WorkOrder.objects.exclude(order_number='RD樣品')
-            wrong_count = 0
-            
-            for workorder in workorders:
-                # 從 CompanyConfig 取得正確的公司名稱
-                try:
-                    company_config = CompanyConfig.objects.get(company_code=workorder.company_code)
-                    correct_company_name = company_config.company_name
-                except CompanyConfig.DoesNotExist:
-                    # 如果找不到公司配置，使用公司代號作為公司名稱
-                    correct_company_name = workorder.company_code
-                
-                # 修正：比對條件：公司代號或公司名稱+工單號碼一樣，產品編號跟工單不一樣
-                # 檢查該公司該工單的填報紀錄，且產品編號不匹配的記錄
-                fill_works = FillWork.objects.filter(
-                    company_name=correct_company_name,
-                    workorder=workorder.order_number
-                )
-                
-                # 如果沒有填報紀錄，跳過（這屬於缺失填報紀錄問題）
-                if not fill_works.exists():
-                    continue
-                
-                # 檢查是否有產品編號不匹配的記錄
-                wrong_product_fill_works = fill_works.exclude(product_id=workorder.product_code)
-                
-                for fill_work in wrong_product_fill_works:
-                    ConsistencyCheckResult.objects.create(
-                        check_type='wrong_product_code',
-                        company_code=workorder.company_code,
-                        company_name=correct_company_name,
-                        workorder=workorder.order_number,
-                        product_code=workorder.product_code,
-                        wrong_product_code=fill_work.product_id,
-                        operator=fill_work.operator,
-                        work_date=fill_work.work_date,
-                    )
-                    wrong_count += 1
-            
+            wrong_count = self._run_check('wrong_product_code', fill_work_ids)
             self.logger.info(f"產品編號錯誤檢查完成，發現 {wrong_count} 筆問題")
             return wrong_count
             
@@ -167,50 +224,14 @@ class ConsistencyCheckService:
             self.logger.error(f"檢查產品編號錯誤失敗：{str(e)}")
             raise
     
-    def check_wrong_company(self):
+    def check_wrong_company(self, fill_work_ids=None):
         """
         檢查公司代號/名稱錯誤
         比對條件：工單號碼+產品編號相同，公司代號不同
         排除RD樣品工單
         """
         try:
-            self.clear_old_results('wrong_company')
-            
-            # 排除RD樣品工單
-            workorders = WorkOrder.objects.exclude(order_number='RD樣品')
-            wrong_count = 0
-            
-            for workorder in workorders:
-                # 從 CompanyConfig 取得正確的公司名稱
-                try:
-                    company_config = CompanyConfig.objects.get(company_code=workorder.company_code)
-                    correct_company_name = company_config.company_name
-                except CompanyConfig.DoesNotExist:
-                    # 如果找不到公司配置，使用公司代號作為公司名稱
-                    correct_company_name = workorder.company_code
-                
-                # 比對條件：工單號碼+產品編號相同，公司代號不同
-                # 查找填報記錄中工單號碼和產品編號相同，但公司名稱不同的記錄
-                fill_works = FillWork.objects.filter(
-                    workorder=workorder.order_number,
-                    product_id=workorder.product_code
-                ).exclude(company_name=correct_company_name)
-                
-                # 檢查填報紀錄的公司名稱是否與工單對應的公司名稱不一致
-                for fill_work in fill_works:
-                    ConsistencyCheckResult.objects.create(
-                        check_type='wrong_company',
-                        company_code=workorder.company_code,
-                        company_name=correct_company_name,
-                        workorder=workorder.order_number,
-                        product_code=workorder.product_code,
-                        wrong_company_code=fill_work.company_code,
-                        wrong_company_name=fill_work.company_name,
-                        operator=fill_work.operator,
-                        work_date=fill_work.work_date,
-                    )
-                    wrong_count += 1
-            
+            wrong_count = self._run_check('wrong_company', fill_work_ids)
             self.logger.info(f"公司代號/名稱錯誤檢查完成，發現 {wrong_count} 筆問題")
             return wrong_count
             
@@ -218,49 +239,14 @@ class ConsistencyCheckService:
             self.logger.error(f"檢查公司代號/名稱錯誤失敗：{str(e)}")
             raise
     
-    def check_wrong_workorder(self):
+    def check_wrong_workorder(self, fill_work_ids=None):
         """
         檢查工單號碼錯誤
         比對條件：公司代號+產品編號相同，工單號碼不同
         排除RD樣品工單
         """
         try:
-            self.clear_old_results('wrong_workorder')
-            
-            # 排除RD樣品工單
-            workorders = WorkOrder.objects.exclude(order_number='RD樣品')
-            wrong_count = 0
-            
-            for workorder in workorders:
-                # 從 CompanyConfig 取得正確的公司名稱
-                try:
-                    company_config = CompanyConfig.objects.get(company_code=workorder.company_code)
-                    correct_company_name = company_config.company_name
-                except CompanyConfig.DoesNotExist:
-                    # 如果找不到公司配置，使用公司代號作為公司名稱
-                    correct_company_name = workorder.company_code
-                
-                # 比對條件：公司代號+產品編號相同，工單號碼不同
-                # 查找填報記錄中公司名稱和產品編號相同，但工單號碼不同的記錄
-                fill_works = FillWork.objects.filter(
-                    company_name=correct_company_name,
-                    product_id=workorder.product_code
-                ).exclude(workorder=workorder.order_number)
-                
-                # 檢查填報紀錄的工單號碼是否與工單的工單號碼不一致
-                for fill_work in fill_works:
-                    ConsistencyCheckResult.objects.create(
-                        check_type='wrong_workorder',
-                        company_code=workorder.company_code,
-                        company_name=correct_company_name,
-                        workorder=workorder.order_number,
-                        product_code=workorder.product_code,
-                        wrong_workorder=fill_work.workorder,
-                        operator=fill_work.operator,
-                        work_date=fill_work.work_date,
-                    )
-                    wrong_count += 1
-            
+            wrong_count = self._run_check('wrong_workorder', fill_work_ids)
             self.logger.info(f"工單號碼錯誤檢查完成，發現 {wrong_count} 筆問題")
             return wrong_count
             
@@ -268,19 +254,71 @@ class ConsistencyCheckService:
             self.logger.error(f"檢查工單號碼錯誤失敗：{str(e)}")
             raise
     
-    def run_all_checks(self):
+    def get_changed_fill_work_ids(self, since):
+        """
+        取得自 since 起需要重新檢查的填報記錄
+        包含本身有異動的填報記錄，以及工單號碼或產品編號與異動工單相同的填報記錄
+        """
+        changed_workorders = WorkOrder.objects.filter(updated_at__gte=since)
+        changed_numbers = changed_workorders.values('order_number')
+        changed_products = changed_workorders.values('product_code')
+        
+        return list(
+            FillWork.objects.filter(
+                Q(updated_at__gte=since)
+                | Q(workorder__in=changed_numbers)
+                | Q(product_id__in=changed_products)
+            ).values_list('id', flat=True)
+        )
+    
+    def _get_watermark(self):
+        from workorder.models import SystemConfig
+        
+        value = SystemConfig.get_config(CONSISTENCY_CHECK_WATERMARK_KEY)
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            self.logger.warning(f"無法解析相符性檢查高水位 {value}，改為完整檢查")
+            return None
+    
+    def _set_watermark(self, started_at):
+        from workorder.models import SystemConfig
+        
+        SystemConfig.set_config(
+            CONSISTENCY_CHECK_WATERMARK_KEY, started_at.isoformat(), "相符性檢查增量高水位（上次檢查開始時間）"
+        )
+    
+    def run_all_checks(self, incremental=False):
         """
         執行所有相符性檢查
+        
+        Args:
+            incremental: True 時只重新檢查上次檢查後異動的填報記錄與工單；
+                         沒有高水位時自動改為完整檢查。公司設定異動或工單刪除請執行完整檢查
         """
         try:
-            self.logger.info("開始執行所有相符性檢查")
+            started_at = timezone.now()
+            fill_work_ids = None
+            watermark = self._get_watermark() if incremental else None
+            if watermark:
+                fill_work_ids = self.get_changed_fill_work_ids(watermark)
+                # 已刪除的填報記錄不會再被檢查到，直接移除其結果
+                ConsistencyCheckResult.objects.filter(fill_work_id__isnull=False).exclude(
+                    fill_work_id__in=FillWork.objects.values('id')
+                ).delete()
+                self.logger.info(f"開始執行增量相符性檢查：自 {watermark} 起 {len(fill_work_ids)} 筆填報記錄")
+            else:
+                self.logger.info("開始執行所有相符性檢查")
             
             results = {
-                'missing_dispatch': self.check_missing_dispatch(),
-                'wrong_product_code': self.check_wrong_product_code(),
-                'wrong_company': self.check_wrong_company(),
-                'wrong_workorder': self.check_wrong_workorder(),
+                'missing_dispatch': self.check_missing_dispatch(fill_work_ids),
+                'wrong_product_code': self.check_wrong_product_code(fill_work_ids),
+                'wrong_company': self.check_wrong_company(fill_work_ids),
+                'wrong_workorder': self.check_wrong_workorder(fill_work_ids),
             }
+            self._set_watermark(started_at)
             
             total_issues = sum(results.values())
             self.logger.info(f"所有相符性檢查完成，總共發現 {total_issues} 筆問題")
@@ -366,7 +404,7 @@ class ConsistencyCheckService:
                 raise ValueError("修改填報紀錄需要提供修復資料（公司名稱、工單號碼或產品編號）")
             
             if update_fields:
-                updated_count = fill_works.update(**update_fields)
+                updated_count = fill_works.update(**update_fields, updated_at=timezone.now())
                 self.logger.info(f"已更新 {updated_count} 筆填報紀錄：{update_fields}")
             else:
                 self.logger.warning("沒有需要更新的欄位，請檢查修復資料")
@@ -391,7 +429,7 @@ class ConsistencyCheckService:
             company_name=result.company_name,
             workorder=result.workorder,
             product_id=result.wrong_product_code
-        ).update(product_id=new_product_id)
+        ).update(product_id=new_product_id, updated_at=timezone.now())
         
         self.logger.info(f"已更新 {updated_count} 筆填報紀錄的產品編號：{result.wrong_product_code} → {new_product_id}")
     
@@ -415,7 +453,8 @@ class ConsistencyCheckService:
             company_name=result.wrong_company_name
         ).update(
             company_code=new_company_code,
-            company_name=new_company_name
+            company_name=new_company_name,
+            updated_at=timezone.now(),
         )
         
         self.logger.info(f"已更新 {updated_count} 筆填報紀錄的公司名稱：{result.wrong_company_name} → {new_company_name}")
@@ -436,6 +475,6 @@ class ConsistencyCheckService:
             company_name=result.company_name,
             product_id=result.product_code,
             workorder=result.wrong_workorder
-        ).update(workorder=new_workorder)
+        ).update(workorder=new_workorder, updated_at=timezone.now())
         
         self.logger.info(f"已更新 {updated_count} 筆填報紀錄的工單號碼：{result.wrong_workorder} → {new_workorder}") 
\ No newline at end of file
@@ -164,14 +164,10 @@ class DispatchStatisticsService:
             
             # 從填報記錄獲取已完成的工序
             from workorder.fill_work.models import FillWork
-            from erp_integration.models import CompanyConfig
+            from workorder.services.master_data_cache import MasterDataCache
             
             # 獲取公司名稱
-            company_name = None
-            if dispatch.company_code:
-                company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-                if company_config:
-                    company_name = company_config.company_name
+            company_name = MasterDataCache.get_company_name(dispatch.company_code)
             
             # 統計已完成的工序（有報工記錄的工序）
             if company_name:
@@ -237,9 +233,8 @@ class DispatchStatisticsService:
     @staticmethod
     def _get_company_name(dispatch):
         """取得公司名稱"""
-        from erp_integration.models import CompanyConfig
-        company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-        return company_config.company_name if company_config else None
+        from workorder.services.master_data_cache import MasterDataCache
+        return MasterDataCache.get_company_name(dispatch.company_code)
 
     @staticmethod
     def _get_onsite_packaging_quantity(dispatch):
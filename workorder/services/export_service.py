@@ -0,0 +1,202 @@
+"""
+串流匯出服務
+提供 CSV／XLSX 共用的匯出層：資料以 values_list().iterator() 分批讀取，
+CSV 以 StreamingHttpResponse 邊產生邊輸出，XLSX 以 openpyxl write-only 模式寫入暫存檔後串流回傳，
+資料量過大時改由背景任務寫入 MEDIA_ROOT 供下載；背景匯出檔依發起的使用者分目錄存放，
+只有發起者可以下載，逾期檔案由定時任務清除。
+"""
+
+import csv
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+# 每批從資料庫讀取的筆數
+EXPORT_CHUNK_SIZE = 2000
+
+# XLSX 暫存在記憶體的上限，超過後自動改寫入磁碟暫存檔
+EXPORT_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# 超過此筆數時改由背景任務產生檔案
+EXPORT_ASYNC_THRESHOLD = 50000
+
+# 背景匯出檔案存放於 MEDIA_ROOT 下的子目錄（其下再以使用者ID分目錄）
+EXPORT_DIR = 'exports'
+
+# 背景匯出檔案預設保留時數
+DEFAULT_EXPORT_FILE_MAX_AGE_HOURS = 24
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _EchoBuffer:
+    """csv.writer 的寫入目標，直接回傳寫入內容供串流輸出"""
+
+    def write(self, value):
+        return value
+
+
+class StreamingExportService:
+    """
+    串流匯出服務
+    所有匯出都以「標頭 + 逐列產生的資料」描述，不需要一次把整份資料放進記憶體
+    """
+
+    @staticmethod
+    def iter_rows(queryset, fields, row_formatter=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        以 values_list().iterator() 逐批讀取資料列
+
+        Args:
+            queryset: 要匯出的查詢集
+            fields: 要讀取的欄位
+            row_formatter: 將 values_list tuple 轉為輸出列的函式，None 時原樣輸出
+            chunk_size: 每批讀取筆數
+        """
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        if row_formatter is None:
+            yield from rows
+        else:
+            for row in rows:
+                yield row_formatter(row)
+
+    @staticmethod
+    def csv_response(filename, headers, rows):
+        """以 StreamingHttpResponse 串流輸出 CSV"""
+        writer = csv.writer(_EchoBuffer())
+
+        def generate():
+            yield writer.writerow(headers)
+            for row in rows:
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def write_xlsx(fileobj, sheet_title, headers, rows, column_widths=None):
+        """
+        以 openpyxl write-only 模式寫入 XLSX，逐列寫出不保留儲存格物件
+
+        write-only 模式無法事後依內容調整欄寬，需要時以 column_widths 預先指定
+        """
+        import openpyxl
+        from openpyxl.utils import get_column_letter
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_title)
+        for index, width in enumerate(column_widths or [], 1):
+            ws.column_dimensions[get_column_letter(index)].width = width
+        ws.append(headers)
+        for row in rows:
+            ws.append(row)
+        wb.save(fileobj)
+
+    @classmethod
+    def xlsx_response(cls, filename, sheet_title, headers, rows, column_widths=None):
+        """產生 XLSX 到暫存檔（小檔留在記憶體，大檔自動落地磁碟）後以 FileResponse 分段回傳"""
+        spooled = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+        try:
+            cls.write_xlsx(spooled, sheet_title, headers, rows, column_widths)
+        except Exception:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        return FileResponse(spooled, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+    @staticmethod
+    def new_export_name(filename):
+        """產生背景匯出檔名（加上隨機前綴避免互相覆蓋，也讓下載網址不可猜測）"""
+        return f"{uuid.uuid4().hex}_{filename}"
+
+    @classmethod
+    def write_export_file(cls, stored_name, owner_id, file_format, sheet_title, headers, rows):
+        """
+        背景匯出：把檔案寫入 MEDIA_ROOT/exports/<owner_id>，寫完才改名，避免下載到未完成的檔案
+
+        Args:
+            stored_name: 匯出檔名（new_export_name 產生）
+            owner_id: 發起匯出的使用者ID，只有此使用者可以下載
+
+        Returns:
+            str: 產生的檔案完整路徑
+        """
+        export_dir = cls.get_export_dir(owner_id)
+        os.makedirs(export_dir, exist_ok=True)
+        final_path = os.path.join(export_dir, stored_name)
+        partial_path = f"{final_path}.part"
+
+        try:
+            if file_format == 'csv':
+                with open(partial_path, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(headers)
+                    writer.writerows(rows)
+            else:
+                with open(partial_path, 'wb') as f:
+                    cls.write_xlsx(f, sheet_title, headers, rows)
+            os.replace(partial_path, final_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        logger.info(f"背景匯出完成：{final_path}")
+        return final_path
+
+    @staticmethod
+    def get_export_dir(owner_id=None):
+        """匯出目錄；指定 owner_id 時為該使用者的子目錄"""
+        export_dir = os.path.join(settings.MEDIA_ROOT, EXPORT_DIR)
+        if owner_id is None:
+            return export_dir
+        return os.path.join(export_dir, str(int(owner_id)))
+
+    @classmethod
+    def get_export_path(cls, stored_name, owner_id):
+        """取得使用者自己的背景匯出檔案路徑，檔名不合法、不屬於該使用者或檔案不存在時回傳 None"""
+        if not stored_name or os.path.basename(stored_name) != stored_name or owner_id is None:
+            return None
+        path = os.path.join(cls.get_export_dir(owner_id), stored_name)
+        if not os.path.isfile(path):
+            return None
+        return path
+
+    @classmethod
+    def cleanup_expired_exports(cls, max_age_hours=None):
+        """
+        刪除超過保留時數的背景匯出檔（含中斷留下的 .part 暫存檔）與清空的使用者目錄
+
+        Returns:
+            int: 刪除的檔案數
+        """
+        if max_age_hours is None:
+            max_age_hours = getattr(settings, 'EXPORT_FILE_MAX_AGE_HOURS', DEFAULT_EXPORT_FILE_MAX_AGE_HOURS)
+        export_dir = cls.get_export_dir()
+        if not os.path.isdir(export_dir):
+            return 0
+
+        cutoff = time.time() - max_age_hours * 60 * 60
+        removed = 0
+        for dirpath, _, filenames in os.walk(export_dir, topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+            if dirpath != export_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+        if removed:
+            logger.info(f"已清除逾期的背景匯出檔案 {removed} 個")
+        return removed
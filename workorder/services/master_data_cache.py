@@ -0,0 +1,161 @@
+"""
+主檔快取服務
+公司設定、系統設定與作業員／工序／設備名稱等主檔很少異動，卻在迴圈、信號與每個請求中反覆查詢。
+每張主檔整份載入後存放於快取（Redis，測試時為本機記憶體），之後的查詢都是字典查找；
+主檔新增、修改或刪除時由信號在交易提交後清除對應快取。
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 每張主檔一個快取鍵
+MASTER_DATA_CACHE_KEY = 'master_data:{table}'
+
+COMPANY_TABLE = 'company_config'
+SYSTEM_CONFIG_TABLE = 'system_config'
+OPERATOR_TABLE = 'operator'
+PROCESS_NAME_TABLE = 'process_name'
+EQUIPMENT_TABLE = 'equipment'
+
+
+def _cache_timeout():
+    return getattr(settings, 'MASTER_DATA_CACHE_TIMEOUT', 60 * 60)
+
+
+def _load_companies():
+    from erp_integration.models import CompanyConfig
+
+    # 依主鍵排序，名稱或代號重複時與原本 filter(...).first() 取到同一筆
+    companies = list(CompanyConfig.objects.order_by('id').values('id', 'company_name', 'company_code'))
+    code_by_name = {}
+    name_by_code = {}
+    for company in companies:
+        code_by_name.setdefault(company['company_name'], company['company_code'])
+        name_by_code.setdefault(company['company_code'], company['company_name'])
+    return {'companies': companies, 'code_by_name': code_by_name, 'name_by_code': name_by_code}
+
+
+def _load_system_configs():
+    from workorder.models import SystemConfig
+
+    return dict(SystemConfig.objects.values_list('key', 'value'))
+
+
+def _load_operator_names():
+    from process.models import Operator
+
+    return list(Operator.objects.order_by('name').values_list('name', flat=True))
+
+
+def _load_process_names():
+    from process.models import ProcessName
+
+    return list(ProcessName.objects.order_by('name').values_list('name', flat=True))
+
+
+def _load_equipment_names():
+    from equip.models import Equipment
+
+    return list(Equipment.objects.order_by('name').values_list('name', flat=True))
+
+
+_LOADERS = {
+    COMPANY_TABLE: _load_companies,
+    SYSTEM_CONFIG_TABLE: _load_system_configs,
+    OPERATOR_TABLE: _load_operator_names,
+    PROCESS_NAME_TABLE: _load_process_names,
+    EQUIPMENT_TABLE: _load_equipment_names,
+}
+
+
+class MasterDataCache:
+    """
+    主檔快取服務（讀取時載入、異動時清除）
+    迴圈中需要多次對應公司時，先取得 company_code_map()／company_name_map() 再查字典
+    """
+
+    @staticmethod
+    def _get(table):
+        key = MASTER_DATA_CACHE_KEY.format(table=table)
+        data = cache.get(key)
+        if data is None:
+            data = _LOADERS[table]()
+            cache.set(key, data, _cache_timeout())
+        return data
+
+    @staticmethod
+    def invalidate(table):
+        """
+        清除指定主檔快取
+        立即清除一次，交易提交後再清除一次，避免其他連線在提交前重新載入舊資料
+        """
+        key = MASTER_DATA_CACHE_KEY.format(table=table)
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def invalidate_all(cls):
+        for table in _LOADERS:
+            cls.invalidate(table)
+
+    # 公司設定
+
+    @classmethod
+    def companies(cls):
+        """所有公司設定：[{'id', 'company_name', 'company_code'}, ...]"""
+        return cls._get(COMPANY_TABLE)['companies']
+
+    @classmethod
+    def company_code_map(cls):
+        """公司名稱 → 公司代號"""
+        return cls._get(COMPANY_TABLE)['code_by_name']
+
+    @classmethod
+    def company_name_map(cls):
+        """公司代號 → 公司名稱"""
+        return cls._get(COMPANY_TABLE)['name_by_code']
+
+    @classmethod
+    def get_company_code(cls, company_name, default=None):
+        if not company_name:
+            return default
+        return cls.company_code_map().get(company_name, default)
+
+    @classmethod
+    def get_company_name(cls, company_code, default=None):
+        if not company_code:
+            return default
+        return cls.company_name_map().get(company_code, default)
+
+    # 系統設定
+
+    @classmethod
+    def system_configs(cls):
+        """系統設定：設定名稱 → 設定值"""
+        return cls._get(SYSTEM_CONFIG_TABLE)
+
+    @classmethod
+    def get_system_config(cls, key, default=None):
+        return cls.system_configs().get(key, default)
+
+    # 作業員、工序、設備
+
+    @classmethod
+    def operator_names(cls):
+        """作業員名稱（依名稱排序）"""
+        return cls._get(OPERATOR_TABLE)
+
+    @classmethod
+    def process_names(cls):
+        """工序名稱（依名稱排序）"""
+        return cls._get(PROCESS_NAME_TABLE)
+
+    @classmethod
+    def equipment_names(cls):
+        """設備名稱（依名稱排序）"""
+        return cls._get(EQUIPMENT_TABLE)
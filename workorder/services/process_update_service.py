@@ -77,10 +77,10 @@ class ProcessUpdateService:
             
             # 如果工單有公司代號，則按公司分離過濾
             if workorder.company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=workorder.company_code).first()
-                if company_config:
-                    fill_work_reports = fill_work_reports.filter(company_name=company_config.company_name)
+                from workorder.services.master_data_cache import MasterDataCache
+                company_name = MasterDataCache.get_company_name(workorder.company_code)
+                if company_name:
+                    fill_work_reports = fill_work_reports.filter(company_name=company_name)
             
             # 計算總完成數量
             fill_work_quantity = fill_work_reports.aggregate(
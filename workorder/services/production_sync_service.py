@@ -8,7 +8,7 @@ from datetime import datetime
 from django.db import transaction
 from django.utils import timezone
 from workorder.models import WorkOrder, WorkOrderProduction, WorkOrderProductionDetail
-from erp_integration.models import CompanyConfig
+from workorder.services.master_data_cache import MasterDataCache
 
 logger = logging.getLogger(__name__)
 
@@ -181,137 +181,137 @@ class ProductionReportSyncService:
         使用公司代號 + 工單號碼 + 產品編號 + 工序名稱 + 報工日期作為唯一性識別
         """
         try:
-            if not workorder:
-                logger.error("工單為空，無法建立填報記錄")
-                return False
+            # 以保存點包住寫入，唯一鍵衝突等錯誤只回滾本筆，不影響呼叫端的交易
+            with transaction.atomic():
+                if not workorder:
+                    logger.error("工單為空，無法建立填報記錄")
+                    return False
                 
-            # 確保生產中工單記錄存在
-            production_record, created = WorkOrderProduction.objects.get_or_create(
-                workorder=workorder,
-                defaults={
-                    'status': 'in_production',
-                    'current_process': process_name,
-                }
-            )
+                # 確保生產中工單記錄存在
+                production_record, created = WorkOrderProduction.objects.get_or_create(
+                    workorder_id=workorder.id,
+                    defaults={
+                        'status': 'in_production',
+                        'current_process': process_name,
+                    }
+                )
             
-            # 解析公司名稱（用於顯示）
-            company_name_value = None
-            try:
-                if workorder and workorder.company_code:
-                    cfg = CompanyConfig.objects.filter(company_code=workorder.company_code).first()
-                    if cfg:
-                        company_name_value = cfg.company_name
-            except Exception:
+                # 解析公司名稱（用於顯示）
                 company_name_value = None
+                try:
+                    if workorder and workorder.company_code:
+                        company_name_value = MasterDataCache.get_company_name(workorder.company_code)
+                except Exception:
+                    company_name_value = None
 
-            # 檢查是否已存在相同的填報記錄（避免重複）
-            # 1) 以來源紀錄唯一鍵判斷（最可靠）
-            existing_detail = None
-            if original_report_id is not None and original_report_type:
-                existing_detail = WorkOrderProductionDetail.objects.filter(
-                    workorder_production=production_record,
-                    original_report_id=original_report_id,
-                    original_report_type=original_report_type,
-                ).first()
-            # 2) 退而求其次：以主要欄位比對（需處理 None 與空字串差異）
-            if existing_detail is None:
-                from django.db.models import Q
-                operator_q = Q(operator__isnull=True) if operator in (None, '') else Q(operator=operator)
-                equipment_q = Q(equipment__isnull=True) if equipment in (None, '') else Q(equipment=equipment)
-                existing_detail = WorkOrderProductionDetail.objects.filter(
-                    Q(workorder_production=production_record),
-                    Q(process_name=process_name),
-                    Q(report_date=report_date),
-                    operator_q,
-                    equipment_q,
-                    Q(work_quantity=work_quantity),
-                    Q(defect_quantity=defect_quantity),
-                    Q(report_source=report_source)
-                ).first()
+                # 檢查是否已存在相同的填報記錄（避免重複）
+                # 1) 以來源紀錄唯一鍵判斷（最可靠）
+                existing_detail = None
+                if original_report_id is not None and original_report_type:
+                    existing_detail = WorkOrderProductionDetail.objects.filter(
+                        workorder_production_id=production_record.id,
+                        original_report_id=original_report_id,
+                        original_report_type=original_report_type,
+                    ).first()
+                # 2) 退而求其次：以主要欄位比對（需處理 None 與空字串差異）
+                if existing_detail is None:
+                    from django.db.models import Q
+                    operator_q = Q(operator__isnull=True) if operator in (None, '') else Q(operator=operator)
+                    equipment_q = Q(equipment__isnull=True) if equipment in (None, '') else Q(equipment=equipment)
+                    existing_detail = WorkOrderProductionDetail.objects.filter(
+                        Q(workorder_production_id=production_record.id),
+                        Q(process_name=process_name),
+                        Q(report_date=report_date),
+                        operator_q,
+                        equipment_q,
+                        Q(work_quantity=work_quantity),
+                        Q(defect_quantity=defect_quantity),
+                        Q(report_source=report_source)
+                    ).first()
             
-            if existing_detail:
-                # 如果記錄已存在，更新所有欄位
-                existing_detail.report_time = report_time
-                existing_detail.start_time = start_time
-                existing_detail.end_time = end_time
-                existing_detail.work_hours = work_hours
-                existing_detail.overtime_hours = overtime_hours
-                existing_detail.has_break = has_break
-                existing_detail.break_start_time = break_start_time
-                existing_detail.break_end_time = break_end_time
-                existing_detail.break_hours = break_hours
-                existing_detail.report_type = report_type
-                existing_detail.allocated_quantity = allocated_quantity
-                existing_detail.quantity_source = quantity_source
-                existing_detail.allocation_notes = allocation_notes
-                existing_detail.is_completed = is_completed
-                existing_detail.completion_method = completion_method
-                existing_detail.auto_completed = auto_completed
-                existing_detail.completion_time = completion_time
-                existing_detail.cumulative_quantity = cumulative_quantity
-                existing_detail.cumulative_hours = cumulative_hours
-                existing_detail.approval_status = approval_status
-                existing_detail.approved_by = approved_by
-                existing_detail.approved_at = approved_at
-                existing_detail.approval_remarks = approval_remarks
-                existing_detail.rejection_reason = rejection_reason
-                existing_detail.rejected_by = rejected_by
-                existing_detail.rejected_at = rejected_at
-                existing_detail.remarks = remarks or existing_detail.remarks
-                existing_detail.abnormal_notes = abnormal_notes or existing_detail.abnormal_notes
-                if company_name_value:
-                    existing_detail.company_name = company_name_value
-                existing_detail.updated_at = timezone.now()
-                existing_detail.save()
-                logger.debug(f"更新已存在的填報記錄: {workorder.order_number} - {process_name}")
-                return True
-            else:
-                # 建立新的填報記錄
-                detail = WorkOrderProductionDetail.objects.create(
-                    workorder_production=production_record,
-                    process_name=process_name,
-                    report_date=report_date,
-                    report_time=report_time,
-                    work_quantity=work_quantity,
-                    defect_quantity=defect_quantity,
-                    operator=operator,
-                    equipment=equipment,
-                    company_name=company_name_value,
-                    report_source=report_source,
-                    start_time=start_time,
-                    end_time=end_time,
-                    # 新增欄位
-                    work_hours=work_hours,
-                    overtime_hours=overtime_hours,
-                    has_break=has_break,
-                    break_start_time=break_start_time,
-                    break_end_time=break_end_time,
-                    break_hours=break_hours,
-                    report_type=report_type,
-                    allocated_quantity=allocated_quantity,
-                    quantity_source=quantity_source,
-                    allocation_notes=allocation_notes,
-                    is_completed=is_completed,
-                    completion_method=completion_method,
-                    auto_completed=auto_completed,
-                    completion_time=completion_time,
-                    cumulative_quantity=cumulative_quantity,
-                    cumulative_hours=cumulative_hours,
-                    approval_status=approval_status,
-                    approved_by=approved_by,
-                    approved_at=approved_at,
-                    approval_remarks=approval_remarks,
-                    rejection_reason=rejection_reason,
-                    rejected_by=rejected_by,
-                    rejected_at=rejected_at,
-                    remarks=remarks,
-                    abnormal_notes=abnormal_notes,
-                    original_report_id=original_report_id,
-                    original_report_type=original_report_type,
-                    created_by=f"同步服務({original_report_type})"
-                )
-                logger.debug(f"建立新的填報記錄: {workorder.order_number} - {process_name} (ID: {detail.id})")
-                return True
+                if existing_detail:
+                    # 如果記錄已存在，更新所有欄位
+                    existing_detail.report_time = report_time
+                    existing_detail.start_time = start_time
+                    existing_detail.end_time = end_time
+                    existing_detail.work_hours = work_hours
+                    existing_detail.overtime_hours = overtime_hours
+                    existing_detail.has_break = has_break
+                    existing_detail.break_start_time = break_start_time
+                    existing_detail.break_end_time = break_end_time
+                    existing_detail.break_hours = break_hours
+                    existing_detail.report_type = report_type
+                    existing_detail.allocated_quantity = allocated_quantity
+                    existing_detail.quantity_source = quantity_source
+                    existing_detail.allocation_notes = allocation_notes
+                    existing_detail.is_completed = is_completed
+                    existing_detail.completion_method = completion_method
+                    existing_detail.auto_completed = auto_completed
+                    existing_detail.completion_time = completion_time
+                    existing_detail.cumulative_quantity = cumulative_quantity
+                    existing_detail.cumulative_hours = cumulative_hours
+                    existing_detail.approval_status = approval_status
+                    existing_detail.approved_by = approved_by
+                    existing_detail.approved_at = approved_at
+                    existing_detail.approval_remarks = approval_remarks
+                    existing_detail.rejection_reason = rejection_reason
+                    existing_detail.rejected_by = rejected_by
+                    existing_detail.rejected_at = rejected_at
+                    existing_detail.remarks = remarks or existing_detail.remarks
+                    existing_detail.abnormal_notes = abnormal_notes or existing_detail.abnormal_notes
+                    if company_name_value:
+                        existing_detail.company_name = company_name_value
+                    existing_detail.updated_at = timezone.now()
+                    existing_detail.save()
+                    logger.debug(f"更新已存在的填報記錄: {workorder.order_number} - {process_name}")
+                    return True
+                else:
+                    # 建立新的填報記錄
+                    detail = WorkOrderProductionDetail.objects.create(
+                        workorder_production_id=production_record.id,
+                        process_name=process_name,
+                        report_date=report_date,
+                        report_time=report_time,
+                        work_quantity=work_quantity,
+                        defect_quantity=defect_quantity,
+                        operator=operator,
+                        equipment=equipment,
+                        company_name=company_name_value,
+                        report_source=report_source,
+                        start_time=start_time,
+                        end_time=end_time,
+                        # 新增欄位
+                        work_hours=work_hours,
+                        overtime_hours=overtime_hours,
+                        has_break=has_break,
+                        break_start_time=break_start_time,
+                        break_end_time=break_end_time,
+                        break_hours=break_hours,
+                        report_type=report_type,
+                        allocated_quantity=allocated_quantity,
+                        quantity_source=quantity_source,
+                        allocation_notes=allocation_notes,
+                        is_completed=is_completed,
+                        completion_method=completion_method,
+                        auto_completed=auto_completed,
+                        completion_time=completion_time,
+                        cumulative_quantity=cumulative_quantity,
+                        cumulative_hours=cumulative_hours,
+                        approval_status=approval_status,
+                        approved_by=approved_by,
+                        approved_at=approved_at,
+                        approval_remarks=approval_remarks,
+                        rejection_reason=rejection_reason,
+                        rejected_by=rejected_by,
+                        rejected_at=rejected_at,
+                        remarks=remarks,
+                        abnormal_notes=abnormal_notes,
+                        original_report_id=original_report_id,
+                        original_report_type=original_report_type,
+                        created_by=f"同步服務({original_report_type})"
+                    )
+                    logger.debug(f"建立新的填報記錄: {workorder.order_number} - {process_name} (ID: {detail.id})")
+                    return True
                 
         except Exception as e:
             error_msg = f"建立填報記錄失敗 - 工單: {workorder.order_number if workorder else 'None'}, 工序: {process_name}, 錯誤: {str(e)}"
@@ -322,6 +322,51 @@ class ProductionReportSyncService:
             print(f"詳細錯誤: {traceback.format_exc()}")
             return False
     
+    @staticmethod
+    def sync_fill_work_record(fill_work, workorder):
+        """
+        將一筆已核准的填報記錄同步到生產中工單詳情
+        作業員或工序名稱含 SMT 者視為 SMT 報工，其餘為作業員報工
+        """
+        is_smt = 'SMT' in (fill_work.operator or '').upper() or 'SMT' in (fill_work.process_name or '').upper()
+        return ProductionReportSyncService._create_or_update_production_detail(
+            workorder=workorder,
+            process_name=(fill_work.process_name or fill_work.operation or ''),
+            report_date=fill_work.work_date,
+            report_time=timezone.now(),
+            work_quantity=fill_work.work_quantity or 0,
+            defect_quantity=fill_work.defect_quantity or 0,
+            operator=(fill_work.operator or None),
+            equipment=(fill_work.equipment or None),
+            report_source='fill_work',
+            start_time=fill_work.start_time,
+            end_time=fill_work.end_time,
+            remarks=fill_work.remarks,
+            abnormal_notes=fill_work.abnormal_notes,
+            original_report_id=fill_work.id,
+            original_report_type='fill_work',
+            work_hours=float(fill_work.work_hours_calculated or 0),
+            overtime_hours=float(fill_work.overtime_hours_calculated or 0),
+            has_break=bool(fill_work.has_break),
+            break_start_time=fill_work.break_start_time,
+            break_end_time=fill_work.break_end_time,
+            break_hours=float(fill_work.break_hours or 0),
+            report_type='smt' if is_smt else 'operator',
+            allocated_quantity=0,
+            quantity_source='original',
+            allocation_notes='',
+            is_completed=bool(fill_work.is_completed),
+            completion_method='manual',
+            auto_completed=False,
+            completion_time=None,
+            cumulative_quantity=0,
+            cumulative_hours=float(fill_work.work_hours_calculated or 0),
+            approval_status='approved',
+            approved_by=fill_work.approved_by,
+            approved_at=fill_work.approved_at,
+            approval_remarks=fill_work.approval_remarks or ''
+        )
+    
     @staticmethod
     def sync_specific_workorder(workorder_id):
         """
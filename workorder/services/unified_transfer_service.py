@@ -1,10 +1,14 @@
 """
 統一資料轉移服務
 將所有資料轉移邏輯統一到一個服務中，避免重複程式碼
+單筆轉移與批次歸檔共用同一套批次轉移流程：每一批工單在同一個交易中處理，
+每張目標資料表只寫入一次 bulk_create，工序統計以分組彙總查詢計算。
 """
 
 import logging
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Count, Sum
 from django.utils import timezone
 from datetime import datetime
 
@@ -14,6 +18,22 @@ from ..onsite_reporting.models import OnsiteReport
 
 logger = logging.getLogger(__name__)
 
+# 每個交易處理的工單數量
+DEFAULT_ARCHIVE_CHUNK_SIZE = 200
+
+# bulk_create 每批寫入筆數
+TRANSFER_BULK_BATCH_SIZE = 1000
+
+# 轉移完成後重新計算的已完工工單統計欄位
+COMPLETED_STATISTICS_FIELDS = [
+    'total_work_hours', 'total_overtime_hours', 'total_all_hours',
+    'total_good_quantity', 'total_defect_quantity', 'total_report_count',
+]
+
+
+def _workorder_key(company_name, order_number, product_code):
+    return (company_name, order_number, product_code)
+
 
 class UnifiedTransferService:
     """
@@ -39,39 +59,23 @@ class UnifiedTransferService:
                 # 1. 獲取工單
                 workorder = WorkOrder.objects.get(id=workorder_id)
                 
-                # 2. 檢查是否已經轉移過
-                existing = CompletedWorkOrder.objects.filter(
-                    order_number=workorder.order_number,
-                    product_code=workorder.product_code,
-                    company_code=workorder.company_code
-                ).first()
-                
-                if existing:
+                # 2. 轉移（已轉移過的工單只回傳既有的已完工工單）
+                completed_id, was_already_transferred = cls._transfer_chunk([workorder], transfer_reason)[workorder.id]
+
+                if was_already_transferred:
                     return {
                         'success': True,
                         'message': f'工單 {workorder.order_number} 已經轉移過',
-                        'completed_workorder_id': existing.id,
+                        'completed_workorder_id': completed_id,
                         'was_already_transferred': True
                     }
                 
-                # 3. 建立已完工工單
-                completed_workorder = cls._create_completed_workorder(workorder, transfer_reason)
-                
-                # 4. 轉移所有相關資料
-                cls._transfer_all_data(workorder, completed_workorder)
-                
-                # 5. 更新統計資料
-                cls._update_statistics(completed_workorder)
-                
-                # 6. 清理原始資料
-                cls._cleanup_original_data(workorder)
-                
                 logger.info(f"工單 {workorder.order_number} 轉移完成")
                 
                 return {
                     'success': True,
                     'message': f'工單 {workorder.order_number} 轉移成功',
-                    'completed_workorder_id': completed_workorder.id,
+                    'completed_workorder_id': completed_id,
                     'was_already_transferred': False
                 }
                 
@@ -88,20 +92,126 @@ class UnifiedTransferService:
             }
     
     @classmethod
-    def _create_completed_workorder(cls, workorder, transfer_reason):
-        """建立已完工工單記錄"""
-        # 獲取公司名稱
-        company_name = ""
-        if workorder.company_code:
+    def transfer_workorders_to_completed(cls, workorder_ids, transfer_reason="批次轉移", chunk_size=None):
+        """
+        批次轉移多張工單
+        每批工單在同一個交易中轉移；整批失敗時改為逐張轉移，找出有問題的工單而不影響其他工單
+
+        Args:
+            workorder_ids: 工單ID清單
+            transfer_reason: 轉移原因
+            chunk_size: 每個交易處理的工單數量，預設為 settings.WORKORDER_ARCHIVE_CHUNK_SIZE
+
+        Returns:
+            dict: 轉移結果，completed_workorder_ids 為 工單ID → 已完工工單ID
+        """
+        chunk_size = chunk_size or getattr(settings, 'WORKORDER_ARCHIVE_CHUNK_SIZE', DEFAULT_ARCHIVE_CHUNK_SIZE)
+        workorder_ids = list(dict.fromkeys(workorder_ids))
+        transferred_count = 0
+        already_transferred_count = 0
+        completed_ids = {}
+        errors = []
+
+        for start in range(0, len(workorder_ids), chunk_size):
+            chunk_ids = workorder_ids[start:start + chunk_size]
+            failed_ids = set()
             try:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=workorder.company_code).first()
-                if company_config:
-                    company_name = company_config.company_name
-            except:
-                pass
-        
-        return CompletedWorkOrder.objects.create(
+                with transaction.atomic():
+                    workorders = list(WorkOrder.objects.filter(id__in=chunk_ids))
+                    results = cls._transfer_chunk(workorders, transfer_reason)
+            except Exception as e:
+                logger.error(f"批次轉移工單失敗，改為逐張轉移: {str(e)}")
+                results = {}
+                for workorder_id in chunk_ids:
+                    result = cls.transfer_workorder_to_completed(workorder_id, transfer_reason)
+                    if result.get('success'):
+                        results[workorder_id] = (result['completed_workorder_id'], result['was_already_transferred'])
+                    else:
+                        failed_ids.add(workorder_id)
+                        errors.append(f"工單 {workorder_id}: {result.get('error', '轉移失敗')}")
+
+            for workorder_id, (completed_id, was_already_transferred) in results.items():
+                completed_ids[workorder_id] = completed_id
+                if was_already_transferred:
+                    already_transferred_count += 1
+                else:
+                    transferred_count += 1
+            for workorder_id in set(chunk_ids) - set(results) - failed_ids:
+                errors.append(f"工單 {workorder_id}: 工單不存在")
+
+        logger.info(f"批次轉移完成：轉移 {transferred_count} 張，已轉移過 {already_transferred_count} 張，失敗 {len(errors)} 張")
+        return {
+            'success': True,
+            'transferred_count': transferred_count,
+            'already_transferred_count': already_transferred_count,
+            'completed_workorder_ids': completed_ids,
+            'errors': errors,
+        }
+
+    @classmethod
+    def _transfer_chunk(cls, workorders, transfer_reason):
+        """
+        在目前交易中轉移一批工單
+
+        Returns:
+            dict: 工單ID → (已完工工單ID, 是否先前已轉移)
+        """
+        from .master_data_cache import MasterDataCache
+
+        if not workorders:
+            return {}
+
+        results = {}
+        order_numbers = {workorder.order_number for workorder in workorders}
+
+        # 1. 檢查是否已經轉移過
+        existing = {
+            (company_code, order_number, product_code): completed_id
+            for completed_id, company_code, order_number, product_code in CompletedWorkOrder.objects.filter(
+                order_number__in=order_numbers
+            ).values_list('id', 'company_code', 'order_number', 'product_code')
+        }
+        pending = []
+        for workorder in workorders:
+            completed_id = existing.get((workorder.company_code, workorder.order_number, workorder.product_code))
+            if completed_id:
+                results[workorder.id] = (completed_id, True)
+            else:
+                pending.append(workorder)
+        if not pending:
+            return results
+
+        # 2. 建立已完工工單
+        company_names = MasterDataCache.company_name_map()
+        completed_workorders = CompletedWorkOrder.objects.bulk_create([
+            cls._build_completed_workorder(workorder, company_names.get(workorder.company_code, ""), transfer_reason)
+            for workorder in pending
+        ])
+        completed_by_key = {}
+        for workorder, completed_workorder in zip(pending, completed_workorders):
+            results[workorder.id] = (completed_workorder.id, False)
+            key = _workorder_key(completed_workorder.company_name, workorder.order_number, workorder.product_code)
+            completed_by_key[key] = completed_workorder
+
+        # 3. 轉移報工記錄與工序記錄
+        reports = cls._build_fillwork_reports(completed_by_key) + cls._build_onsite_reports(completed_by_key)
+        CompletedProductionReport.objects.bulk_create(reports, batch_size=TRANSFER_BULK_BATCH_SIZE)
+        CompletedWorkOrderProcess.objects.bulk_create(
+            cls._build_process_records(completed_by_key), batch_size=TRANSFER_BULK_BATCH_SIZE
+        )
+
+        # 4. 更新統計資料
+        cls._update_statistics(completed_workorders, reports)
+
+        # 5. 清理原始資料
+        cls._cleanup_original_data(pending)
+
+        return results
+
+    @classmethod
+    def _build_completed_workorder(cls, workorder, company_name, transfer_reason):
+        """建立已完工工單記錄（尚未儲存）"""
+        return CompletedWorkOrder(
             original_workorder_id=workorder.id,
             company_code=workorder.company_code,
             company_name=company_name,
@@ -115,222 +225,212 @@ class UnifiedTransferService:
             production_record_id=None
         )
     
+    @staticmethod
+    def _source_filter(completed_by_key):
+        """一次查詢整批工單來源記錄的篩選條件（再以唯一鍵比對）"""
+        return {
+            'workorder__in': {order_number for _, order_number, _ in completed_by_key},
+            'product_id__in': {product_code for _, _, product_code in completed_by_key},
+            'company_name__in': {company_name for company_name, _, _ in completed_by_key},
+        }
+
     @classmethod
-    def _transfer_all_data(cls, workorder, completed_workorder):
-        """轉移所有相關資料"""
-        # 轉移填報記錄
-        cls._transfer_fillwork_records(workorder, completed_workorder)
-        
-        # 轉移現場報工記錄
-        cls._transfer_onsite_records(workorder, completed_workorder)
-        
-        # 轉移工序記錄
-        cls._transfer_process_records(workorder, completed_workorder)
-    
-    @classmethod
-    def _transfer_fillwork_records(cls, workorder, completed_workorder):
-        """轉移填報記錄"""
-        try:
-            fillwork_records = FillWork.objects.filter(
-                workorder=workorder.order_number,
-                product_id=workorder.product_code,
-                company_name=completed_workorder.company_name,
-                approval_status='approved'
+    def _build_fillwork_reports(cls, completed_by_key):
+        """轉移已核准的填報記錄"""
+        reports = []
+        fillwork_records = FillWork.objects.filter(
+            approval_status='approved', **cls._source_filter(completed_by_key)
+        ).iterator(chunk_size=TRANSFER_BULK_BATCH_SIZE)
+
+        for record in fillwork_records:
+            completed_workorder = completed_by_key.get(
+                _workorder_key(record.company_name, record.workorder, record.product_id)
             )
-            
-            for record in fillwork_records:
-                try:
-                    # 處理時間欄位
-                    start_datetime = None
-                    end_datetime = None
-                    
-                    if record.start_time and record.work_date:
-                        start_datetime = timezone.make_aware(
-                            datetime.combine(record.work_date, record.start_time)
-                        )
-                    
-                    if record.end_time and record.work_date:
-                        end_datetime = timezone.make_aware(
-                            datetime.combine(record.work_date, record.end_time)
-                        )
-                    
-                    # 建立轉移記錄
-                    CompletedProductionReport.objects.create(
-                        completed_workorder_id=completed_workorder.id,
-                        report_date=record.work_date,
-                        process_name=record.operation or '未知工序',
-                        operator=record.operator,
-                        equipment=record.equipment or '-',
-                        work_quantity=record.work_quantity or 0,
-                        defect_quantity=record.defect_quantity or 0,
-                        work_hours=float(record.work_hours_calculated or 0),
-                        overtime_hours=float(record.overtime_hours_calculated or 0),
-                        start_time=start_datetime,
-                        end_time=end_datetime,
-                        report_source='填報記錄',
-                        report_type='fillwork',
-                        remarks=record.remarks or '',
-                        abnormal_notes=record.abnormal_notes or '',
-                        approval_status=record.approval_status or 'approved',
-                        approved_by=record.approved_by or '',
-                        allocation_method='manual'
-                    )
-                except Exception as e:
-                    logger.error(f"轉移填報記錄失敗 {record.id}: {str(e)}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"轉移填報記錄失敗: {str(e)}")
-    
+            if completed_workorder is None:
+                continue
+
+            # 處理時間欄位
+            start_datetime = None
+            end_datetime = None
+            if record.start_time and record.work_date:
+                start_datetime = timezone.make_aware(datetime.combine(record.work_date, record.start_time))
+            if record.end_time and record.work_date:
+                end_datetime = timezone.make_aware(datetime.combine(record.work_date, record.end_time))
+
+            reports.append(CompletedProductionReport(
+                completed_workorder_id=completed_workorder.id,
+                report_date=record.work_date,
+                process_name=record.operation or '未知工序',
+                operator=record.operator,
+                equipment=record.equipment or '-',
+                work_quantity=record.work_quantity or 0,
+                defect_quantity=record.defect_quantity or 0,
+                work_hours=float(record.work_hours_calculated or 0),
+                overtime_hours=float(record.overtime_hours_calculated or 0),
+                start_time=start_datetime,
+                end_time=end_datetime,
+                report_source='填報記錄',
+                report_type='fillwork',
+                remarks=record.remarks or '',
+                abnormal_notes=record.abnormal_notes or '',
+                approval_status=record.approval_status or 'approved',
+                approved_by=record.approved_by or '',
+                allocation_method='manual'
+            ))
+        return reports
+
     @classmethod
-    def _transfer_onsite_records(cls, workorder, completed_workorder):
-        """轉移現場報工記錄"""
-        try:
-            onsite_records = OnsiteReport.objects.filter(
-                workorder=workorder.order_number,
-                product_id=workorder.product_code,
-                company_name=completed_workorder.company_name,
-                status='completed'
+    def _build_onsite_reports(cls, completed_by_key):
+        """轉移已完成的現場報工記錄"""
+        reports = []
+        onsite_records = OnsiteReport.objects.filter(
+            status='completed', **cls._source_filter(completed_by_key)
+        ).iterator(chunk_size=TRANSFER_BULK_BATCH_SIZE)
+
+        for record in onsite_records:
+            completed_workorder = completed_by_key.get(
+                _workorder_key(record.company_name, record.workorder, record.product_id)
             )
-            
-            for record in onsite_records:
-                try:
-                    CompletedProductionReport.objects.create(
-                        completed_workorder_id=completed_workorder.id,
-                        report_date=record.work_date,
-                        process_name=record.process,
-                        operator=record.operator,
-                        equipment=record.equipment or '-',
-                        work_quantity=record.work_quantity or 0,
-                        defect_quantity=record.defect_quantity or 0,
-                        work_hours=float(record.work_minutes or 0) / 60,  # 分鐘轉小時
-                        overtime_hours=0.0,
-                        start_time=record.start_datetime,
-                        end_time=record.end_datetime,
-                        report_source='現場報工',
-                        report_type='onsite',
-                        remarks=record.remarks or '',
-                        abnormal_notes=record.abnormal_notes or '',
-                        approval_status='completed',
-                        approved_by=record.operator or '',
-                        allocation_method='manual'
-                    )
-                except Exception as e:
-                    logger.error(f"轉移現場報工記錄失敗 {record.id}: {str(e)}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"轉移現場報工記錄失敗: {str(e)}")
-    
+            if completed_workorder is None:
+                continue
+
+            reports.append(CompletedProductionReport(
+                completed_workorder_id=completed_workorder.id,
+                report_date=record.work_date,
+                process_name=record.process,
+                operator=record.operator,
+                equipment=record.equipment or '-',
+                work_quantity=record.work_quantity or 0,
+                defect_quantity=record.defect_quantity or 0,
+                work_hours=float(record.work_minutes or 0) / 60,  # 分鐘轉小時
+                overtime_hours=0.0,
+                start_time=record.start_datetime,
+                end_time=record.end_datetime,
+                report_source='現場報工',
+                report_type='onsite',
+                remarks=record.remarks or '',
+                abnormal_notes=record.abnormal_notes or '',
+                approval_status='completed',
+                approved_by=record.operator or '',
+                allocation_method='manual'
+            ))
+        return reports
+
     @classmethod
-    def _transfer_process_records(cls, workorder, completed_workorder):
-        """轉移工序記錄"""
-        try:
-            from ..models import WorkOrderProcess
-            
-            process_records = WorkOrderProcess.objects.filter(
-                workorder_id=workorder.id
-            ).order_by('step_order')
-            
-            for process in process_records:
-                try:
-                    # 從填報記錄統計該工序的實際資料
-                    fill_work_records = FillWork.objects.filter(
-                        workorder=workorder.order_number,
-                        product_id=workorder.product_code,
-                        operation=process.process_name,
-                        approval_status='approved'
-                    )
-                    
-                    # 統計實際資料
-                    total_work_hours = sum(float(record.work_hours_calculated or 0) for record in fill_work_records)
-                    total_overtime_hours = sum(float(record.overtime_hours_calculated or 0) for record in fill_work_records)
-                    total_good_quantity = sum(int(record.work_quantity or 0) for record in fill_work_records)
-                    total_defect_quantity = sum(int(record.defect_quantity or 0) for record in fill_work_records)
-                    report_count = fill_work_records.count()
-                    
-                    # 收集參與的作業員和設備
-                    operators = list(set(record.operator for record in fill_work_records if record.operator))
-                    equipment = list(set(record.equipment for record in fill_work_records if record.equipment))
-                    
-                    # 如果沒有從填報記錄找到資料，使用原始工序的分配資訊
-                    if not operators and process.assigned_operator:
-                        operators = [process.assigned_operator]
-                    if not equipment and process.assigned_equipment:
-                        equipment = [process.assigned_equipment]
-                    
-                    # 轉移到已完工工單工序記錄
-                    CompletedWorkOrderProcess.objects.create(
-                        completed_workorder_id=completed_workorder.id,
-                        process_name=process.process_name,
-                        process_order=process.step_order,
-                        planned_quantity=process.planned_quantity,
-                        completed_quantity=process.completed_quantity,
-                        status=process.status,
-                        assigned_operator=process.assigned_operator or '',
-                        assigned_equipment=process.assigned_equipment or '',
-                        total_work_hours=total_work_hours,
-                        total_good_quantity=total_good_quantity,
-                        total_defect_quantity=total_defect_quantity,
-                        report_count=report_count,
-                        operators=operators,
-                        equipment=equipment
-                    )
-                except Exception as e:
-                    logger.error(f"轉移工序記錄失敗 {process.id}: {str(e)}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"轉移工序記錄失敗: {str(e)}")
-    
+    def _build_process_records(cls, completed_by_key):
+        """轉移工序記錄，實際工時與數量以填報記錄分組彙總"""
+        from ..models import WorkOrderProcess
+
+        source_filter = cls._source_filter(completed_by_key)
+        group_fields = ('company_name', 'workorder', 'product_id', 'operation')
+
+        # 從填報記錄統計各工序的實際資料
+        totals = {
+            tuple(row[field] for field in group_fields): row
+            for row in FillWork.objects.filter(approval_status='approved', **source_filter).values(
+                *group_fields
+            ).annotate(
+                total_work_hours=Sum('work_hours_calculated'),
+                total_good_quantity=Sum('work_quantity'),
+                total_defect_quantity=Sum('defect_quantity'),
+                report_count=Count('id'),
+            )
+        }
+
+        # 收集參與的作業員和設備
+        operators = {}
+        equipment = {}
+        for *group, operator, equipment_name in FillWork.objects.filter(
+            approval_status='approved', **source_filter
+        ).values_list(*group_fields, 'operator', 'equipment').distinct():
+            group = tuple(group)
+            if operator:
+                operators.setdefault(group, set()).add(operator)
+            if equipment_name:
+                equipment.setdefault(group, set()).add(equipment_name)
+
+        completed_by_workorder_id = {
+            completed_workorder.original_workorder_id: completed_workorder
+            for completed_workorder in completed_by_key.values()
+        }
+
+        process_records = []
+        for process in WorkOrderProcess.objects.filter(
+            workorder_id__in=completed_by_workorder_id
+        ).order_by('workorder_id', 'step_order'):
+            completed_workorder = completed_by_workorder_id.get(process.workorder_id)
+            if completed_workorder is None:
+                continue
+            group = (completed_workorder.company_name, completed_workorder.order_number,
+                     completed_workorder.product_code, process.process_name)
+            total = totals.get(group, {})
+
+            # 如果沒有從填報記錄找到資料，使用原始工序的分配資訊
+            process_operators = sorted(operators.get(group, ()))
+            process_equipment = sorted(equipment.get(group, ()))
+            if not process_operators and process.assigned_operator:
+                process_operators = [process.assigned_operator]
+            if not process_equipment and process.assigned_equipment:
+                process_equipment = [process.assigned_equipment]
+
+            process_records.append(CompletedWorkOrderProcess(
+                completed_workorder_id=completed_workorder.id,
+                process_name=process.process_name,
+                process_order=process.step_order,
+                planned_quantity=process.planned_quantity,
+                completed_quantity=process.completed_quantity,
+                status=process.status,
+                assigned_operator=process.assigned_operator or '',
+                assigned_equipment=process.assigned_equipment or '',
+                total_work_hours=float(total.get('total_work_hours') or 0),
+                total_good_quantity=total.get('total_good_quantity') or 0,
+                total_defect_quantity=total.get('total_defect_quantity') or 0,
+                report_count=total.get('report_count') or 0,
+                operators=process_operators,
+                equipment=process_equipment
+            ))
+        return process_records
+
     @classmethod
-    def _update_statistics(cls, completed_workorder):
-        """更新統計資料"""
-        try:
-            # 從已轉移的記錄重新計算統計資料
-            production_reports = CompletedProductionReport.objects.filter(
-                completed_workorder_id=completed_workorder.id
+    def _update_statistics(cls, completed_workorders, reports):
+        """依本批轉移的報工記錄更新已完工工單統計資料"""
+        by_id = {completed_workorder.id: completed_workorder for completed_workorder in completed_workorders}
+        for completed_workorder in completed_workorders:
+            for field in COMPLETED_STATISTICS_FIELDS:
+                setattr(completed_workorder, field, 0)
+
+        for report in reports:
+            completed_workorder = by_id[report.completed_workorder_id]
+            completed_workorder.total_work_hours += report.work_hours
+            completed_workorder.total_overtime_hours += report.overtime_hours
+            completed_workorder.total_good_quantity += report.work_quantity
+            completed_workorder.total_defect_quantity += report.defect_quantity
+            completed_workorder.total_report_count += 1
+
+        for completed_workorder in completed_workorders:
+            completed_workorder.total_all_hours = (
+                completed_workorder.total_work_hours + completed_workorder.total_overtime_hours
             )
-            
-            total_work_hours = sum(report.work_hours for report in production_reports)
-            total_overtime_hours = sum(report.overtime_hours for report in production_reports)
-            total_good_quantity = sum(report.work_quantity for report in production_reports)
-            total_defect_quantity = sum(report.defect_quantity for report in production_reports)
-            
-            completed_workorder.total_work_hours = total_work_hours
-            completed_workorder.total_overtime_hours = total_overtime_hours
-            completed_workorder.total_all_hours = total_work_hours + total_overtime_hours
-            completed_workorder.total_good_quantity = total_good_quantity
-            completed_workorder.total_defect_quantity = total_defect_quantity
-            completed_workorder.total_report_count = production_reports.count()
-            completed_workorder.save()
-            
-        except Exception as e:
-            logger.error(f"更新統計資料失敗: {str(e)}")
-    
+        CompletedWorkOrder.objects.bulk_update(
+            completed_workorders, COMPLETED_STATISTICS_FIELDS, batch_size=TRANSFER_BULK_BATCH_SIZE
+        )
+
     @classmethod
-    def _cleanup_original_data(cls, workorder):
-        """清理原始資料"""
-        try:
-            # 更新派工單狀態
-            from ..workorder_dispatch.models import WorkOrderDispatch
-            dispatch = WorkOrderDispatch.objects.filter(
-                order_number=workorder.order_number,
-                product_code=workorder.product_code,
-                company_code=workorder.company_code
-            ).first()
-            
-            if dispatch:
-                dispatch.status = 'completed'
-                dispatch.production_end_date = timezone.now()
-                dispatch.save()
-                
-                # 刪除派工單記錄
-                dispatch.delete()
-                logger.info(f"刪除派工單記錄：{workorder.order_number}")
-            
-            # 刪除原始工單記錄
-            workorder.delete()
-            
-        except Exception as e:
-            logger.error(f"清理原始資料失敗: {str(e)}")
+    def _cleanup_original_data(cls, workorders):
+        """刪除已轉移工單的派工單與原始工單記錄"""
+        from ..workorder_dispatch.models import WorkOrderDispatch
+
+        keys = {(workorder.company_code, workorder.order_number, workorder.product_code) for workorder in workorders}
+        dispatch_ids = [
+            dispatch_id
+            for dispatch_id, company_code, order_number, product_code in WorkOrderDispatch.objects.filter(
+                order_number__in={order_number for _, order_number, _ in keys}
+            ).values_list('id', 'company_code', 'order_number', 'product_code')
+            if (company_code, order_number, product_code) in keys
+        ]
+        if dispatch_ids:
+            WorkOrderDispatch.objects.filter(id__in=dispatch_ids).delete()
+            logger.info(f"刪除派工單記錄 {len(dispatch_ids)} 筆")
+
+        # 刪除原始工單記錄
+        WorkOrder.objects.filter(id__in=[workorder.id for workorder in workorders]).delete()
@@ -0,0 +1,227 @@
+"""
+工單異動彙整服務
+填報記錄與現場報工儲存時只記錄受影響的工單鍵（公司, 工單號, 產品編號），
+交易提交後統一交給一個背景任務；任務延遲一小段時間再執行，期間同一工單的異動不會重複排程，
+最後每個工單只重算一次派工單統計、工單狀態與完工判斷。
+"""
+
+import logging
+import threading
+import weakref
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 排程後延遲執行的秒數，也是同一工單鍵不重複排程的時間窗
+DIRTY_WORKORDER_DEBOUNCE_SECONDS = 5
+
+# 已排程的工單鍵旗標
+DIRTY_WORKORDER_CACHE_KEY = 'dirty_workorder:{check}:{company_code}:{company_name}:{order_number}:{product_code}'
+
+
+class _DirtyBatch:
+    """
+    同一交易（保存點）內累積的工單鍵 → 是否需要完工檢查
+    以 on_commit 回呼的形式掛在交易上：交易或保存點回滾時 Django 捨棄回呼，
+    批次失去唯一的強參考後隨即釋放，工單鍵一起被捨棄
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.keys = {}
+        self.flushed = False
+
+    def add(self, key, check_completion):
+        self.keys[key] = self.keys.get(key, False) or bool(check_completion)
+
+    def flush(self):
+        """交易提交後執行；同一次提交的其他批次一併送出，只排程一次重算"""
+        if self.flushed:
+            return
+        pending = {}
+        for batch in [self, *_live_batches(self.alias)]:
+            if batch.flushed:
+                continue
+            batch.flushed = True
+            for key, check_completion in batch.keys.items():
+                pending[key] = pending.get(key, False) or check_completion
+        WorkOrderRefreshService.flush(pending)
+
+
+# 每個執行緒目前交易中的批次：(資料庫別名, 保存點 ID) -> 批次
+# 只保留弱參考，強參考由 on_commit 回呼持有，回滾後批次自動從此移除
+_local = threading.local()
+
+
+def _batches():
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = weakref.WeakValueDictionary()
+    return batches
+
+
+def _live_batches(alias):
+    """指定資料庫連線上尚未送出的工單鍵批次"""
+    return [
+        batch for (batch_alias, _), batch in list(_batches().items())
+        if batch_alias == alias and not batch.flushed
+    ]
+
+
+def _current_batch():
+    """目前交易層級的工單鍵批次，不存在時建立並註冊 on_commit；不在交易中時回傳 None"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    level = (connection.alias, tuple(connection.savepoint_ids))
+    batch = _batches().get(level)
+    if batch is None or batch.flushed:
+        batch = _DirtyBatch(connection.alias)
+        _batches()[level] = batch
+        transaction.on_commit(batch.flush)
+    return batch
+
+
+def _cache_key(company_code, company_name, order_number, product_code, check_completion):
+    return DIRTY_WORKORDER_CACHE_KEY.format(
+        check=int(bool(check_completion)), company_code=company_code, company_name=company_name,
+        order_number=order_number, product_code=product_code,
+    )
+
+
+class WorkOrderRefreshService:
+    """
+    工單異動彙整服務
+    取代逐筆 post_save 重算，讓批次核准、匯入等大量寫入只觸發一次重算
+    """
+
+    @staticmethod
+    def mark_dirty(company_code, company_name, order_number, product_code, check_completion=False):
+        """
+        記錄受影響的工單，於交易提交後送出（不在交易中時立即送出）
+
+        Args:
+            company_code: 公司代號（填報記錄可能未填，可留空）
+            company_name: 公司名稱，公司代號留空時用來對應公司設定
+            order_number: 工單號碼
+            product_code: 產品編號
+            check_completion: 是否需要檢查自動完工
+        """
+        if not order_number:
+            return
+        key = (company_code or '', company_name or '', order_number, product_code or '')
+        batch = _current_batch()
+        if batch is None:
+            WorkOrderRefreshService.flush({key: bool(check_completion)})
+        else:
+            batch.add(key, check_completion)
+
+    @staticmethod
+    def flush(pending):
+        """
+        送出工單鍵；時間窗內已排程的工單鍵略過
+
+        Args:
+            pending: {(公司代號, 公司名稱, 工單號碼, 產品編號): 是否需要完工檢查}
+        """
+        if not pending:
+            return
+
+        keys = []
+        for key, check_completion in pending.items():
+            if cache.add(_cache_key(*key, check_completion), 1, DIRTY_WORKORDER_DEBOUNCE_SECONDS * 2):
+                keys.append([*key, check_completion])
+        if not keys:
+            return
+
+        try:
+            from workorder.tasks import refresh_dirty_workorders_task
+            refresh_dirty_workorders_task.apply_async(args=[keys], countdown=DIRTY_WORKORDER_DEBOUNCE_SECONDS)
+        except Exception as e:
+            # 排程失敗時清除旗標，讓下一次異動可以重新排程
+            cache.delete_many([_cache_key(*key) for key in keys])
+            logger.error(f"排程工單異動重算失敗：{str(e)}")
+
+    @classmethod
+    def refresh(cls, keys):
+        """
+        重算受影響工單的派工單統計、工單狀態，必要時執行自動完工
+
+        Args:
+            keys: [[公司代號, 公司名稱, 工單號碼, 產品編號, 是否需要完工檢查], ...]
+
+        Returns:
+            dict: 重算結果
+        """
+        from workorder.models import WorkOrder, SystemConfig
+        from workorder.workorder_dispatch.models import WorkOrderDispatch
+        from workorder.services.dispatch_statistics_service import DispatchStatisticsService
+        from workorder.services.workorder_status_service import WorkOrderStatusService
+        from workorder.services.completion_service import FillWorkCompletionService
+        from workorder.services.master_data_cache import MasterDataCache
+
+        # 先清除排程旗標，重算期間的新異動會重新排程
+        cache.delete_many([_cache_key(*key) for key in keys])
+
+        company_codes = MasterDataCache.company_code_map()
+        wanted = {}
+        for company_code, company_name, order_number, product_code, check_completion in keys:
+            resolved = (company_code or company_codes.get(company_name) or '', order_number, product_code)
+            wanted[resolved] = wanted.get(resolved, False) or check_completion
+        # 找不到公司代號時只依工單號與產品編號比對
+        wanted_any_company = {
+            (order_number, product_code): check_completion
+            for (company_code, order_number, product_code), check_completion in wanted.items() if not company_code
+        }
+        order_numbers = {order_number for _, order_number, _ in wanted}
+        product_codes = {product_code for _, _, product_code in wanted}
+
+        def lookup(company_code, order_number, product_code):
+            """回傳是否需要完工檢查；不在異動清單內回傳 None"""
+            if (company_code, order_number, product_code) in wanted:
+                return wanted[(company_code, order_number, product_code)]
+            return wanted_any_company.get((order_number, product_code))
+
+        dispatches = [
+            dispatch for dispatch in WorkOrderDispatch.objects.filter(
+                order_number__in=order_numbers, product_code__in=product_codes,
+            )
+            if lookup(dispatch.company_code, dispatch.order_number, dispatch.product_code) is not None
+        ]
+        for dispatch in dispatches:
+            DispatchStatisticsService.update_all_statistics(dispatch)
+
+        workorders = [
+            (workorder_id, check_completion)
+            for workorder_id, company_code, order_number, product_code in WorkOrder.objects.filter(
+                order_number__in=order_numbers, product_code__in=product_codes,
+            ).values_list('id', 'company_code', 'order_number', 'product_code')
+            for check_completion in [lookup(company_code, order_number, product_code)]
+            if check_completion is not None
+        ]
+        for workorder_id, _ in workorders:
+            WorkOrderStatusService.update_workorder_status(workorder_id)
+
+        completed_count = 0
+        completion_ids = [workorder_id for workorder_id, check_completion in workorders if check_completion]
+        if completion_ids and SystemConfig.get_config("auto_completion_enabled") != "True":
+            logger.debug("智能自動完工功能未啟用，跳過自動完工檢查")
+            completion_ids = []
+        for workorder_id in completion_ids:
+            result = FillWorkCompletionService.auto_complete_workorder(workorder_id)
+            if result.get('success'):
+                completed_count += 1
+            else:
+                logger.debug(f"工單 {workorder_id} 尚未自動完工：{result.get('error', result.get('message', ''))}")
+
+        logger.info(
+            f"工單異動重算完成：派工單 {len(dispatches)} 筆、工單 {len(workorders)} 筆、自動完工 {completed_count} 筆"
+        )
+        return {
+            'success': True,
+            'dispatch_count': len(dispatches),
+            'workorder_count': len(workorders),
+            'completed_count': completed_count,
+        }
@@ -9,7 +9,7 @@ from django.db import transaction
 from django.utils import timezone
 from ..models import WorkOrder
 from ..fill_work.models import FillWork
-from erp_integration.models import CompanyConfig
+from .master_data_cache import MasterDataCache
 
 logger = logging.getLogger(__name__)
 
@@ -105,18 +105,14 @@ class WorkOrderStatusService:
             
             # 2. 檢查填報記錄（任何狀態的記錄都算生產活動）
             # 根據多公司架構，需要同時檢查公司名稱、工單號碼和產品編號
-            from erp_integration.models import CompanyConfig
+            # 先找到對應的公司名稱
+            company_name = MasterDataCache.get_company_name(workorder.company_code)
             
-            # 先找到對應的公司配置
-            company_config = CompanyConfig.objects.filter(
-                company_code=workorder.company_code
-            ).first()
-            
-            if company_config:
+            if company_name:
                 has_fillwork_reports = FillWork.objects.filter(
                     workorder=workorder.order_number,
                     product_id=workorder.product_code,
-                    company_name=company_config.company_name
+                    company_name=company_name
                 ).exists()
             else:
                 has_fillwork_reports = False
@@ -248,10 +244,9 @@ class WorkOrderStatusService:
             
             # 如果工單有公司代號，則按公司分離過濾
             if workorder.company_code:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=workorder.company_code).first()
-                if company_config:
-                    approved_reports_count = approved_reports_count.filter(company_name=company_config.company_name)
+                company_name = MasterDataCache.get_company_name(workorder.company_code)
+                if company_name:
+                    approved_reports_count = approved_reports_count.filter(company_name=company_name)
             
             approved_reports_count = approved_reports_count.count()
             
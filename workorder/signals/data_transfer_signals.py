@@ -33,13 +33,13 @@ def trigger_data_transfer_on_completion(sender, instance, created, **kwargs):
             logger.info(f"工單 {instance.order_number} 狀態變為已完工，觸發資料轉移檢查")
             
             # 檢查智能自動完工功能是否啟用（資料轉移使用同一個開關）
-            try:
-                from ..models import SystemConfig
-                auto_completion_config = SystemConfig.objects.get(key="auto_completion_enabled")
-                transfer_enabled = auto_completion_config.value.lower() == 'true'
-            except SystemConfig.DoesNotExist:
+            from ..models import SystemConfig
+            auto_completion_value = SystemConfig.get_config("auto_completion_enabled")
+            if auto_completion_value is None:
                 transfer_enabled = True  # 預設啟用
                 logger.info("未找到智能自動完工啟用設定，使用預設值啟用")
+            else:
+                transfer_enabled = auto_completion_value.lower() == 'true'
             
             if not transfer_enabled:
                 logger.info("資料轉移功能已停用，跳過自動轉移")
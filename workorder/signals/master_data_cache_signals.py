@@ -0,0 +1,42 @@
+"""
+主檔快取信號處理器
+公司設定、系統設定、作業員、工序、設備新增／修改／刪除時清除對應的主檔快取
+"""
+
+import logging
+
+from django.db.models.signals import post_save, post_delete
+
+logger = logging.getLogger(__name__)
+
+
+def register_master_data_cache_signals():
+    """
+    註冊主檔快取失效信號
+    在應用程式啟動時調用
+    """
+    from equip.models import Equipment
+    from erp_integration.models import CompanyConfig
+    from process.models import Operator, ProcessName
+    from workorder.models import SystemConfig
+    from workorder.services.master_data_cache import (
+        MasterDataCache, COMPANY_TABLE, SYSTEM_CONFIG_TABLE, OPERATOR_TABLE, PROCESS_NAME_TABLE, EQUIPMENT_TABLE,
+    )
+
+    senders = {
+        CompanyConfig: COMPANY_TABLE,
+        SystemConfig: SYSTEM_CONFIG_TABLE,
+        Operator: OPERATOR_TABLE,
+        ProcessName: PROCESS_NAME_TABLE,
+        Equipment: EQUIPMENT_TABLE,
+    }
+
+    def master_data_changed(sender, **kwargs):
+        MasterDataCache.invalidate(senders[sender])
+
+    for sender in senders:
+        uid = f"master_data_cache_{sender._meta.label_lower}"
+        post_save.connect(master_data_changed, sender=sender, weak=False, dispatch_uid=f"{uid}_save")
+        post_delete.connect(master_data_changed, sender=sender, weak=False, dispatch_uid=f"{uid}_delete")
+
+    logger.info("註冊主檔快取信號處理器")
@@ -5,10 +5,6 @@
 """
 
 import logging
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from ..fill_work.models import FillWork
-from ..services.workorder_status_service import WorkOrderStatusService
 
 logger = logging.getLogger(__name__)
 
@@ -41,58 +37,8 @@ logger = logging.getLogger(__name__)
 #         logger.error(f"工序記錄觸發工單狀態更新失敗：{str(e)}")
 
 
-@receiver(post_save, sender=FillWork)
-def update_workorder_status_on_report_approval(sender, instance, created, **kwargs):
-    """
-    當填報記錄核准狀態變更時更新工單狀態
-    
-    Args:
-        sender: 發送者模型
-        instance: 保存的實例
-        created: 是否為新建記錄
-        **kwargs: 其他參數
-    """
-    try:
-        logger.info(f"填報記錄觸發工單狀態更新：工單 {instance.workorder}，核准狀態：{instance.approval_status}")
-        
-        # 查找對應的工單
-        from ..models import WorkOrder
-        from erp_integration.models import CompanyConfig
-        
-        # 從公司名稱找到公司代號
-        company_code = None
-        try:
-            company_config = CompanyConfig.objects.filter(
-                company_name=instance.company_name
-            ).first()
-            if company_config:
-                company_code = company_config.company_code
-        except Exception:
-            pass
-        
-        if company_code:
-            # 根據多公司架構，需要同時檢查公司代號、工單號碼和產品編號
-            workorder = WorkOrder.objects.filter(
-                company_code=company_code,
-                order_number=instance.workorder,
-                product_code=instance.product_id
-            ).first()
-            
-            if workorder:
-                # 更新工單狀態
-                updated = WorkOrderStatusService.update_workorder_status(workorder.id)
-                
-                if updated:
-                    logger.info(f"工單 {workorder.order_number} 狀態更新成功")
-                else:
-                    logger.warning(f"工單 {workorder.order_number} 狀態更新失敗")
-            else:
-                logger.warning(f"找不到對應的工單：{instance.workorder}")
-        else:
-            logger.warning(f"找不到對應的公司代號：{instance.company_name}")
-                
-    except Exception as e:
-        logger.error(f"填報記錄觸發工單狀態更新失敗：{str(e)}")
+# 填報記錄觸發的工單狀態更新已併入 fill_work/signals.py 的異動記錄，
+# 由 WorkOrderRefreshService 於交易提交後統一重算
 
 
 def register_workorder_status_signals():
@@ -243,57 +243,24 @@ def auto_convert_orders():
 def auto_check_workorder_completion():
     """
     自動檢查工單完工狀態
-    檢查所有生產中的工單是否達到完工條件
+    以批量模式檢查所有進行中的工單是否達到完工條件，完工的工單於交易提交後批次轉移
     """
     try:
         logger.info("開始執行自動完工檢查任務")
         
-        # 取得所有生產中的工單
-        production_workorders = WorkOrder.objects.filter(status='in_progress')
-        total_count = production_workorders.count()
+        result = FillWorkCompletionService.check_all_workorders_completion()
+        if 'error' in result:
+            raise RuntimeError(result['error'])
         
-        if total_count == 0:
-            logger.info("沒有生產中的工單需要檢查")
-            return {
-                'success': True,
-                'message': '沒有生產中的工單需要檢查',
-                'checked_count': 0,
-                'completed_count': 0
-            }
-        
-        completed_count = 0
-        error_count = 0
-        
-        for workorder in production_workorders:
-            try:
-                # 檢查完工條件
-                summary = FillWorkCompletionService.get_completion_summary(workorder.id)
-                
-                if summary.get('can_complete', False):
-                    # 執行自動完工
-                    result = FillWorkCompletionService.auto_complete_workorder(workorder.id)
-                    
-                    if result.get('success', False):
-                        completed_count += 1
-                        logger.info(f"工單 {workorder.order_number} 自動完工成功")
-                    else:
-                        error_count += 1
-                        logger.warning(f"工單 {workorder.order_number} 自動完工失敗：{result.get('message', '未知錯誤')}")
-                else:
-                    logger.debug(f"工單 {workorder.order_number} 尚未達到完工條件")
-                    
-            except Exception as e:
-                error_count += 1
-                logger.error(f"檢查工單 {workorder.order_number} 完工狀態時發生錯誤：{str(e)}")
-        
-        logger.info(f"自動完工檢查任務完成：檢查了 {total_count} 個工單，完工 {completed_count} 個，錯誤 {error_count} 個")
+        logger.info(f"自動完工檢查任務完成：{result['message']}")
         
         return {
             'success': True,
-            'message': f'自動完工檢查任務完成，檢查了 {total_count} 個工單',
-            'checked_count': total_count,
-            'completed_count': completed_count,
-            'error_count': error_count
+            'message': result['message'],
+            'checked_count': result['total_checked'],
+            'completed_count': result['completed_count'],
+            'error_count': result['error_count'],
+            'timestamp': timezone.now().isoformat()
         }
         
     except Exception as e:
@@ -303,7 +270,8 @@ def auto_check_workorder_completion():
             'error': f'自動完工檢查任務執行失敗: {str(e)}',
             'checked_count': 0,
             'completed_count': 0,
-            'error_count': 1
+            'error_count': 1,
+            'timestamp': timezone.now().isoformat()
         }
 
 
@@ -317,11 +285,7 @@ def auto_data_transfer_task():
         from workorder.models import SystemConfig
         
         # 檢查智能自動完工功能是否啟用（資料轉移使用同一個開關）
-        try:
-            auto_completion_config = SystemConfig.objects.get(key="auto_completion_enabled")
-            transfer_enabled = auto_completion_config.value.lower() == 'true'
-        except SystemConfig.DoesNotExist:
-            transfer_enabled = True  # 預設啟用
+        transfer_enabled = SystemConfig.get_config("auto_completion_enabled", "True").lower() == 'true'  # 預設啟用
         
         if not transfer_enabled:
             logger.info("資料轉移功能已停用，跳過自動轉移任務")
@@ -334,9 +298,8 @@ def auto_data_transfer_task():
         
         # 取得批次轉移數量設定
         try:
-            batch_size_config = SystemConfig.objects.get(key="transfer_batch_size")
-            batch_size = int(batch_size_config.value)
-        except (SystemConfig.DoesNotExist, ValueError):
+            batch_size = int(SystemConfig.get_config("transfer_batch_size", 50))
+        except ValueError:
             batch_size = 50  # 預設批次大小
         
         logger.info(f"開始執行自動資料轉移任務，批次大小：{batch_size}")
@@ -346,26 +309,17 @@ def auto_data_transfer_task():
         
         # 獲取需要轉移的工單
         from workorder.models import WorkOrder, CompletedWorkOrder
-        completed_workorders = WorkOrder.objects.filter(
+        completed_workorder_ids = list(WorkOrder.objects.filter(
             status='completed'
         ).exclude(
             id__in=CompletedWorkOrder.objects.values_list('original_workorder_id', flat=True)
-        )[:batch_size]
-        
-        transferred_count = 0
-        errors = []
-        
-        for workorder in completed_workorders:
-            try:
-                transfer_result = UnifiedTransferService.transfer_workorder_to_completed(
-                    workorder.id, "定時自動轉移"
-                )
-                if transfer_result.get('success'):
-                    transferred_count += 1
-                else:
-                    errors.append(f'工單 {workorder.order_number}: {transfer_result.get("error", "轉移失敗")}')
-            except Exception as e:
-                errors.append(f'工單 {workorder.order_number}: {str(e)}')
+        ).values_list('id', flat=True)[:batch_size])
+        
+        transfer_result = UnifiedTransferService.transfer_workorders_to_completed(
+            completed_workorder_ids, "定時自動轉移"
+        )
+        transferred_count = transfer_result['transferred_count']
+        errors = transfer_result['errors']
         
         result = {
             'success': True,
@@ -400,3 +354,144 @@ def auto_data_transfer_task():
             'transferred_count': 0,
             'timestamp': timezone.now().isoformat()
         }
+
+@shared_task
+def export_fill_work_records_task(kind, file_format, stored_name, owner_id):
+    """
+    背景任務：產生大量填報記錄匯出檔
+    
+    Args:
+        kind: operator 或 smt
+        file_format: csv 或 xlsx
+        stored_name: 匯出檔名（由發起匯出的視圖產生，用於下載網址）
+        owner_id: 發起匯出的使用者ID，只有此使用者可以下載
+    """
+    try:
+        from workorder.fill_work.services import FillWorkExportService
+        
+        path = FillWorkExportService.write_export_file(kind, file_format, stored_name, owner_id)
+        return {
+            'success': True,
+            'message': f'填報記錄匯出完成：{stored_name}',
+            'file_path': path,
+            'timestamp': timezone.now().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"填報記錄背景匯出失敗: {str(e)}")
+        return {
+            'success': False,
+            'error': f'填報記錄背景匯出失敗: {str(e)}',
+            'timestamp': timezone.now().isoformat()
+        }
+
+
+@shared_task
+def cleanup_export_files_task(max_age_hours=None):
+    """
+    定時任務：清除超過保留時數（settings.EXPORT_FILE_MAX_AGE_HOURS）的背景匯出檔
+    """
+    try:
+        from workorder.services.export_service import StreamingExportService
+        
+        removed = StreamingExportService.cleanup_expired_exports(max_age_hours)
+        return {
+            'success': True,
+            'message': f'已清除逾期匯出檔案 {removed} 個',
+            'removed_count': removed,
+            'timestamp': timezone.now().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"清除背景匯出檔案失敗: {str(e)}")
+        return {
+            'success': False,
+            'error': f'清除背景匯出檔案失敗: {str(e)}',
+            'timestamp': timezone.now().isoformat()
+        }
+
+@shared_task
+def incremental_consistency_check_task():
+    """
+    定時任務：增量相符性檢查
+    只重新檢查上次檢查後異動的填報記錄與工單，沒有高水位時自動改為完整檢查
+    """
+    try:
+        from workorder.services.consistency_check_service import ConsistencyCheckService
+        
+        results = ConsistencyCheckService().run_all_checks(incremental=True)
+        total = sum(results.values())
+        return {
+            'success': True,
+            'message': f'增量相符性檢查完成，總共發現 {total} 筆問題',
+            'results': results,
+            'timestamp': timezone.now().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"增量相符性檢查失敗: {str(e)}")
+        return {
+            'success': False,
+            'error': f'增量相符性檢查失敗: {str(e)}',
+            'timestamp': timezone.now().isoformat()
+        }
+
+@shared_task
+def import_fill_work_records_task(job_id, path, is_smt, username):
+    """
+    背景任務：匯入大型填報記錄檔案，進度可由 FillWorkImportService.get_progress(job_id) 查詢
+    
+    Args:
+        job_id: 匯入任務代號
+        path: 上傳檔案的暫存路徑（匯入後刪除）
+        is_smt: 是否為 SMT 匯入
+        username: 建立人員
+    """
+    import os
+    from workorder.fill_work.services import FillWorkImportService
+    
+    try:
+        with open(path, 'rb') as f:
+            result = FillWorkImportService.import_file(f, path, is_smt=is_smt, username=username, job_id=job_id)
+        return {
+            'success': result['success'],
+            'message': f"填報記錄匯入完成：新增 {result['created']} 筆，覆蓋 {result['updated']} 筆，失敗 {len(result['errors'])} 筆",
+            'timestamp': timezone.now().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"填報記錄背景匯入失敗: {str(e)}")
+        FillWorkImportService.set_progress(job_id, 'failed', errors=[f'匯入過程發生未預期錯誤：{e}'])
+        return {
+            'success': False,
+            'error': f'填報記錄背景匯入失敗: {str(e)}',
+            'timestamp': timezone.now().isoformat()
+        }
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@shared_task
+def refresh_dirty_workorders_task(keys):
+    """
+    背景任務：統一重算填報記錄／現場報工異動所影響的工單
+    由 WorkOrderRefreshService.flush 延遲排程，同一時間窗內的異動只會重算一次
+    
+    Args:
+        keys: [[公司代號, 公司名稱, 工單號碼, 產品編號, 是否需要完工檢查], ...]
+    """
+    try:
+        from workorder.services.workorder_refresh_service import WorkOrderRefreshService
+        
+        result = WorkOrderRefreshService.refresh(keys)
+        result['timestamp'] = timezone.now().isoformat()
+        return result
+        
+    except Exception as e:
+        logger.error(f"工單異動重算失敗: {str(e)}")
+        return {
+            'success': False,
+            'error': f'工單異動重算失敗: {str(e)}',
+            'timestamp': timezone.now().isoformat()
+        }
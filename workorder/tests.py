@@ -0,0 +1,380 @@
+"""
+工單管理模組 - 測試
+"""
+
+from datetime import date, datetime, time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    WorkOrder, WorkOrderProcess, CompletedWorkOrder, CompletedWorkOrderProcess, CompletedProductionReport,
+)
+from .services.unified_transfer_service import UnifiedTransferService
+
+
+PROGRESS_PROPERTIES = (
+    'completed_quantity', 'progress', 'completion_rate', 'current_operator', 'current_process', 'start_time',
+)
+
+
+class WorkOrderProgressQueryTest(TestCase):
+    """工單進度註解測試"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.create_workorder('WO-001', [
+            ('completed', 100, '王小明', datetime(2025, 3, 10, 8, 0)),
+            ('in_progress', 40, '李小華', datetime(2025, 3, 10, 13, 0)),
+            ('pending', 0, None, None),
+        ])
+        self.create_workorder('WO-002', [])
+
+    def create_workorder(self, order_number, processes):
+        workorder = WorkOrder.objects.create(
+            company_code='10', order_number=order_number, product_code='PROD-A', quantity=100,
+        )
+        for step, (status, completed, operator, start) in enumerate(processes, 1):
+            WorkOrderProcess.objects.create(
+                workorder_id=workorder.id, process_name=f'工序{step}', step_order=step,
+                planned_quantity=100, completed_quantity=completed, status=status, assigned_operator=operator,
+                actual_start_time=timezone.make_aware(start) if start else None,
+            )
+        return workorder
+
+    def progress_values(self, workorder):
+        return [getattr(workorder, name) for name in PROGRESS_PROPERTIES]
+
+    def test_annotations_match_properties(self):
+        """註解結果與逐筆查詢結果一致"""
+        expected = {workorder.id: self.progress_values(workorder) for workorder in WorkOrder.objects.all()}
+
+        with self.assertNumQueries(1):
+            annotated = {workorder.id: self.progress_values(workorder) for workorder in WorkOrder.objects.with_progress()}
+
+        self.assertEqual(annotated, expected)
+        workorder = WorkOrder.objects.with_progress().get(order_number='WO-001')
+        self.assertEqual(workorder.completed_quantity, 47)
+        self.assertEqual(workorder.progress, 33.3)
+        self.assertEqual(workorder.current_operator, '李小華')
+        self.assertEqual(workorder.current_process, '工序2')
+
+    def fetch_list_page(self, url):
+        """取得列表頁並讀取每筆工單的進度欄位，回傳 (工單列表, 查詢數)"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            # 列表範本目前以卡片分流、不渲染工單表格，於此強制取值以涵蓋列表查詢與進度欄位
+            workorders = list(response.context['workorders'])
+            for workorder in workorders:
+                self.progress_values(workorder)
+        return workorders, len(queries)
+
+    def test_list_view_query_count_does_not_grow_with_rows(self):
+        """工單列表（含每筆進度欄位）的查詢數不隨筆數增加"""
+        self.client.force_login(self.user)
+        url = reverse('workorder:list')
+
+        workorders, before = self.fetch_list_page(url)
+        self.assertEqual(len(workorders), 2)
+        for index in range(5):
+            self.create_workorder(f'WO-1{index}', [('in_progress', 10, '王小明', datetime(2025, 3, 11, 8, 0))])
+        workorders, after = self.fetch_list_page(url)
+
+        self.assertEqual(len(workorders), 7)
+        self.assertEqual(after, before)
+
+
+class ActiveWorkOrdersQueryTest(TestCase):
+    """生產執行監控（執行中工單）查詢測試"""
+
+    def setUp(self):
+        from erp_integration.models import CompanyConfig
+        from workorder.workorder_dispatch.models import WorkOrderDispatch
+
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        for order_number, status in (('WO-A', 'pending'), ('WO-B', 'completed'), ('WO-C', 'pending'), ('WO-D', 'pending')):
+            WorkOrder.objects.create(
+                company_code='10', order_number=order_number, product_code='PROD-A', quantity=100, status=status,
+            )
+        self.create_report('WO-A', time(8, 0))
+        self.create_report('WO-B', time(13, 0))
+        WorkOrderDispatch.objects.create(
+            company_code='10', order_number='WO-C', product_code='PROD-A', status='in_production',
+        )
+
+    def create_report(self, order_number, start_time):
+        from workorder.fill_work.models import FillWork
+
+        return FillWork.objects.create(
+            operator='王小明', company_name='測試公司', workorder=order_number, product_id='PROD-A',
+            planned_quantity=100, process_name='出貨包裝', operation='出貨包裝', work_date=date(2025, 3, 10),
+            start_time=start_time, end_time=time(start_time.hour + 2, 0), work_quantity=20,
+            approval_status='approved', created_by='testuser',
+        )
+
+    def test_in_production(self):
+        """已核准填報的未完工工單與生產中派工單列為執行中，並帶出公司名稱"""
+        workorders = WorkOrder.objects.in_production().with_company_name().order_by('order_number')
+
+        self.assertEqual([workorder.order_number for workorder in workorders], ['WO-A', 'WO-C'])
+        self.assertEqual({workorder.company_name for workorder in workorders}, {'測試公司'})
+
+    def test_view_context(self):
+        """列表、篩選與統計皆來自資料庫查詢"""
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('workorder:active_workorders'), {'workorder_number': 'wo-c'})
+
+        self.assertEqual(response.context['total_active'], 2)
+        self.assertEqual(response.context['total_filtered'], 1)
+        self.assertEqual([workorder.order_number for workorder in response.context['page_obj']], ['WO-C'])
+        self.assertEqual(response.context['total_approved_reports'], 2)
+        self.assertEqual(response.context['total_approved_reports_with_workorder'], 2)
+        self.assertEqual(response.context['total_good_quantity'], 40)
+        self.assertEqual(response.context['all_companies'], ['測試公司'])
+
+
+class UnifiedTransferServiceTest(TestCase):
+    """工單批次轉移（歸檔）測試"""
+
+    def setUp(self):
+        from erp_integration.models import CompanyConfig
+
+        cache.clear()
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        self.workorders = [self.create_workorder(f'WO-00{number}') for number in range(1, 4)]
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_workorder(self, order_number):
+        from workorder.fill_work.models import FillWork
+
+        workorder = WorkOrder.objects.create(
+            company_code='10', order_number=order_number, product_code='PROD-A', quantity=100, status='completed',
+        )
+        for step, process_name in enumerate(('組裝', '包裝'), 1):
+            WorkOrderProcess.objects.create(
+                workorder_id=workorder.id, process_name=process_name, step_order=step,
+                planned_quantity=100, completed_quantity=100, status='completed',
+            )
+        for operator, start, end, quantity in (
+            ('王小明', time(8, 0), time(10, 0), 60),
+            ('李小華', time(10, 0), time(11, 0), 40),
+        ):
+            FillWork.objects.create(
+                operator=operator, company_name='測試公司', workorder=order_number, product_id='PROD-A',
+                planned_quantity=100, process_name='組裝', operation='組裝', work_date=date(2025, 3, 10),
+                start_time=start, end_time=end, work_quantity=quantity, defect_quantity=1,
+                approval_status='approved', created_by='testuser',
+            )
+        return workorder
+
+    def workorder_ids(self):
+        return [workorder.id for workorder in self.workorders]
+
+    def test_transfer_in_chunks(self):
+        """分批轉移所有工單，轉移後刪除原始工單"""
+        with mock.patch.object(
+            UnifiedTransferService, '_transfer_chunk', wraps=UnifiedTransferService._transfer_chunk,
+        ) as transfer_chunk:
+            result = UnifiedTransferService.transfer_workorders_to_completed(self.workorder_ids(), chunk_size=2)
+
+        self.assertEqual([len(call.args[0]) for call in transfer_chunk.call_args_list], [2, 1])
+        self.assertEqual(result['transferred_count'], 3)
+        self.assertEqual(result['already_transferred_count'], 0)
+        self.assertEqual(result['errors'], [])
+        self.assertFalse(WorkOrder.objects.filter(id__in=self.workorder_ids()).exists())
+
+        completed = CompletedWorkOrder.objects.get(id=result['completed_workorder_ids'][self.workorders[0].id])
+        self.assertEqual(completed.order_number, 'WO-001')
+        self.assertEqual(completed.company_name, '測試公司')
+        self.assertEqual(completed.total_report_count, 2)
+        self.assertEqual(completed.total_good_quantity, 100)
+        self.assertEqual(completed.total_defect_quantity, 2)
+        self.assertEqual(Decimal(str(completed.total_work_hours)), Decimal('3'))
+        self.assertEqual(CompletedProductionReport.objects.filter(completed_workorder_id=completed.id).count(), 2)
+
+    def test_already_transferred_workorder(self):
+        """已轉移過的工單回傳既有的已完工工單，不重複建立"""
+        first = UnifiedTransferService.transfer_workorder_to_completed(self.workorders[0].id)
+        WorkOrder.objects.create(
+            company_code='10', order_number='WO-001', product_code='PROD-A', quantity=100, status='completed',
+        )
+        duplicate = WorkOrder.objects.get(order_number='WO-001')
+
+        result = UnifiedTransferService.transfer_workorders_to_completed([duplicate.id, self.workorders[1].id])
+
+        self.assertEqual(result['transferred_count'], 1)
+        self.assertEqual(result['already_transferred_count'], 1)
+        self.assertEqual(result['completed_workorder_ids'][duplicate.id], first['completed_workorder_id'])
+        self.assertEqual(CompletedWorkOrder.objects.filter(order_number='WO-001').count(), 1)
+
+    def test_failed_chunk_falls_back_to_single_transfers(self):
+        """整批失敗時逐張轉移，只有出錯的工單留在原表"""
+        transfer_chunk = UnifiedTransferService._transfer_chunk
+
+        def fail_on_batch_or_bad_workorder(workorders, transfer_reason):
+            if len(workorders) > 1 or workorders[0].order_number == 'WO-002':
+                raise ValueError('轉移失敗')
+            return transfer_chunk(workorders, transfer_reason)
+
+        with mock.patch.object(UnifiedTransferService, '_transfer_chunk', side_effect=fail_on_batch_or_bad_workorder):
+            result = UnifiedTransferService.transfer_workorders_to_completed(self.workorder_ids(), chunk_size=3)
+
+        self.assertEqual(result['transferred_count'], 2)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn(str(self.workorders[1].id), result['errors'][0])
+        self.assertEqual(list(WorkOrder.objects.values_list('order_number', flat=True)), ['WO-002'])
+        self.assertEqual(
+            sorted(CompletedWorkOrder.objects.values_list('order_number', flat=True)), ['WO-001', 'WO-003']
+        )
+
+    def test_process_totals(self):
+        """工序統計以填報記錄分組彙總"""
+        result = UnifiedTransferService.transfer_workorders_to_completed(self.workorder_ids())
+        completed_id = result['completed_workorder_ids'][self.workorders[0].id]
+
+        processes = {
+            process.process_name: process
+            for process in CompletedWorkOrderProcess.objects.filter(completed_workorder_id=completed_id)
+        }
+        self.assertEqual(set(processes), {'組裝', '包裝'})
+        assembly = processes['組裝']
+        self.assertEqual(assembly.process_order, 1)
+        self.assertEqual(assembly.report_count, 2)
+        self.assertEqual(assembly.total_good_quantity, 100)
+        self.assertEqual(assembly.total_defect_quantity, 2)
+        self.assertEqual(Decimal(str(assembly.total_work_hours)), Decimal('3'))
+        self.assertEqual(assembly.operators, ['李小華', '王小明'])
+        self.assertEqual(processes['包裝'].report_count, 0)
+        self.assertEqual(processes['包裝'].operators, [])
+
+
+class AutoCompletionTaskTest(TestCase):
+    """自動完工檢查任務測試"""
+
+    def setUp(self):
+        from erp_integration.models import CompanyConfig
+        from workorder.fill_work.models import FillWork
+
+        cache.clear()
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        for order_number, packed in (('WO-001', 100), ('WO-002', 30)):
+            workorder = WorkOrder.objects.create(
+                company_code='10', order_number=order_number, product_code='PROD-A', quantity=100,
+                status='in_progress',
+            )
+            WorkOrderProcess.objects.create(
+                workorder_id=workorder.id, process_name='出貨包裝', step_order=1,
+                planned_quantity=100, status='in_progress',
+            )
+            FillWork.objects.create(
+                operator='王小明', company_name='測試公司', workorder=order_number, product_id='PROD-A',
+                planned_quantity=100, process_name='出貨包裝', operation='出貨包裝', work_date=date(2025, 3, 10),
+                start_time=time(8, 0), end_time=time(10, 0), work_quantity=packed,
+                approval_status='approved', created_by='testuser',
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_completes_and_archives_in_batch(self):
+        """達到完工條件的工單以批量模式完工，交易提交後轉移到已完工工單"""
+        from workorder.tasks import auto_check_workorder_completion
+
+        with mock.patch.object(
+            WorkOrder.objects, 'get', side_effect=AssertionError('不應逐張查詢工單'),
+        ), self.captureOnCommitCallbacks(execute=True):
+            result = auto_check_workorder_completion()
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['checked_count'], 2)
+        self.assertEqual(result['completed_count'], 1)
+        self.assertEqual(list(WorkOrder.objects.values_list('order_number', 'status')), [('WO-002', 'in_progress')])
+        completed = CompletedWorkOrder.objects.get(order_number='WO-001')
+        self.assertEqual(completed.total_good_quantity, 100)
+
+
+class ConsistencyCheckServiceTest(TestCase):
+    """相符性檢查服務測試"""
+
+    def setUp(self):
+        from erp_integration.models import CompanyConfig
+
+        cache.clear()
+        CompanyConfig.objects.create(company_name='測試公司', company_code='10')
+        WorkOrder.objects.create(company_code='10', order_number='WO-001', product_code='PROD-A', quantity=100)
+        self.fill_works = {
+            name: self.create_fill_work(operator, company_name, workorder, product_id)
+            for name, operator, company_name, workorder, product_id in (
+                ('ok', '王小明', '測試公司', 'WO-001', 'PROD-A'),
+                ('product', '李小華', '測試公司', 'WO-001', 'PROD-X'),
+                ('company', '王小明', '其他公司', 'WO-001', 'PROD-A'),
+                ('workorder', '王小明', '測試公司', 'WO-999', 'PROD-A'),
+                ('sample', '王小明', '測試公司', 'RD樣品', 'PROD-Z'),
+            )
+        }
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_fill_work(self, operator, company_name, workorder, product_id):
+        from workorder.fill_work.models import FillWork
+
+        return FillWork.objects.create(
+            operator=operator, company_name=company_name, workorder=workorder, product_id=product_id,
+            planned_quantity=100, process_name='組裝', operation='組裝', work_date=date(2025, 3, 10),
+            start_time=time(8, 0), end_time=time(10, 0), work_quantity=20,
+            approval_status='approved', created_by='testuser',
+        )
+
+    def found(self):
+        from .models import ConsistencyCheckResult
+
+        ids = {fill_work.id: name for name, fill_work in self.fill_works.items()}
+        return {
+            (check_type, ids[fill_work_id])
+            for check_type, fill_work_id in ConsistencyCheckResult.objects.values_list('check_type', 'fill_work_id')
+        }
+
+    def test_run_all_checks(self):
+        """各項檢查找出對應的填報記錄，排除RD樣品工單"""
+        from .services.consistency_check_service import ConsistencyCheckService
+
+        results = ConsistencyCheckService().run_all_checks()
+
+        self.assertEqual(results, {
+            'missing_dispatch': 2, 'wrong_product_code': 1, 'wrong_company': 1, 'wrong_workorder': 1,
+        })
+        self.assertEqual(self.found(), {
+            ('missing_dispatch', 'product'), ('missing_dispatch', 'workorder'),
+            ('wrong_product_code', 'product'), ('wrong_company', 'company'), ('wrong_workorder', 'workorder'),
+        })
+
+    def test_incremental_rechecks_changed_fill_works(self):
+        """修復後增量檢查只重新檢查有異動的填報記錄，其他結果保留"""
+        from .models import ConsistencyCheckResult
+        from .services.consistency_check_service import ConsistencyCheckService
+
+        service = ConsistencyCheckService()
+        service.run_all_checks()
+        result = ConsistencyCheckResult.objects.get(check_type='wrong_product_code')
+        service.fix_issue(result.id, 'update_fill_work', 'admin')
+
+        with mock.patch.object(service, '_run_check', wraps=service._run_check) as run_check:
+            results = service.run_all_checks(incremental=True)
+
+        self.assertEqual({tuple(call.args[1]) for call in run_check.call_args_list}, {(self.fill_works['product'].id,)})
+        self.assertEqual(sum(results.values()), 0)
+        self.assertEqual(self.found(), {
+            ('missing_dispatch', 'workorder'), ('wrong_company', 'company'), ('wrong_workorder', 'workorder'),
+        })
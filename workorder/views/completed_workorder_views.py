@@ -58,9 +58,8 @@ class CompletedWorkOrderListView(LoginRequiredMixin, ListView):
         
         # 為每個工單添加公司名稱和重新計算工作時數
         try:
-            from erp_integration.models import CompanyConfig
-            company_configs = {config.company_code: config.company_name 
-                             for config in CompanyConfig.objects.all()}
+            from workorder.services.master_data_cache import MasterDataCache
+            company_configs = MasterDataCache.company_name_map()
             
             for workorder in context['completed_workorders']:
                 # 添加公司名稱顯示
@@ -289,26 +288,16 @@ def batch_transfer_completed_workorders(request):
         from ..models import WorkOrder
         
         # 獲取所有已完工但尚未轉移的工單
-        completed_workorders = WorkOrder.objects.filter(
+        completed_workorder_ids = list(WorkOrder.objects.filter(
             status='completed'
         ).exclude(
             id__in=CompletedWorkOrder.objects.values_list('original_workorder_id', flat=True)
-        )
+        ).values_list('id', flat=True))
         
-        transferred_count = 0
-        errors = []
-        
-        for workorder in completed_workorders:
-            try:
-                from ..services.unified_transfer_service import UnifiedTransferService
-                transfer_result = UnifiedTransferService.transfer_workorder_to_completed(workorder.id, "批次轉移")
-                
-                if transfer_result.get('success'):
-                    transferred_count += 1
-                else:
-                    errors.append(f'工單 {workorder.order_number}: {transfer_result.get("error", "轉移失敗")}')
-            except Exception as e:
-                errors.append(f'工單 {workorder.order_number}: {str(e)}')
+        from ..services.unified_transfer_service import UnifiedTransferService
+        transfer_result = UnifiedTransferService.transfer_workorders_to_completed(completed_workorder_ids, "批次轉移")
+        transferred_count = transfer_result['transferred_count']
+        errors = transfer_result['errors']
         
         return JsonResponse({
             'success': True,
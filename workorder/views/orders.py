@@ -7,12 +7,13 @@ from scheduling.models import OrderMain, OrderUpdateSchedule  # type: ignore
 import logging
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger("workorder.views")
 
 
 def scheduling_user_required(user):
-    return user.is_superuser or user.groups.filter(name="排程使用者").exists()
+    return user.is_superuser or user_in_groups(user, "排程使用者")
 
 
 @login_required
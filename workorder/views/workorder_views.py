@@ -56,8 +56,8 @@ class WorkOrderListView(LoginRequiredMixin, ListView):
     ordering = ["created_at"]
 
     def get_queryset(self):
-        """取得查詢集，支援搜尋功能"""
-        queryset = super().get_queryset()
+        """取得查詢集，支援搜尋功能；進度欄位以註解一次帶出"""
+        queryset = super().get_queryset().with_progress()
         search = self.request.GET.get("search", "")
         if search:
             queryset = queryset.filter(
@@ -85,6 +85,9 @@ class WorkOrderDetailView(LoginRequiredMixin, DetailView):
     template_name = "workorder/workorder/workorder_detail.html"
     context_object_name = "workorder"
 
+    def get_queryset(self):
+        return WorkOrder.objects.with_progress()
+
     def get_object(self, queryset=None):
         """重寫 get_object 方法，處理已轉移到已完工工單的情況"""
         try:
@@ -672,7 +675,7 @@ class MesOrderListView(LoginRequiredMixin, ListView):
     ordering = ["-created_at"]
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().with_progress()
         
         # 排除已完工的工單（已完工的工單不應該在 MES 工單作業中顯示）
         qs = qs.exclude(status='completed')
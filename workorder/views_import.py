@@ -11,13 +11,15 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from django.shortcuts import redirect, render
 from django.utils import timezone
-from datetime import datetime, time
+from datetime import date, datetime, time
+from decimal import Decimal
 from io import BytesIO
 
 from workorder.models import WorkOrder
 from process.models import Operator, ProcessName
 from equip.models import Equipment
 from erp_integration.models import CompanyConfig
+from system.permission_resolver import user_in_groups
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +27,7 @@ def import_user_required(user):
     """
     檢查用戶是否為超級用戶或具有匯入權限
     """
-    return user.is_superuser or user.groups.filter(name="報表使用者").exists()
+    return user.is_superuser or user_in_groups(user, "報表使用者")
 
 @login_required
 @user_passes_test(import_user_required, login_url='/login/')
@@ -1198,16 +1200,62 @@ def get_smt_import_field_guide(request):
         'data': field_guide
     })
 
+# SMT 設備報工匯出欄位
+SMT_REPORT_EXPORT_HEADERS = [
+    '設備名稱', '公司代號', '報工日期', '開始時間', '結束時間',
+    '工單號', '產品編號', '工序名稱', '報工數量',
+    '不良品數量', '正常工時', '加班工時', '備註', '異常紀錄'
+]
+SMT_REPORT_EXPORT_FIELDS = (
+    'equipment', 'company_code', 'work_date', 'start_time', 'end_time',
+    'workorder', 'product_id', 'operation', 'work_quantity',
+    'defect_quantity', 'work_hours_calculated', 'overtime_hours_calculated', 'remarks', 'abnormal_notes',
+)
+
+# 作業員報工匯出欄位
+OPERATOR_REPORT_EXPORT_HEADERS = [
+    '作業員名稱', '公司代號', '報工日期', '開始時間', '結束時間', '工單號', '產品編號',
+    '工序名稱', '設備名稱', '報工數量', '不良品數量', '正常工時', '加班工時', '備註', '異常紀錄'
+]
+OPERATOR_REPORT_EXPORT_FIELDS = (
+    'operator', 'company_code', 'work_date', 'start_time', 'end_time', 'workorder', 'product_id',
+    'operation', 'equipment', 'work_quantity', 'defect_quantity',
+    'work_hours_calculated', 'overtime_hours_calculated', 'remarks', 'abnormal_notes',
+)
+
+
+def _format_report_export_row(row, time_format):
+    """報工匯出列格式化：日期、時間轉字串，時數轉數值，None 轉空字串"""
+    formatted = []
+    for value in row:
+        if value is None:
+            formatted.append('')
+        elif isinstance(value, datetime):
+            formatted.append(value.strftime('%Y-%m-%d %H:%M:%S'))
+        elif isinstance(value, date):
+            formatted.append(value.strftime('%Y-%m-%d'))
+        elif isinstance(value, time):
+            formatted.append(value.strftime(time_format))
+        elif isinstance(value, Decimal):
+            formatted.append(float(value))
+        else:
+            formatted.append(value)
+    return formatted
+
+
 @login_required
 @user_passes_test(import_user_required, login_url='/login/')
 def smt_report_export(request):
     """
     匯出SMT設備報工記錄
-    支援篩選條件和Excel格式匯出
+    支援篩選條件，以串流方式產生 Excel（資料取自填報記錄）
     """
     try:
-        # 注意：SMTSupplementReport 模型已棄用
-        reports = []
+        from workorder.fill_work.services import FillWorkExportService
+        from workorder.services.export_service import StreamingExportService
+        
+        # 原 SMTSupplementReport 模型已棄用，SMT 報工資料改由填報記錄提供
+        reports = FillWorkExportService.get_queryset('smt')
         
         # 篩選條件
         date_from = request.GET.get('date_from')
@@ -1220,93 +1268,17 @@ def smt_report_export(request):
         
         equipment_id = request.GET.get('equipment_id')
         if equipment_id:
-            reports = reports.filter(equipment_id=equipment_id)
-        
-        # 建立Excel檔案
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "SMT設備報工記錄"
-        
-        # 設定標題（增加正常工時和加班工時欄位）
-        headers = [
-            '設備名稱', '公司代號', '報工日期', '開始時間', '結束時間', 
-            '工單號', '產品編號', '工序名稱', '報工數量', 
-            '不良品數量', '正常工時', '加班工時', '備註', '異常紀錄'
-        ]
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
+            equipment = Equipment.objects.filter(id=equipment_id).values_list('name', flat=True).first()
+            reports = reports.filter(equipment=equipment or '')
         
-        # 填入資料
-        for row, report in enumerate(reports, 2):
-            ws.cell(row=row, column=1, value=report.equipment.name if report.equipment else '')
-            
-            # 改善公司代號處理：優先從 SMTSupplementReport 的 company_code 欄位取得
-            company_code = ''
-            if report.company_code:
-                company_code = report.company_code
-            elif report.workorder and report.workorder.company_code:
-                company_code = report.workorder.company_code
-            else:
-                # 如果都沒有，使用預設值
-                company_code = '10'  # 預設公司代號
-            ws.cell(row=row, column=2, value=company_code)
-            
-            ws.cell(row=row, column=3, value=report.work_date.strftime('%Y-%m-%d'))
-            ws.cell(row=row, column=4, value=report.start_time.strftime('%H:%M') if report.start_time else '')
-            ws.cell(row=row, column=5, value=report.end_time.strftime('%H:%M') if report.end_time else '')
-            
-            # 使用 workorder_number 屬性來取得工單號碼，這個屬性會處理各種情況
-            ws.cell(row=row, column=6, value=report.workorder_number)
-            
-            # 產品編號 - 直接使用報工記錄本身的產品編號欄位
-            product_id = report.product_id or ''
-            if not product_id and report.workorder and hasattr(report.workorder, 'product_code') and report.workorder.product_code:
-                # 如果報工記錄的產品編號為空，才從工單取得
-                product_id = report.workorder.product_code
-            ws.cell(row=row, column=7, value=product_id)
-            ws.cell(row=row, column=8, value=report.operation)
-            ws.cell(row=row, column=9, value=report.work_quantity or 0)
-            ws.cell(row=row, column=10, value=report.defect_quantity or 0)
-            # 新增正常工時和加班工時欄位
-            ws.cell(row=row, column=11, value=float(report.work_hours_calculated) if report.work_hours_calculated else 0)
-            ws.cell(row=row, column=12, value=float(report.overtime_hours_calculated) if report.overtime_hours_calculated else 0)
-            ws.cell(row=row, column=13, value=report.remarks or '')
-            ws.cell(row=row, column=14, value=report.abnormal_notes or '')
-        
-        # 調整欄寬
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # 儲存檔案
-        from django.http import HttpResponse
-        from io import BytesIO
-        
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        rows = StreamingExportService.iter_rows(
+            reports, SMT_REPORT_EXPORT_FIELDS, lambda row: _format_report_export_row(row, '%H:%M')
+        )
+        filename = f'SMT設備報工記錄_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        return StreamingExportService.xlsx_response(
+            filename, 'SMT設備報工記錄', SMT_REPORT_EXPORT_HEADERS, rows,
+            column_widths=[20, 10, 12, 10, 10, 20, 20, 15, 10, 10, 10, 10, 30, 30],
         )
-        response['Content-Disposition'] = f'attachment; filename="SMT設備報工記錄_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-        
-        return response
         
     except Exception as e:
         messages.error(request, f'SMT匯出失敗：{str(e)}')
@@ -1316,13 +1288,12 @@ def smt_report_export(request):
 def operator_report_export(request):
     """
     匯出作業員報工資料
-    支援按日期範圍、作業員、工序等條件篩選匯出
+    支援按日期範圍、作業員、工序等條件篩選，以串流方式產生 Excel（資料取自填報記錄）
     """
     try:
-        from django.http import HttpResponse
-        import pandas as pd
-        from io import BytesIO
-        from datetime import datetime
+        from django.db.models import Q
+        from workorder.fill_work.services import FillWorkExportService
+        from workorder.services.export_service import StreamingExportService
         
         # 取得篩選參數
         start_date = request.GET.get('start_date')
@@ -1331,8 +1302,8 @@ def operator_report_export(request):
         process_name = request.GET.get('process_name')
         company_code = request.GET.get('company_code')
         
-        # 注意：相關模型已棄用
-        query = []
+        # 原作業員補登報工模型已棄用，報工資料改由填報記錄提供
+        query = FillWorkExportService.get_queryset('operator')
         
         # 應用篩選條件
         if start_date:
@@ -1340,96 +1311,24 @@ def operator_report_export(request):
         if end_date:
             query = query.filter(work_date__lte=end_date)
         if operator_name:
-            query = query.filter(operator__name__icontains=operator_name)
+            query = query.filter(operator__icontains=operator_name)
         if process_name:
-            query = query.filter(process_name__icontains=process_name)
+            query = query.filter(Q(operation__icontains=process_name) | Q(process_name__icontains=process_name))
         if company_code:
-            query = query.filter(workorder__company_code=company_code)
-        
-        # 限制匯出數量，避免檔案過大
-        max_export_count = 10000
-        total_count = query.count()
-        if total_count > max_export_count:
-            query = query[:max_export_count]
-        
-        # 準備匯出資料
-        export_data = []
-        for report in query:
-            # 取得工單號碼 - 只從             workorder_number = ''
-            if report.workorder:
-                workorder_number = report.workorder.order_number
-            elif report.original_workorder_number:
-                workorder_number = report.original_workorder_number
-            elif report.rd_workorder_number:
-                workorder_number = report.rd_workorder_number
-            
-            # 取得產品編號 - 只從             product_code = ''
-            if report.workorder and report.workorder.product_code:
-                product_code = report.workorder.product_code
-            elif report.product_id:
-                product_code = report.product_id
-            elif report.rd_product_code:
-                product_code = report.rd_product_code
-            
-            # 取得公司代號 - 優先從             company_code_value = ''
-            if report.company_code:
-                company_code_value = report.company_code
-            elif report.workorder and report.workorder.company_code:
-                company_code_value = report.workorder.company_code
-            
-            export_data.append({
-                '作業員名稱': report.operator.name if report.operator else '',
-                '公司代號': company_code_value,
-                '報工日期': report.work_date.strftime('%Y-%m-%d') if report.work_date else '',
-                '開始時間': report.start_time.strftime('%H:%M:%S') if report.start_time else '',
-                '結束時間': report.end_time.strftime('%H:%M:%S') if report.end_time else '',
-                '工單號': workorder_number,
-                '產品編號': product_code,
-                '工序名稱': report.process.name if report.process else '',
-                '設備名稱': report.equipment.name if report.equipment else '',  # 直接從                 '報工數量': report.work_quantity,
-                '不良品數量': report.defect_quantity,
-                '正常工時': float(report.work_hours_calculated) if report.work_hours_calculated else 0,  # 新增：正常工時
-                '加班工時': float(report.overtime_hours_calculated) if report.overtime_hours_calculated else 0,  # 新增：加班工時
-                '備註': report.remarks or '',
-                '異常紀錄': report.abnormal_notes or '',
-            })
+            query = query.filter(company_code=company_code)
         
-        # 建立 DataFrame
-        df = pd.DataFrame(export_data)
-        
-        # 建立 Excel 檔案
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='作業員報工資料', index=False)
-            
-            # 取得工作表並調整欄寬
-            worksheet = writer.sheets['作業員報工資料']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
+        rows = StreamingExportService.iter_rows(
+            query, OPERATOR_REPORT_EXPORT_FIELDS, lambda row: _format_report_export_row(row, '%H:%M:%S')
+        )
         
         # 準備檔案名稱
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'作業員報工資料_{timestamp}.xlsx'
         
-        # 建立回應
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return StreamingExportService.xlsx_response(
+            filename, '作業員報工資料', OPERATOR_REPORT_EXPORT_HEADERS, rows,
+            column_widths=[15, 10, 12, 10, 10, 20, 20, 15, 20, 10, 10, 10, 10, 30, 30],
         )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
         
     except Exception as e:
         logger.error(f"匯出作業員報工資料失敗: {str(e)}")
@@ -1437,5 +1336,3 @@ def operator_report_export(request):
             'success': False,
             'message': f'匯出失敗: {str(e)}'
         })
-
- 
\ No newline at end of file
@@ -5153,12 +5153,12 @@ def active_workorders(request):
     顯示主管審核後的真正填報紀錄統計
     功能：基於已核准填報記錄監控生產執行狀況
     """
-    from django.db.models import Q, Count, Sum
+    from django.db.models import Count, Exists, OuterRef, Q, Subquery, Sum
     from django.core.paginator import Paginator
+    from erp_integration.models import CompanyConfig
     from workorder.models import WorkOrder
     from workorder.fill_work.models import FillWork
-    from erp_integration.models import CompanyConfig
-    from datetime import date, timedelta
+    from datetime import date
     
     # 獲取篩選參數
     company_name_filter = request.GET.get('company_name', '').strip()
@@ -5168,108 +5168,19 @@ def active_workorders(request):
     # 獲取今天的日期
     today = date.today()
     
-    # 新的生產中工單判斷邏輯：
-    # 生產中工單 = 有已核准填報記錄的工單 + 狀態為生產中的派工單
-    # 這樣可以監控所有真正在生產的工單和已派工的工單
-    
-    # 獲取所有有已核准填報記錄的工單（正確區分公司）
-    # 先獲取已核准填報記錄的公司和工單號碼對應關係
-    approved_fill_works = FillWork.objects.filter(
-        approval_status='approved'
-    ).values(
-        'id', 'operator', 'company_code', 'company_name', 'workorder', 
-        'product_id', 'planned_quantity', 'process_id', 'operation', 
-        'equipment', 'work_date', 'start_time', 'end_time', 'has_break',
-        'break_start_time', 'break_end_time', 'break_hours', 
-        'work_hours_calculated', 'overtime_hours_calculated', 
-        'work_quantity', 'defect_quantity', 'is_completed', 
-        'approval_status', 'approved_by', 'approved_at', 
-        'approval_remarks', 'rejection_reason', 'rejected_by', 
-        'rejected_at', 'remarks', 'abnormal_notes', 'created_by', 
-        'created_at', 'updated_at'
-    )
-    
-    # 建立公司代號到公司名稱的對應
-    company_name_to_code = {config.company_name: config.company_code for config in CompanyConfig.objects.all()}
-    
-    # 獲取有已核准填報記錄的工單（正確區分公司）
-    workorders_with_approved_reports = []
-    for fill_work in approved_fill_works:
-        # 從填報記錄的公司名稱找到對應的公司代號
-        company_code = company_name_to_code.get(fill_work['company_name'])
-        if company_code:
-            # 根據多公司架構，需要同時檢查公司代號、工單號碼和產品編號
-            workorder = WorkOrder.objects.filter(
-                company_code=company_code,
-                order_number=fill_work['workorder'],
-                product_code=fill_work['product_id']
-            ).first()
-            
-            # 檢查工單是否存在且未完工
-            if workorder and workorder.status != 'completed':
-                workorders_with_approved_reports.append(workorder)
-            elif not workorder:
-                # 如果工單不存在於 WorkOrder 表中，檢查是否已完工
-                from workorder.models import CompletedWorkOrder
-                completed_workorder = CompletedWorkOrder.objects.filter(
-                    company_code=company_code,
-                    order_number=fill_work['workorder'],
-                    product_code=fill_work['product_id']
-                ).first()
-                
-                # 如果工單已完工，則不加入執行中工單列表
-                if completed_workorder:
-                    workorder_logger.debug(f"工單 {fill_work['workorder']} 已完工，不顯示在執行中工單列表")
-                else:
-                    workorder_logger.warning(f"工單 {fill_work['workorder']} 不存在於任何工單表中")
-    
-    # 獲取狀態為生產中的派工單對應的工單
-    try:
-        from workorder.workorder_dispatch.models import WorkOrderDispatch
-        production_dispatches = WorkOrderDispatch.objects.filter(status='in_production')
-        
-        for dispatch in production_dispatches:
-            # 根據派工單資訊找到對應的工單
-            workorder = WorkOrder.objects.filter(
-                company_code=dispatch.company_code,
-                order_number=dispatch.order_number,
-                product_code=dispatch.product_code
-            ).first()
-            
-            if workorder and workorder not in workorders_with_approved_reports:
-                # 如果工單不在已核准填報記錄中，則加入執行中工單列表
-                workorders_with_approved_reports.append(workorder)
-    except Exception as e:
-        # 如果派工單模組不存在或發生錯誤，記錄錯誤但不影響功能
-        workorder_logger.warning(f"獲取生產中派工單失敗: {str(e)}")
-    
-    # 去重並排序
-    workorders_with_approved_reports = list(set(workorders_with_approved_reports))
-    workorders_with_approved_reports.sort(key=lambda x: x.created_at, reverse=True)
-    
-    # 獲取公司配置資訊，用於顯示公司名稱
-    company_configs = {config.company_code: config.company_name for config in CompanyConfig.objects.all()}
-    
-    # 為每個工單添加公司名稱
-    for workorder in workorders_with_approved_reports:
-        workorder.company_name = company_configs.get(workorder.company_code, workorder.company_code or '-')
+    # 生產中工單 = 有已核准填報記錄的未完工工單 + 狀態為生產中的派工單
+    # 判斷、公司名稱、篩選與分頁都在資料庫完成，只讀取目前頁面的工單
+    active_workorders = WorkOrder.objects.in_production().with_company_name()
     
     # 應用篩選條件
-    filtered_workorders = []
-    for workorder in workorders_with_approved_reports:
-        # 公司名稱篩選
-        if company_name_filter and company_name_filter.lower() not in workorder.company_name.lower():
-            continue
-        
-        # 工單號碼篩選
-        if workorder_number_filter and workorder_number_filter.lower() not in workorder.order_number.lower():
-            continue
-        
-        # 產品編號篩選
-        if product_code_filter and product_code_filter.lower() not in workorder.product_code.lower():
-            continue
-        
-        filtered_workorders.append(workorder)
+    filtered_workorders = active_workorders
+    if company_name_filter:
+        filtered_workorders = filtered_workorders.filter(company_name__icontains=company_name_filter)
+    if workorder_number_filter:
+        filtered_workorders = filtered_workorders.filter(order_number__icontains=workorder_number_filter)
+    if product_code_filter:
+        filtered_workorders = filtered_workorders.filter(product_code__icontains=product_code_filter)
+    filtered_workorders = filtered_workorders.order_by('-created_at', '-id')
     
     # 分頁處理
     paginator = Paginator(filtered_workorders, 10)  # 每頁顯示10筆
@@ -5277,76 +5188,58 @@ def active_workorders(request):
     page_obj = paginator.get_page(page_number)
     
     # 獲取統計數據
-    total_active = len(workorders_with_approved_reports)  # 執行中工單數量（有已核准填報記錄 + 生產中派工單）
+    total_active = active_workorders.count()  # 執行中工單數量（有已核准填報記錄 + 生產中派工單）
     total_pending = WorkOrder.objects.filter(status='pending').count()
     
-    # 已核准填報記錄統計（只計算主管審核後的記錄）
-    total_approved_reports = FillWork.objects.filter(approval_status='approved').count()
-    
-    # 計算有對應工單的已核准填報記錄數量（正確區分公司）
-    total_approved_reports_with_workorder = 0
-    for fill_work in approved_fill_works:
-        company_code = company_name_to_code.get(fill_work['company_name'])
-        if company_code:
-            # 根據多公司架構，需要同時檢查公司代號、工單號碼和產品編號
-            workorder_exists = WorkOrder.objects.filter(
-                company_code=company_code,
-                order_number=fill_work['workorder'],
-                product_code=fill_work['product_id']
-            ).exists()
-            if workorder_exists:
-                total_approved_reports_with_workorder += 1
-    
-    # 計算總工作時數（所有工序）
-    total_work_hours = FillWork.objects.filter(approval_status='approved').aggregate(
-        total=Sum('work_hours_calculated')
-    )['total'] or 0.0
-    
-    total_overtime_hours = FillWork.objects.filter(approval_status='approved').aggregate(
-        total=Sum('overtime_hours_calculated')
-    )['total'] or 0.0
-    
-    # 計算出貨包裝工序的合格品數量（填報記錄 + 現場報工）
-    # 1. 填報記錄的出貨包裝數量
-    packaging_fillwork_reports = FillWork.objects.filter(
-        approval_status='approved',
-        operation__exact='出貨包裝'  # 修正：使用 operation 欄位
+    # 已核准填報記錄統計（只計算主管審核後的記錄），以單一聚合查詢取得
+    # 有對應工單：填報的公司名稱對應的公司代號、工單號碼、產品編號皆相符
+    matching_workorders = WorkOrder.objects.filter(
+        company_code=Subquery(
+            CompanyConfig.objects.filter(company_name=OuterRef(OuterRef('company_name'))).order_by('id').values(
+                'company_code'
+            )[:1]
+        ),
+        order_number=OuterRef('workorder'),
+        product_code=OuterRef('product_id'),
+    )
+    report_stats = FillWork.objects.filter(approval_status='approved').aggregate(
+        total_approved_reports=Count('id'),
+        total_approved_reports_with_workorder=Count('id', filter=Q(Exists(matching_workorders))),
+        total_work_hours=Sum('work_hours_calculated'),
+        total_overtime_hours=Sum('overtime_hours_calculated'),
+        # 出貨包裝工序的合格品數量
+        fillwork_good_quantity=Sum('work_quantity', filter=Q(operation__exact='出貨包裝')),
     )
-    fillwork_good_quantity = packaging_fillwork_reports.aggregate(
-        total=Sum('work_quantity')
-    )['total'] or 0
     
-    # 2. 現場報工的出貨包裝數量
+    # 現場報工的出貨包裝數量
     try:
         from workorder.onsite_reporting.models import OnsiteReport
-        packaging_onsite_reports = OnsiteReport.objects.filter(
+        onsite_good_quantity = OnsiteReport.objects.filter(
             process="出貨包裝",
             status='completed'  # 只統計已完成的現場報工
-        )
-        onsite_good_quantity = packaging_onsite_reports.aggregate(
-            total=Sum('work_quantity')
-        )['total'] or 0
+        ).aggregate(total=Sum('work_quantity'))['total'] or 0
     except Exception as e:
         # 如果現場報工模組不存在或發生錯誤，設為0
         onsite_good_quantity = 0
     
-    # 3. 總合格品數量 = 填報記錄 + 現場報工
-    total_good_quantity = fillwork_good_quantity + onsite_good_quantity
+    # 總合格品數量 = 填報記錄 + 現場報工
+    total_good_quantity = (report_stats['fillwork_good_quantity'] or 0) + onsite_good_quantity
     
     # 確保數值類型一致，轉換為 float
-    total_work_hours = float(total_work_hours) if total_work_hours else 0.0
-    total_overtime_hours = float(total_overtime_hours) if total_overtime_hours else 0.0
+    total_work_hours = float(report_stats['total_work_hours'] or 0)
+    total_overtime_hours = float(report_stats['total_overtime_hours'] or 0)
     
     # 獲取所有公司名稱供篩選下拉選單使用
-    all_companies = list(set([workorder.company_name for workorder in workorders_with_approved_reports]))
-    all_companies.sort()
+    all_companies = list(
+        active_workorders.order_by('company_name').values_list('company_name', flat=True).distinct()
+    )
     
     context = {
         'total_active': total_active,
-        'total_filtered': len(filtered_workorders),  # 篩選後的工單數量
+        'total_filtered': paginator.count,  # 篩選後的工單數量
         'total_pending': total_pending,
-        'total_approved_reports': total_approved_reports,
-        'total_approved_reports_with_workorder': total_approved_reports_with_workorder,
+        'total_approved_reports': report_stats['total_approved_reports'],
+        'total_approved_reports_with_workorder': report_stats['total_approved_reports_with_workorder'],
         'total_good_quantity': total_good_quantity,
         'total_work_hours': total_work_hours + total_overtime_hours,
         'workorders_with_approved_reports': page_obj,  # 使用分頁後的資料
@@ -106,10 +106,10 @@ class DispatchListView(LoginRequiredMixin, ListView):
             # 首先處理公司名稱
             if not dispatch.company_name and dispatch.company_code:
                 try:
-                    from erp_integration.models import CompanyConfig
-                    company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-                    if company_config:
-                        dispatch.company_name = company_config.company_name
+                    from workorder.services.master_data_cache import MasterDataCache
+                    company_name = MasterDataCache.get_company_name(dispatch.company_code)
+                    if company_name:
+                        dispatch.company_name = company_name
                         # 更新資料庫中的公司名稱
                         dispatch.save(update_fields=['company_name'])
                     else:
@@ -276,10 +276,9 @@ class DispatchDetailView(LoginRequiredMixin, DetailView):
         company_name = dispatch.company_name
         if not company_name and dispatch.company_code:
             try:
-                from erp_integration.models import CompanyConfig
-                company_config = CompanyConfig.objects.filter(company_code=dispatch.company_code).first()
-                if company_config:
-                    company_name = company_config.company_name
+                from workorder.services.master_data_cache import MasterDataCache
+                company_name = MasterDataCache.get_company_name(dispatch.company_code)
+                if company_name:
                     # 更新派工單的公司名稱欄位
                     dispatch.company_name = company_name
                     dispatch.save(update_fields=['company_name'])